@@ -1,73 +1,221 @@
 import threading
 from concurrent.futures import ThreadPoolExecutor
 from itertools import permutations
+from pathlib import Path
+from typing import Any, Optional, Sequence
 
 import structlog
 from eth_typing import Address, ChecksumAddress
-from web3.middleware import latest_block_based_cache_middleware
+from eth_utils import function_abi_to_4byte_selector
+from web3 import Web3
+from web3.contract import Contract
 
 import beamer.agent.metrics
+import beamer.agent.snapshot
+import beamer.middleware
 from beamer.agent.chain import EventMonitor, EventProcessor
-from beamer.agent.config import Config
+from beamer.agent.config import ChainConfig, Config, ShardConfig
+from beamer.agent.headers import HeaderStore, header_store_path
+from beamer.agent.mempool import MempoolWatcher
+from beamer.agent.prepare import FillPreparer
+from beamer.agent.router import EventRouter
 from beamer.agent.state_machine import Context
 from beamer.agent.tracker import Tracker
-from beamer.agent.util import BaseChain, Chain
+from beamer.agent.util import BaseChain, Chain, FileLock, FillMutex
 from beamer.contracts import ABIManager, obtain_contract
-from beamer.typing import ChainId, TransferDirection
-from beamer.util import make_web3
+from beamer.typing import BlockNumber, ChainId, TransferDirection
+from beamer.util import get_ERC20_abi, get_web3
 
 log = structlog.get_logger(__name__)
 
 
+def load_contracts(
+    w3: Web3, abi_manager: ABIManager, artifacts_dir: Path, chain_id: ChainId
+) -> tuple[BlockNumber, Contract, Contract]:
+    """Return the deployment block, the RequestManager and the FillManager
+    contract on chain ``chain_id``."""
+    deployment = beamer.artifacts.load(artifacts_dir, chain_id)
+    if deployment is None:
+        raise RuntimeError(f"Deployment artifact for chain ID {chain_id} not available")
+
+    assert deployment.chain is not None
+    request_manager = obtain_contract(w3, abi_manager, deployment, "RequestManager")
+    fill_manager = obtain_contract(w3, abi_manager, deployment, "FillManager")
+    return deployment.earliest_block, request_manager, fill_manager
+
+
+# Contract functions whose call results are cached, along with the events
+# changing them. Functions without such events return immutable values.
+_CACHED_CALLS: dict[str, dict[str, tuple[str, ...]]] = {
+    "RequestManager": {
+        "claimStake": (),
+        "claimRequestExtension": (),
+        "MAX_VALIDITY_PERIOD": (),
+        "allowedLps": ("LpAdded", "LpRemoved"),
+        "chains": ("ChainUpdated",),
+        "minFeePPM": ("FeesUpdated",),
+        "lpFeePPM": ("FeesUpdated",),
+        "protocolFeePPM": ("FeesUpdated",),
+    },
+    "FillManager": {
+        "allowedLps": ("LpAdded", "LpRemoved"),
+    },
+    "ERC20": {
+        "symbol": (),
+        "decimals": (),
+    },
+}
+
+
+def _register_cached_calls(chain_id: ChainId, name: str, address: str, abi: Sequence[Any]) -> None:
+    abi_by_name = {entry["name"]: entry for entry in abi if entry["type"] == "function"}
+    for function_name, invalidated_by in _CACHED_CALLS[name].items():
+        selector = "0x" + function_abi_to_4byte_selector(abi_by_name[function_name]).hex()
+        beamer.middleware.register_cached_call(chain_id, address, selector, invalidated_by)
+
+
+def register_cached_calls(
+    chain_id: ChainId,
+    request_manager: Contract,
+    fill_manager: Contract,
+    tokens: list[tuple[ChainId, ChecksumAddress]],
+) -> None:
+    """Cache the results of calls to contract constants of chain ``chain_id``,
+    including those of the given tokens of the chain, see
+    beamer.middleware.register_cached_call."""
+    _register_cached_calls(
+        chain_id, "RequestManager", request_manager.address, request_manager.abi
+    )
+    _register_cached_calls(chain_id, "FillManager", fill_manager.address, fill_manager.abi)
+    for _, address in tokens:
+        _register_cached_calls(chain_id, "ERC20", address, get_ERC20_abi())
+
+
+def get_transfer_directions(
+    chain_ids_by_name: dict[str, ChainId], shard: Optional[ShardConfig]
+) -> set[TransferDirection]:
+    """Return the transfer directions between the configured chains that are
+    owned by this agent."""
+    # Chains with the same ID are only set up once.
+    chain_ids = list(dict.fromkeys(chain_ids_by_name.values()))
+    if len(chain_ids) == 1:
+        chain_ids.append(chain_ids[0])
+
+    directions = set(
+        TransferDirection(source, target) for source, target in permutations(chain_ids, 2)
+    )
+    if shard is None or shard.directions is None:
+        return directions
+
+    owned = set(
+        TransferDirection(chain_ids_by_name[source], chain_ids_by_name[target])
+        for source, target in shard.directions
+    )
+    return directions & owned
+
+
 class Agent:
-    def __init__(self, config: Config):
+    _event_monitor_class = EventMonitor
+    _event_processor_class = EventProcessor
+
+    def __init__(self, config: Config, monitor_events: bool = True):
         self._config = config
+        # If monitor_events is False, the agent does not fetch any events by
+        # itself. Instead, events need to be fed to the event processors
+        # externally, e.g. by an event monitor running in another process.
+        self._monitor_events = monitor_events
         self._stopped = threading.Event()
         self._stopped.set()
         self._abi_manager = ABIManager(config.abi_dir)
         self._init()
 
     def _init_l1_chain(self) -> BaseChain:
-        l1_w3 = make_web3(self._config.base_chain_rpc_url, self._config.account)
-        l1_w3.middleware_onion.add(latest_block_based_cache_middleware)
+        l1_w3 = get_web3(
+            self._config.base_chain_rpc_url, self._config.account, latest_block_cache=True
+        )
         return BaseChain(w3=l1_w3, id=ChainId(l1_w3.eth.chain_id))
 
     def _init_chains(self) -> dict[ChainId, Chain]:
         chains: dict[ChainId, Chain] = {}
         for chain_name, chain_config in self._config.chains.items():
-            w3 = make_web3(chain_config.rpc_url, self._config.account)
+            w3 = get_web3(
+                chain_config.rpc_url,
+                self._config.account,
+                max_concurrent_requests=chain_config.max_concurrent_requests,
+                max_requests_per_second=chain_config.max_requests_per_second,
+                compute_units_per_second=chain_config.compute_units_per_second,
+                compute_units=chain_config.compute_units,
+                fallback_urls=chain_config.fallback_rpc_urls,
+                hedged_requests=chain_config.hedged_requests,
+                pool_size=chain_config.pool_size,
+                keep_alive=chain_config.keep_alive,
+                fused_middleware=chain_config.fused_middleware,
+            )
             chain_id = ChainId(w3.eth.chain_id)
+            self._chain_ids_by_name[chain_name] = chain_id
             if chain_id in chains:
                 continue
 
-            deployment = beamer.artifacts.load(self._config.artifacts_dir, chain_id)
-            if deployment is None:
-                raise RuntimeError(f"Deployment artifact for chain ID {chain_id} not available")
-
-            assert deployment.chain is not None
-            request_manager = obtain_contract(w3, self._abi_manager, deployment, "RequestManager")
-            fill_manager = obtain_contract(w3, self._abi_manager, deployment, "FillManager")
+            deployment_block, request_manager, fill_manager = load_contracts(
+                w3, self._abi_manager, self._config.artifacts_dir, chain_id
+            )
 
-            self._event_monitors[chain_id] = EventMonitor(
+            header_store = self._init_header_store(chain_id)
+            self._event_monitors[chain_id] = self._make_event_monitor(
+                chain_config,
                 web3=w3,
                 contracts=(request_manager, fill_manager),
-                deployment_block=deployment.earliest_block,
+                deployment_block=deployment_block,
                 poll_period=chain_config.poll_period,
                 confirmation_blocks=chain_config.confirmation_blocks,
                 on_new_events=[],
                 on_sync_done=[],
                 on_rpc_status_change=[],
+                header_store=header_store,
+                router=self._event_router,
+                bloom_prefilter=chain_config.bloom_prefilter,
             )
+            tokens = self._config.token_checker.get_tokens_for_chain(chain_id)
+            register_cached_calls(chain_id, request_manager, fill_manager, tokens)
             chains[chain_id] = Chain(
                 w3=w3,
                 id=chain_id,
                 name=chain_name,
-                tokens=self._config.token_checker.get_tokens_for_chain(chain_id),
+                tokens=tokens,
                 request_manager=request_manager,
                 fill_manager=fill_manager,
+                header_store=header_store,
             )
         return chains
 
+    def _make_event_monitor(
+        self, chain_config: ChainConfig, **kwargs: Any  # pylint: disable=unused-argument
+    ) -> EventMonitor:
+        return self._event_monitor_class(**kwargs)
+
+    def _init_header_store(self, chain_id: ChainId) -> Optional[HeaderStore]:
+        header_store_dir = self._config.header_store_dir
+        if header_store_dir is None:
+            return None
+        header_store_dir.mkdir(parents=True, exist_ok=True)
+        header_store = HeaderStore(header_store_path(header_store_dir, chain_id), chain_id)
+        self._header_stores.append(header_store)
+        return header_store
+
+    def _init_mempool_watchers(
+        self, chains: dict[ChainId, Chain], directions: set[TransferDirection]
+    ) -> None:
+        for chain_id in {direction.target for direction in directions}:
+            chain = chains[chain_id]
+            chain_config = self._config.chains[chain.name]
+            if chain_config.watch_mempool:
+                self._mempool_watchers[chain_id] = MempoolWatcher(
+                    chain.w3,
+                    chain.fill_manager,
+                    self._config.account.address,
+                    chain_config.poll_period,
+                )
+
     def _check_source_chain(self, source_chain: Chain) -> None:
         max_validity_period = source_chain.request_manager.functions.MAX_VALIDITY_PERIOD().call()
 
@@ -85,11 +233,21 @@ class Agent:
 
     def _init_fill_mutexes(
         self, chains: dict[ChainId, Chain]
-    ) -> dict[tuple[ChainId, ChecksumAddress], threading.Lock]:
-        mutexes: dict[tuple[ChainId, ChecksumAddress], threading.Lock] = {}
+    ) -> dict[tuple[ChainId, ChecksumAddress], FillMutex]:
+        lock_dir = self._config.shard.lock_dir if self._config.shard is not None else None
+        if lock_dir is not None:
+            lock_dir.mkdir(parents=True, exist_ok=True)
+
+        mutexes: dict[tuple[ChainId, ChecksumAddress], FillMutex] = {}
         for chain in chains.values():
             for chain_id, address in chain.tokens:
-                mutexes[(chain_id, address)] = threading.Lock()
+                if lock_dir is None:
+                    mutexes[(chain_id, address)] = threading.Lock()
+                else:
+                    # Agent processes sharing the lock directory must not
+                    # fill the same token on the same chain concurrently.
+                    path = lock_dir.joinpath(f"fill-{chain_id}-{address}.lock")
+                    mutexes[(chain_id, address)] = FileLock(path)
         return mutexes
 
     def _setup_direction(
@@ -97,7 +255,7 @@ class Agent:
         direction: TransferDirection,
         chains: dict[ChainId, Chain],
         l1: BaseChain,
-        mutexes: dict[tuple[ChainId, ChecksumAddress], threading.Lock],
+        mutexes: dict[tuple[ChainId, ChecksumAddress], FillMutex],
     ) -> None:
         source_chain = chains[direction.source]
         target_chain = chains[direction.target]
@@ -128,8 +286,15 @@ class Agent:
             l1_resolutions={},
             fill_mutexes=mutexes,
             logger=logger,
+            fill_preparer=self._fill_preparer,
+            mempool_watcher=self._mempool_watchers.get(target_chain.id),
         )
-        event_processor = EventProcessor(context)
+        snapshot_path = None
+        if self._config.snapshot_dir is not None:
+            snapshot_path = beamer.agent.snapshot.snapshot_path(
+                self._config.snapshot_dir, direction
+            )
+        event_processor = self._event_processor_class(context, snapshot_path)
         self._event_monitors[direction.source].subscribe(event_processor)
         if source_chain.id != target_chain.id:
             self._event_monitors[direction.target].subscribe(event_processor)
@@ -140,33 +305,57 @@ class Agent:
         # This is necessary as we use the account for all resolutions and
         # would otherwise run into nonce problems
         self._task_pool = ThreadPoolExecutor(max_workers=1)
+        self._fill_preparer = None
+        if self._config.prepare_fills:
+            self._fill_preparer = FillPreparer(self._config.account)
         self._event_processors: dict[TransferDirection, EventProcessor] = {}
         self._event_monitors: dict[ChainId, EventMonitor] = {}
+        self._event_router = EventRouter()
+        self._chain_ids_by_name: dict[str, ChainId] = {}
+        self._header_stores: list[HeaderStore] = []
+        self._mempool_watchers: dict[ChainId, MempoolWatcher] = {}
         l1 = self._init_l1_chain()
         chains = self._init_chains()
         mutexes = self._init_fill_mutexes(chains)
-        chain_ids = list(chains.keys())
-        if len(chain_ids) == 1:
-            chain_ids.append(chain_ids[0])
-
-        directions = permutations(chain_ids, 2)
-
-        for direction in set(directions):
-            direction = TransferDirection(direction[0], direction[1])
+        directions = get_transfer_directions(self._chain_ids_by_name, self._config.shard)
+        self._init_mempool_watchers(chains, directions)
+        for direction in directions:
             self._setup_direction(direction, chains, l1, mutexes)
 
-    def start(self) -> None:
-        assert self._stopped.is_set()
+        # Chains that are not part of any owned direction need not be monitored.
+        for chain_id, event_monitor in list(self._event_monitors.items()):
+            if not event_monitor.has_subscribers:
+                del self._event_monitors[chain_id]
+
+    def _init_metrics(self) -> None:
+        rpc_urls = {}
+        for event_processor in self._event_processors.values():
+            for chain in (
+                event_processor.context.source_chain,
+                event_processor.context.target_chain,
+            ):
+                rpc_urls[chain.id] = chain.rpc_url
+        # The agent_info metric only records the RPC URLs of the first
+        # direction; chain_info records those of all chains.
         for event_processor in self._event_processors.values():
             beamer.agent.metrics.init(
                 config=self._config,
                 source_rpc_url=event_processor.context.source_chain.rpc_url,
                 target_rpc_url=event_processor.context.target_chain.rpc_url,
+                rpc_urls=rpc_urls,
             )
+
+    def start(self) -> None:
+        assert self._stopped.is_set()
+        self._init_metrics()
+        for mempool_watcher in self._mempool_watchers.values():
+            mempool_watcher.start()
+        for event_processor in self._event_processors.values():
             event_processor.start()
 
-        for event_monitor in self._event_monitors.values():
-            event_monitor.start()
+        if self._monitor_events:
+            for event_monitor in self._event_monitors.values():
+                event_monitor.start()
         self._stopped.clear()
 
     def get_directions(self) -> tuple[TransferDirection, ...]:
@@ -183,11 +372,21 @@ class Agent:
         assert not self._stopped.is_set()
         for event_processor in self._event_processors.values():
             event_processor.stop()
-        for event_monitor in self._event_monitors.values():
-            event_monitor.stop()
+        if self._monitor_events:
+            for event_monitor in self._event_monitors.values():
+                event_monitor.stop()
+        for mempool_watcher in self._mempool_watchers.values():
+            mempool_watcher.stop()
+        for header_store in self._header_stores:
+            header_store.close()
+        self._reset()
+        self._stopped.set()
+
+    def _reset(self) -> None:
         self._task_pool.shutdown(wait=True, cancel_futures=False)
+        if self._fill_preparer is not None:
+            self._fill_preparer.shutdown()
         self._init()
-        self._stopped.set()
 
     @property
     def running(self) -> bool:
@@ -0,0 +1,72 @@
+import asyncio
+import threading
+from typing import Any
+
+import structlog
+
+from beamer.agent.agent import Agent
+from beamer.agent.async_chain import AsyncEventMonitor, AsyncEventProcessor
+from beamer.agent.chain import EventMonitor, _wrap_thread_func
+from beamer.agent.config import ChainConfig
+from beamer.util import close_async_sessions
+
+log = structlog.get_logger(__name__)
+
+
+class AsyncAgent(Agent):
+    """An agent that runs all event monitors and event processors as tasks
+    of a single asyncio event loop, instead of one thread each.
+
+    The event loop runs in a dedicated thread, so that :meth:`start`,
+    :meth:`stop` and :meth:`wait` behave the same as for :class:`Agent`.
+    """
+
+    _event_processor_class = AsyncEventProcessor
+
+    def _make_event_monitor(self, chain_config: ChainConfig, **kwargs: Any) -> EventMonitor:
+        return AsyncEventMonitor(chain_config=chain_config, **kwargs)
+
+    def start(self) -> None:
+        assert self._stopped.is_set()
+        self._init_metrics()
+        self._stop_requested = asyncio.Event()  # pylint: disable=attribute-defined-outside-init
+        self._loop = asyncio.new_event_loop()  # pylint: disable=attribute-defined-outside-init
+        self._loop_thread = threading.Thread(  # pylint: disable=attribute-defined-outside-init
+            name="AsyncAgent", target=_wrap_thread_func(self._run_loop)
+        )
+        self._loop_thread.start()
+        self._stopped.clear()
+
+    def _run_loop(self) -> None:
+        asyncio.set_event_loop(self._loop)
+        try:
+            self._loop.run_until_complete(self._main())
+        finally:
+            self._loop.close()
+
+    async def _main(self) -> None:
+        event_processors = list(self._event_processors.values())
+        event_monitors = list(self._event_monitors.values())
+        for event_processor in event_processors:
+            event_processor.start()
+        for event_monitor in event_monitors:
+            event_monitor.start()
+
+        await self._stop_requested.wait()
+
+        for event_processor in event_processors:
+            event_processor.stop()
+        for event_monitor in event_monitors:
+            event_monitor.stop()
+        await asyncio.gather(
+            *(event_processor.join() for event_processor in event_processors),  # type: ignore
+            *(event_monitor.join() for event_monitor in event_monitors),  # type: ignore
+        )
+        await close_async_sessions()
+
+    def stop(self) -> None:
+        assert not self._stopped.is_set()
+        self._loop.call_soon_threadsafe(self._stop_requested.set)
+        self._loop_thread.join()
+        self._reset()
+        self._stopped.set()
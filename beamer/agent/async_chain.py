@@ -0,0 +1,167 @@
+import asyncio
+import os
+import sys
+import traceback
+from pathlib import Path
+from typing import Any, Coroutine, Optional
+
+import aiohttp
+from web3 import AsyncWeb3
+
+from beamer.agent.chain import EventMonitor, EventProcessor
+from beamer.agent.config import ChainConfig
+from beamer.agent.state_machine import Context
+from beamer.events import AsyncEventFetcher, Event
+from beamer.typing import URL
+from beamer.util import make_async_web3
+
+
+async def _exit_on_error(coro: Coroutine[Any, Any, None]) -> None:
+    # Same as _wrap_thread_func in beamer.agent.chain, but for coroutines.
+    try:
+        await coro
+    except Exception:
+        traceback.print_exception(*sys.exc_info())
+        os._exit(1)
+
+
+class AsyncEventMonitor(EventMonitor):
+    """An event monitor that runs as a task on an asyncio event loop and
+    fetches events via AsyncWeb3, instead of occupying a thread.
+
+    The AsyncWeb3 instance obeys the RPC limits and fallback endpoints of
+    ``chain_config``, sharing the limits with the chain's Web3 instance.
+
+    :meth:`start` and :meth:`stop` must be called from the event loop.
+    """
+
+    def __init__(self, *args: Any, chain_config: ChainConfig, **kwargs: Any):
+        super().__init__(*args, **kwargs)
+        self._chain_config = chain_config
+
+    def start(self) -> None:
+        self._task = asyncio.create_task(  # pylint: disable=attribute-defined-outside-init
+            _exit_on_error(self._run()), name=f"EventMonitor[cid={self._chain_id}]"
+        )
+
+    def stop(self) -> None:
+        self._stop = True
+
+    async def join(self) -> None:
+        await self._task
+
+    async def _async_inner_fetch(self, fetcher: AsyncEventFetcher) -> list[Event]:
+        events = []
+        was_working = self._rpc_working
+        try:
+            events.extend(await fetcher.fetch())
+        except aiohttp.ClientConnectionError:
+            self._rpc_working = False
+        else:
+            self._rpc_working = True
+            self._record_sync_lag(fetcher.head_block, fetcher.synced_block)
+        if was_working != self._rpc_working:
+            self._call_on_rpc_status_change(self._rpc_working)
+            self._log.info(
+                "RPC stopped working" if was_working else "RPC started working",
+                rpc_url=self._rpc_url,
+            )
+        return events
+
+    @property
+    def _rpc_url(self) -> URL:
+        return self._chain_config.rpc_url
+
+    async def _run(self) -> None:
+        self._log.info(
+            "EventMonitor started",
+            addresses=[c.address for c in self._contracts],
+        )
+        chain_config = self._chain_config
+        w3: AsyncWeb3 = await make_async_web3(
+            chain_config.rpc_url,
+            max_concurrent_requests=chain_config.max_concurrent_requests,
+            max_requests_per_second=chain_config.max_requests_per_second,
+            compute_units_per_second=chain_config.compute_units_per_second,
+            compute_units=chain_config.compute_units,
+            fallback_urls=chain_config.fallback_rpc_urls,
+        )
+        start_block = self._deployment_block if self._start_block is None else self._start_block
+        fetcher = AsyncEventFetcher(
+            w3,
+            self._chain_id,
+            self._contracts,
+            start_block,
+            self._confirmation_blocks,
+            header_store=self._header_store,
+            bloom_prefilter=self._bloom_prefilter,
+        )
+        current_block = await w3.eth.block_number
+        events = []
+        while fetcher.synced_block < current_block and not self._stop:
+            events.extend(await self._async_inner_fetch(fetcher))
+        if events:
+            self._call_on_new_events(events)
+        self._call_on_sync_done()
+        self._log.info("Sync done")
+        while not self._stop:
+            events = await self._async_inner_fetch(fetcher)
+            if events:
+                self._call_on_new_events(events)
+            await asyncio.sleep(self._poll_period)
+        self._log.info("EventMonitor stopped")
+
+
+class AsyncEventProcessor(EventProcessor):
+    """An event processor that runs as a task on an asyncio event loop.
+
+    Waiting for new events costs a suspended coroutine instead of a thread.
+    The state machine and the request and claim handlers still use the
+    synchronous Web3 instances of the context, so each processing iteration
+    is run in a worker thread, in order not to block the event loop.
+
+    :meth:`start` and :meth:`stop` must be called from the event loop.
+    """
+
+    def __init__(self, context: Context, snapshot_path: Optional[Path] = None):
+        super().__init__(context, snapshot_path)
+        self._new_events = asyncio.Event()
+
+    def add_events(self, events: list[Event]) -> None:
+        super().add_events(events)
+        self._new_events.set()
+
+    def start(self) -> None:
+        self._task = asyncio.create_task(  # pylint: disable=attribute-defined-outside-init
+            _exit_on_error(self._run()), name="EventProcessor"
+        )
+
+    def stop(self) -> None:
+        self._stop = True
+        self._new_events.set()
+
+    async def join(self) -> None:
+        await self._task
+
+    async def _wait_for_new_events(self) -> None:
+        try:
+            await asyncio.wait_for(self._new_events.wait(), EventProcessor._WAIT_TIME)
+        except asyncio.TimeoutError:
+            pass
+        self._new_events.clear()
+
+    async def _run(self) -> None:
+        self._context.logger.info("EventProcessor started")
+
+        # Wait until all past events are fetched and in the queue
+        # so the agent can sync to the current state
+        while not self._synced and not self._stop:
+            await self._wait_for_new_events()
+
+        while not self._stop:
+            await self._wait_for_new_events()
+            await asyncio.to_thread(self._process_iteration)
+
+        if self._snapshot_path is not None and self._synced:
+            await asyncio.to_thread(self._write_snapshot)
+        self._context.logger.info("EventProcessor stopped")
@@ -4,22 +4,40 @@ import threading
 import time
 import traceback
 from concurrent.futures import Future
-from typing import Callable
+from pathlib import Path
+from typing import Callable, Optional
 
 import requests
 import structlog
 from web3 import HTTPProvider, Web3
 from web3._utils.empty import Empty
 from web3.contract import Contract
-from web3.types import Timestamp, Wei
+from web3.types import Timestamp, TxReceipt, Wei
 
+import beamer.agent.metrics
+import beamer.agent.snapshot
+from beamer.agent.headers import BlockHeader, HeaderStore
 from beamer.agent.models.claim import Claim
 from beamer.agent.models.request import Request
-from beamer.agent.state_machine import Context, process_event
+from beamer.agent.prepare import make_fill_function
+from beamer.agent.router import EventRouter
+from beamer.agent.state_machine import Context, process_event, prune_settled_requests
+from beamer.agent.util import Chain
 from beamer.chains import get_chain_descriptor
-from beamer.events import Event, EventFetcher
+from beamer.events import (
+    ChainUpdated,
+    Event,
+    EventFetcher,
+    FeesUpdated,
+    LatestBlockUpdatedEvent,
+    LpAdded,
+    LpRemoved,
+    TxEvent,
+    coalesce_latest_blocks,
+)
+from beamer.middleware import RequestPriority, invalidate_cached_calls, request_priority
 from beamer.relayer import run_relayer_for_tx
-from beamer.typing import BlockNumber, ChainId
+from beamer.typing import BlockNumber, ChainId, TransferDirection
 from beamer.util import TransactionFailed, get_ERC20_abi, transact
 
 # The time we're waiting for our thread in stop(), in seconds.
@@ -27,6 +45,10 @@ from beamer.util import TransactionFailed, get_ERC20_abi, transact
 _STOP_TIMEOUT = 2
 
 
+# Events changing the results of cached contract calls, see
+# beamer.agent.agent.register_cached_calls.
+_CACHE_INVALIDATING_EVENTS = (LpAdded, LpRemoved, ChainUpdated, FeesUpdated)
+
 _SyncDoneCallback = Callable[[], None]
 _RPCStatusCallback = Callable[[bool], None]
 _NewEventsCallback = Callable[[list[Event]], None]
@@ -56,18 +78,32 @@ class EventMonitor:
         on_rpc_status_change: list[_RPCStatusCallback],
         poll_period: float,
         confirmation_blocks: int,
+        header_store: Optional[HeaderStore] = None,
+        router: Optional[EventRouter] = None,
+        bloom_prefilter: bool = True,
     ):
         self._web3 = web3
         self._chain_id = ChainId(self._web3.eth.chain_id)
         self._contracts = contracts
         self._deployment_block = deployment_block
+        # The block to start fetching events from. Normally the deployment
+        # block, but it can be later if all subscribed event processors
+        # were restored from a snapshot.
+        self._start_block: Optional[BlockNumber] = None
         self._stop = False
         self._on_new_events = on_new_events
         self._on_sync_done = on_sync_done
         self._on_rpc_status_change = on_rpc_status_change
+        # The transfer directions of the subscribers, None for subscribers
+        # that need all events. If all directions are known, the router
+        # sends each subscriber only the events of its direction.
+        self._directions: list[Optional[TransferDirection]] = [None] * len(on_new_events)
+        self._router = router
         self._rpc_working = True
         self._poll_period = poll_period
         self._confirmation_blocks = confirmation_blocks
+        self._header_store = header_store
+        self._bloom_prefilter = bloom_prefilter
         self._log = structlog.get_logger(type(self).__name__).bind(chain_id=self._chain_id)
 
         for contract in contracts:
@@ -83,10 +119,48 @@ class EventMonitor:
         self._stop = True
         self._thread.join(_STOP_TIMEOUT)
 
+    @property
+    def has_subscribers(self) -> bool:
+        return bool(self._on_new_events)
+
     def subscribe(self, event_processor: "EventProcessor") -> None:
-        self._on_new_events.append(event_processor.add_events)
-        self._on_sync_done.append(event_processor.mark_sync_done)
-        self._on_rpc_status_change.append(event_processor.set_rpc_working)
+        context = event_processor.context
+        direction = TransferDirection(context.source_chain.id, context.target_chain.id)
+        if self._router is not None:
+            # Requests restored from a snapshot are not created again.
+            for request in context.requests:
+                self._router.add_request(request.id, direction)
+        self.add_subscriber(
+            on_new_events=event_processor.add_events,
+            on_sync_done=event_processor.mark_sync_done,
+            on_rpc_status_change=event_processor.set_rpc_working,
+            resume_block=event_processor.get_resume_block(self._chain_id),
+            direction=direction,
+        )
+
+    def add_subscriber(
+        self,
+        on_new_events: _NewEventsCallback,
+        on_sync_done: _SyncDoneCallback,
+        on_rpc_status_change: _RPCStatusCallback,
+        resume_block: Optional[BlockNumber] = None,
+        direction: Optional[TransferDirection] = None,
+    ) -> None:
+        """Add a subscriber that needs events starting from ``resume_block``,
+        or from the deployment block if ``resume_block`` is None.
+
+        If ``direction`` is given, the subscriber only receives the events
+        concerning that transfer direction, otherwise it receives all events."""
+        if resume_block is None:
+            resume_block = self._deployment_block
+        resume_block = max(resume_block, self._deployment_block)
+        if self._start_block is None or resume_block < self._start_block:
+            self._start_block = resume_block
+
+        self._on_new_events.append(on_new_events)
+        self._on_sync_done.append(on_sync_done)
+        self._on_rpc_status_change.append(on_rpc_status_change)
+        self._directions.append(direction)
 
     def _inner_fetch(self, fetcher: EventFetcher) -> list[Event]:
         events = []
@@ -97,6 +171,7 @@ class EventMonitor:
             self._rpc_working = False
         else:
             self._rpc_working = True
+            self._record_sync_lag(fetcher.head_block, fetcher.synced_block)
         if was_working != self._rpc_working:
             self._call_on_rpc_status_change(self._rpc_working)
             assert isinstance(self._web3.provider, HTTPProvider)
@@ -111,8 +186,14 @@ class EventMonitor:
             "EventMonitor started",
             addresses=[c.address for c in self._contracts],
         )
+        start_block = self._deployment_block if self._start_block is None else self._start_block
         fetcher = EventFetcher(
-            self._web3, self._contracts, self._deployment_block, self._confirmation_blocks
+            self._web3,
+            self._contracts,
+            start_block,
+            self._confirmation_blocks,
+            header_store=self._header_store,
+            bloom_prefilter=self._bloom_prefilter,
         )
         current_block = self._web3.eth.block_number
         events = []
@@ -129,9 +210,27 @@ class EventMonitor:
             time.sleep(self._poll_period)
         self._log.info("EventMonitor stopped")
 
+    def _record_sync_lag(
+        self, head_block: Optional[BlockNumber], synced_block: BlockNumber
+    ) -> None:
+        if head_block is None:
+            return
+        with beamer.agent.metrics.update() as data:
+            data.sync_lag.labels(chain_id=self._chain_id).set(max(0, head_block - synced_block))
+
     def _call_on_new_events(self, events: list[Event]) -> None:
-        for on_new_events in self._on_new_events:
-            on_new_events(events)
+        events = coalesce_latest_blocks(events)
+        if self._router is None or None in self._directions:
+            for on_new_events in self._on_new_events:
+                on_new_events(events)
+            return
+
+        directions = {direction for direction in self._directions if direction is not None}
+        routed = self._router.route(events, directions)
+        for on_new_events, direction in zip(self._on_new_events, self._directions):
+            assert direction is not None
+            if routed[direction]:
+                on_new_events(routed[direction])
 
     def _call_on_sync_done(self) -> None:
         for on_sync_done in self._on_sync_done:
@@ -146,7 +245,7 @@ class EventProcessor:
     # Internal wait time for checking if new events are being queued
     _WAIT_TIME = 1
 
-    def __init__(self, context: Context):
+    def __init__(self, context: Context, snapshot_path: Optional[Path] = None):
         # This lock protects the following objects:
         #   - self._events
         #   - self._num_syncs_done
@@ -162,6 +261,17 @@ class EventProcessor:
         self._context = context
         self._rpc_working = True
         self._chain_ids = {self._context.source_chain.id, self._context.target_chain.id}
+        self._direction_labels = (self._context.source_chain.id, self._context.target_chain.id)
+        self._snapshot_path = snapshot_path
+        self._last_snapshot_time = time.monotonic()
+        # The blocks up to which (inclusive) the context was restored from a
+        # snapshot, per chain. Events from those blocks were already
+        # processed and must not be processed again.
+        self._restored_blocks: dict[ChainId, BlockNumber] = {}
+        # Whether the events of the initial sync were pruned, see _prune_history.
+        self._history_pruned = False
+        if snapshot_path is not None:
+            self._restore_snapshot(snapshot_path)
 
     @property
     def context(self) -> Context:
@@ -187,12 +297,81 @@ class EventProcessor:
         self._stop = True
         self._thread.join(_STOP_TIMEOUT)
 
+    def get_resume_block(self, chain_id: ChainId) -> Optional[BlockNumber]:
+        """Return the block from which events of ``chain_id`` need to be
+        fetched, or None if the processor needs the full event history."""
+        block_number = self._restored_blocks.get(chain_id)
+        if block_number is None:
+            return None
+        return BlockNumber(block_number + 1)
+
+    def _already_processed(self, event: Event) -> bool:
+        restored_block = self._restored_blocks.get(event.event_chain_id)
+        if restored_block is None:
+            return False
+        if isinstance(event, TxEvent):
+            return event.block_number <= restored_block
+        if isinstance(event, LatestBlockUpdatedEvent):
+            return event.block.number <= restored_block
+        return False
+
+    def _restore_snapshot(self, path: Path) -> None:
+        snapshot = beamer.agent.snapshot.load(path)
+        if snapshot is None:
+            return
+
+        events = beamer.agent.snapshot.restore(self._context, snapshot)
+        self._events.extend(events)
+        self._restored_blocks = snapshot.synced_blocks
+        self._context.logger.info(
+            "Restored snapshot",
+            path=str(path),
+            synced_blocks=self._restored_blocks,
+            num_requests=len(self._context.requests),
+            num_claims=len(self._context.claims),
+            num_events=len(events),
+        )
+
+    def _write_snapshot(self) -> None:
+        assert self._snapshot_path is not None
+        with self._lock:
+            events = self._events[:]
+        snapshot = beamer.agent.snapshot.take(self._context, events)
+        if snapshot is None:
+            return
+        beamer.agent.snapshot.write(self._snapshot_path, snapshot)
+        self._last_snapshot_time = time.monotonic()
+        self._context.logger.debug(
+            "Wrote snapshot", path=str(self._snapshot_path), synced_blocks=snapshot.synced_blocks
+        )
+
+    def _maybe_write_snapshot(self) -> None:
+        if self._snapshot_path is None:
+            return
+        elapsed = time.monotonic() - self._last_snapshot_time
+        if elapsed >= self._context.config.snapshot_interval:
+            self._write_snapshot()
+
     def add_events(self, events: list[Event]) -> None:
+        for event in events:
+            if isinstance(event, _CACHE_INVALIDATING_EVENTS):
+                invalidate_cached_calls(
+                    event.event_chain_id, event.event_address, type(event).__name__
+                )
+        if self._restored_blocks:
+            events = [event for event in events if not self._already_processed(event)]
+        events = coalesce_latest_blocks(events)
         with self._lock:
             self._events.extend(events)
-            self._context.logger.debug("New events", events=events)
+            num_events = len(self._events)
+        self._context.logger.debug("New events", events=events)
+        self._record_queue_depth(num_events)
         self._have_new_events.set()
 
+    def _record_queue_depth(self, num_events: int) -> None:
+        with beamer.agent.metrics.update() as data:
+            data.event_queue_depth.labels(*self._direction_labels).set(num_events)
+
     def set_rpc_working(self, rpc_working: bool) -> None:
         self._rpc_working = rpc_working
 
@@ -208,16 +387,36 @@ class EventProcessor:
         while not self._stop:
             if self._have_new_events.wait(EventProcessor._WAIT_TIME):
                 self._have_new_events.clear()
-            if self._events:
-                self._process_events()
+            self._process_iteration()
 
-            if not self._rpc_working:
-                continue
+        if self._snapshot_path is not None and self._synced:
+            self._write_snapshot()
+        self._context.logger.info("EventProcessor stopped")
 
-            process_requests(self._context)
-            process_claims(self._context)
+    def _prune_history(self) -> None:
+        # Before processing the events of the initial sync, drop the ones of
+        # requests that were settled long ago, so that only live requests and
+        # claims enter the context.
+        with self._lock:
+            num_events = len(self._events)
+            self._events[:] = prune_settled_requests(self._events, self._context)
+            num_pruned = num_events - len(self._events)
+        self._history_pruned = True
+        self._context.logger.info("Pruned settled requests", num_events=num_pruned)
 
-        self._context.logger.info("EventProcessor stopped")
+    def _process_iteration(self) -> None:
+        if not self._history_pruned:
+            self._prune_history()
+
+        if self._events:
+            self._process_events()
+
+        if not self._rpc_working:
+            return
+
+        process_requests(self._context)
+        process_claims(self._context)
+        self._maybe_write_snapshot()
 
     def _process_events(self) -> None:
         iteration = 0
@@ -225,8 +424,11 @@ class EventProcessor:
         while True:
             t1 = time.time()
             with self._lock:
-                events = self._events[:]
+                queued = self._events[:]
 
+            # Events queued by several polls may include several latest
+            # blocks of a chain, of which only the newest needs processing.
+            events = coalesce_latest_blocks(queued)
             unprocessed: list[Event] = []
             any_state_changed = False
             for event in events:
@@ -242,15 +444,19 @@ class EventProcessor:
             # back of the list, as opposed to the front, may avoid an extra
             # iteration over all events.
             with self._lock:
-                del self._events[: len(events)]
+                del self._events[: len(queued)]
                 self._events.extend(unprocessed)
+                num_events = len(self._events)
 
             t2 = time.time()
+            with beamer.agent.metrics.update() as data:
+                data.event_processing_duration.labels(*self._direction_labels).observe(t2 - t1)
+                data.event_queue_depth.labels(*self._direction_labels).set(num_events)
             self._context.logger.debug(
                 "Finished iteration",
                 iteration=iteration,
                 any_state_changed=any_state_changed,
-                num_events=len(self._events),
+                num_events=num_events,
                 duration=round((t2 - t1) * 1e3, 3),
             )
             iteration += 1
@@ -264,16 +470,22 @@ class EventProcessor:
         # events has been processed.
         with self._lock:
             self._events.extend(created_events)
+            num_events = len(self._events)
+        self._record_queue_depth(num_events)
 
 
 def process_requests(context: Context) -> None:
     to_remove = []
     for request in context.requests:
+        # Filling and claiming are latency-critical, so their requests are
+        # served before e.g. those fetching historical events.
         if request.pending.is_active:
-            fill_request(request, context)
+            with request_priority(RequestPriority.FILL):
+                fill_request(request, context)
 
         elif request.filled.is_active:
-            claim_request(request, context)
+            with request_priority(RequestPriority.FILL):
+                claim_request(request, context)
 
         elif request.withdrawn.is_active or request.ignored.is_active:
             active_claims = any(claim.request_id == request.id for claim in context.claims)
@@ -283,6 +495,8 @@ def process_requests(context: Context) -> None:
 
     for request_id in to_remove:
         context.requests.remove(request_id)
+        if context.fill_preparer is not None:
+            context.fill_preparer.discard(request_id)
 
 
 def process_claims(context: Context) -> None:
@@ -336,8 +550,22 @@ def process_claims(context: Context) -> None:
         context.claims.remove(claim_id)
 
 
+def _replace_pending_after(context: Context, chain: Chain) -> Optional[float]:
+    """Return the time after which pending transactions on ``chain`` are
+    replaced, see :func:`beamer.util.transact`."""
+    return context.config.chains[chain.name].replace_pending_after
+
+
 def fill_request(request: Request, context: Context) -> None:
-    chain_id = ChainId(context.fill_manager.w3.eth.chain_id)
+    # A request with a competing fill pending is skipped before taking the
+    # fill mutex, so that other requests of the same token go first. It is
+    # retried once the competing fill is mined or dropped.
+    mempool_watcher = context.mempool_watcher
+    if mempool_watcher is not None and mempool_watcher.is_contested(request.id):
+        context.logger.debug("Competing fill pending, skipping request", request_id=request.id)
+        return
+
+    chain_id = context.target_chain.id
     token_address = request.target_token_address
     mutex = context.fill_mutexes[(chain_id, token_address)]
     t = time.time()
@@ -356,14 +584,55 @@ def _fill_request_exclusive(request: Request, context: Context) -> None:
     unsafe_time = request.valid_until - context.config.unsafe_fill_time
     if time.time() >= unsafe_time:
         context.logger.info("Request fill is unsafe, ignoring", request=request)
-        request.ignore()
+        _ignore_request(request, context)
         return
 
-    if block["timestamp"] >= request.valid_until:
+    if block.timestamp >= request.valid_until:
         context.logger.info("Request expired, ignoring", request=request)
-        request.ignore()
+        _ignore_request(request, context)
+        return
+
+    sent_time = None
+
+    def on_sent() -> None:
+        nonlocal sent_time
+        sent_time = time.time()
+
+    try:
+        receipt = None
+        if context.fill_preparer is not None:
+            receipt = context.fill_preparer.send(request, context, on_sent)
+        if receipt is None:
+            receipt = _send_fill(request, context, on_sent)
+    except TransactionFailed as exc:
+        context.logger.error("fillRequest failed", request_id=request.id, exc=exc)
+        return
+    if receipt is None:
         return
+    confirmed_time = time.time()
+
+    request.try_to_fill()
+    target_web3 = context.fill_manager.w3
+    token = target_web3.eth.contract(abi=get_ERC20_abi(), address=request.target_token_address)
+    context.logger.info(
+        "Filled request",
+        request=request,
+        txn_hash=receipt.transactionHash.hex(),  # type: ignore
+        token=token.functions.symbol().call(),
+    )
+    assert sent_time is not None
+    _record_fill_latency(request, context, sent_time, confirmed_time)
+
 
+def _ignore_request(request: Request, context: Context) -> None:
+    request.ignore()
+    if context.fill_preparer is not None:
+        context.fill_preparer.discard(request.id)
+
+
+def _send_fill(
+    request: Request, context: Context, on_sent: Callable[[], None]
+) -> Optional[TxReceipt]:
     source_web3 = context.request_manager.w3
     source_address = source_web3.eth.default_account
     assert not isinstance(source_address, Empty)
@@ -377,7 +646,7 @@ def _fill_request_exclusive(request: Request, context: Context) -> None:
             min_source_balance=min_source_balance,
             source_balance=source_balance,
         )
-        return
+        return None
 
     target_web3 = context.fill_manager.w3
     token = target_web3.eth.contract(abi=get_ERC20_abi(), address=request.target_token_address)
@@ -390,7 +659,7 @@ def _fill_request_exclusive(request: Request, context: Context) -> None:
             request_amount=request.amount,
             request_id=request.id,
         )
-        return
+        return None
 
     allowance = context.config.token_checker.allowance(request.target_chain_id, token.address)
     if allowance is None:
@@ -403,7 +672,7 @@ def _fill_request_exclusive(request: Request, context: Context) -> None:
             allowance=allowance,
             request_amount=request.amount,
         )
-        return
+        return None
 
     context.logger.debug("fillRequest started", request_id=request.id)
 
@@ -416,28 +685,54 @@ def _fill_request_exclusive(request: Request, context: Context) -> None:
             transact(func)
         except TransactionFailed as exc:
             context.logger.error("approve failed", request_id=request.id, exc=exc)
-            return
+            return None
 
-    func = context.fill_manager.functions.fillRequest(
-        sourceChainId=request.source_chain_id,
-        targetTokenAddress=request.target_token_address,
-        targetReceiverAddress=request.target_address,
-        amount=request.amount,
-        nonce=request.nonce,
+    func = make_fill_function(request, context)
+    return transact(
+        func,
+        on_sent=on_sent,
+        gas_key=request.target_token_address,
+        replace_after=_replace_pending_after(context, context.target_chain),
+        deadline=request.valid_until,
     )
-    try:
-        receipt = transact(func)
-    except TransactionFailed as exc:
-        context.logger.error("fillRequest failed", request_id=request.id, exc=exc)
+
+
+def _record_fill_latency(
+    request: Request, context: Context, sent_time: float, confirmed_time: float
+) -> None:
+    # The creation block is looked up only after the fill, so as not to
+    # delay the fill itself.
+    if request.created_block is None:
         return
+    labels = request.source_chain_id, request.target_chain_id
+    header_store = context.source_chain.header_store
+    if header_store is not None:
+        created_time = header_store.get_timestamp(request.created_block)
+        if created_time is not None:
+            _observe_fill_latency(labels, created_time, sent_time, confirmed_time)
+            return
+
+    # Fetching the block would hold up the event processor, so the metric
+    # is recorded in the background.
+    def fetch_and_observe(created_block: BlockNumber) -> None:
+        try:
+            block = context.request_manager.w3.eth.get_block(created_block)
+        except (requests.exceptions.RequestException, ValueError) as exc:
+            context.logger.warning("Failed to record fill latency", exc=exc)
+            return
+        if header_store is not None:
+            header_store.add(BlockHeader.from_block(block))
+        _observe_fill_latency(labels, block["timestamp"], sent_time, confirmed_time)
+
+    context.task_pool.submit(fetch_and_observe, request.created_block)
 
-    request.try_to_fill()
-    context.logger.info(
-        "Filled request",
-        request=request,
-        txn_hash=receipt.transactionHash.hex(),  # type: ignore
-        token=token.functions.symbol().call(),
-    )
+
+def _observe_fill_latency(
+    labels: tuple[ChainId, ChainId], created_time: int, sent_time: float, confirmed_time: float
+) -> None:
+    with beamer.agent.metrics.update() as data:
+        data.fill_latency.labels(*labels, "sent").observe(sent_time - created_time)
+        data.fill_latency.labels(*labels, "confirmed").observe(confirmed_time - created_time)
 
 
 def claim_request(request: Request, context: Context) -> None:
@@ -445,7 +740,7 @@ def claim_request(request: Request, context: Context) -> None:
         return
 
     block = context.latest_blocks[request.source_chain_id]
-    if block["timestamp"] >= request.valid_until + context.claim_request_extension:
+    if block.timestamp >= request.valid_until + context.claim_request_extension:
         context.logger.info("Request expired, ignoring", request=request)
         request.ignore()
         return
@@ -454,7 +749,13 @@ def claim_request(request: Request, context: Context) -> None:
 
     func = context.request_manager.functions.claimRequest(request.id, request.fill_id)
     try:
-        receipt = transact(func, value=stake)
+        receipt = transact(
+            func,
+            value=stake,
+            gas_key=request.source_token_address,
+            replace_after=_replace_pending_after(context, context.source_chain),
+            deadline=request.valid_until + context.claim_request_extension,
+        )
     except TransactionFailed as exc:
         context.logger.error(
             "claimRequest failed",
@@ -497,7 +798,7 @@ def maybe_challenge(claim: Claim, context: Context) -> bool:
         return False
 
     block = context.latest_blocks[request.source_chain_id]
-    if block["timestamp"] >= claim.termination:
+    if block.timestamp >= claim.termination:
         return False
     if int(time.time()) < claim.challenge_back_off_timestamp:
         return False
@@ -527,7 +828,13 @@ def maybe_challenge(claim: Claim, context: Context) -> bool:
 
     func = context.request_manager.functions.challengeClaim(claim.id)
     try:
-        receipt = transact(func, value=stake)
+        receipt = transact(
+            func,
+            value=stake,
+            gas_key=request.source_token_address,
+            replace_after=_replace_pending_after(context, context.source_chain),
+            deadline=claim.termination,
+        )
     except TransactionFailed as exc:
         context.logger.error("challengeClaim failed", claim=claim, exc=exc, stake=stake)
         return False
@@ -769,7 +1076,7 @@ def maybe_withdraw(claim: Claim, context: Context) -> None:
         _withdraw(claim, context)
 
     # Otherwise check that the challenge period is over
-    elif block["timestamp"] >= claim.termination:
+    elif block.timestamp >= claim.termination:
         winning_addresses = claim.get_winning_addresses()
         if context.address in winning_addresses:
             _withdraw(claim, context)
@@ -778,7 +1085,9 @@ def maybe_withdraw(claim: Claim, context: Context) -> None:
 def _withdraw(claim: Claim, context: Context) -> None:
     func = context.request_manager.functions.withdraw(claim.id)
     try:
-        receipt = transact(func)
+        receipt = transact(
+            func, replace_after=_replace_pending_after(context, context.source_chain)
+        )
     except TransactionFailed as exc:
         # Ignore the exception when the claim has been withdrawn already
         if "Claim already withdrawn" in str(exc):
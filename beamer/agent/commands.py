@@ -2,7 +2,7 @@ import signal
 import sys
 from importlib.metadata import version
 from pathlib import Path
-from typing import Optional
+from typing import Optional, Union
 
 import click
 import structlog
@@ -11,12 +11,14 @@ import beamer.agent.config
 import beamer.contracts
 import beamer.util
 from beamer.agent.agent import Agent
+from beamer.agent.async_agent import AsyncAgent
+from beamer.agent.processes import ProcessAgent
 from beamer.relayer import get_relayer_executable
 
 log = structlog.get_logger(__name__)
 
 
-def _sigint_handler(agent: Agent) -> None:
+def _sigint_handler(agent: Union[Agent, ProcessAgent]) -> None:
     signal.signal(signal.SIGINT, signal.SIG_IGN)
     log.info("Received SIGINT, shutting down")
     agent.stop()
@@ -87,6 +89,13 @@ def _sigint_handler(agent: Agent) -> None:
     show_default=True,
     help="Provide Prometheus metrics on PORT.",
 )
+@click.option(
+    "--execution-mode",
+    type=click.Choice(("threads", "processes", "asyncio")),
+    help="""Run all transfer directions as threads of a single process, each event monitor
+    and each transfer direction in its own process, or all of them as tasks of a single asyncio
+    event loop. Default: threads""",
+)
 @click.option(
     "--base-chain",
     type=str,
@@ -122,6 +131,7 @@ def agent(
     unsafe_fill_time: Optional[int],
     poll_period: Optional[float],
     confirmation_blocks: Optional[int],
+    execution_mode: Optional[str],
 ) -> None:
     """Start Beamer Bridge Agent"""
 
@@ -144,6 +154,7 @@ def agent(
         "poll-period": poll_period,
         "base-chain.rpc-url": base_chain,
         "confirmation-blocks": confirmation_blocks,
+        "execution-mode": execution_mode,
     }
 
     for chainspec in chain:
@@ -152,7 +163,7 @@ def agent(
 
     config = beamer.agent.config.load(config_path, options)
 
-    beamer.util.setup_logging(log_level=config.log_level.upper(), log_json=False)
+    beamer.util.setup_logging(log_level=config.log_level.upper(), log_json=False, threaded=True)
     log.info("Running beamer bridge agent", version=version("beamer"))
     log.info(f"Using account {config.account.address}")
 
@@ -160,7 +171,13 @@ def agent(
         log.error("No relayer found")
         sys.exit(1)
 
-    agent = Agent(config)
+    agent: Union[Agent, ProcessAgent]
+    if config.execution_mode == "processes":
+        agent = ProcessAgent(config)
+    elif config.execution_mode == "asyncio":
+        agent = AsyncAgent(config)
+    else:
+        agent = Agent(config)
     signal.signal(signal.SIGINT, lambda *_unused: _sigint_handler(agent))
     agent.start()
     agent.wait()
@@ -1,6 +1,6 @@
 import copy
 import itertools
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from pathlib import Path
 from typing import Any, Optional
 
@@ -9,6 +9,8 @@ from eth_account.signers.local import LocalAccount
 from eth_utils import to_wei
 
 from beamer.agent.util import TokenChecker
+from beamer.middleware import DEFAULT_MAX_CONCURRENT_REQUESTS
+from beamer.provider import DEFAULT_POOL_SIZE
 from beamer.typing import URL
 from beamer.util import account_from_keyfile
 
@@ -23,6 +25,39 @@ class ChainConfig:
     min_source_balance: int
     confirmation_blocks: int
     poll_period: float
+    # Limits of the requests issued to the chain's RPC, see beamer.middleware.
+    max_concurrent_requests: int = DEFAULT_MAX_CONCURRENT_REQUESTS
+    max_requests_per_second: Optional[float] = None
+    compute_units_per_second: Optional[float] = None
+    # Compute units by JSON-RPC method, overriding the default ones.
+    compute_units: dict[str, float] = field(default_factory=dict)
+    # Endpoints used if rpc_url stops working, see beamer.provider.
+    fallback_rpc_urls: list[URL] = field(default_factory=list)
+    hedged_requests: bool = False
+    # The HTTP connection pool of each RPC endpoint, see beamer.provider.
+    pool_size: int = DEFAULT_POOL_SIZE
+    keep_alive: bool = True
+    # Whether to use the fused middleware, see beamer.middleware.
+    fused_middleware: bool = False
+    # Seconds after which pending transactions are replaced by ones with
+    # higher fees, see beamer.util.transact. None disables replacements.
+    replace_pending_after: Optional[float] = None
+    # Whether to watch the mempool for competing fills, see beamer.agent.mempool.
+    watch_mempool: bool = False
+    # Whether to skip eth_getLogs calls based on logs blooms, see beamer.events.
+    bloom_prefilter: bool = True
+
+
+@dataclass
+class ShardConfig:
+    # Transfer directions owned by this agent process, as pairs of chain
+    # names. None means all directions.
+    directions: Optional[list[tuple[str, str]]]
+    # Token equivalence classes owned by this agent process, by their name
+    # in the [tokens] section. None means all token classes.
+    tokens: Optional[list[str]]
+    # Directory holding the lock files shared by all agent processes.
+    lock_dir: Optional[Path]
 
 
 @dataclass
@@ -37,6 +72,14 @@ class Config:
     prometheus_metrics_port: Optional[int]
     log_level: str
     chains: dict[str, ChainConfig]
+    snapshot_dir: Optional[Path] = None
+    snapshot_interval: float = 300.0
+    header_store_dir: Optional[Path] = None
+    shard: Optional[ShardConfig] = None
+    execution_mode: str = "threads"
+    # Whether to prepare fill transactions in the background, see
+    # beamer.agent.prepare.
+    prepare_fills: bool = False
 
 
 def _set_value(config: dict[str, Any], key: str, value: Any) -> None:
@@ -96,9 +139,57 @@ def _default_config() -> dict:
         "tokens": {},
         "poll-period": 5.0,
         "confirmation-blocks": 0,
+        "max-concurrent-requests": DEFAULT_MAX_CONCURRENT_REQUESTS,
+        "compute-units": {},
+        "hedged-requests": False,
+        "pool-size": DEFAULT_POOL_SIZE,
+        "keep-alive": True,
+        "fused-middleware": False,
+        "snapshot": {"interval": 300.0},
+        "execution-mode": "threads",
+        "prepare-fills": False,
+        "watch-mempool": False,
+        "bloom-prefilter": True,
     }
 
 
+def _parse_direction(direction: str, chain_names: set[str]) -> tuple[str, str]:
+    try:
+        source, target = (name.strip() for name in direction.split("->"))
+    except ValueError as exc:
+        raise ConfigError(f"invalid direction {direction!r}, expected 'SOURCE -> TARGET'") from exc
+    for name in (source, target):
+        if name not in chain_names:
+            raise ConfigError(f"unknown chain {name!r} in direction {direction!r}")
+    return source, target
+
+
+def _load_shard_config(config: dict[str, Any]) -> Optional[ShardConfig]:
+    shard = config.get("shard")
+    if shard is None:
+        return None
+
+    directions = shard.get("directions")
+    if directions is not None:
+        chain_names = set(config["chains"])
+        directions = [_parse_direction(direction, chain_names) for direction in directions]
+
+    tokens = shard.get("tokens")
+    if tokens is not None:
+        unknown = set(tokens) - set(config["tokens"])
+        if unknown:
+            raise ConfigError(f"unknown token classes in shard config: {sorted(unknown)}")
+
+    lock_dir = shard.get("lock-dir")
+    return ShardConfig(
+        directions=directions,
+        tokens=tokens,
+        lock_dir=Path(lock_dir) if lock_dir is not None else None,
+    )
+
+
+_EXECUTION_MODES = ("threads", "processes", "asyncio")
+
 _REQUIRED_KEYS = (
     "confirmation-blocks",
     "artifacts-dir",
@@ -128,18 +219,77 @@ def load(config_path: Path, options: dict[str, Any]) -> Config:
     chains = {}
 
     for chain_name, chain_info in config["chains"].items():
+        max_concurrent_requests = chain_info.get(
+            "max-concurrent-requests", config["max-concurrent-requests"]
+        )
+        if max_concurrent_requests < 1:
+            raise ConfigError(f"max-concurrent-requests of chain {chain_name} must be at least 1")
+        max_requests_per_second = chain_info.get(
+            "max-requests-per-second", config.get("max-requests-per-second")
+        )
+        compute_units_per_second = chain_info.get(
+            "compute-units-per-second", config.get("compute-units-per-second")
+        )
+        if compute_units_per_second is not None and compute_units_per_second <= 0:
+            raise ConfigError(f"compute-units-per-second of chain {chain_name} must be positive")
+        compute_units = {**config["compute-units"], **chain_info.get("compute-units", {})}
+        negative = sorted(method for method, units in compute_units.items() if units < 0)
+        if negative:
+            raise ConfigError(f"negative compute units of chain {chain_name}: {negative}")
+        replace_pending_after = chain_info.get(
+            "replace-pending-after", config.get("replace-pending-after")
+        )
+        if replace_pending_after is not None and replace_pending_after <= 0:
+            raise ConfigError(f"replace-pending-after of chain {chain_name} must be positive")
+        pool_size = chain_info.get("pool-size", config["pool-size"])
+        if pool_size < 1:
+            raise ConfigError(f"pool-size of chain {chain_name} must be at least 1")
+        fallback_rpc_urls = chain_info.get("fallback-rpc-urls", [])
+        if not isinstance(fallback_rpc_urls, list):
+            raise ConfigError(f"fallback-rpc-urls of chain {chain_name} must be a list")
         chains[chain_name] = ChainConfig(
             URL(chain_info["rpc-url"]),
             to_wei(chain_info.get("min-source-balance", config["min-source-balance"]), "ether"),
             chain_info.get("confirmation-blocks", config["confirmation-blocks"]),
             float(chain_info.get("poll-period", config["poll-period"])),
+            max_concurrent_requests=max_concurrent_requests,
+            max_requests_per_second=(
+                float(max_requests_per_second) if max_requests_per_second is not None else None
+            ),
+            compute_units_per_second=(
+                float(compute_units_per_second) if compute_units_per_second is not None else None
+            ),
+            compute_units={method: float(units) for method, units in compute_units.items()},
+            fallback_rpc_urls=[URL(url) for url in fallback_rpc_urls],
+            hedged_requests=chain_info.get("hedged-requests", config["hedged-requests"]),
+            pool_size=pool_size,
+            keep_alive=chain_info.get("keep-alive", config["keep-alive"]),
+            fused_middleware=chain_info.get("fused-middleware", config["fused-middleware"]),
+            replace_pending_after=(
+                float(replace_pending_after) if replace_pending_after is not None else None
+            ),
+            watch_mempool=chain_info.get("watch-mempool", config["watch-mempool"]),
+            bloom_prefilter=chain_info.get("bloom-prefilter", config["bloom-prefilter"]),
         )
 
     path = Path(_get_value(config, "account.path"))
     password = _get_value(config, "account.password")
     account = account_from_keyfile(path, password)
 
-    token_checker = TokenChecker(list(config["tokens"].values()))
+    shard = _load_shard_config(config)
+    tokens = config["tokens"]
+    if shard is not None and shard.tokens is not None:
+        # Requests for tokens outside of the shard are simply considered
+        # invalid, so they are left to the agent processes owning them.
+        tokens = {name: tokens[name] for name in shard.tokens}
+    token_checker = TokenChecker(list(tokens.values()))
+    snapshot_dir = _lookup_value(config, "snapshot.dir")
+    header_store_dir = _lookup_value(config, "header-store.dir")
+    execution_mode = _get_value(config, "execution-mode")
+    if execution_mode not in _EXECUTION_MODES:
+        raise ConfigError(
+            f"invalid execution mode {execution_mode!r}, expected one of {_EXECUTION_MODES}"
+        )
 
     return Config(
         account=account,
@@ -152,4 +302,10 @@ def load(config_path: Path, options: dict[str, Any]) -> Config:
         prometheus_metrics_port=_lookup_value(config, "metrics.prometheus-port"),
         log_level=_get_value(config, "log-level"),
         chains=chains,
+        snapshot_dir=Path(snapshot_dir) if snapshot_dir is not None else None,
+        snapshot_interval=float(_get_value(config, "snapshot.interval")),
+        header_store_dir=Path(header_store_dir) if header_store_dir is not None else None,
+        shard=shard,
+        execution_mode=execution_mode,
+        prepare_fills=config["prepare-fills"],
     )
@@ -0,0 +1,212 @@
+import fcntl
+import mmap
+import os
+import struct
+import threading
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Iterable, Optional
+
+import structlog
+from hexbytes import HexBytes
+from web3.types import BlockData
+
+from beamer.typing import BlockNumber, ChainId
+
+log = structlog.get_logger(__name__)
+
+# The header store.
+#
+# The agent only needs a few fields of the blocks containing its events,
+# mostly the timestamp. Instead of fetching these blocks again after every
+# restart, their headers are kept in an append-only file per chain:
+#
+#   magic (8 bytes) | chain ID (8 bytes) | record | record | ...
+#
+# Each record has a fixed size and holds the block number, hash, parent hash,
+# timestamp and base fee of one block. The file is memory-mapped for lookups
+# and an in-memory index maps block numbers to record offsets. If a block is
+# added again, e.g. after a reorg, the later record wins.
+#
+# New headers are buffered and appended in batches of _FLUSH_SIZE, so that
+# filling the store during a backfill does not cost a write per block.
+# Appends are made with a single write(2) while holding an flock(2) on the
+# file, so several agent processes can share the same store. Records written
+# by other processes are picked up on the next lookup that misses.
+
+_MAGIC = b"BEAMHDR1"
+_FILE_HEADER = struct.Struct("<8sQ")
+_RECORD = struct.Struct("<Q32s32sQQ")
+
+# Stands in for the base fee of blocks before EIP-1559.
+_NO_BASE_FEE = 2**64 - 1
+
+# The number of buffered headers that triggers an append.
+_FLUSH_SIZE = 64
+
+
+@dataclass(frozen=True)
+class BlockHeader:
+    number: BlockNumber
+    hash: HexBytes
+    parent_hash: HexBytes
+    timestamp: int
+    base_fee: Optional[int]
+
+    @staticmethod
+    def from_block(block: BlockData) -> "BlockHeader":
+        return BlockHeader(
+            number=block["number"],
+            hash=HexBytes(block["hash"]),
+            parent_hash=HexBytes(block["parentHash"]),
+            timestamp=block["timestamp"],
+            base_fee=block.get("baseFeePerGas"),
+        )
+
+    @staticmethod
+    def from_rpc_result(block: dict[str, Any]) -> "BlockHeader":
+        """Return the header of an unformatted eth_getBlockByNumber result."""
+        base_fee = block.get("baseFeePerGas")
+        return BlockHeader(
+            number=BlockNumber(int(block["number"], 16)),
+            hash=HexBytes(block["hash"]),
+            parent_hash=HexBytes(block["parentHash"]),
+            timestamp=int(block["timestamp"], 16),
+            base_fee=None if base_fee is None else int(base_fee, 16),
+        )
+
+
+def _pack(header: BlockHeader) -> bytes:
+    base_fee = _NO_BASE_FEE if header.base_fee is None else header.base_fee
+    return _RECORD.pack(header.number, header.hash, header.parent_hash, header.timestamp, base_fee)
+
+
+def _unpack(data: mmap.mmap, offset: int) -> BlockHeader:
+    number, hash_, parent_hash, timestamp, base_fee = _RECORD.unpack_from(data, offset)
+    return BlockHeader(
+        number=BlockNumber(number),
+        hash=HexBytes(hash_),
+        parent_hash=HexBytes(parent_hash),
+        timestamp=timestamp,
+        base_fee=None if base_fee == _NO_BASE_FEE else base_fee,
+    )
+
+
+def header_store_path(header_store_dir: Path, chain_id: ChainId) -> Path:
+    return header_store_dir.joinpath(f"headers-{chain_id}.bin")
+
+
+class HeaderStore:
+    """A persistent store of block headers of a single chain, see above."""
+
+    def __init__(self, path: Path, chain_id: ChainId) -> None:
+        self._path = path
+        self._chain_id = chain_id
+        self._lock = threading.Lock()
+        self._fd = os.open(path, os.O_RDWR | os.O_CREAT | os.O_APPEND, 0o644)
+        self._map: Optional[mmap.mmap] = None
+        self._size = _FILE_HEADER.size
+        self._index: dict[BlockNumber, int] = {}
+        self._pending: dict[BlockNumber, BlockHeader] = {}
+        try:
+            self._open()
+        except BaseException:
+            os.close(self._fd)
+            raise
+
+    @property
+    def path(self) -> Path:
+        return self._path
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._index.keys() | self._pending.keys())
+
+    def _open(self) -> None:
+        fcntl.flock(self._fd, fcntl.LOCK_EX)
+        try:
+            size = os.fstat(self._fd).st_size
+            file_header = os.pread(self._fd, _FILE_HEADER.size, 0)
+            valid = size >= _FILE_HEADER.size and _FILE_HEADER.unpack(file_header) == (
+                _MAGIC,
+                self._chain_id,
+            )
+            if not valid:
+                if size > 0:
+                    log.warning("Discarding invalid header store", path=str(self._path))
+                os.ftruncate(self._fd, 0)
+                os.write(self._fd, _FILE_HEADER.pack(_MAGIC, self._chain_id))
+            elif (size - _FILE_HEADER.size) % _RECORD.size:
+                # A partial record left by a crash.
+                os.ftruncate(self._fd, size - (size - _FILE_HEADER.size) % _RECORD.size)
+        finally:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+        self._refresh()
+
+    def _refresh(self) -> bool:
+        """Index the records appended since the last refresh. Return whether
+        there were any."""
+        size = os.fstat(self._fd).st_size
+        size -= (size - _FILE_HEADER.size) % _RECORD.size
+        if size <= self._size:
+            return False
+
+        if self._map is not None:
+            self._map.close()
+        self._map = mmap.mmap(self._fd, size, access=mmap.ACCESS_READ)
+        for offset in range(self._size, size, _RECORD.size):
+            (number,) = struct.unpack_from("<Q", self._map, offset)
+            self._index[BlockNumber(number)] = offset
+        self._size = size
+        return True
+
+    def get(self, number: BlockNumber) -> Optional[BlockHeader]:
+        with self._lock:
+            header = self._pending.get(number)
+            if header is not None:
+                return header
+            offset = self._index.get(number)
+            if offset is None and self._refresh():
+                offset = self._index.get(number)
+            if offset is None:
+                return None
+            assert self._map is not None
+            return _unpack(self._map, offset)
+
+    def get_timestamp(self, number: BlockNumber) -> Optional[int]:
+        header = self.get(number)
+        return None if header is None else header.timestamp
+
+    def add(self, header: BlockHeader) -> None:
+        self.add_many((header,))
+
+    def add_many(self, headers: Iterable[BlockHeader]) -> None:
+        with self._lock:
+            for header in headers:
+                self._pending[header.number] = header
+            if len(self._pending) >= _FLUSH_SIZE:
+                self._flush()
+
+    def flush(self) -> None:
+        with self._lock:
+            self._flush()
+
+    def _flush(self) -> None:
+        if not self._pending:
+            return
+        data = b"".join(map(_pack, self._pending.values()))
+        fcntl.flock(self._fd, fcntl.LOCK_EX)
+        try:
+            os.write(self._fd, data)
+        finally:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+        self._pending.clear()
+        self._refresh()
+
+    def close(self) -> None:
+        with self._lock:
+            self._flush()
+            if self._map is not None:
+                self._map.close()
+                self._map = None
+            os.close(self._fd)
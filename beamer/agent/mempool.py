@@ -0,0 +1,131 @@
+"""Detection of competing fills in the target chain's mempool.
+
+The agent only learns that a request was filled by another LP once the
+``RequestFilled`` event of a confirmed block is processed. A fill sent in the
+meantime reverts and wastes its fees. :class:`MempoolWatcher` polls the
+pending transactions of the target chain via ``txpool_content``, decodes the
+``fillRequest`` calls to the fill manager and marks the requests they fill as
+contested, so that the agent does not try to fill them as well.
+
+``txpool_content`` is supported by geth, anvil and most other nodes that
+expose their transaction pool, but usually not by public RPC providers.
+"""
+import threading
+import time
+from typing import Any, Optional
+
+import requests
+import structlog
+from eth_utils import to_checksum_address
+from web3 import Web3
+from web3.contract import Contract
+from web3.exceptions import MethodUnavailable
+
+from beamer.typing import ChainId, ChecksumAddress, RequestId
+from beamer.util import create_request_id
+
+# How long, in seconds, a request stays contested after the competing fill
+# was last seen pending. Once the fill is mined, it is no longer in the
+# mempool, but its RequestFilled event is only processed after the block is
+# confirmed.
+_CONTESTED_TIME = 120.0
+
+
+class MempoolWatcher:
+    """Watches the mempool of a chain for fills by other LPs, see above.
+
+    If the competing fill is dropped, the request is filled by the agent as
+    usual once it is no longer contested.
+    """
+
+    def __init__(
+        self, web3: Web3, fill_manager: Contract, address: ChecksumAddress, poll_period: float
+    ) -> None:
+        self._web3 = web3
+        self._chain_id = ChainId(web3.eth.chain_id)
+        self._fill_manager = fill_manager
+        self._address = address
+        self._poll_period = poll_period
+        self._lock = threading.Lock()
+        # The contested requests and the time their fill was last seen.
+        self._contested: dict[RequestId, float] = {}
+        self._stop = threading.Event()
+        self._log = structlog.get_logger(type(self).__name__).bind(chain_id=self._chain_id)
+
+    def start(self) -> None:
+        self._stop.clear()
+        self._thread = threading.Thread(  # pylint: disable=attribute-defined-outside-init
+            name=f"MempoolWatcher[cid={self._chain_id}]", target=self._thread_func, daemon=True
+        )
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._thread.join(self._poll_period)
+
+    def is_contested(self, request_id: RequestId) -> bool:
+        """Return whether a fill of ``request_id`` by another LP was seen
+        pending recently."""
+        with self._lock:
+            seen_at = self._contested.get(request_id)
+        return seen_at is not None and time.monotonic() - seen_at < _CONTESTED_TIME
+
+    def poll(self) -> None:
+        """Check the pending transactions for competing fills."""
+        content = self._web3.geth.txpool.content()
+        request_ids = []
+        for sender, transactions in content["pending"].items():
+            if to_checksum_address(sender) == self._address:
+                continue
+            for transaction in transactions.values():
+                request_id = self._decode_fill(transaction)
+                if request_id is not None:
+                    request_ids.append(request_id)
+
+        now = time.monotonic()
+        with self._lock:
+            for request_id in request_ids:
+                if request_id not in self._contested:
+                    self._log.debug("Competing fill pending", request_id=request_id.hex())
+                self._contested[request_id] = now
+            for request_id, seen_at in list(self._contested.items()):
+                if now - seen_at >= _CONTESTED_TIME:
+                    del self._contested[request_id]
+
+    def _decode_fill(self, transaction: Any) -> Optional[RequestId]:
+        to = transaction.get("to")
+        if to is None or to_checksum_address(to) != self._fill_manager.address:
+            return None
+        try:
+            func, args = self._fill_manager.decode_function_input(transaction["input"])
+        except ValueError:
+            return None
+        if func.fn_name != "fillRequest":
+            return None
+        return create_request_id(
+            args["sourceChainId"],
+            self._chain_id,
+            args["targetTokenAddress"],
+            args["targetReceiverAddress"],
+            args["amount"],
+            args["nonce"],
+        )
+
+    def _thread_func(self) -> None:
+        self._log.info("MempoolWatcher started", fill_manager=self._fill_manager.address)
+        while not self._stop.is_set():
+            try:
+                self.poll()
+            except MethodUnavailable as exc:
+                self._log.error("Node does not support txpool_content, stopping", exc=exc)
+                break
+            except (ValueError, requests.exceptions.RequestException) as exc:
+                # Watching the mempool is an optimization only, so the agent
+                # keeps running if polling fails.
+                self._log.warning("Polling the mempool failed", exc=exc)
+            except Exception:
+                # E.g. a malformed transaction in the node's response. Keep
+                # polling, so that the watcher does not silently stop.
+                self._log.exception("Unexpected error while polling the mempool")
+            self._stop.wait(self._poll_period)
+        self._log.info("MempoolWatcher stopped")
@@ -1,18 +1,40 @@
 import contextlib
 import threading
 from dataclasses import dataclass
-from typing import Any, Generator
+from typing import Any, Generator, Mapping
 
 import structlog
-from prometheus_client import Counter, Info, start_http_server
+from prometheus_client import (
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    Info,
+    multiprocess,
+    start_http_server,
+)
+
+from beamer.typing import ChainId
 
 log = structlog.get_logger(__name__)
 
+_DIRECTION_LABELS = ("source_chain_id", "target_chain_id")
+
+# Fills take from a few seconds to several minutes, depending on the
+# configured fill wait time and the target chain.
+_FILL_LATENCY_BUCKETS = (1, 2, 5, 10, 20, 30, 60, 120, 300, 600, 1800, float("inf"))
 
-def init(config: Any, source_rpc_url: str, target_rpc_url: str) -> None:
+
+def init(
+    config: Any, source_rpc_url: str, target_rpc_url: str, rpc_urls: Mapping[ChainId, str]
+) -> None:
+    """Create the agent's metrics, unless already created, and record the
+    RPC URLs of the given chains."""
     global _DATA
 
     if _DATA is not None:
+        for chain_id, rpc_url in rpc_urls.items():
+            _DATA.chain_info.labels(chain_id=chain_id).info(dict(rpc_url=rpc_url))
         return
 
     info = Info("agent_info", "Agent information")
@@ -23,6 +45,9 @@ def init(config: Any, source_rpc_url: str, target_rpc_url: str) -> None:
             target_rpc_url=target_rpc_url,
         )
     )
+    chain_info = Info("chain", "Chain information", ["chain_id"])
+    for chain_id, rpc_url in rpc_urls.items():
+        chain_info.labels(chain_id=chain_id).info(dict(rpc_url=rpc_url))
     requests_filled = Counter(
         "requests_filled",
         "Number of requests filled on the target rollup, regardless of filler",
@@ -34,23 +59,89 @@ def init(config: Any, source_rpc_url: str, target_rpc_url: str) -> None:
         "requests_created", "Number of requests created on the source rollup"
     )
 
+    # Each chain is monitored by a single process and each direction is
+    # processed by a single process, so in multiprocess mode the values of
+    # live processes can simply be summed up.
+    sync_lag = Gauge(
+        "sync_lag_blocks",
+        "Number of blocks between the chain head and the last block events were fetched for",
+        ["chain_id"],
+        multiprocess_mode="livesum",
+    )
+    event_queue_depth = Gauge(
+        "event_queue_depth",
+        "Number of events waiting to be processed",
+        _DIRECTION_LABELS,
+        multiprocess_mode="livesum",
+    )
+    event_processing_duration = Histogram(
+        "event_processing_duration_seconds",
+        "Time spent on a single pass over the queued events",
+        _DIRECTION_LABELS,
+    )
+    fill_latency = Histogram(
+        "fill_latency_seconds",
+        "Time from the block containing a request until the agent sent the fill "
+        "transaction (stage=sent) or received its receipt (stage=confirmed)",
+        (*_DIRECTION_LABELS, "stage"),
+        buckets=_FILL_LATENCY_BUCKETS,
+    )
+
     _DATA = _Data(
         info=info,
+        chain_info=chain_info,
         requests_filled=requests_filled,
         requests_filled_by_agent=requests_filled_by_agent,
         requests_created=requests_created,
+        sync_lag=sync_lag,
+        event_queue_depth=event_queue_depth,
+        event_processing_duration=event_processing_duration,
+        fill_latency=fill_latency,
     )
     if config.prometheus_metrics_port is not None:
         log.info("Serving Prometheus metrics", port=config.prometheus_metrics_port)
         start_http_server(config.prometheus_metrics_port)
 
 
+def serve_multiprocess(config: Any, rpc_urls: Mapping[ChainId, str]) -> None:
+    """Serve the metrics collected by all agent processes.
+
+    Must be called from the parent process, with the PROMETHEUS_MULTIPROC_DIR
+    environment variable pointing to the directory shared by the child
+    processes. Child processes must not serve metrics themselves.
+    """
+    if config.prometheus_metrics_port is None:
+        return
+
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)
+    # Info metrics are not supported in multiprocess mode, so the parent
+    # process provides them itself.
+    info = Info("agent_info", "Agent information", registry=registry)
+    info.info(dict(account=config.account.address))
+    chain_info = Info("chain", "Chain information", ["chain_id"], registry=registry)
+    for chain_id, rpc_url in rpc_urls.items():
+        chain_info.labels(chain_id=chain_id).info(dict(rpc_url=rpc_url))
+    log.info("Serving Prometheus metrics", port=config.prometheus_metrics_port)
+    start_http_server(config.prometheus_metrics_port, registry=registry)
+
+
+def process_exited(pid: int) -> None:
+    """Clean up the metrics of an exited child process."""
+    multiprocess.mark_process_dead(pid)
+
+
 @dataclass
 class _Data:
     info: Info
+    chain_info: Info
     requests_filled: Counter
     requests_filled_by_agent: Counter
     requests_created: Counter
+    sync_lag: Gauge
+    event_queue_depth: Gauge
+    event_processing_duration: Histogram
+    fill_latency: Histogram
 
 
 _DATA: _Data = None  # type:ignore
@@ -1,23 +1,32 @@
 from typing import Optional
 
-import structlog
 from eth_typing import ChecksumAddress as Address
 from hexbytes import HexBytes
-from statemachine import State, StateMachine
 from web3.types import Timestamp, Wei
 
+from beamer.agent.models.fsm import State, StateMachine
 from beamer.agent.models.request import Request
 from beamer.events import ClaimMade
 from beamer.typing import ClaimId, FillId, RequestId, Termination
 
 
 class Claim(StateMachine):
+    __slots__ = (
+        "_latest_claim_made",
+        "_challenger_stakes",
+        "challenge_back_off_timestamp",
+        "transaction_pending",
+        "invalidation_tx",
+        "invalidation_timestamp",
+        "proved_tx",
+        "unprocessed_claim_made_events",
+    )
+
     def __init__(
         self,
         claim_made: ClaimMade,
         challenge_back_off_timestamp: int,
     ) -> None:
-        self._log = structlog.get_logger(type(self).__name__)
         self._latest_claim_made = claim_made
         self._challenger_stakes: dict[Address, int] = {}
         self.challenge_back_off_timestamp = challenge_back_off_timestamp
@@ -74,9 +83,6 @@ class Claim(StateMachine):
         | withdrawn.to(withdrawn)
     )
 
-    def on_enter_state(self) -> None:
-        self._log.debug("Claim changed state", claim=self)
-
     @property
     def id(self) -> ClaimId:
         return self._latest_claim_made.claim_id
@@ -101,6 +107,10 @@ class Claim(StateMachine):
     def latest_claim_made(self) -> ClaimMade:
         return self._latest_claim_made
 
+    @property
+    def challenger_stakes(self) -> dict[Address, int]:
+        return dict(self._challenger_stakes)
+
     def get_challenger_stake(self, challenger: Address) -> int:
         return self._challenger_stakes.get(challenger, 0)
 
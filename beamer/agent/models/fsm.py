@@ -0,0 +1,162 @@
+"""A minimal finite state machine for the agent's models.
+
+Models subclass :class:`StateMachine` and declare their states and
+transitions at class level, using the same notation as python-statemachine::
+
+    class Door(StateMachine):
+        __slots__ = ()
+
+        closed = State(initial=True)
+        opened = State()
+
+        open = closed.to(opened) | opened.to(opened)
+
+Unlike python-statemachine, the transitions of all events are compiled into
+a single lookup table per class when the class is created. An instance only
+stores the ID of its current state, so models can define ``__slots__`` and
+hold no per-instance machinery.
+
+Triggering an event calls the model's ``on_<event>`` method, if any, with the
+arguments passed to the event, and then moves the model to the target state.
+If the event is not allowed in the current state, :class:`TransitionNotAllowed`
+is raised and neither happens.
+"""
+from typing import Any, Callable, ClassVar, Optional
+
+import structlog
+
+from beamer.util import is_debug_logging_enabled
+
+log = structlog.get_logger(__name__)
+
+
+class TransitionNotAllowed(Exception):
+    def __init__(self, event: str, state: "State"):
+        self.event = event
+        self.state = state
+        super().__init__(f"Can't {event} when in {state.id}.")
+
+
+class State:
+    __slots__ = ("id", "initial")
+
+    def __init__(self, initial: bool = False):
+        self.id = ""
+        self.initial = initial
+
+    def __set_name__(self, owner: type, name: str) -> None:
+        self.id = name
+
+    def __get__(self, obj: Optional["StateMachine"], owner: type) -> Any:
+        if obj is None:
+            return self
+        return _BoundState(self, obj)
+
+    def to(self, target: "State") -> "Transitions":
+        return Transitions([(self, target)])
+
+    def __repr__(self) -> str:
+        return f"State({self.id!r})"
+
+
+class _BoundState:
+    __slots__ = ("_state", "_obj")
+
+    def __init__(self, state: State, obj: "StateMachine"):
+        self._state = state
+        self._obj = obj
+
+    @property
+    def id(self) -> str:
+        return self._state.id
+
+    @property
+    def is_active(self) -> bool:
+        return self._obj.current_state_value == self._state.id
+
+
+class Transitions:
+    """The transitions triggered by a single event."""
+
+    __slots__ = ("_pairs", "event")
+
+    def __init__(self, pairs: list[tuple[State, State]]):
+        self._pairs = pairs
+        self.event = ""
+
+    def __or__(self, other: "Transitions") -> "Transitions":
+        return Transitions(self._pairs + other._pairs)
+
+    def __set_name__(self, owner: type, name: str) -> None:
+        self.event = name
+
+    def __get__(self, obj: Optional["StateMachine"], owner: type) -> Any:
+        if obj is None:
+            return self
+        event = self.event
+
+        def trigger(*args: Any, **kwargs: Any) -> None:
+            obj.send(event, *args, **kwargs)
+
+        return trigger
+
+    def compile(self) -> dict[str, str]:
+        table: dict[str, str] = {}
+        for source, target in self._pairs:
+            assert source.id not in table, f"ambiguous transition {self.event} from {source.id}"
+            table[source.id] = target.id
+        return table
+
+
+class StateMachine:
+    __slots__ = ("current_state_value",)
+
+    # Compiled when a subclass is created, see __init_subclass__.
+    _states: ClassVar[dict[str, State]]
+    _initial_state: ClassVar[str]
+    # Maps each event to a mapping from source state ID to target state ID.
+    _transitions: ClassVar[dict[str, dict[str, str]]]
+    # Maps each event to the name of its on_<event> method, or None.
+    _callbacks: ClassVar[dict[str, Optional[str]]]
+
+    def __init_subclass__(cls, **kwargs: Any) -> None:
+        super().__init_subclass__(**kwargs)
+        states: dict[str, State] = {}
+        transitions: dict[str, dict[str, str]] = {}
+        for klass in reversed(cls.__mro__):
+            for value in vars(klass).values():
+                if isinstance(value, State):
+                    states[value.id] = value
+                elif isinstance(value, Transitions):
+                    transitions[value.event] = value.compile()
+
+        initial = [state.id for state in states.values() if state.initial]
+        assert len(initial) == 1, f"{cls.__name__} must have exactly one initial state"
+        cls._states = states
+        cls._initial_state = initial[0]
+        cls._transitions = transitions
+        cls._callbacks = {
+            event: f"on_{event}" if hasattr(cls, f"on_{event}") else None for event in transitions
+        }
+
+    def __init__(self) -> None:
+        self.current_state_value = self._initial_state
+
+    @property
+    def current_state(self) -> State:
+        return self._states[self.current_state_value]
+
+    def send(self, event: str, *args: Any, **kwargs: Any) -> None:
+        source = self.current_state_value
+        target = self._transitions[event].get(source)
+        if target is None:
+            raise TransitionNotAllowed(event, self._states[source])
+
+        callback_name = self._callbacks[event]
+        if callback_name is not None:
+            callback: Callable[..., None] = getattr(self, callback_name)
+            callback(*args, **kwargs)
+        self.current_state_value = target
+
+        if is_debug_logging_enabled():
+            log.debug(f"{type(self).__name__} changed state", model=self, event=event)
@@ -1,15 +1,35 @@
 from typing import Optional
 
-import structlog
 from eth_typing import ChecksumAddress
 from hexbytes import HexBytes
-from statemachine import State, StateMachine
 from web3.types import Timestamp
 
-from beamer.typing import ChainId, FillId, Nonce, RequestId, TokenAmount
+from beamer.agent.models.fsm import State, StateMachine
+from beamer.typing import BlockNumber, ChainId, FillId, Nonce, RequestId, TokenAmount
 
 
 class Request(StateMachine):
+    __slots__ = (
+        "id",
+        "source_chain_id",
+        "target_chain_id",
+        "source_token_address",
+        "target_token_address",
+        "target_address",
+        "amount",
+        "nonce",
+        "valid_until",
+        "created_block",
+        "filler",
+        "fill_tx",
+        "fill_timestamp",
+        "fill_id",
+        "invalid_fill_ids",
+        "l1_resolution_filler",
+        "l1_resolution_fill_id",
+        "l1_resolution_invalid_fill_ids",
+    )
+
     def __init__(
         self,
         request_id: RequestId,
@@ -21,8 +41,8 @@ class Request(StateMachine):
         amount: TokenAmount,
         nonce: Nonce,
         valid_until: int,
+        created_block: Optional[BlockNumber] = None,
     ) -> None:
-        self._log = structlog.get_logger(type(self).__name__)
         self.id = request_id
         self.source_chain_id = source_chain_id
         self.target_chain_id = target_chain_id
@@ -32,6 +52,8 @@ class Request(StateMachine):
         self.amount = amount
         self.nonce = nonce
         self.valid_until = valid_until
+        # The block containing the RequestCreated event, if known.
+        self.created_block = created_block
         self.filler: Optional[ChecksumAddress] = None
         self.fill_tx: Optional[HexBytes] = None
         self.fill_timestamp: Optional[Timestamp] = None
@@ -67,9 +89,6 @@ class Request(StateMachine):
     )
     ignore = pending.to(ignored) | filled.to(ignored)
 
-    def on_enter_state(self) -> None:
-        self._log.debug("Request changed state", request=self)
-
     def on_fill(
         self,
         filler: ChecksumAddress,
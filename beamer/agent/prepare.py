@@ -0,0 +1,175 @@
+"""Speculative preparation of fill transactions.
+
+Filling a request takes a number of round trips to the target chain's RPC:
+checking balances and the allowance, estimating the gas, getting the fees
+and the nonce, and finally sending the transaction. As soon as a request is
+created, :class:`FillPreparer` takes these steps in the background and signs
+the ``fillRequest`` transaction, while the event processor is busy with other
+events or waits for the fill mutex of the token. When the request is filled,
+only the state that might have changed in the meantime is checked again
+before the signed transaction is broadcast.
+"""
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Callable, Optional
+
+import requests
+from eth_account.signers.local import LocalAccount
+from hexbytes import HexBytes
+from web3.contract.contract import ContractFunction
+from web3.exceptions import ContractLogicError
+from web3.types import TxParams, TxReceipt
+
+from beamer.agent.models.request import Request
+from beamer.middleware import RequestPriority, request_priority
+from beamer.typing import RequestId
+from beamer.util import get_ERC20_abi, transact_raw
+
+if TYPE_CHECKING:
+    from beamer.agent.state_machine import Context
+
+# The number of fills prepared concurrently.
+_MAX_WORKERS = 4
+
+# Prepared fills older than this, in seconds, are not used, since their fees
+# may no longer get them included in a block.
+_MAX_AGE = 30.0
+
+
+@dataclass(frozen=True)
+class PreparedFill:
+    # The unsigned transaction, so that it can be signed again if its nonce
+    # was used by another transaction in the meantime.
+    transaction: TxParams
+    raw_transaction: HexBytes
+    prepared_at: float
+
+
+def make_fill_function(request: Request, context: "Context") -> ContractFunction:
+    return context.fill_manager.functions.fillRequest(
+        sourceChainId=request.source_chain_id,
+        targetTokenAddress=request.target_token_address,
+        targetReceiverAddress=request.target_address,
+        amount=request.amount,
+        nonce=request.nonce,
+    )
+
+
+def _can_fill(request: Request, context: "Context") -> bool:
+    source_web3 = context.request_manager.w3
+    min_source_balance = context.config.chains[context.source_chain.name].min_source_balance
+    if source_web3.eth.get_balance(context.address) < min_source_balance:
+        return False
+
+    allowance = context.config.token_checker.allowance(
+        request.target_chain_id, request.target_token_address
+    )
+    if allowance is not None and allowance < request.amount:
+        return False
+
+    return _has_funds(request, context)
+
+
+def _has_funds(request: Request, context: "Context") -> bool:
+    target_web3 = context.fill_manager.w3
+    token = target_web3.eth.contract(abi=get_ERC20_abi(), address=request.target_token_address)
+    if token.functions.balanceOf(context.address).call() < request.amount:
+        return False
+    allowance = token.functions.allowance(context.address, context.fill_manager.address).call()
+    return allowance >= request.amount
+
+
+class FillPreparer:
+    """Prepares the fill transactions of new requests, see above.
+
+    Requests that cannot be filled at preparation time, e.g. because the
+    fill manager's allowance needs to be raised first, are not prepared and
+    are filled the regular way.
+    """
+
+    def __init__(self, account: LocalAccount) -> None:
+        self._account = account
+        self._lock = threading.Lock()
+        self._prepared: dict[RequestId, Future[Optional[PreparedFill]]] = {}
+        self._executor = ThreadPoolExecutor(
+            max_workers=_MAX_WORKERS, thread_name_prefix="FillPreparer"
+        )
+
+    def prepare(self, request: Request, context: "Context") -> None:
+        """Start preparing the fill of ``request``, unless it is unsafe
+        to fill already."""
+        if time.time() >= request.valid_until - context.config.unsafe_fill_time:
+            return
+        with self._lock:
+            if request.id not in self._prepared:
+                future = self._executor.submit(self._prepare, request, context)
+                self._prepared[request.id] = future
+
+    def discard(self, request_id: RequestId) -> None:
+        """Discard the prepared fill of ``request_id``, e.g. because the
+        request was filled by someone else or expired."""
+        with self._lock:
+            future = self._prepared.pop(request_id, None)
+        if future is not None:
+            future.cancel()
+
+    def shutdown(self) -> None:
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def _prepare(self, request: Request, context: "Context") -> Optional[PreparedFill]:
+        w3 = context.fill_manager.w3
+        try:
+            with request_priority(RequestPriority.FILL):
+                if not _can_fill(request, context):
+                    return None
+                nonce = w3.eth.get_transaction_count(context.address, "pending")
+                func = make_fill_function(request, context)
+                transaction = func.build_transaction({"from": context.address, "nonce": nonce})
+        except (ContractLogicError, ValueError, requests.exceptions.RequestException) as exc:
+            context.logger.debug("Preparing fill failed", request_id=request.id, exc=exc)
+            return None
+
+        signed = self._account.sign_transaction(transaction)
+        return PreparedFill(transaction, signed.rawTransaction, time.monotonic())
+
+    def send(
+        self, request: Request, context: "Context", on_sent: Callable[[], None]
+    ) -> Optional[TxReceipt]:
+        """Send the prepared fill of ``request`` and wait for its receipt.
+
+        Return None if there is no prepared fill that can still be used, in
+        which case the request needs to be filled the regular way. Must be
+        called with the request's fill mutex held.
+        """
+        with self._lock:
+            future = self._prepared.pop(request.id, None)
+        if future is None or future.cancelled():
+            return None
+        # The preparation may still be running, but waiting for it is not
+        # slower than doing the same work in the regular way.
+        prepared = future.result()
+        if prepared is None or time.monotonic() - prepared.prepared_at > _MAX_AGE:
+            return None
+
+        w3 = context.fill_manager.w3
+        # Fills of the same token, possibly by other agent processes, may
+        # have used up the balance or allowance since the preparation.
+        if not _has_funds(request, context):
+            return None
+
+        raw_transaction = prepared.raw_transaction
+        nonce = w3.eth.get_transaction_count(context.address, "pending")
+        if nonce != prepared.transaction["nonce"]:
+            transaction: TxParams = {**prepared.transaction, "nonce": nonce}
+            raw_transaction = self._account.sign_transaction(transaction).rawTransaction
+
+        context.logger.debug("Sending prepared fill", request_id=request.id)
+        return transact_raw(
+            w3,
+            raw_transaction,
+            on_sent=on_sent,
+            replace_after=context.config.chains[context.target_chain.name].replace_pending_after,
+            deadline=request.valid_until,
+        )
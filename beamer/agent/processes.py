@@ -0,0 +1,311 @@
+import dataclasses
+import functools
+import multiprocessing
+import multiprocessing.connection
+import os
+import queue
+import signal
+import tempfile
+import threading
+from multiprocessing.context import SpawnProcess
+from multiprocessing.queues import Queue
+from multiprocessing.synchronize import Event as ProcessEvent
+from pathlib import Path
+from typing import Any, Optional
+
+import structlog
+from eth_typing import Address
+
+import beamer.agent.metrics
+import beamer.agent.snapshot
+import beamer.util
+from beamer.agent.agent import Agent, get_transfer_directions, load_contracts
+from beamer.agent.chain import EventMonitor
+from beamer.agent.config import Config, ShardConfig
+from beamer.agent.headers import HeaderStore, header_store_path
+from beamer.agent.router import EventRouter
+from beamer.contracts import ABIManager
+from beamer.events import Event
+from beamer.typing import BlockNumber, ChainId, TransferDirection
+from beamer.util import get_web3
+
+log = structlog.get_logger(__name__)
+
+# The time in seconds a child process waits for a message before checking
+# whether it needs to stop.
+_QUEUE_TIMEOUT = 1
+
+# The time in seconds we wait for a child process to exit in stop(), before
+# terminating it.
+_STOP_TIMEOUT = 10
+
+# Messages sent from event monitor processes to event processor processes.
+_NEW_EVENTS = "new-events"
+_SYNC_DONE = "sync-done"
+_RPC_STATUS = "rpc-status"
+
+_Message = tuple[str, Any]
+
+
+def _init_child_process(config: Config) -> None:
+    # SIGINT is delivered to the whole process group. The parent process is
+    # responsible for shutting down the children in an orderly fashion.
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    beamer.util.setup_logging(log_level=config.log_level.upper(), log_json=False, threaded=True)
+
+
+def _send(messages: "Queue[_Message]", kind: str, value: Any = None) -> None:
+    messages.put((kind, value))
+
+
+def _run_event_monitor(
+    config: Config,
+    chain_name: str,
+    subscribers: list[tuple["Queue[_Message]", TransferDirection, Optional[BlockNumber]]],
+    stop: ProcessEvent,
+) -> None:
+    _init_child_process(config)
+    chain_config = config.chains[chain_name]
+    w3 = get_web3(
+        chain_config.rpc_url,
+        config.account,
+        max_concurrent_requests=chain_config.max_concurrent_requests,
+        max_requests_per_second=chain_config.max_requests_per_second,
+        compute_units_per_second=chain_config.compute_units_per_second,
+        compute_units=chain_config.compute_units,
+        fallback_urls=chain_config.fallback_rpc_urls,
+        hedged_requests=chain_config.hedged_requests,
+        pool_size=chain_config.pool_size,
+        keep_alive=chain_config.keep_alive,
+        fused_middleware=chain_config.fused_middleware,
+    )
+    chain_id = ChainId(w3.eth.chain_id)
+    # Info metrics are provided by the parent process, see serve_multiprocess.
+    beamer.agent.metrics.init(
+        config,
+        source_rpc_url=chain_config.rpc_url,
+        target_rpc_url=chain_config.rpc_url,
+        rpc_urls={chain_id: chain_config.rpc_url},
+    )
+    deployment_block, request_manager, fill_manager = load_contracts(
+        w3, ABIManager(config.abi_dir), config.artifacts_dir, chain_id
+    )
+    header_store = None
+    if config.header_store_dir is not None:
+        config.header_store_dir.mkdir(parents=True, exist_ok=True)
+        header_store = HeaderStore(header_store_path(config.header_store_dir, chain_id), chain_id)
+    event_monitor = EventMonitor(
+        web3=w3,
+        contracts=(request_manager, fill_manager),
+        deployment_block=deployment_block,
+        poll_period=chain_config.poll_period,
+        confirmation_blocks=chain_config.confirmation_blocks,
+        on_new_events=[],
+        on_sync_done=[],
+        on_rpc_status_change=[],
+        header_store=header_store,
+        # The request index of the router only covers requests created on
+        # this chain, events of other requests go to all candidate directions.
+        router=EventRouter(),
+        bloom_prefilter=chain_config.bloom_prefilter,
+    )
+    for messages, direction, resume_block in subscribers:
+        event_monitor.add_subscriber(
+            on_new_events=functools.partial(_send, messages, _NEW_EVENTS),
+            on_sync_done=functools.partial(_send, messages, _SYNC_DONE),
+            on_rpc_status_change=functools.partial(_send, messages, _RPC_STATUS),
+            resume_block=resume_block,
+            direction=direction,
+        )
+
+    event_monitor.start()
+    stop.wait()
+    event_monitor.stop()
+    if header_store is not None:
+        header_store.close()
+
+
+def _run_event_processor(
+    config: Config,
+    direction: TransferDirection,
+    messages: "Queue[_Message]",
+    stop: ProcessEvent,
+) -> None:
+    _init_child_process(config)
+    agent = Agent(config, monitor_events=False)
+    event_processor = agent.get_event_processor(direction)
+    agent.start()
+
+    while not stop.is_set():
+        try:
+            kind, value = messages.get(timeout=_QUEUE_TIMEOUT)
+        except queue.Empty:
+            continue
+
+        if kind == _NEW_EVENTS:
+            events: list[Event] = value
+            event_processor.add_events(events)
+        elif kind == _SYNC_DONE:
+            event_processor.mark_sync_done()
+        elif kind == _RPC_STATUS:
+            event_processor.set_rpc_working(value)
+        else:
+            raise RuntimeError(f"Unexpected message: {kind}")
+
+    agent.stop()
+
+
+class ProcessAgent:
+    """An agent that runs each event monitor and each event processor in its
+    own process, so that they do not compete for the GIL.
+
+    Each event monitor process fetches and decodes the events of one chain and
+    sends them to the event processor processes of all transfer directions
+    involving that chain. Fills of the same token on the same chain are
+    serialized across processes via lock files, see :class:`FileLock`.
+    Metrics of all processes are aggregated using the multiprocess mode of
+    the Prometheus client.
+    """
+
+    def __init__(self, config: Config):
+        self._config = config
+        self._context = multiprocessing.get_context("spawn")
+        self._stopped = threading.Event()
+        self._stopped.set()
+        self._processes: list[SpawnProcess] = []
+        self._stop_children = self._context.Event()
+        self._chain_ids_by_name: dict[str, ChainId] = {}
+
+    def _get_chain_names(self) -> dict[ChainId, str]:
+        chain_names: dict[ChainId, str] = {}
+        for chain_name, chain_config in self._config.chains.items():
+            w3 = get_web3(chain_config.rpc_url, fallback_urls=chain_config.fallback_rpc_urls)
+            chain_id = ChainId(w3.eth.chain_id)
+            self._chain_ids_by_name[chain_name] = chain_id
+            chain_names.setdefault(chain_id, chain_name)
+        return chain_names
+
+    def _get_resume_block(
+        self, direction: TransferDirection, chain_id: ChainId
+    ) -> Optional[BlockNumber]:
+        if self._config.snapshot_dir is None:
+            return None
+        path = beamer.agent.snapshot.snapshot_path(self._config.snapshot_dir, direction)
+        snapshot = beamer.agent.snapshot.load(path)
+        if snapshot is None:
+            return None
+        synced_block = snapshot.synced_blocks.get(chain_id)
+        return None if synced_block is None else BlockNumber(synced_block + 1)
+
+    def _make_child_config(
+        self, lock_dir: str, directions: Optional[list[tuple[str, str]]]
+    ) -> Config:
+        shard = self._config.shard
+        return dataclasses.replace(
+            self._config,
+            # Only the parent process serves metrics.
+            prometheus_metrics_port=None,
+            shard=ShardConfig(
+                directions=directions,
+                tokens=shard.tokens if shard is not None else None,
+                lock_dir=Path(lock_dir),
+            ),
+        )
+
+    def _spawn(self, name: str, target: Any, *args: Any) -> None:
+        process = self._context.Process(name=name, target=target, args=args)
+        process.start()
+        self._processes.append(process)
+
+    def start(self) -> None:
+        assert self._stopped.is_set()
+
+        # Metric values of child processes are shared via files in this
+        # directory. The variable needs to be set before spawning children.
+        if "PROMETHEUS_MULTIPROC_DIR" not in os.environ:
+            os.environ["PROMETHEUS_MULTIPROC_DIR"] = tempfile.mkdtemp(prefix="beamer-metrics-")
+
+        shard = self._config.shard
+        if shard is not None and shard.lock_dir is not None:
+            lock_dir = str(shard.lock_dir)
+        else:
+            lock_dir = tempfile.mkdtemp(prefix="beamer-locks-")
+
+        chain_names = self._get_chain_names()
+        rpc_urls = {
+            chain_id: self._config.chains[chain_name].rpc_url
+            for chain_id, chain_name in chain_names.items()
+        }
+        beamer.agent.metrics.serve_multiprocess(self._config, rpc_urls)
+        directions = get_transfer_directions(self._chain_ids_by_name, shard)
+        self._stop_children.clear()
+
+        subscribers: dict[
+            ChainId, list[tuple["Queue[_Message]", TransferDirection, Optional[BlockNumber]]]
+        ] = {}
+        for direction in directions:
+            messages: "Queue[_Message]" = self._context.Queue()
+            for chain_id in set(direction):
+                resume_block = self._get_resume_block(direction, chain_id)
+                subscribers.setdefault(chain_id, []).append((messages, direction, resume_block))
+
+            names = chain_names[direction.source], chain_names[direction.target]
+            config = self._make_child_config(lock_dir, [names])
+            self._spawn(
+                f"EventProcessor[{direction!r}]",
+                _run_event_processor,
+                config,
+                direction,
+                messages,
+                self._stop_children,
+            )
+
+        config = self._make_child_config(lock_dir, None)
+        for chain_id, chain_subscribers in subscribers.items():
+            self._spawn(
+                f"EventMonitor[cid={chain_id}]",
+                _run_event_monitor,
+                config,
+                chain_names[chain_id],
+                chain_subscribers,
+                self._stop_children,
+            )
+
+        log.info("Started agent processes", num_processes=len(self._processes))
+        self._stopped.clear()
+
+    def stop(self) -> None:
+        assert not self._stopped.is_set()
+        self._stop_children.set()
+        for process in self._processes:
+            process.join(_STOP_TIMEOUT)
+            if process.is_alive():
+                log.warning("Terminating agent process", name=process.name)
+                process.terminate()
+                process.join()
+            assert process.pid is not None
+            beamer.agent.metrics.process_exited(process.pid)
+        self._processes.clear()
+        self._stopped.set()
+
+    @property
+    def running(self) -> bool:
+        return not self._stopped.is_set()
+
+    @property
+    def address(self) -> Address:
+        return self._config.account.address
+
+    def wait(self) -> None:
+        while not self._stopped.wait(_QUEUE_TIMEOUT):
+            sentinels = [process.sentinel for process in self._processes]
+            if not sentinels:
+                continue
+            ready = multiprocessing.connection.wait(sentinels, timeout=0)
+            if ready and not self._stop_children.is_set():
+                # One of the children exited on its own, which only happens
+                # due to an error. There is no way to recover from that.
+                exited = [p.name for p in self._processes if p.sentinel in ready]
+                log.error("Agent process exited unexpectedly, shutting down", processes=exited)
+                self.stop()
+                raise RuntimeError(f"agent processes exited unexpectedly: {exited}")
@@ -0,0 +1,84 @@
+import threading
+from typing import Collection, Optional
+
+import lru
+
+from beamer.events import Event, RequestCreated, RequestFilled, SourceChainEvent, TargetChainEvent
+from beamer.typing import RequestId, TransferDirection
+
+# The maximum number of requests whose direction is remembered. Events of
+# requests that were evicted are sent to all candidate directions.
+_MAX_REQUESTS = 100_000
+
+
+class EventRouter:
+    """Dispatch events to the transfer directions they concern.
+
+    Events are routed by the chain they were emitted on and the chain ids
+    they carry: a :class:`RequestCreated` goes only to the direction towards
+    its target chain and a :class:`RequestFilled` only to the direction from
+    its source chain. Other request related events, like claims or fill
+    invalidations, carry just the request id. They are routed via an index
+    from request id to direction, which is filled from ``RequestCreated``
+    events and shared by the event monitors of all chains. If a request is
+    not in the index, its events go to all directions that have the event's
+    chain as source chain (for source chain events) or target chain (for
+    target chain events), whose event processors ignore unknown requests.
+    """
+
+    def __init__(self, max_requests: int = _MAX_REQUESTS) -> None:
+        self._lock = threading.Lock()
+        self._directions: lru.LRU[RequestId, TransferDirection] = lru.LRU(max_requests)
+
+    def add_request(self, request_id: RequestId, direction: TransferDirection) -> None:
+        with self._lock:
+            self._directions[request_id] = direction
+
+    def get_direction(self, request_id: RequestId) -> Optional[TransferDirection]:
+        with self._lock:
+            return self._directions.get(request_id)
+
+    def route(
+        self, events: list[Event], directions: Collection[TransferDirection]
+    ) -> dict[TransferDirection, list[Event]]:
+        """Return the events each of ``directions`` needs to receive, in the
+        order of ``events``."""
+        routed: dict[TransferDirection, list[Event]] = {direction: [] for direction in directions}
+        for event in events:
+            for direction in self._route_event(event, directions):
+                routed[direction].append(event)
+        return routed
+
+    def _route_event(
+        self, event: Event, directions: Collection[TransferDirection]
+    ) -> Collection[TransferDirection]:
+        chain_id = event.event_chain_id
+        direction: Optional[TransferDirection] = None
+        if isinstance(event, RequestCreated):
+            direction = TransferDirection(chain_id, event.target_chain_id)
+            self.add_request(event.request_id, direction)
+        elif isinstance(event, RequestFilled):
+            direction = TransferDirection(event.source_chain_id, chain_id)
+        else:
+            request_id = getattr(event, "request_id", None)
+            if request_id is not None:
+                direction = self.get_direction(request_id)
+
+        is_source_event = isinstance(event, SourceChainEvent)
+        is_target_event = isinstance(event, TargetChainEvent)
+        if direction is not None and (
+            (is_source_event and direction.source == chain_id)
+            or (is_target_event and direction.target == chain_id)
+        ):
+            return (direction,) if direction in directions else ()
+
+        if not is_source_event and not is_target_event:
+            # Events like LatestBlockUpdatedEvent concern all directions
+            # involving the chain.
+            return directions
+        return [
+            direction
+            for direction in directions
+            if (is_source_event and direction.source == chain_id)
+            or (is_target_event and direction.target == chain_id)
+        ]
@@ -0,0 +1,347 @@
+import json
+import os
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Optional
+
+import apischema
+import structlog
+from eth_typing import ChecksumAddress
+from hexbytes import HexBytes
+from web3.types import Timestamp
+
+from beamer.agent.models.claim import Claim
+from beamer.agent.models.request import Request
+from beamer.agent.state_machine import Context
+from beamer.events import EVENT_TYPES, ClaimMade, Event, LatestBlock, TxEvent
+from beamer.typing import (
+    BlockNumber,
+    ChainId,
+    FillId,
+    Nonce,
+    RequestId,
+    TokenAmount,
+    TransferDirection,
+)
+
+log = structlog.get_logger(__name__)
+
+# Bump this whenever the snapshot format changes in an incompatible way.
+# Snapshots with a different version are ignored and the agent falls back
+# to a full sync.
+SNAPSHOT_VERSION = 1
+
+
+class SnapshotError(Exception):
+    pass
+
+
+@dataclass
+class _BlockSnapshot:
+    number: BlockNumber
+    hash: HexBytes
+    timestamp: Timestamp
+
+
+@dataclass
+class _ChainSnapshot:
+    chain_id: ChainId
+    # The block up to which (inclusive) all events of this chain are
+    # reflected in the snapshot, either as state or as pending events.
+    synced_block: BlockNumber
+    latest_block: _BlockSnapshot
+
+
+@dataclass
+class _InvalidFill:
+    fill_id: FillId
+    tx_hash: HexBytes
+    timestamp: int
+
+
+@dataclass
+class _RequestSnapshot:
+    state: str
+    request_id: RequestId
+    source_chain_id: ChainId
+    target_chain_id: ChainId
+    source_token_address: ChecksumAddress
+    target_token_address: ChecksumAddress
+    target_address: ChecksumAddress
+    amount: TokenAmount
+    nonce: Nonce
+    valid_until: int
+    filler: Optional[ChecksumAddress]
+    fill_tx: Optional[HexBytes]
+    fill_timestamp: Optional[Timestamp]
+    fill_id: Optional[FillId]
+    invalid_fill_ids: list[_InvalidFill]
+    l1_resolution_filler: Optional[ChecksumAddress]
+    l1_resolution_fill_id: Optional[FillId]
+    l1_resolution_invalid_fill_ids: list[FillId]
+    created_block: Optional[BlockNumber] = None
+
+
+@dataclass
+class _ChallengerStake:
+    challenger: ChecksumAddress
+    stake: int
+
+
+@dataclass
+class _ClaimSnapshot:
+    state: str
+    claim_made: ClaimMade
+    challenger_stakes: list[_ChallengerStake]
+    challenge_back_off_timestamp: int
+    invalidation_tx: Optional[HexBytes]
+    invalidation_timestamp: Optional[Timestamp]
+    proved_tx: Optional[HexBytes]
+    unprocessed_claim_made_events: list[ClaimMade]
+
+
+@dataclass
+class _EventSnapshot:
+    type: str
+    data: dict
+
+
+@dataclass
+class _FinalityPeriod:
+    chain_id: ChainId
+    finality_period: int
+
+
+@dataclass
+class ContextSnapshot:
+    version: int
+    source_chain_id: ChainId
+    target_chain_id: ChainId
+    chains: list[_ChainSnapshot]
+    finality_periods: list[_FinalityPeriod]
+    requests: list[_RequestSnapshot]
+    claims: list[_ClaimSnapshot]
+    # Events that were received, but not successfully processed yet.
+    events: list[_EventSnapshot] = field(default_factory=list)
+
+    @property
+    def synced_blocks(self) -> dict[ChainId, BlockNumber]:
+        return {chain.chain_id: chain.synced_block for chain in self.chains}
+
+
+def snapshot_path(snapshot_dir: Path, direction: TransferDirection) -> Path:
+    return snapshot_dir.joinpath(f"{direction.source}-{direction.target}.json")
+
+
+def _snapshot_request(request: Request) -> _RequestSnapshot:
+    return _RequestSnapshot(
+        state=request.current_state.id,
+        request_id=request.id,
+        source_chain_id=request.source_chain_id,
+        target_chain_id=request.target_chain_id,
+        source_token_address=request.source_token_address,
+        target_token_address=request.target_token_address,
+        target_address=request.target_address,
+        amount=request.amount,
+        nonce=request.nonce,
+        valid_until=request.valid_until,
+        filler=request.filler,
+        fill_tx=request.fill_tx,
+        fill_timestamp=request.fill_timestamp,
+        fill_id=request.fill_id,
+        invalid_fill_ids=[
+            _InvalidFill(fill_id, tx_hash, timestamp)
+            for fill_id, (tx_hash, timestamp) in request.invalid_fill_ids.items()
+        ],
+        l1_resolution_filler=request.l1_resolution_filler,
+        l1_resolution_fill_id=request.l1_resolution_fill_id,
+        l1_resolution_invalid_fill_ids=list(request.l1_resolution_invalid_fill_ids),
+        created_block=request.created_block,
+    )
+
+
+def _restore_request(data: _RequestSnapshot) -> Request:
+    request = Request(
+        request_id=data.request_id,
+        source_chain_id=data.source_chain_id,
+        target_chain_id=data.target_chain_id,
+        source_token_address=data.source_token_address,
+        target_token_address=data.target_token_address,
+        target_address=data.target_address,
+        amount=data.amount,
+        nonce=data.nonce,
+        valid_until=data.valid_until,
+        created_block=data.created_block,
+    )
+    request.filler = data.filler
+    request.fill_tx = data.fill_tx
+    request.fill_timestamp = data.fill_timestamp
+    request.fill_id = data.fill_id
+    request.invalid_fill_ids = {
+        entry.fill_id: (entry.tx_hash, entry.timestamp) for entry in data.invalid_fill_ids
+    }
+    request.l1_resolution_filler = data.l1_resolution_filler
+    request.l1_resolution_fill_id = data.l1_resolution_fill_id
+    request.l1_resolution_invalid_fill_ids = set(data.l1_resolution_invalid_fill_ids)
+    # Bypass the transition hooks, the state is restored as-is.
+    request.current_state_value = data.state
+    return request
+
+
+def _snapshot_claim(claim: Claim) -> _ClaimSnapshot:
+    return _ClaimSnapshot(
+        state=claim.current_state.id,
+        claim_made=claim.latest_claim_made,
+        challenger_stakes=[
+            _ChallengerStake(challenger, stake)
+            for challenger, stake in claim.challenger_stakes.items()
+        ],
+        challenge_back_off_timestamp=claim.challenge_back_off_timestamp,
+        invalidation_tx=claim.invalidation_tx,
+        invalidation_timestamp=claim.invalidation_timestamp,
+        proved_tx=claim.proved_tx,
+        unprocessed_claim_made_events=list(claim.unprocessed_claim_made_events),
+    )
+
+
+def _restore_claim(data: _ClaimSnapshot) -> Claim:
+    claim = Claim(data.claim_made, data.challenge_back_off_timestamp)
+    for entry in data.challenger_stakes:
+        claim.add_challenger_stake(entry.challenger, entry.stake)
+    claim.invalidation_tx = data.invalidation_tx
+    claim.invalidation_timestamp = data.invalidation_timestamp
+    claim.proved_tx = data.proved_tx
+    claim.unprocessed_claim_made_events = set(data.unprocessed_claim_made_events)
+    # Bypass the transition hooks, the state is restored as-is.
+    claim.current_state_value = data.state
+    return claim
+
+
+def _snapshot_event(event: Event) -> _EventSnapshot:
+    return _EventSnapshot(type=type(event).__name__, data=apischema.serialize(event))
+
+
+def _restore_event(data: _EventSnapshot) -> Event:
+    event_type = EVENT_TYPES.get(data.type)
+    if event_type is None:
+        raise SnapshotError(f"unknown event type: {data.type}")
+    return apischema.deserialize(event_type, data.data)
+
+
+def take(context: Context, events: list[Event]) -> Optional[ContextSnapshot]:
+    """Return a snapshot of ``context``, or None if the context has not seen
+    the latest block of both chains yet.
+
+    ``events`` are the events received, but not yet successfully processed by
+    the event processor. Events newer than the synced block of their chain are
+    not part of the snapshot, since they will be fetched again on restore.
+    """
+    chain_ids = {context.source_chain.id, context.target_chain.id}
+    chains = []
+    for chain_id in sorted(chain_ids):
+        block = context.latest_blocks.get(chain_id)
+        if block is None:
+            return None
+        chains.append(
+            _ChainSnapshot(
+                chain_id=chain_id,
+                synced_block=block.number,
+                latest_block=_BlockSnapshot(
+                    number=block.number,
+                    hash=block.hash,
+                    timestamp=block.timestamp,
+                ),
+            )
+        )
+    synced_blocks = {chain.chain_id: chain.synced_block for chain in chains}
+
+    pending_events = [
+        _snapshot_event(event)
+        for event in events
+        if isinstance(event, TxEvent)
+        and event.block_number <= synced_blocks.get(event.event_chain_id, -1)
+    ]
+
+    return ContextSnapshot(
+        version=SNAPSHOT_VERSION,
+        source_chain_id=context.source_chain.id,
+        target_chain_id=context.target_chain.id,
+        chains=chains,
+        finality_periods=[
+            _FinalityPeriod(chain_id, period)
+            for chain_id, period in context.finality_periods.items()
+        ],
+        requests=[_snapshot_request(request) for request in context.requests],
+        claims=[_snapshot_claim(claim) for claim in context.claims],
+        events=pending_events,
+    )
+
+
+def restore(context: Context, snapshot: ContextSnapshot) -> list[Event]:
+    """Restore the state from ``snapshot`` into ``context`` and return the
+    pending events that need to be processed again."""
+    if (snapshot.source_chain_id, snapshot.target_chain_id) != (
+        context.source_chain.id,
+        context.target_chain.id,
+    ):
+        raise SnapshotError("snapshot does not match the transfer direction")
+
+    for chain in snapshot.chains:
+        block = chain.latest_block
+        context.latest_blocks[chain.chain_id] = LatestBlock(
+            number=block.number, hash=block.hash, timestamp=block.timestamp
+        )
+
+    for entry in snapshot.finality_periods:
+        context.finality_periods[entry.chain_id] = entry.finality_period
+
+    for request_data in snapshot.requests:
+        request = _restore_request(request_data)
+        context.requests.add(request.id, request)
+
+    for claim_data in snapshot.claims:
+        claim = _restore_claim(claim_data)
+        context.claims.add(claim.id, claim)
+
+    return [_restore_event(event_data) for event_data in snapshot.events]
+
+
+def write(path: Path, snapshot: ContextSnapshot) -> None:
+    data = apischema.serialize(snapshot)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    # Write to a temporary file first and rename it afterwards, so that we
+    # never end up with a partially written snapshot.
+    tmp_path = path.with_name(path.name + ".tmp")
+    with open(tmp_path, "wt") as f:
+        json.dump(data, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def load(path: Path) -> Optional[ContextSnapshot]:
+    if not path.exists():
+        return None
+
+    try:
+        with open(path, "rt") as f:
+            data = json.load(f)
+    except (OSError, ValueError) as exc:
+        log.warning("Failed to read snapshot, ignoring", path=str(path), exc=exc)
+        return None
+
+    version = data.get("version") if isinstance(data, dict) else None
+    if version != SNAPSHOT_VERSION:
+        log.warning(
+            "Snapshot version mismatch, ignoring",
+            path=str(path),
+            version=version,
+            expected_version=SNAPSHOT_VERSION,
+        )
+        return None
+
+    try:
+        return apischema.deserialize(ContextSnapshot, data)
+    except apischema.ValidationError as exc:
+        log.warning("Invalid snapshot, ignoring", path=str(path), exc=exc)
+        return None
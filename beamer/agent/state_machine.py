@@ -2,24 +2,24 @@ import os
 import time
 from concurrent.futures import Executor, Future
 from dataclasses import dataclass, field
-from threading import Lock
-from typing import Optional
+from typing import TYPE_CHECKING, Optional
 
 import structlog
 from eth_typing import ChecksumAddress
 from hexbytes import HexBytes
-from statemachine.exceptions import TransitionNotAllowed
 from web3 import Web3
 from web3.constants import ADDRESS_ZERO
 from web3.contract import Contract
-from web3.types import BlockData
+from web3.types import Timestamp
 
 import beamer.agent.metrics
 from beamer.agent.config import Config
+from beamer.agent.headers import BlockHeader
 from beamer.agent.models.claim import Claim
+from beamer.agent.models.fsm import TransitionNotAllowed
 from beamer.agent.models.request import Request
 from beamer.agent.tracker import Tracker
-from beamer.agent.util import Chain, TokenChecker
+from beamer.agent.util import Chain, FillMutex, TokenChecker
 from beamer.events import (
     ChainUpdated,
     ClaimMade,
@@ -29,6 +29,7 @@ from beamer.events import (
     FeesUpdated,
     FillInvalidated,
     FillInvalidatedResolved,
+    LatestBlock,
     LatestBlockUpdatedEvent,
     LpAdded,
     LpRemoved,
@@ -41,6 +42,10 @@ from beamer.events import (
 )
 from beamer.typing import ChainId, ClaimId, FillId, RequestId
 
+if TYPE_CHECKING:
+    from beamer.agent.mempool import MempoolWatcher
+    from beamer.agent.prepare import FillPreparer
+
 log = structlog.get_logger(__name__)
 
 
@@ -52,15 +57,19 @@ class Context:
     target_chain: Chain
     token_checker: TokenChecker
     address: ChecksumAddress
-    latest_blocks: dict[ChainId, BlockData]
+    latest_blocks: dict[ChainId, LatestBlock]
     config: Config
     web3_l1: Web3
     task_pool: Executor
     claim_request_extension: int
     l1_resolutions: dict[HexBytes, Future]
-    fill_mutexes: dict[tuple[ChainId, ChecksumAddress], Lock]
+    fill_mutexes: dict[tuple[ChainId, ChecksumAddress], FillMutex]
     logger: structlog.BoundLogger
     finality_periods: dict[ChainId, int] = field(default_factory=dict)
+    # Prepares fill transactions in the background, see beamer.agent.prepare.
+    fill_preparer: Optional["FillPreparer"] = None
+    # Detects competing fills on the target chain, see beamer.agent.mempool.
+    mempool_watcher: Optional["MempoolWatcher"] = None
 
     @property
     def request_manager(self) -> Contract:
@@ -121,6 +130,85 @@ def process_event(event: Event, context: Context) -> HandlerResult:
     raise RuntimeError("Unrecognized event type")
 
 
+def prune_settled_requests(events: list[Event], context: Context) -> list[Event]:
+    """Return ``events`` without the events of requests that were settled
+    before the end of ``events``.
+
+    A request is settled if its deposit was withdrawn and the stakes of all
+    its claims were withdrawn, or if it can no longer be claimed since it
+    expired and it is irrelevant to the agent. The latter is the case if it
+    was never claimed, or if it was filled by another LP and all its claims
+    are honest claims of that LP, neither made nor challenged by the agent.
+    Processing the events of such a request would only create it, drive it
+    through its fill and claim transitions and remove it again in
+    :func:`beamer.agent.chain.process_requests`, or keep its ignored claims
+    around. Requests that are already in the context, e.g. restored from a
+    snapshot, are kept.
+    """
+    source_chain_id = context.source_chain.id
+    target_chain_id = context.target_chain.id
+    created: dict[RequestId, RequestCreated] = {}
+    withdrawn: set[RequestId] = set()
+    claims: dict[RequestId, list[ClaimMade]] = {}
+    withdrawn_claims: set[ClaimId] = set()
+    fills: dict[RequestId, RequestFilled] = {}
+    invalidated: set[RequestId] = set()
+    block = context.latest_blocks.get(source_chain_id)
+    latest_timestamp = None if block is None else block.timestamp
+
+    for event in events:
+        if event.event_chain_id == target_chain_id:
+            match event:
+                case RequestFilled():
+                    fills[event.request_id] = event
+                case FillInvalidated():
+                    invalidated.add(event.request_id)
+        if event.event_chain_id != source_chain_id:
+            continue
+        match event:
+            case RequestCreated() if event.target_chain_id == target_chain_id:
+                created[event.request_id] = event
+            case DepositWithdrawn():
+                withdrawn.add(event.request_id)
+            case ClaimMade():
+                claims.setdefault(event.request_id, []).append(event)
+            case ClaimStakeWithdrawn():
+                withdrawn_claims.add(event.claim_id)
+            case LatestBlockUpdatedEvent():
+                latest_timestamp = event.block.timestamp
+
+    def is_irrelevant(request_id: RequestId, request_claims: list[ClaimMade]) -> bool:
+        fill = fills.get(request_id)
+        if fill is None or fill.filler == context.address or request_id in invalidated:
+            return False
+        return all(
+            claim.claimer == fill.filler
+            and claim.fill_id == fill.fill_id
+            and claim.last_challenger != context.address
+            for claim in request_claims
+        )
+
+    settled = set()
+    for request_id, event in created.items():
+        if request_id in context.requests:
+            continue
+        request_claims = claims.get(request_id, [])
+        claim_ids = {claim.claim_id for claim in request_claims}
+        claim_deadline = event.valid_until + context.claim_request_extension
+        expired = latest_timestamp is not None and latest_timestamp >= claim_deadline
+        if not request_claims:
+            if expired:
+                settled.add(request_id)
+        elif request_id in withdrawn and claim_ids <= withdrawn_claims:
+            settled.add(request_id)
+        elif expired and is_irrelevant(request_id, request_claims):
+            settled.add(request_id)
+
+    if not settled:
+        return events
+    return [event for event in events if getattr(event, "request_id", None) not in settled]
+
+
 def _find_claims(context: Context, request_id: RequestId, fill_id: FillId) -> list[Claim]:
     """
     This returns a list with matching request ID and fill ID, as there can be multiple claims
@@ -133,10 +221,29 @@ def _find_claims(context: Context, request_id: RequestId, fill_id: FillId) -> li
     return matching_claims
 
 
+def _get_block_timestamp(context: Context, event: RequestFilled | FillInvalidated) -> Timestamp:
+    """Return the timestamp of the block of ``event``, which is set by the
+    event fetcher unless fetching the block failed."""
+    if event.block_timestamp is not None:
+        return event.block_timestamp
+
+    block_number = event.block_number
+    header_store = context.target_chain.header_store
+    if header_store is not None:
+        timestamp = header_store.get_timestamp(block_number)
+        if timestamp is not None:
+            return Timestamp(timestamp)
+
+    block = context.fill_manager.w3.eth.get_block(block_number)
+    if header_store is not None:
+        header_store.add(BlockHeader.from_block(block))
+    return block["timestamp"]
+
+
 def _handle_latest_block_updated(
     event: LatestBlockUpdatedEvent, context: Context
 ) -> HandlerResult:
-    context.latest_blocks[event.event_chain_id] = event.block_data
+    context.latest_blocks[event.event_chain_id] = event.block
     return True, None
 
 
@@ -176,8 +283,11 @@ def _handle_request_created(event: RequestCreated, context: Context) -> HandlerR
         amount=event.amount,
         nonce=event.nonce,
         valid_until=event.valid_until,
+        created_block=event.block_number,
     )
     context.requests.add(request.id, request)
+    if context.fill_preparer is not None:
+        context.fill_preparer.prepare(request, context)
 
     # We only count valid requests from the agent's perspective to reason about
     # the ratio of fills to valid requests
@@ -210,16 +320,18 @@ def _handle_request_filled(event: RequestFilled, context: Context) -> HandlerRes
         return True, None
 
     try:
-        fill_block = context.fill_manager.w3.eth.get_block(event.block_number)
         request.fill(
             filler=event.filler,
             fill_tx=event.tx_hash,
             fill_id=event.fill_id,
-            fill_timestamp=fill_block.timestamp,  # type: ignore
+            fill_timestamp=_get_block_timestamp(context, event),
         )
     except TransitionNotAllowed:
         return False, None
 
+    if context.fill_preparer is not None:
+        context.fill_preparer.discard(request.id)
+
     with beamer.agent.metrics.update() as data:
         data.requests_filled.inc()
         if event.filler == context.address:
@@ -334,8 +446,7 @@ def _handle_request_resolved(event: RequestResolved, context: Context) -> Handle
 
 
 def _handle_fill_invalidated(event: FillInvalidated, context: Context) -> HandlerResult:
-    fill_block = context.fill_manager.w3.eth.get_block(event.block_number)
-    timestamp = fill_block.timestamp  # type: ignore
+    timestamp = _get_block_timestamp(context, event)
     request = context.requests.get(event.request_id)
 
     if request is not None:
@@ -1,10 +1,16 @@
+import fcntl
+import os
+import threading
 from dataclasses import dataclass
-from typing import cast
+from pathlib import Path
+from types import TracebackType
+from typing import Optional, Union, cast
 
 from eth_utils import is_checksum_address, to_checksum_address
 from web3 import HTTPProvider, Web3
 from web3.contract import Contract
 
+from beamer.agent.headers import HeaderStore
 from beamer.typing import URL, ChainId, ChecksumAddress
 
 _Token = tuple[ChainId, ChecksumAddress]
@@ -28,6 +34,7 @@ class Chain(BaseChain):
     tokens: list[tuple[ChainId, ChecksumAddress]]
     request_manager: Contract
     fill_manager: Contract
+    header_store: Optional[HeaderStore] = None
 
 
 @dataclass(frozen=True)
@@ -82,3 +89,61 @@ class TokenChecker:
 
     def get_tokens_for_chain(self, chain_id: ChainId) -> list:
         return [token for token in self._tokens if token[0] == chain_id]
+
+
+class FileLock:
+    """A lock that is shared between threads of the current process as well as
+    other processes on the same host that use the same lock file.
+
+    Mutual exclusion between processes is achieved via flock(2) on the lock
+    file, so the lock is released automatically by the kernel if the process
+    holding it dies.
+    """
+
+    def __init__(self, path: Path) -> None:
+        self._path = path
+        self._thread_lock = threading.Lock()
+        self._fd: Optional[int] = None
+
+    @property
+    def path(self) -> Path:
+        return self._path
+
+    def acquire(self) -> None:
+        self._thread_lock.acquire()  # pylint:disable=consider-using-with
+        try:
+            fd = os.open(self._path, os.O_RDWR | os.O_CREAT, 0o644)
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX)
+            except BaseException:
+                os.close(fd)
+                raise
+        except BaseException:
+            self._thread_lock.release()
+            raise
+        self._fd = fd
+
+    def release(self) -> None:
+        assert self._fd is not None, "lock not held"
+        fd, self._fd = self._fd, None
+        try:
+            fcntl.flock(fd, fcntl.LOCK_UN)
+        finally:
+            os.close(fd)
+            self._thread_lock.release()
+
+    def __enter__(self) -> "FileLock":
+        self.acquire()
+        return self
+
+    def __exit__(
+        self,
+        exc_type: Optional[type[BaseException]],
+        exc: Optional[BaseException],
+        traceback: Optional[TracebackType],
+    ) -> None:
+        self.release()
+
+
+# The mutex that serializes fills of the same token on the same chain.
+FillMutex = Union[threading.Lock, FileLock]
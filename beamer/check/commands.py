@@ -27,7 +27,7 @@ import beamer.util
 from beamer.contracts import ABIManager, obtain_contract
 from beamer.relayer import RelayerError, run_relayer_for_tx
 from beamer.typing import URL, ChainId, ClaimId, FillId, RequestId, TokenAmount
-from beamer.util import ChainIdParam, create_request_id, get_ERC20_abi, make_web3
+from beamer.util import ChainIdParam, create_request_id, get_ERC20_abi, get_web3
 
 log = structlog.get_logger(__name__)
 
@@ -164,7 +164,7 @@ def initiate_l1_invalidations(
 
     rpc_info = beamer.util.load_rpc_info(rpc_file)
     url = rpc_info[proof_source]
-    w3 = make_web3(url, account)
+    w3 = get_web3(url, account)
     assert w3.eth.chain_id == proof_source
     log.info("Connected to RPC", url=url)
 
@@ -283,7 +283,7 @@ class Context(NamedTuple):
 def _obtain_request_manager(ctx: Context, chain_id: ChainId) -> Contract:
     deployment = beamer.artifacts.load(ctx.artifacts_dir, chain_id)
     url = ctx.rpc_info[chain_id]
-    w3 = make_web3(url, ctx.account)
+    w3 = get_web3(url, ctx.account)
     assert w3.eth.chain_id == chain_id
 
     return obtain_contract(w3, ctx.abi_manager, deployment, "RequestManager")
@@ -498,7 +498,7 @@ def _find_token(ctx: Context, chain_id: ChainId, symbol: str) -> Contract | None
     assert deployment.chain is not None
 
     url = ctx.rpc_info[chain_id]
-    w3 = make_web3(url, ctx.account)
+    w3 = get_web3(url, ctx.account)
     assert w3.eth.chain_id == chain_id
 
     request_manager = obtain_contract(w3, ctx.abi_manager, deployment, "RequestManager")
@@ -23,7 +23,7 @@ from beamer.events import (
     TokenUpdated,
 )
 from beamer.typing import BlockNumber
-from beamer.util import get_ERC20_abi, make_web3
+from beamer.util import get_ERC20_abi, get_web3
 
 log = structlog.get_logger(__name__)
 
@@ -152,7 +152,7 @@ def read(
     assert deployment.chain is not None
     chain_id = deployment.chain.chain_id
     url = rpc_info[chain_id]
-    w3 = make_web3(url)
+    w3 = get_web3(url)
     assert w3.eth.chain_id == chain_id
     log.info("Connected to RPC", url=url)
 
@@ -410,7 +410,7 @@ def write(
     assert deployment.chain is not None
     chain_id = deployment.chain.chain_id
     url = rpc_info[chain_id]
-    w3 = make_web3(url, account)
+    w3 = get_web3(url, account)
     assert w3.eth.chain_id == chain_id
     log.info("Connected to RPC", url=url)
 
@@ -1,4 +1,6 @@
 import json
+import threading
+import weakref
 from collections import namedtuple
 from pathlib import Path
 from typing import cast
@@ -39,9 +41,19 @@ class ABIManager:
         )
 
 
+# Contracts returned by obtain_contract, by Web3 instance, ABI directory, name
+# and address. Building a contract parses its ABI, which is too costly to
+# repeat for every call of short-lived code paths.
+_CONTRACTS: weakref.WeakKeyDictionary[Web3, dict[tuple[Path, str, str], Contract]]
+_CONTRACTS = weakref.WeakKeyDictionary()
+_CONTRACTS_LOCK = threading.Lock()
+
+
 def obtain_contract(
     w3: Web3, abi_manager: ABIManager, deployment: beamer.artifacts.Deployment, name: str
 ) -> Contract:
+    """Return the contract ``name`` of ``deployment`` on the chain of ``w3``.
+    Contracts are memoized per Web3 instance."""
     chain_id = w3.eth.chain_id
 
     if chain_id == deployment.base.chain_id and name in deployment.base.contracts:
@@ -52,6 +64,12 @@ def obtain_contract(
     else:
         raise ValueError(f"{name} not found on chain with ID {chain_id} in {deployment}")
 
-    abi = abi_manager.get_abi(name)
-    contract = w3.eth.contract(address, abi=abi, decode_tuples=True)
-    return cast(Contract, contract)
+    key = (abi_manager.abi_dir, name, address)
+    with _CONTRACTS_LOCK:
+        contracts = _CONTRACTS.setdefault(w3, {})
+        contract = contracts.get(key)
+        if contract is None:
+            abi = abi_manager.get_abi(name)
+            contract = cast(Contract, w3.eth.contract(address, abi=abi, decode_tuples=True))
+            contracts[key] = contract
+        return contract
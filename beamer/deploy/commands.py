@@ -10,7 +10,7 @@ import beamer.util
 from beamer.contracts import ABIManager, obtain_contract
 from beamer.deploy.util import deploy_beamer, deploy_contract, generate_artifacts
 from beamer.typing import ChainId
-from beamer.util import ChainIdParam, get_commit_id, make_web3
+from beamer.util import ChainIdParam, get_commit_id, get_web3
 
 log = structlog.get_logger(__name__)
 
@@ -89,7 +89,7 @@ def deploy_base(
     log.info("Loaded keystore file", address=account.address)
 
     url = rpc_info[chain_id]
-    w3 = make_web3(url, account)
+    w3 = get_web3(url, account)
     assert w3.eth.chain_id == chain_id
     log.info("Connected to RPC", url=url)
 
@@ -181,7 +181,7 @@ def deploy(
     )
 
     url = rpc_info[base_deployment.base.chain_id]
-    base_w3 = make_web3(url, account)
+    base_w3 = get_web3(url, account)
     assert base_w3.eth.chain_id == base_deployment.base.chain_id
     log.info("Connected to base chain RPC", chain_id=base_deployment.base.chain_id, url=url)
 
@@ -193,7 +193,7 @@ def deploy(
         log.info("Loaded chain config", name=chain.name, chain_id=chain.chain_id, path=str(path))
 
         url = rpc_info[chain.chain_id]
-        w3 = make_web3(url, account, timeout=60)
+        w3 = get_web3(url, account, timeout=60)
         assert w3.eth.chain_id == chain.chain_id
         log.info("Connected to chain RPC", chain_id=chain.chain_id, url=url)
 
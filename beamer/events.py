@@ -1,20 +1,38 @@
+import asyncio
+import dataclasses
+import functools
 import time
 from dataclasses import dataclass
 from itertools import pairwise
-from typing import Iterable, Optional
+from typing import Any, Iterable, Optional, cast
 
+import aiohttp
 import requests
 import structlog
 from eth_abi.codec import ABICodec
+from eth_utils import keccak, to_checksum_address
 from eth_utils.abi import event_abi_to_log_topic
 from hexbytes import HexBytes
+from prometheus_client import Counter
 from requests.exceptions import HTTPError, ReadTimeout, RequestException
-from web3 import HTTPProvider, Web3
+from web3 import AsyncHTTPProvider, AsyncWeb3, HTTPProvider, Web3
 from web3.constants import ADDRESS_ZERO
-from web3.contract import Contract
+from web3.contract import AsyncContract, Contract
 from web3.contract.contract import get_event_data
-from web3.types import ABIEvent, BlockData, ChecksumAddress, FilterParams, LogReceipt, Wei
+from web3.types import (
+    ABIEvent,
+    BlockData,
+    ChecksumAddress,
+    LogReceipt,
+    RPCEndpoint,
+    RPCResponse,
+    Timestamp,
+    Wei,
+)
 
+from beamer.agent.headers import BlockHeader, HeaderStore
+from beamer.middleware import RequestPriority, request_priority
+from beamer.provider import async_make_batch_request, make_batch_request
 from beamer.typing import (
     BlockNumber,
     ChainId,
@@ -45,21 +63,54 @@ class TargetChainEvent(Event):
     pass
 
 
+@dataclass(frozen=True, slots=True)
+class LatestBlock:
+    """The fields of a chain's latest block that the agent needs. Unlike the
+    full block data, this does not hold the block's transaction hashes."""
+
+    number: BlockNumber
+    hash: HexBytes
+    timestamp: Timestamp
+
+    @staticmethod
+    def from_block(block: BlockData) -> "LatestBlock":
+        return LatestBlock(
+            number=block["number"], hash=HexBytes(block["hash"]), timestamp=block["timestamp"]
+        )
+
+
 @dataclass(frozen=True)
 class LatestBlockUpdatedEvent(Event):
-    block_data: BlockData
+    block: LatestBlock
 
-    def __init__(self, event_chain_id: ChainId, block_data: BlockData) -> None:
+    def __init__(self, event_chain_id: ChainId, block: LatestBlock) -> None:
         # We need to set these directly via __dict__ since the class is frozen.
         self.__dict__["event_chain_id"] = event_chain_id
         self.__dict__["event_address"] = ADDRESS_ZERO
-        self.__dict__["block_data"] = block_data
+        self.__dict__["block"] = block
 
     def __repr__(self) -> str:
         chain_id = self.event_chain_id
-        number = self.block_data["number"]
-        hash_ = self.block_data["hash"].hex()
-        return _BLOCK_UPDATED_FORMAT % (chain_id, number, hash_)
+        return _BLOCK_UPDATED_FORMAT % (chain_id, self.block.number, self.block.hash.hex())
+
+
+def coalesce_latest_blocks(events: list[Event]) -> list[Event]:
+    """Return ``events`` with only the last LatestBlockUpdatedEvent of each
+    chain. The earlier ones are superseded, since no event handler other than
+    the one of LatestBlockUpdatedEvent looks at the latest block."""
+    last_indices = {
+        event.event_chain_id: index
+        for index, event in enumerate(events)
+        if isinstance(event, LatestBlockUpdatedEvent)
+    }
+    if len(last_indices) == sum(isinstance(event, LatestBlockUpdatedEvent) for event in events):
+        return events
+    return [
+        event
+        for index, event in enumerate(events)
+        if not isinstance(event, LatestBlockUpdatedEvent)
+        or last_indices[event.event_chain_id] == index
+    ]
 
 
 @dataclass(frozen=True)
@@ -126,6 +177,8 @@ class RequestFilled(RequestEvent, TargetChainEvent):
     target_token_address: ChecksumAddress
     filler: ChecksumAddress
     amount: TokenAmount
+    # Filled in by the event fetcher, if the block header could be fetched.
+    block_timestamp: Optional[Timestamp] = None
 
 
 @dataclass(frozen=True)
@@ -172,6 +225,8 @@ class FillInvalidatedResolved(TxEvent, SourceChainEvent):
 class FillInvalidated(TxEvent, TargetChainEvent):
     request_id: RequestId
     fill_id: FillId
+    # Filled in by the event fetcher, if the block header could be fetched.
+    block_timestamp: Optional[Timestamp] = None
 
 
 def _camel_to_snake(s: str) -> str:
@@ -184,7 +239,7 @@ def _camel_to_snake(s: str) -> str:
     return snake.lstrip("_") + s[-1].lower()
 
 
-_EVENT_TYPES = dict(
+EVENT_TYPES = dict(
     RequestCreated=RequestCreated,
     RequestFilled=RequestFilled,
     DepositWithdrawn=DepositWithdrawn,
@@ -201,7 +256,9 @@ _EVENT_TYPES = dict(
 )
 
 
-def _make_topics_abi_mapping_for_contracts(contracts: Iterable[Contract]) -> dict[bytes, ABIEvent]:
+def _make_topics_abi_mapping_for_contracts(
+    contracts: Iterable[Contract | AsyncContract],
+) -> dict[bytes, ABIEvent]:
     result = {}
     for contract in contracts:
         result.update(_make_topics_to_abi(contract))
@@ -209,7 +266,7 @@ def _make_topics_abi_mapping_for_contracts(contracts: Iterable[Contract]) -> dic
     return result
 
 
-def _make_topics_to_abi(contract: Contract) -> dict[bytes, ABIEvent]:
+def _make_topics_to_abi(contract: Contract | AsyncContract) -> dict[bytes, ABIEvent]:
     event_abis = {}
     for abi in contract.abi:
         if abi["type"] == "event":
@@ -233,63 +290,222 @@ def _decode_event(
     topic = log_entry["topics"][0]
     event_abi = event_abis[topic]
     data = get_event_data(abi_codec=codec, event_abi=event_abi, log_entry=log_entry)
-    if data.event in _EVENT_TYPES:
-        kwargs = {_camel_to_snake(name): value for name, value in data.args.items()}
+    event_name = data["event"]
+    if event_name in EVENT_TYPES:
+        kwargs = {_camel_to_snake(name): value for name, value in data["args"].items()}
         kwargs["event_chain_id"] = chain_id
         kwargs["event_address"] = log_entry["address"]
         kwargs["block_number"] = log_entry["blockNumber"]
         kwargs["tx_hash"] = log_entry["transactionHash"]
         _convert_bytes(kwargs)
-        return _EVENT_TYPES[data.event](**kwargs)
+        return EVENT_TYPES[event_name](**kwargs)
     return None
 
 
+# The events whose handlers need the timestamp of their block.
+_TIMESTAMPED_EVENT_TYPES = (RequestFilled, FillInvalidated)
+
+# The maximum number of requests in a JSON-RPC batch. Most RPC providers
+# reject larger batches.
+_MAX_BATCH_SIZE = 100
+
+_GET_BLOCK_BY_NUMBER = RPCEndpoint("eth_getBlockByNumber")
+
+
+def _get_block_batches(numbers: list[BlockNumber]) -> Iterable[list[list[Any]]]:
+    for start in range(0, len(numbers), _MAX_BATCH_SIZE):
+        end = start + _MAX_BATCH_SIZE
+        yield [[hex(number), False] for number in numbers[start:end]]
+
+
+def _set_block_timestamps(
+    events: list[Event], timestamps: dict[BlockNumber, Timestamp]
+) -> list[Event]:
+    return [
+        dataclasses.replace(event, block_timestamp=timestamps[event.block_number])
+        if isinstance(event, _TIMESTAMPED_EVENT_TYPES) and event.block_number in timestamps
+        else event
+        for event in events
+    ]
+
+
+# The logs are requested without web3's result formatters, which convert
+# every field of every log entry, and only the fields needed for decoding
+# the events are converted here.
+_to_checksum_address = functools.lru_cache(maxsize=None)(to_checksum_address)
+
+_GET_LOGS = RPCEndpoint("eth_getLogs")
+
+
+def _format_log_entry(entry: dict[str, Any]) -> LogReceipt:
+    return cast(
+        LogReceipt,
+        dict(
+            address=_to_checksum_address(entry["address"]),
+            topics=[HexBytes(topic) for topic in entry["topics"]],
+            data=HexBytes(entry["data"]),
+            blockNumber=int(entry["blockNumber"], 16),
+            blockHash=HexBytes(entry["blockHash"]),
+            transactionHash=HexBytes(entry["transactionHash"]),
+            transactionIndex=int(entry["transactionIndex"], 16),
+            logIndex=int(entry["logIndex"], 16),
+        ),
+    )
+
+
+def _make_get_logs_params(
+    from_block: BlockNumber, to_block: BlockNumber, addresses: list[ChecksumAddress]
+) -> list[dict[str, Any]]:
+    return [dict(fromBlock=hex(from_block), toBlock=hex(to_block), address=addresses)]
+
+
 def _decode_events(
-    logs: list[LogReceipt], codec: ABICodec, chain_id: ChainId, event_abis: dict[bytes, ABIEvent]
+    logs: list[dict[str, Any]],
+    codec: ABICodec,
+    chain_id: ChainId,
+    event_abis: dict[bytes, ABIEvent],
 ) -> list[Event]:
     events = []
     for entry in logs:
-        event = _decode_event(codec, entry, chain_id, event_abis)
+        event = _decode_event(codec, _format_log_entry(entry), chain_id, event_abis)
         if event is not None:
             events.append(event)
     return events
 
 
-class EventFetcher:
+# The logs bloom prefilter.
+#
+# Each block header contains a bloom filter of the addresses and topics of the
+# block's logs. If the bloom of a block contains neither one of our contract
+# addresses nor one of our event topics, the block cannot contain any of our
+# events. The event fetchers test the blooms of the headers they fetch anyway
+# and mark ranges whose blooms all miss as synced, without calling
+# eth_getLogs. Blooms have false positives, but no false negatives, so a
+# range is only skipped if it is certain to contain none of our events.
+#
+# Only blooms of blocks that were already confirmed when their header was
+# fetched are used. Without confirmation blocks, that is the latest block
+# fetched on each poll. With confirmation blocks, the header of the single
+# block to fetch is requested instead of its logs; the LatestBlockUpdatedEvent
+# of the poll then uses the same header, answered from the block cache.
+# Ranges containing a block whose header was not fetched are always fetched
+# with eth_getLogs.
+#
+# Some nodes return all-zero or incomplete blooms. An all-zero bloom is
+# treated as unknown, since a block whose bloom is empty has no logs at all
+# and there is nothing to gain from trusting it. For chains whose blooms are
+# otherwise unreliable, the prefilter can be disabled in the configuration.
+
+_GET_LOGS_SKIPPED = Counter(
+    "event_fetcher_get_logs_skipped",
+    "Number of eth_getLogs calls avoided because the logs blooms of the range missed",
+    ["chain_id"],
+)
+
+
+def _bloom_bits(value: bytes) -> int:
+    """Return the bits set in a logs bloom by ``value``."""
+    digest = keccak(value)
+    bits = 0
+    for index in range(0, 6, 2):
+        bits |= 1 << (((digest[index] << 8) | digest[index + 1]) & 2047)
+    return bits
+
+
+def _bloom_contains_any(bloom: int, bits: Iterable[int]) -> bool:
+    return any(bloom & value == value for value in bits)
+
+
+class _BaseEventFetcher:
     _DEFAULT_BLOCKS = 1_000
     _MIN_BLOCKS = 2
     _MAX_BLOCKS = 100_000
     _ETH_GET_LOGS_THRESHOLD_FAST = 2
     _ETH_GET_LOGS_THRESHOLD_SLOW = 5
+    # The number of blocks behind the chain head above which fetching events
+    # is considered a backfill, whose requests must not delay the fill path.
+    _BACKFILL_BLOCKS = 100
 
     def __init__(
         self,
-        web3: Web3,
-        contracts: tuple[Contract, ...],
+        chain_id: ChainId,
+        contracts: tuple[Contract | AsyncContract, ...],
         start_block: BlockNumber,
         confirmation_blocks: int,
+        header_store: Optional[HeaderStore],
+        bloom_prefilter: bool,
     ):
-        self._web3 = web3
-        self._chain_id = ChainId(web3.eth.chain_id)
+        self._chain_id = chain_id
         self._contract_addresses = [c.address for c in contracts]
         self._next_block_number = start_block
-        self._blocks_to_fetch = EventFetcher._DEFAULT_BLOCKS
+        self._head_block: Optional[BlockNumber] = None
+        self._blocks_to_fetch = _BaseEventFetcher._DEFAULT_BLOCKS
         self._event_abis = _make_topics_abi_mapping_for_contracts(contracts)
         self._confirmation_blocks = confirmation_blocks
+        self._header_store = header_store
         self._log = structlog.get_logger(type(self).__name__).bind(chain_id=self._chain_id)
-
-        for contract in contracts:
-            assert self._chain_id == contract.w3.eth.chain_id, f"Chain id mismatch for {contract}"
+        # Logs blooms by block number, see the logs bloom prefilter above.
+        self._bloom_prefilter = bloom_prefilter and bool(self._contract_addresses)
+        self._blooms: dict[BlockNumber, int] = {}
+        self._address_bloom_bits = [
+            _bloom_bits(HexBytes(address)) for address in self._contract_addresses
+        ]
+        self._topic_bloom_bits = [_bloom_bits(topic) for topic in self._event_abis]
+        self._get_logs_skipped = _GET_LOGS_SKIPPED.labels(chain_id)
 
     @property
     def synced_block(self) -> BlockNumber:
         return BlockNumber(self._next_block_number - 1)
 
-    def _fetch_range(
-        self, from_block: BlockNumber, to_block: BlockNumber
-    ) -> Optional[list[Event]]:
-        """Returns a list of events that happened in the period [from_block, to_block],
-        or None if a timeout occurs."""
+    @property
+    def head_block(self) -> Optional[BlockNumber]:
+        """The latest block of the chain, as seen by the last fetch, or None
+        if nothing was fetched yet."""
+        return self._head_block
+
+    def _get_fetch_priority(self, to_block: BlockNumber) -> RequestPriority:
+        if to_block - self._next_block_number >= _BaseEventFetcher._BACKFILL_BLOCKS:
+            return RequestPriority.BACKFILL
+        return RequestPriority.POLLING
+
+    def _add_bloom(self, block_data: BlockData) -> None:
+        bloom = block_data.get("logsBloom")
+        if bloom is None or not self._bloom_prefilter:
+            return
+        value = int.from_bytes(bloom, "big")
+        # An all-zero bloom is not trusted, see the logs bloom prefilter above.
+        if value != 0:
+            self._blooms[block_data["number"]] = value
+
+    def _needs_bloom_header(self, block_number: BlockNumber) -> bool:
+        """Return whether the header of ``block_number`` should be fetched
+        to test its bloom before fetching the logs up to it."""
+        return (
+            self._bloom_prefilter
+            and self._confirmation_blocks > 0
+            and block_number == self._next_block_number
+        )
+
+    def _can_skip_range(self, from_block: BlockNumber, to_block: BlockNumber) -> bool:
+        """Return whether the blooms of all blocks in the range show that it
+        contains none of our events."""
+        for number in range(from_block, to_block + 1):
+            bloom = self._blooms.get(BlockNumber(number))
+            if bloom is None:
+                return False
+            if _bloom_contains_any(bloom, self._address_bloom_bits) and _bloom_contains_any(
+                bloom, self._topic_bloom_bits
+            ):
+                return False
+        self._get_logs_skipped.inc()
+        self._log.debug("Skipping range without events", from_block=from_block, to_block=to_block)
+        return True
+
+    def _prune_blooms(self) -> None:
+        for number in [number for number in self._blooms if number < self._next_block_number]:
+            del self._blooms[number]
+
+    def _log_fetch_range(self, from_block: BlockNumber, to_block: BlockNumber) -> None:
         self._log.debug(
             "Fetching events",
             contracts=self._contract_addresses,
@@ -297,12 +513,93 @@ class EventFetcher:
             to_block=to_block,
         )
 
-        before_query = time.monotonic()
-        params: FilterParams = dict(
-            fromBlock=from_block, toBlock=to_block, address=self._contract_addresses
+    def _on_fetch_range_failed(self, exc: Exception) -> None:
+        old = self._blocks_to_fetch
+        self._blocks_to_fetch = max(_BaseEventFetcher._MIN_BLOCKS, old // 5)
+        self._log.debug(
+            "Failed to get events, reducing number of blocks",
+            old=old,
+            new=self._blocks_to_fetch,
+            exc=exc,
+        )
+
+    def _on_fetch_range_done(self, duration: float) -> None:
+        if duration < _BaseEventFetcher._ETH_GET_LOGS_THRESHOLD_FAST:
+            self._blocks_to_fetch = min(_BaseEventFetcher._MAX_BLOCKS, self._blocks_to_fetch * 2)
+        elif duration > _BaseEventFetcher._ETH_GET_LOGS_THRESHOLD_SLOW:
+            self._blocks_to_fetch = max(_BaseEventFetcher._MIN_BLOCKS, self._blocks_to_fetch // 2)
+
+    def _lookup_block_timestamps(
+        self, events: list[Event]
+    ) -> tuple[dict[BlockNumber, Timestamp], list[BlockNumber]]:
+        """Return the timestamps of the blocks of ``events`` that are known
+        from the header store, and the numbers of the blocks that need to be
+        fetched."""
+        numbers = sorted(
+            {event.block_number for event in events if isinstance(event, _TIMESTAMPED_EVENT_TYPES)}
         )
+        timestamps = {}
+        missing = []
+        for number in numbers:
+            timestamp = None
+            if self._header_store is not None:
+                timestamp = self._header_store.get_timestamp(number)
+            if timestamp is None:
+                missing.append(number)
+            else:
+                timestamps[number] = Timestamp(timestamp)
+        return timestamps, missing
+
+    def _add_block_headers(
+        self, responses: list[RPCResponse], timestamps: dict[BlockNumber, Timestamp]
+    ) -> None:
+        headers = []
+        for response in responses:
+            result = response.get("result")
+            if result is None:
+                self._log.warning("Failed to fetch block", error=response.get("error"))
+                continue
+            header = BlockHeader.from_rpc_result(result)
+            headers.append(header)
+            timestamps[header.number] = Timestamp(header.timestamp)
+        if self._header_store is not None:
+            self._header_store.add_many(headers)
+
+
+class EventFetcher(_BaseEventFetcher):
+    def __init__(
+        self,
+        web3: Web3,
+        contracts: tuple[Contract, ...],
+        start_block: BlockNumber,
+        confirmation_blocks: int,
+        header_store: Optional[HeaderStore] = None,
+        bloom_prefilter: bool = True,
+    ):
+        super().__init__(
+            ChainId(web3.eth.chain_id),
+            contracts,
+            start_block,
+            confirmation_blocks,
+            header_store,
+            bloom_prefilter,
+        )
+        self._web3 = web3
+
+        for contract in contracts:
+            assert self._chain_id == contract.w3.eth.chain_id, f"Chain id mismatch for {contract}"
+
+    def _fetch_range(
+        self, from_block: BlockNumber, to_block: BlockNumber
+    ) -> Optional[list[Event]]:
+        """Returns a list of events that happened in the period [from_block, to_block],
+        or None if a timeout occurs."""
+        self._log_fetch_range(from_block, to_block)
+
+        before_query = time.monotonic()
+        params = _make_get_logs_params(from_block, to_block, self._contract_addresses)
         try:
-            logs = self._web3.eth.get_logs(params)
+            logs = self._web3.manager.request_blocking(_GET_LOGS, params)
 
         # Boba limits the range to 5000 blocks
         # 'ValueError: {'code': -32000, 'message': 'exceed maximum block range: 5000'}'
@@ -312,14 +609,7 @@ class EventFetcher:
             if isinstance(exc, HTTPError) and exc.response.status_code != 413:
                 raise exc
 
-            old = self._blocks_to_fetch
-            self._blocks_to_fetch = max(EventFetcher._MIN_BLOCKS, old // 5)
-            self._log.debug(
-                "Failed to get events, reducing number of blocks",
-                old=old,
-                new=self._blocks_to_fetch,
-                exc=exc,
-            )
+            self._on_fetch_range_failed(exc)
             return None
 
         except requests.exceptions.ConnectionError as exc:
@@ -330,19 +620,30 @@ class EventFetcher:
             raise exc
 
         else:
-            after_query = time.monotonic()
-            duration = after_query - before_query
-            if duration < EventFetcher._ETH_GET_LOGS_THRESHOLD_FAST:
-                self._blocks_to_fetch = min(EventFetcher._MAX_BLOCKS, self._blocks_to_fetch * 2)
-            elif duration > EventFetcher._ETH_GET_LOGS_THRESHOLD_SLOW:
-                self._blocks_to_fetch = max(EventFetcher._MIN_BLOCKS, self._blocks_to_fetch // 2)
-
-            return _decode_events(
+            self._on_fetch_range_done(time.monotonic() - before_query)
+            events = _decode_events(
                 logs=logs,
                 codec=self._web3.codec,
                 chain_id=self._chain_id,
                 event_abis=self._event_abis,
             )
+            return self._add_block_timestamps(events)
+
+    def _add_block_timestamps(self, events: list[Event]) -> list[Event]:
+        """Set the block timestamp of the events that need it, fetching all
+        missing blocks in batches."""
+        timestamps, missing = self._lookup_block_timestamps(events)
+        for params_list in _get_block_batches(missing):
+            try:
+                responses = make_batch_request(self._web3, _GET_BLOCK_BY_NUMBER, params_list)
+            except requests.exceptions.ConnectionError:
+                raise
+            except (RequestException, ValueError) as exc:
+                # The event handlers fall back to fetching the blocks themselves.
+                self._log.warning("Failed to fetch blocks", exc=exc)
+                break
+            self._add_block_headers(responses, timestamps)
+        return _set_block_timestamps(events, timestamps)
 
     def fetch(self) -> list[Event]:
         try:
@@ -352,22 +653,38 @@ class EventFetcher:
         except RequestException:
             return []
 
+        self._head_block = BlockNumber(block_data["number"])
         block_number = BlockNumber(block_data["number"] - self._confirmation_blocks)
 
         if block_number < self._next_block_number:
             return []
 
+        if self._confirmation_blocks == 0:
+            self._add_bloom(block_data)
+        elif self._needs_bloom_header(block_number):
+            try:
+                self._add_bloom(self._web3.eth.get_block(block_number))
+            except requests.exceptions.ConnectionError:
+                raise
+            except RequestException:
+                pass
+
         result = []
         from_block = self._next_block_number
 
-        while from_block <= block_number:
-            to_block = min(block_number, BlockNumber(from_block + self._blocks_to_fetch))
-            events = self._fetch_range(from_block, to_block)
-            if events is not None:
-                result.extend(events)
-                from_block = BlockNumber(to_block + 1)
+        with request_priority(self._get_fetch_priority(block_number)):
+            while from_block <= block_number:
+                to_block = min(block_number, BlockNumber(from_block + self._blocks_to_fetch))
+                if self._can_skip_range(from_block, to_block):
+                    events: Optional[list[Event]] = []
+                else:
+                    events = self._fetch_range(from_block, to_block)
+                if events is not None:
+                    result.extend(events)
+                    from_block = BlockNumber(to_block + 1)
 
         self._next_block_number = from_block
+        self._prune_blooms()
         try:
             # Block number needs to be decremented here, because it is already incremented above
             block_data = self._web3.eth.get_block(from_block - 1)
@@ -375,11 +692,136 @@ class EventFetcher:
             raise
         except RequestException:
             return result
+
+        else:
+            result.append(
+                LatestBlockUpdatedEvent(
+                    event_chain_id=self._chain_id,
+                    block=LatestBlock.from_block(block_data),
+                )
+            )
+        return result
+
+
+class AsyncEventFetcher(_BaseEventFetcher):
+    """Same as :class:`EventFetcher`, but for AsyncWeb3 instances."""
+
+    def __init__(
+        self,
+        web3: AsyncWeb3,
+        chain_id: ChainId,
+        contracts: tuple[Contract | AsyncContract, ...],
+        start_block: BlockNumber,
+        confirmation_blocks: int,
+        header_store: Optional[HeaderStore] = None,
+        bloom_prefilter: bool = True,
+    ):
+        super().__init__(
+            chain_id, contracts, start_block, confirmation_blocks, header_store, bloom_prefilter
+        )
+        self._web3 = web3
+
+    async def _fetch_range(
+        self, from_block: BlockNumber, to_block: BlockNumber
+    ) -> Optional[list[Event]]:
+        self._log_fetch_range(from_block, to_block)
+
+        before_query = time.monotonic()
+        params = _make_get_logs_params(from_block, to_block, self._contract_addresses)
+        try:
+            logs = await self._web3.manager.coro_request(_GET_LOGS, params)
+
+        # See EventFetcher._fetch_range for the errors caused by a too large range.
+        except (asyncio.TimeoutError, ValueError, aiohttp.ClientResponseError) as exc:
+            if isinstance(exc, aiohttp.ClientResponseError) and exc.status != 413:
+                raise exc
+
+            self._on_fetch_range_failed(exc)
+            return None
+
+        except aiohttp.ClientConnectionError as exc:
+            assert isinstance(self._web3.provider, AsyncHTTPProvider)
+            url = self._web3.provider.endpoint_uri
+            self._log.error("Connection error", url=url, exc=exc)
+            raise exc
+
+        else:
+            self._on_fetch_range_done(time.monotonic() - before_query)
+            events = _decode_events(
+                logs=logs,
+                codec=self._web3.codec,
+                chain_id=self._chain_id,
+                event_abis=self._event_abis,
+            )
+            return await self._add_block_timestamps(events)
+
+    async def _add_block_timestamps(self, events: list[Event]) -> list[Event]:
+        timestamps, missing = self._lookup_block_timestamps(events)
+        for params_list in _get_block_batches(missing):
+            try:
+                responses = await async_make_batch_request(
+                    self._web3, _GET_BLOCK_BY_NUMBER, params_list
+                )
+            except aiohttp.ClientConnectionError:
+                raise
+            except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as exc:
+                self._log.warning("Failed to fetch blocks", exc=exc)
+                break
+            self._add_block_headers(responses, timestamps)
+        return _set_block_timestamps(events, timestamps)
+
+    async def fetch(self) -> list[Event]:
+        try:
+            block_data = await self._web3.eth.get_block("latest")
+        except aiohttp.ClientConnectionError:
+            raise
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            return []
+
+        self._head_block = BlockNumber(block_data["number"])
+        block_number = BlockNumber(block_data["number"] - self._confirmation_blocks)
+
+        if block_number < self._next_block_number:
+            return []
+
+        if self._confirmation_blocks == 0:
+            self._add_bloom(block_data)
+        elif self._needs_bloom_header(block_number):
+            try:
+                self._add_bloom(await self._web3.eth.get_block(block_number))
+            except aiohttp.ClientConnectionError:
+                raise
+            except (aiohttp.ClientError, asyncio.TimeoutError):
+                pass
+
+        result = []
+        from_block = self._next_block_number
+
+        with request_priority(self._get_fetch_priority(block_number)):
+            while from_block <= block_number:
+                to_block = min(block_number, BlockNumber(from_block + self._blocks_to_fetch))
+                if self._can_skip_range(from_block, to_block):
+                    events: Optional[list[Event]] = []
+                else:
+                    events = await self._fetch_range(from_block, to_block)
+                if events is not None:
+                    result.extend(events)
+                    from_block = BlockNumber(to_block + 1)
+
+        self._next_block_number = from_block
+        self._prune_blooms()
+        try:
+            # Block number needs to be decremented here, because it is already incremented above
+            block_data = await self._web3.eth.get_block(from_block - 1)
+        except aiohttp.ClientConnectionError:
+            raise
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            return result
         else:
             result.append(
                 LatestBlockUpdatedEvent(
                     event_chain_id=self._chain_id,
-                    block_data=block_data,
+                    block=LatestBlock.from_block(block_data),
                 )
             )
         return result
@@ -24,7 +24,7 @@ from beamer.util import (
     get_token_amount_in_decimals,
     get_token_balance,
     get_token_details,
-    make_web3,
+    get_web3,
 )
 
 
@@ -205,7 +205,7 @@ def fetch_events() -> ChainEventMap:
 
     events = {}
     for chain_id, (rpc) in get_config()["rpcs"].items():
-        web3 = make_web3(URL(rpc))
+        web3 = get_web3(URL(rpc))
         assert chain_id == ChainId(web3.eth.chain_id)
 
         deployment = beamer.artifacts.load(config["artifacts_dir"], ChainId(chain_id))
@@ -275,7 +275,7 @@ def get_agent_liquidity(
             liquidity[name][chain_id] = get_token_amount_in_decimals(balance, token_details)
 
     for chain_id, (rpc) in rpcs.items():
-        web3 = make_web3(rpc)
+        web3 = get_web3(rpc)
         agent_address = to_checksum_address(agent_address)
         assert ChainId(int(chain_id)) == ChainId(web3.eth.chain_id)
         balance = web3.eth.get_balance(agent_address)
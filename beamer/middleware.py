@@ -1,18 +1,33 @@
+import asyncio
+import contextlib
+import contextvars
+import email.utils
+import enum
 import functools
+import heapq
+import itertools
+import math
 import threading
 import time
 from dataclasses import dataclass, field
-from typing import Any, Callable, cast
+from types import MappingProxyType
+from typing import Any, Awaitable, Callable, Iterable, Iterator, Mapping, Sequence, cast
 
-import atomics
-import atomics.base
+import aiohttp
 import lru
+import requests
 import requests.exceptions
 import structlog
-from web3 import HTTPProvider, Web3
-from web3.types import Middleware, RPCEndpoint, RPCResponse
-from beamer.typing import ChainId
+from eth_account.signers.local import LocalAccount
+from eth_utils.toolz import assoc
+from prometheus_client import Counter, Histogram
+from web3 import AsyncHTTPProvider, AsyncWeb3, HTTPProvider, Web3
+from web3.datastructures import AttributeDict
+from web3.middleware import construct_sign_and_send_raw_middleware
+from web3.middleware.cache import SIMPLE_CACHE_RPC_WHITELIST
+from web3.types import AsyncMiddleware, Middleware, RPCEndpoint, RPCResponse
 
+from beamer.typing import ChainId
 
 log = structlog.get_logger(__name__)
 
@@ -74,118 +89,625 @@ def cache_get_block_by_number(
     def middleware(method: RPCEndpoint, params: Any) -> RPCResponse:
         if method != "eth_getBlockByNumber":
             return make_request(method, params)
+        return _get_block_with_cache(method, params, make_request, cache)
 
-        if params[0] == "latest":
+    return middleware
+
+
+def _get_block_with_cache(
+    method: RPCEndpoint,
+    params: Any,
+    make_request: Callable[[RPCEndpoint, Any], RPCResponse],
+    cache: _BlockCache,
+) -> RPCResponse:
+    if params[0] == "latest":
+        response = make_request(method, params)
+        if _result_ok(response):
+            key = response["result"].number, params[1]
+            cache.add_block(key, response)
+    elif params[0].startswith("0x"):
+        response = cache.get_block(params)
+        if response is None:
             response = make_request(method, params)
             if _result_ok(response):
-                key = response["result"].number, params[1]
-                cache.add_block(key, response)
-        elif params[0].startswith("0x"):
-            response = cache.get_block(params)
-            if response is None:
-                response = make_request(method, params)
-                if _result_ok(response):
-                    cache.add_block(params, response)
-        else:
-            response = make_request(method, params)
-        return response
+                cache.add_block(params, response)
+    else:
+        response = make_request(method, params)
+    return response
+
+
+class _CallCache:
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        # The selectors of the cached functions by contract address, each
+        # with the names of the events invalidating their results.
+        self._functions: dict[str, dict[str, frozenset[str]]] = {}
+        self._results: dict[tuple[str, str], RPCResponse] = {}
+        # Incremented by each invalidation, so that results of calls made
+        # before an invalidation are not cached after it.
+        self._generation = 0
+
+    def register(self, address: str, selector: str, invalidated_by: Iterable[str]) -> None:
+        with self._lock:
+            functions = self._functions.setdefault(address.lower(), {})
+            functions[selector.lower()] = frozenset(invalidated_by)
+
+    def get_key(self, params: Any) -> tuple[str, str] | None:
+        # Only calls against the latest block are cached, since the
+        # invalidation is based on the latest events.
+        if len(params) > 1 and params[1] != "latest":
+            return None
+        address = params[0].get("to")
+        data = params[0].get("data")
+        if address is None or data is None:
+            return None
+        address = address.lower()
+        functions = self._functions.get(address)
+        if functions is None or data[:10].lower() not in functions:
+            return None
+        return address, data.lower()
+
+    def get(self, key: tuple[str, str]) -> tuple[RPCResponse | None, int]:
+        with self._lock:
+            return self._results.get(key), self._generation
+
+    def add(self, key: tuple[str, str], response: RPCResponse, generation: int) -> None:
+        with self._lock:
+            if generation == self._generation:
+                self._results[key] = response
+
+    def invalidate(self, address: str, event_name: str) -> None:
+        address = address.lower()
+        functions = self._functions.get(address)
+        if functions is None:
+            return
+        with self._lock:
+            self._generation += 1
+            stale = [
+                key
+                for key in self._results
+                if key[0] == address and event_name in functions[key[1][:10]]
+            ]
+            for key in stale:
+                del self._results[key]
+
+
+_CALL_CACHES: dict[ChainId, _CallCache] = {}
+
+
+def _get_call_cache(chain_id: ChainId) -> _CallCache:
+    cache = _CALL_CACHES.get(chain_id)
+    if cache is None:
+        cache = _CALL_CACHES.setdefault(chain_id, _CallCache())
+    return cache
+
+
+def register_cached_call(
+    chain_id: ChainId, address: str, selector: str, invalidated_by: Iterable[str] = ()
+) -> None:
+    """Cache the results of eth_call requests of the function with the given
+    selector of the contract at ``address``. The results are dropped when
+    one of the events named in ``invalidated_by`` is emitted by the contract,
+    see invalidate_cached_calls. Without such events, the results never
+    change."""
+    _get_call_cache(chain_id).register(address, selector, invalidated_by)
+
+
+def invalidate_cached_calls(chain_id: ChainId, address: str, event_name: str) -> None:
+    """Drop the cached call results invalidated by the event ``event_name``,
+    emitted by the contract at ``address``."""
+    cache = _CALL_CACHES.get(chain_id)
+    if cache is not None:
+        cache.invalidate(address, event_name)
+
+
+def generate_call_cache(chain_id: ChainId) -> Middleware:
+    return cast(Middleware, functools.partial(cache_calls, cache=_get_call_cache(chain_id)))
+
+
+# This middleware answers eth_call requests of registered contract functions
+# from the cache, see register_cached_call. This is meant for functions whose
+# results only change through transactions emitting known events, such as
+# immutable contract parameters or the LP whitelist, so that reading them
+# does not cost any requests after the first one.
+def cache_calls(
+    make_request: Callable[[RPCEndpoint, Any], RPCResponse], _w3: Web3, cache: _CallCache
+) -> Callable[[RPCEndpoint, Any], RPCResponse]:
+    def middleware(method: RPCEndpoint, params: Any) -> RPCResponse:
+        if method != "eth_call":
+            return make_request(method, params)
+        return _call_with_cache(method, params, make_request, cache)
 
     return middleware
 
 
-# The rate limiter middleware.
-#
-# In cases where an RPC returns HTTP 429 (Too many requests), we need to reduce
-# the rate at which we issue requests to that RPC. In order to do that, we
-# define the following operating modes:
-#
-# 1) normal operation
-# 2) rate limiting mode
-# 3) tapering mode
-#
-# In normal operation, the RPC accepts our every request and we issue requests
-# at full rate, i.e. as they come.
+def _call_with_cache(
+    method: RPCEndpoint,
+    params: Any,
+    make_request: Callable[[RPCEndpoint, Any], RPCResponse],
+    cache: _CallCache,
+) -> RPCResponse:
+    key = cache.get_key(params)
+    if key is None:
+        return make_request(method, params)
+
+    response, generation = cache.get(key)
+    if response is None:
+        response = make_request(method, params)
+        if _result_ok(response):
+            cache.add(key, response, generation)
+    return response
+
+
+# JSON-RPC batches.
 #
-# Rate limiting mode begins when the RPC returns HTTP 429, while we are in
-# normal operation. For the duration of this mode, defined by _RATE_LIMIT_PERIOD,
-# we will attempt to issue requests with a reduced rate, defined by
-# _RATE_LIMIT_REQUEST_DELAY, the number of seconds between each attempt.
+# Web3 does not support batches, so a batch is sent through the middlewares as
+# a single request for BATCH_REQUEST, with a BatchParams as params, which the
+# provider posts as a batch, see beamer.provider.make_batch_request. This way,
+# batches wait for the rate limiter like any other request. The rate limiter
+# charges the compute units of every call in the batch, and the
+# instrumentation records every call as a call of the batched method.
+BATCH_REQUEST = RPCEndpoint("beamer_batchRequest")
+
+
+@dataclass(frozen=True)
+class BatchParams:
+    method: RPCEndpoint
+    params_list: Sequence[Any]
+
+
+def _get_calls(method: RPCEndpoint, params: Any) -> tuple[RPCEndpoint, int]:
+    # Return the method and the number of calls made by a request.
+    if method == BATCH_REQUEST:
+        return params.method, len(params.params_list)
+    return method, 1
+
+
+# Methods whose results are left as decoded from JSON by attrdict_middleware.
+RAW_RESULT_METHODS = frozenset(("eth_getLogs", BATCH_REQUEST))
+
+
+def attrdict_middleware(
+    make_request: Callable[[RPCEndpoint, Any], RPCResponse], _w3: Web3
+) -> Callable[[RPCEndpoint, Any], RPCResponse]:
+    """A replacement of web3's attrdict middleware that does not convert the
+    results of RAW_RESULT_METHODS into AttributeDicts. The event fetchers
+    request logs without web3's result formatters, see
+    beamer.events._format_log_entry, so they only need plain dicts, and
+    converting large eth_getLogs results is costly."""
+
+    def middleware(method: RPCEndpoint, params: Any) -> RPCResponse:
+        response = make_request(method, params)
+        if method in RAW_RESULT_METHODS or "result" not in response:
+            return response
+        return assoc(response, "result", AttributeDict.recursive(response["result"]))
+
+    return middleware
+
+
+# The rate limiter middleware.
 #
-# This effectively caps the request rate at 1 / _RATE_LIMIT_REQUEST_DELAY with
-# the hope that the RPC will eventually notice that we slowed down and accept
-# the requests. If the RPC rejects new requests even after the rate limiting
-# period is over, we simply raise a RuntimeError, which will cause the agent to
-# shut down, as there is nothing more that could be done.
+# The rate limiter bounds the number of concurrent in-flight requests to an RPC,
+# and the rate at which requests are issued, via a token bucket. As long as the
+# RPC accepts our requests, the rate is only limited if a maximum rate is
+# configured, and up to max_concurrent_requests threads may issue requests to
+# the same RPC at the same time.
 #
-# Tapering mode begins immediately after the end of rate limiting mode, with
-# the idea that we ramp up to the original normal operation request rate (i.e.
-# without any delays). Currently, the ramp up is implemented in the following
-# way:
+# When an RPC returns HTTP 429 (Too many requests), we enter rate limiting mode:
 #
-# - upon exiting the rate limiting mode, set
-#   - _RateLimiterState.taper_counter to 0
-#   - _RateLimiterState.taper_counter_max to the number of threads currently
-#    waiting on the rate limiter lock in the _rate_limiter function
+# - the rate is halved, starting from the configured maximum rate, or from the
+#   rate we observed during the last second if there is no maximum, but never
+#   below _RATE_LIMIT_MIN_RATE
 #
-# - as each thread that waited on the lock gets its turn, it will notice it is
-#   in the tapering mode (taper_counter_max > 0) so it will sleep for a delay of
+# - no requests are issued until the time given by the Retry-After header of
+#   the response has passed, or for _RATE_LIMIT_REQUEST_DELAY seconds if there
+#   is no such header
 #
-#       _RATE_LIMIT_REQUEST_DELAY / 2**state.taper_counter
+# - the rejected request is retried; if it keeps being rejected for longer
+#   than _RATE_LIMIT_MAX_RETRY_TIME, we simply raise a RuntimeError, which will
+#   cause the agent to shut down, as there is nothing more that could be done
 #
-# - when taper_counter reaches taper_counter_max, the tapering mode is over and
-#   we return to normal operation
+# Once no request has been rejected for _RATE_LIMIT_PERIOD seconds, the rate is
+# ramped up again, doubling every _RATE_LIMIT_PERIOD seconds. When it reaches
+# the rate we started from, rate limiting mode ends. Any rejection on the way
+# halves the rate again.
 #
-# - if at any point during tapering mode we get rate limited by the RPC, we
-#   will immediately switch back to rate limiting mode
+# Requests waiting for a free request slot are served in order of their
+# priority, see RequestPriority, so that e.g. a fill is not stuck behind a
+# large number of eth_getLogs calls while resyncing. Optionally, the requests
+# are also limited by a budget of compute units per second. Each method is
+# weighted by its compute units, since e.g. eth_getLogs is far more expensive
+# for an RPC provider than eth_chainId.
 #
-# The tapering mode tries to quickly ramp up to normal request rate by
-# exponentially reducing the delay time between consecutive requests.
+# Note: it is important to ensure only one Web3 instance per chain/RPC,
+# otherwise, it could happen that two parallel rate limiter middlewares talk to
+# the same RPC, each of them unaware of the requests of the other.
+
+# The default number of concurrent in-flight requests per RPC.
+DEFAULT_MAX_CONCURRENT_REQUESTS = 10
+
+# The time in seconds without rejected requests after which the rate is ramped
+# up again. Also the time it takes to double the rate while ramping up.
+_RATE_LIMIT_PERIOD = 3
+
+# The time to wait before retrying a rejected request, unless the RPC tells
+# us otherwise via the Retry-After header.
+_RATE_LIMIT_REQUEST_DELAY = 1
+
+# The minimum rate, in requests per second, while in rate limiting mode.
+_RATE_LIMIT_MIN_RATE = 1 / _RATE_LIMIT_REQUEST_DELAY
+
+# The time a request may keep being rejected before we give up.
+_RATE_LIMIT_MAX_RETRY_TIME = 30
+
+# The number of seconds above which the wait time in the rate limiter is
+# considered too long. We will emit a debug log event any time a thread had
+# waited longer than this. Must be greater than _RATE_LIMIT_REQUEST_DELAY in
+# order to avoid spamming the log with too many events.
+_RATE_LIMIT_WAIT_TOO_LONG = _RATE_LIMIT_REQUEST_DELAY * 2
+
+
+def _parse_retry_after(value: str | None) -> float | None:
+    if value is None:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        retry_at = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, retry_at.timestamp() - time.time())
+
+
+class _TokenBucket:
+    """The rate limiting state of a single RPC.
+
+    The bucket itself never blocks, except on its internal lock, which is
+    only held for short computations. Callers are told how long to wait
+    instead, so that the bucket can be shared by the threaded and the async
+    rate limiter.
+    """
+
+    def __init__(self, rpc: str, max_rate: float | None):
+        self._lock = threading.Lock()
+        self._rpc = rpc
+        self._max_rate = max_rate
+        # The current rate in requests per second, None if unlimited.
+        self._rate = max_rate
+        self._tokens = self._capacity
+        self._last_refill = time.monotonic()
+        # No requests are issued before this time.
+        self._blocked_until = 0.0
+        # The rate at which rate limiting mode ends, None if not in rate
+        # limiting mode.
+        self._recovery_rate: float | None = None
+        self._last_rejection = 0.0
+        # Used to estimate the request rate if there is no maximum rate.
+        self._window_start = self._last_refill
+        self._window_requests = 0
+        self._observed_rate = 0.0
+
+    @property
+    def _capacity(self) -> float:
+        # Allow bursts of up to one second worth of requests.
+        return 1.0 if self._rate is None else max(1.0, self._rate)
+
+    def acquire(self) -> float:
+        """Take a token. Return 0 if a token was taken, otherwise the time in
+        seconds to wait before trying again."""
+        exited = False
+        with self._lock:
+            now = time.monotonic()
+            if now < self._blocked_until:
+                return self._blocked_until - now
+
+            elapsed = now - self._last_refill
+            self._last_refill = now
+            if self._recovery_rate is not None and now - self._last_rejection > _RATE_LIMIT_PERIOD:
+                exited = self._ramp_up(elapsed)
+
+            if self._rate is None:
+                wait = 0.0
+            else:
+                self._tokens = min(self._capacity, self._tokens + elapsed * self._rate)
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    wait = 0.0
+                else:
+                    wait = (1 - self._tokens) / self._rate
+            if wait == 0:
+                self._count_request(now)
+
+        if exited:
+            log.debug(
+                "Exiting rate limiting mode", thread=threading.current_thread().name, rpc=self._rpc
+            )
+        return wait
+
+    def _ramp_up(self, elapsed: float) -> bool:
+        assert self._rate is not None and self._recovery_rate is not None
+        self._rate = min(self._recovery_rate, self._rate * 2 ** (elapsed / _RATE_LIMIT_PERIOD))
+        if self._rate < self._recovery_rate:
+            return False
+        self._rate = self._max_rate
+        self._recovery_rate = None
+        self._tokens = self._capacity
+        return True
+
+    def _count_request(self, now: float) -> None:
+        window = now - self._window_start
+        if window >= 1:
+            self._observed_rate = self._window_requests / window
+            self._window_start = now
+            self._window_requests = 0
+        self._window_requests += 1
+
+    def reject(self, retry_after: float | None) -> None:
+        """Record that the RPC rejected a request."""
+        entered = False
+        with self._lock:
+            now = time.monotonic()
+            self._last_rejection = now
+            if self._recovery_rate is None:
+                entered = True
+                if self._max_rate is not None:
+                    self._recovery_rate = self._max_rate
+                else:
+                    self._recovery_rate = max(
+                        _RATE_LIMIT_MIN_RATE, self._observed_rate, self._window_requests
+                    )
+                self._rate = self._recovery_rate
+            assert self._rate is not None
+            # Requests that were in flight when we started backing off are
+            # likely to be rejected as well. Only reduce the rate once for
+            # all of them.
+            if now >= self._blocked_until:
+                self._rate = max(_RATE_LIMIT_MIN_RATE, self._rate / 2)
+                self._tokens = min(self._tokens, self._capacity)
+            delay = _RATE_LIMIT_REQUEST_DELAY if retry_after is None else retry_after
+            self._blocked_until = max(self._blocked_until, now + delay)
+
+        if entered:
+            log.debug(
+                "Entering rate limiting mode",
+                thread=threading.current_thread().name,
+                rpc=self._rpc,
+            )
+
+
+class RequestPriority(enum.IntEnum):
+    """The priority classes of RPC requests, most urgent first."""
+
+    # Sending transactions.
+    SUBMIT = 0
+    # Reads needed to fill or claim a request.
+    FILL = 1
+    # Regular polling for new blocks and events, and everything else.
+    POLLING = 2
+    # Fetching historical events, e.g. while resyncing.
+    BACKFILL = 3
+
+
+_SUBMIT_METHODS = frozenset(("eth_sendTransaction", "eth_sendRawTransaction"))
+
+# A context variable holding the priority of the requests made by the current
+# thread or task, see request_priority.
+_REQUEST_PRIORITY: contextvars.ContextVar[RequestPriority] = contextvars.ContextVar(
+    "request_priority", default=RequestPriority.POLLING
+)
+
+
+@contextlib.contextmanager
+def request_priority(priority: RequestPriority) -> Iterator[None]:
+    """Make the RPC requests of the current thread or task within the block
+    with the given priority. Sending transactions always has the highest
+    priority."""
+    token = _REQUEST_PRIORITY.set(priority)
+    try:
+        yield
+    finally:
+        _REQUEST_PRIORITY.reset(token)
+
+
+def get_request_priority(method: RPCEndpoint) -> RequestPriority:
+    """Return the priority of a request for the given method, made by the
+    current thread or task."""
+    if method in _SUBMIT_METHODS:
+        return RequestPriority.SUBMIT
+    return _REQUEST_PRIORITY.get()
+
+
+# The compute units of JSON-RPC methods, roughly as charged by common RPC
+# providers. They can be overridden per chain in the agent config.
+DEFAULT_COMPUTE_UNITS: Mapping[str, float] = MappingProxyType(
+    {
+        "eth_chainId": 0,
+        "eth_blockNumber": 10,
+        "eth_maxPriorityFeePerGas": 10,
+        "eth_feeHistory": 10,
+        "eth_getTransactionReceipt": 15,
+        "eth_getBlockByNumber": 16,
+        "eth_getTransactionByHash": 17,
+        "eth_gasPrice": 19,
+        "eth_getBalance": 19,
+        "eth_call": 26,
+        "eth_getCode": 26,
+        "eth_getTransactionCount": 26,
+        "eth_getLogs": 75,
+        "eth_estimateGas": 87,
+        "eth_sendTransaction": 250,
+        "eth_sendRawTransaction": 250,
+    }
+)
+
+# The compute units of methods not listed in DEFAULT_COMPUTE_UNITS.
+_DEFAULT_METHOD_COMPUTE_UNITS = 20
+
+
+@dataclass(slots=True, order=True)
+class _Ticket:
+    priority: RequestPriority
+    seq: int
+    cost: float = field(compare=False)
+    # Called when the ticket may be able to get a request slot.
+    wake: Callable[[], None] = field(compare=False)
+
+
+class _PriorityLanes:
+    """Hands out the request slots of a single RPC in order of priority.
+
+    Requests with the same priority are served first come, first served.
+    A request gets a slot once it is the most urgent one waiting, and there
+    is a free slot, enough compute units in the budget and a token in the
+    token bucket. Like the token bucket, the lanes never block. Waiting is
+    up to the caller, which is woken up via the ticket when it may be its
+    turn.
+    """
+
+    def __init__(
+        self,
+        bucket: _TokenBucket,
+        max_concurrent_requests: int,
+        compute_units_per_second: float | None,
+        compute_units: Mapping[str, float],
+    ):
+        self._lock = threading.Lock()
+        self._bucket = bucket
+        self._max_in_flight = max_concurrent_requests
+        self._in_flight = 0
+        self._queue: list[_Ticket] = []
+        self._seq = itertools.count()
+        self._compute_units = {**DEFAULT_COMPUTE_UNITS, **compute_units}
+        self._budget = compute_units_per_second
+        # The compute units available, allowing bursts of up to one second
+        # worth of the budget. Negative if a request cost more than that.
+        self._units = compute_units_per_second or 0.0
+        self._last_refill = time.monotonic()
+
+    @property
+    def num_waiting(self) -> int:
+        return len(self._queue)
+
+    def enqueue(self, method: RPCEndpoint, params: Any, wake: Callable[[], None]) -> _Ticket:
+        method, num_calls = _get_calls(method, params)
+        cost = num_calls * self._compute_units.get(method, _DEFAULT_METHOD_COMPUTE_UNITS)
+        with self._lock:
+            ticket = _Ticket(get_request_priority(method), next(self._seq), cost, wake)
+            heapq.heappush(self._queue, ticket)
+        return ticket
+
+    def try_acquire(self, ticket: _Ticket) -> float:
+        """Take a request slot for the ticket. Return 0 if the slot was
+        taken, otherwise the time in seconds to wait before trying again,
+        which is infinite if the caller needs to wait to be woken up."""
+        with self._lock:
+            if self._in_flight >= self._max_in_flight or self._queue[0] is not ticket:
+                return math.inf
+            wait = self._budget_wait(ticket.cost)
+            if wait == 0:
+                wait = self._bucket.acquire()
+            if wait > 0:
+                return wait
+
+            self._units -= ticket.cost
+            self._in_flight += 1
+            heapq.heappop(self._queue)
+            head = self._queue[0] if self._queue else None
+
+        if head is not None:
+            head.wake()
+        return 0.0
+
+    def _budget_wait(self, cost: float) -> float:
+        if self._budget is None:
+            return 0.0
+        now = time.monotonic()
+        elapsed = now - self._last_refill
+        self._last_refill = now
+        self._units = min(self._budget, self._units + elapsed * self._budget)
+        # Requests costing more than the whole budget only need to wait
+        # for a full budget, otherwise they would never be sent.
+        needed = min(cost, self._budget)
+        if self._units >= needed:
+            return 0.0
+        return (needed - self._units) / self._budget
+
+    def release(self) -> None:
+        """Return a request slot taken via try_acquire."""
+        with self._lock:
+            self._in_flight -= 1
+            head = self._queue[0] if self._queue else None
+        if head is not None:
+            head.wake()
+
+    def cancel(self, ticket: _Ticket) -> None:
+        """Remove a ticket which did not get a request slot."""
+        with self._lock:
+            if ticket not in self._queue:
+                return
+            self._queue.remove(ticket)
+            heapq.heapify(self._queue)
+            head = self._queue[0] if self._queue else None
+        if head is not None:
+            head.wake()
 
 
 # The rate limiter state.
 #
 # One instance per web3 rate limiter middleware, i.e. one instance per
 # chain/RPC if there is exactly one Web3 instance per chain/RPC.
-#
-# Note: it is important to ensure only one Web3 instance per chain/RPC,
-# otherwise, it could happen that two parallel rate limiter middleware talk to
-# the same RPC, which would rate limit both middlewares.
-#
-# The lock protects all state fields except num_waiting_on_lock, which is an
-# atomic used to keep track of threads waiting on the lock. The introduction of
-# this lock means that, effectively, even in normal operation where no rate
-# limiting occurs, concurrent requests may not happen as if the lock were not
-# there. In other words, regardless of rate limiting, if several threads
-# attempt to issue requests and arrive at the rate limiter middleware at the
-# same time, they will be forced to take the lock and make the requests
-# serially.
 @dataclass(slots=True)
 class _RateLimiterState:
-    lock: threading.Lock = field(default_factory=threading.Lock)
-    num_waiting_on_lock: atomics.base.AtomicUint = field(
-        default_factory=lambda: atomics.atomic(width=4, atype=atomics.UINT)
-    )
-    rate_limit_end: None | float = None
-    taper_counter: int = 0
-    taper_counter_max: int = 0
+    bucket: _TokenBucket
+    lanes: _PriorityLanes
+    # The rpc_rate_limiter_wait_seconds histograms of the chain by priority,
+    # if the chain is known.
+    wait_time_metrics: None | dict[RequestPriority, Histogram] = None
 
 
-# The time period during which the middleware will limit the maximum number of
-# requests per second to 1 / _RATE_LIMIT_REQUEST_DELAY.
-# _RATE_LIMIT_PERIOD must always be greater than _RATE_LIMIT_REQUEST_DELAY.
-# It is recommended to use a small multiple of _RATE_LIMIT_REQUEST_DELAY.
-_RATE_LIMIT_PERIOD = 3
+# The token buckets and priority lanes of the rate limiters, by RPC and
+# limits. The threaded and the async rate limiter of the same RPC share them,
+# so that the limits apply to all requests of the process, e.g. both to those
+# of an AsyncEventMonitor and to those of the event processors' threads.
+_LANES: dict[tuple[Any, ...], tuple[_TokenBucket, _PriorityLanes]] = {}
+_LANES_LOCK = threading.Lock()
 
-# The delay between two consecutive attempts at making a request to the RPC.
-# Only used during the rate limiting period.
-_RATE_LIMIT_REQUEST_DELAY = 1
 
-# The number of seconds above which the wait time on the rate limiter lock is
-# considered too long. We will emit a debug log event any time a thread had
-# waited on the lock longer than this. Must be greater than
-# _RATE_LIMIT_REQUEST_DELAY in order to avoid spamming the log with too many
-# events.
-_RATE_LIMIT_LOCK_WAIT_TOO_LONG = _RATE_LIMIT_REQUEST_DELAY * 2
+def _make_lanes(
+    rpc: str,
+    max_concurrent_requests: int,
+    max_requests_per_second: float | None,
+    compute_units_per_second: float | None,
+    compute_units: Mapping[str, float] | None,
+) -> tuple[_TokenBucket, _PriorityLanes]:
+    key = (
+        rpc,
+        max_concurrent_requests,
+        max_requests_per_second,
+        compute_units_per_second,
+        tuple(sorted((compute_units or {}).items())),
+    )
+    with _LANES_LOCK:
+        shared = _LANES.get(key)
+        if shared is None:
+            bucket = _TokenBucket(rpc, max_requests_per_second)
+            lanes = _PriorityLanes(
+                bucket, max_concurrent_requests, compute_units_per_second, compute_units or {}
+            )
+            shared = _LANES[key] = bucket, lanes
+        return shared
+
+
+def _get_wait_time_metrics(chain_id: ChainId | None) -> None | dict[RequestPriority, Histogram]:
+    if chain_id is None:
+        return None
+    return {
+        priority: _RATE_LIMITER_WAIT.labels(chain_id, priority.name.lower())
+        for priority in RequestPriority
+    }
+
 
 # A thread local object used to handle reentrancy in web3py middleware.
 _RATE_LIMITER_TLD = threading.local()
@@ -194,16 +716,31 @@ _RATE_LIMITER_TLD = threading.local()
 _MakeRequest = Callable[[RPCEndpoint, Any], RPCResponse]
 
 
+def _acquire_slot(lanes: _PriorityLanes, method: RPCEndpoint, params: Any) -> RequestPriority:
+    event = threading.Event()
+    ticket = lanes.enqueue(method, params, event.set)
+    try:
+        while True:
+            event.clear()
+            wait = lanes.try_acquire(ticket)
+            if wait == 0:
+                return ticket.priority
+            event.wait(None if wait == math.inf else wait)
+    except BaseException:
+        lanes.cancel(ticket)
+        raise
+
+
 def _try_make_request(
     make_request: _MakeRequest, method: RPCEndpoint, params: Any
-) -> tuple[bool, None | RPCResponse]:
+) -> tuple[bool, float | None, None | RPCResponse]:
     try:
         response = make_request(method, params)
     except requests.exceptions.HTTPError as exc:
         if exc.response.status_code == 429:
-            return True, None
+            return True, _parse_retry_after(exc.response.headers.get("Retry-After")), None
         raise exc
-    return False, response
+    return False, None, response
 
 
 def _rate_limiter_inner(
@@ -213,61 +750,30 @@ def _rate_limiter_inner(
     w3: Web3,
     state: _RateLimiterState,
 ) -> RPCResponse:
-    rpc = cast(HTTPProvider, w3.provider).endpoint_uri
+    # The first attempt got its token from the token bucket along with the
+    # request slot. Retries keep the slot and only wait for another token.
+    give_up_time = None
     while True:
-        if state.rate_limit_end is not None:
-            # We are in rate limiting period.
-            rate_limited, response = _try_make_request(make_request, method, params)
-            while rate_limited and time.time() <= state.rate_limit_end:
-                time.sleep(_RATE_LIMIT_REQUEST_DELAY)
-                rate_limited, response = _try_make_request(make_request, method, params)
-
-            if rate_limited:
-                # Even after _RATE_LIMIT_PERIOD, we are still being rate-limited by
-                # the RPC provider so there is nothing we can really do.
-                raise RuntimeError("rate limit period exceeded: %s" % rpc)
-
+        rate_limited, retry_after, response = _try_make_request(make_request, method, params)
+        if not rate_limited:
             assert response is not None
-
-            if time.time() > state.rate_limit_end:
-                # Rate limit period ended so we now enter the tapering period,
-                num_waiting_on_lock = state.num_waiting_on_lock.load()
-                log.debug(
-                    "Exiting rate limiting mode", thread=threading.current_thread().name, rpc=rpc
-                )
-                state.rate_limit_end = None
-                state.taper_counter = 0
-                state.taper_counter_max = num_waiting_on_lock
-
             return response
 
-        # We are not in rate limiting period.
-        if state.taper_counter_max > 0:
-            # We are in tapering period.
-            request_delay = _RATE_LIMIT_REQUEST_DELAY / 2**state.taper_counter
-            state.taper_counter += 1
-            if state.taper_counter == state.taper_counter_max:
-                # We have reached the end of tapering period.
-                state.taper_counter = 0
-                state.taper_counter_max = 0
-                log.debug("Exiting tapering mode", thread=threading.current_thread().name, rpc=rpc)
-
-            time.sleep(request_delay)
-
-        # If we get rate limited by the RPC, start a new rate limiting
-        # period by setting state.rate_limit_end and try sending the
-        # request again after _RATE_LIMIT_REQUEST_DELAY. Otherwise,
-        # simply return the response.
-        rate_limited, response = _try_make_request(make_request, method, params)
-        if rate_limited:
-            log.debug(
-                "Entering rate limiting mode", thread=threading.current_thread().name, rpc=rpc
-            )
-            state.rate_limit_end = time.time() + _RATE_LIMIT_PERIOD
-            time.sleep(_RATE_LIMIT_REQUEST_DELAY)
-        else:
-            assert response is not None
-            return response
+        now = time.monotonic()
+        if give_up_time is None:
+            give_up_time = now + _RATE_LIMIT_MAX_RETRY_TIME
+        elif now > give_up_time:
+            # Even after retrying for _RATE_LIMIT_MAX_RETRY_TIME, we are still
+            # being rate-limited by the RPC provider so there is nothing we
+            # can really do.
+            rpc = cast(HTTPProvider, w3.provider).endpoint_uri
+            raise RuntimeError("rate limit period exceeded: %s" % rpc)
+        state.bucket.reject(retry_after)
+
+        wait = state.bucket.acquire()
+        while wait > 0:
+            time.sleep(wait)
+            wait = state.bucket.acquire()
 
 
 def _rate_limiter(
@@ -278,74 +784,689 @@ def _rate_limiter(
     state: _RateLimiterState,
 ) -> RPCResponse:
     if hasattr(_RATE_LIMITER_TLD, "entered"):
-        # We already entered this function once and likely took the lock,
-        # so just make a request immediately to avoid deadlocks.
+        # We already entered this function once and hold one of the request
+        # slots, so just make a request immediately to avoid deadlocks.
         # The cause of a second entry into this function is most probably
         # an eth_chainId call made as part of our call to make_request.
         return make_request(method, params)
 
     _RATE_LIMITER_TLD.entered = True
-
-    state.num_waiting_on_lock.inc()
-    t = time.time()
-    with state.lock:
-        lock_wait_time = time.time() - t
-        if lock_wait_time > _RATE_LIMIT_LOCK_WAIT_TOO_LONG:
-            rpc = cast(HTTPProvider, w3.provider).endpoint_uri
-            num_waiting_on_lock = state.num_waiting_on_lock.load()
-            log.debug(
-                "Long rate limiter lock wait time",
-                thread=threading.current_thread().name,
-                lock_wait_time=lock_wait_time,
-                num_waiting_on_lock=num_waiting_on_lock,
-                rpc=rpc,
-            )
-
-        state.num_waiting_on_lock.dec()
+    try:
+        t = time.time()
+        priority = _acquire_slot(state.lanes, method, params)
         try:
-            # The following call may return in exactly one of these cases:
-            # 1) we got a response from the RPC, during rate limiting period
-            # 2) we got a response from the RPC, during tapering period
-            # 3) we got a response from the RPC, during normal operation
-            # 4) we got rejected by the RPC, even after rate limit period; this
-            #    will result in a RuntimeError being raised, causing agent shutdown
+            wait_time = time.time() - t
+            if state.wait_time_metrics is not None:
+                state.wait_time_metrics[priority].observe(wait_time)
+            if wait_time > _RATE_LIMIT_WAIT_TOO_LONG:
+                log.debug(
+                    "Long rate limiter wait time",
+                    thread=threading.current_thread().name,
+                    wait_time=wait_time,
+                    priority=priority.name,
+                    num_waiting=state.lanes.num_waiting,
+                    rpc=cast(HTTPProvider, w3.provider).endpoint_uri,
+                )
             return _rate_limiter_inner(method, params, make_request, w3, state)
         finally:
-            del _RATE_LIMITER_TLD.entered
+            state.lanes.release()
+    finally:
+        del _RATE_LIMITER_TLD.entered
 
 
 def rate_limiter(
-    make_request: _MakeRequest, w3: Web3
+    make_request: _MakeRequest,
+    w3: Web3,
+    chain_id: ChainId | None = None,
+    max_concurrent_requests: int = DEFAULT_MAX_CONCURRENT_REQUESTS,
+    max_requests_per_second: float | None = None,
+    compute_units_per_second: float | None = None,
+    compute_units: Mapping[str, float] | None = None,
 ) -> Callable[[RPCEndpoint, Any], RPCResponse]:
-    state = _RateLimiterState()
+    state = _make_rate_limiter_state(
+        w3,
+        chain_id,
+        max_concurrent_requests,
+        max_requests_per_second,
+        compute_units_per_second,
+        compute_units,
+    )
     return functools.partial(_rate_limiter, make_request=make_request, w3=w3, state=state)
 
 
+def _make_rate_limiter_state(
+    w3: Web3,
+    chain_id: ChainId | None,
+    max_concurrent_requests: int,
+    max_requests_per_second: float | None,
+    compute_units_per_second: float | None,
+    compute_units: Mapping[str, float] | None,
+) -> _RateLimiterState:
+    rpc = str(cast(HTTPProvider, w3.provider).endpoint_uri)
+    bucket, lanes = _make_lanes(
+        rpc,
+        max_concurrent_requests,
+        max_requests_per_second,
+        compute_units_per_second,
+        compute_units,
+    )
+    return _RateLimiterState(
+        bucket=bucket, lanes=lanes, wait_time_metrics=_get_wait_time_metrics(chain_id)
+    )
+
+
+def generate_rate_limiter(
+    chain_id: ChainId,
+    max_concurrent_requests: int = DEFAULT_MAX_CONCURRENT_REQUESTS,
+    max_requests_per_second: float | None = None,
+    compute_units_per_second: float | None = None,
+    compute_units: Mapping[str, float] | None = None,
+) -> Middleware:
+    """Return a rate limiter with the given limits, which records its wait
+    times as metrics of the given chain. Compute units of methods given in
+    ``compute_units`` override those of DEFAULT_COMPUTE_UNITS."""
+    return cast(
+        Middleware,
+        functools.partial(
+            rate_limiter,
+            chain_id=chain_id,
+            max_concurrent_requests=max_concurrent_requests,
+            max_requests_per_second=max_requests_per_second,
+            compute_units_per_second=compute_units_per_second,
+            compute_units=compute_units,
+        ),
+    )
+
+
+# The instrumentation middleware.
+#
+# Records the number, latency and response size of JSON-RPC calls per chain and
+# method, as well as failed calls. It is meant to be the innermost middleware,
+# so that only calls that actually reach the RPC are recorded, including each
+# retry of the rate limiter, but not calls answered from one of the caches.
+# The calls of a batch are recorded as calls of the batched method, with the
+# duration and response size of the whole batch, see BATCH_REQUEST.
+#
+# The middleware only sees decoded responses. The size of the raw response is
+# recorded by the provider, or by a trace config of the HTTP session in the
+# async case, and passed on to the middleware via a thread local object (or
+# a context variable), see set_response_size and
+# make_response_size_trace_config.
+
+_RPC_REQUESTS = Counter("rpc_requests", "Number of JSON-RPC calls", ["chain_id", "method"])
+_RPC_REQUEST_DURATION = Histogram(
+    "rpc_request_duration_seconds",
+    "Time until the response of a JSON-RPC call was received",
+    ["chain_id", "method"],
+    buckets=(0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, float("inf")),
+)
+_RPC_RESPONSE_SIZE = Histogram(
+    "rpc_response_size_bytes",
+    "Size of JSON-RPC responses",
+    ["chain_id", "method"],
+    buckets=tuple(4**exponent for exponent in range(4, 13)) + (float("inf"),),
+)
+# The error label is the HTTP status code for HTTP errors, e.g. 429 (Too Many
+# Requests) or 413 (Request Entity Too Large), "rpc" for JSON-RPC error
+# responses and "connection" for failed connections.
+_RPC_ERRORS = Counter(
+    "rpc_errors", "Number of failed JSON-RPC calls", ["chain_id", "method", "error"]
+)
+_RATE_LIMITER_WAIT = Histogram(
+    "rpc_rate_limiter_wait_seconds",
+    "Time spent waiting for a free request slot of the rate limiter",
+    ["chain_id", "priority"],
+    buckets=(0.001, 0.01, 0.1, 0.5, 1, 2, 5, 10, 30, float("inf")),
+)
+
+_RESPONSE_SIZE_TLD = threading.local()
+
+
+def set_response_size(size: int) -> None:
+    """Pass the size of the response just received on to the instrumentation
+    middleware."""
+    _RESPONSE_SIZE_TLD.size = size
+
+
+class _RPCMetrics:
+    """The metrics of a single chain, with the labeled metrics of each
+    method cached to avoid the label lookup on every call."""
+
+    def __init__(self, chain_id: ChainId):
+        self._chain_id = str(chain_id)
+        self._by_method: dict[str, tuple[Counter, Histogram, Histogram]] = {}
+
+    def record(
+        self, method: str, duration: float, response_size: int | None, num_calls: int = 1
+    ) -> None:
+        metrics = self._by_method.get(method)
+        if metrics is None:
+            metrics = (
+                _RPC_REQUESTS.labels(self._chain_id, method),
+                _RPC_REQUEST_DURATION.labels(self._chain_id, method),
+                _RPC_RESPONSE_SIZE.labels(self._chain_id, method),
+            )
+            self._by_method[method] = metrics
+        num_requests, request_duration, response_sizes = metrics
+        num_requests.inc(num_calls)
+        request_duration.observe(duration)
+        if response_size is not None:
+            response_sizes.observe(response_size)
+
+    def record_error(self, method: str, error: str, num_calls: int = 1) -> None:
+        _RPC_ERRORS.labels(self._chain_id, method, error).inc(num_calls)
+
+
+def _get_error_label(exc: Exception) -> str | None:
+    if isinstance(exc, requests.exceptions.HTTPError) and exc.response is not None:
+        return str(exc.response.status_code)
+    if isinstance(exc, aiohttp.ClientResponseError):
+        return str(exc.status)
+    if isinstance(exc, (requests.exceptions.ConnectionError, aiohttp.ClientConnectionError)):
+        return "connection"
+    return None
+
+
+def _count_rpc_errors(method: RPCEndpoint, response: RPCResponse) -> int:
+    # The calls of a batch fail individually, see BATCH_REQUEST.
+    if method == BATCH_REQUEST and "result" in response:
+        return sum("error" in call_response for call_response in response["result"])
+    return int("error" in response)
+
+
+def generate_instrumentation(chain_id: ChainId) -> Middleware:
+    return cast(Middleware, functools.partial(instrumentation, metrics=_RPCMetrics(chain_id)))
+
+
+def instrumentation(
+    make_request: _MakeRequest, _w3: Web3, metrics: _RPCMetrics
+) -> Callable[[RPCEndpoint, Any], RPCResponse]:
+    def middleware(method: RPCEndpoint, params: Any) -> RPCResponse:
+        _RESPONSE_SIZE_TLD.size = None
+        calls_method, num_calls = _get_calls(method, params)
+        start = time.monotonic()
+        try:
+            response = make_request(method, params)
+        except Exception as exc:
+            error = _get_error_label(exc)
+            if error is not None:
+                metrics.record_error(calls_method, error, num_calls)
+            raise
+        duration = time.monotonic() - start
+        metrics.record(calls_method, duration, _RESPONSE_SIZE_TLD.size, num_calls)
+        num_errors = _count_rpc_errors(method, response)
+        if num_errors:
+            metrics.record_error(calls_method, "rpc", num_errors)
+        return response
+
+    return middleware
+
+
+_MAX_PRIORITY_FEE = RPCEndpoint("eth_maxPriorityFeePerGas")
+_GET_BLOCK_BY_NUMBER = RPCEndpoint("eth_getBlockByNumber")
+
+
 def max_fee_setter(
     make_request: _MakeRequest, _w3: Web3, cache: _BlockCache
 ) -> Callable[[RPCEndpoint, Any], RPCResponse]:
     def middleware(method: RPCEndpoint, params: Any) -> RPCResponse:
         if method != "eth_sendTransaction":
             return make_request(method, params)
-        priority_fee_response = make_request(RPCEndpoint("eth_maxPriorityFeePerGas"), [])
-        if _result_ok(priority_fee_response):
-            priority_fee = int(priority_fee_response["result"], 16)
+        error_response = _set_max_fee(params, make_request, cache)
+        if error_response is not None:
+            return error_response
+        return make_request(method, params)
+
+    return middleware
+
+
+def _set_max_fee(
+    params: Any, make_request: _MakeRequest, cache: _BlockCache
+) -> RPCResponse | None:
+    """Set the fees of the transaction in ``params``, unless they are set
+    already, e.g. for a replacement transaction. Return the error response if
+    a request for the current fees failed."""
+    if _has_max_fee(params):
+        return None
+    priority_fee_response = make_request(_MAX_PRIORITY_FEE, [])
+    if not _result_ok(priority_fee_response):
+        return priority_fee_response
+
+    latest_block = cache.get_latest_block()
+    if latest_block is None:
+        latest_block = make_request(_GET_BLOCK_BY_NUMBER, ["latest", False])
+        if not _result_ok(latest_block):
+            return latest_block
+    _store_max_fee(params, priority_fee_response, latest_block)
+    return None
+
+
+def _has_max_fee(params: Any) -> bool:
+    return "maxFeePerGas" in params[0]
+
+
+def _store_max_fee(
+    params: Any, priority_fee_response: RPCResponse, latest_block: RPCResponse
+) -> None:
+    priority_fee = int(priority_fee_response["result"], 16)
+    base_fee = int(latest_block["result"].baseFeePerGas, 16)
+    params[0]["maxPriorityFeePerGas"] = priority_fee
+    params[0]["maxFeePerGas"] = 2 * base_fee + priority_fee
+
+
+# The fused middleware.
+#
+# Does the work of the middlewares make_web3 installs on top of the web3
+# defaults, i.e. the call cache, the rate limiter, the block cache, the max fee
+# setter, web3's simple cache and web3's signing middleware, in a single
+# middleware. Each of them costs a few call frames on every request, even
+# though most of them only act on a single method. Instead, the fused
+# middleware dispatches each request by its method to a handler that only
+# takes the steps relevant for that method, and sends all other requests
+# through the rate limiter.
+#
+# The responses are the same as with the separate middlewares. The only
+# difference is that responses served from one of the caches do not wait
+# for a request slot of the rate limiter.
+
+# The number of responses kept by the cache of methods whose results never
+# change, see web3's simple cache middleware.
+_SIMPLE_CACHE_SIZE = 256
+
+
+class _FusedMiddleware:
+    def __init__(
+        self,
+        make_request: _MakeRequest,
+        w3: Web3,
+        chain_id: ChainId,
+        account: LocalAccount | None,
+        set_max_fee: bool,
+        state: _RateLimiterState,
+    ):
+        self._make_request = make_request
+        self._w3 = w3
+        self._state = state
+        self._set_max_fee = set_max_fee
+        self._block_cache = _BLOCK_STORAGE.setdefault(chain_id, _BlockCache())
+        self._call_cache = _get_call_cache(chain_id)
+        self._simple_cache = lru.LRU(_SIMPLE_CACHE_SIZE)
+        self._send_transaction: _MakeRequest = make_request
+        if account is not None:
+            sign_and_send = construct_sign_and_send_raw_middleware(account)
+            self._send_transaction = sign_and_send(make_request, w3)
+
+        handlers: dict[str, _MakeRequest] = {
+            method: self._request_simple_cached for method in SIMPLE_CACHE_RPC_WHITELIST
+        }
+        handlers["eth_call"] = self._call
+        handlers["eth_getBlockByNumber"] = self._get_block_by_number
+        handlers["eth_sendTransaction"] = self._send_transaction_rate_limited
+        self._handlers = handlers
+
+    def __call__(self, method: RPCEndpoint, params: Any) -> RPCResponse:
+        handler = self._handlers.get(method)
+        if handler is None:
+            return _rate_limiter(method, params, self._make_request, self._w3, self._state)
+        return handler(method, params)
+
+    def _request(self, method: RPCEndpoint, params: Any) -> RPCResponse:
+        return _rate_limiter(method, params, self._make_request, self._w3, self._state)
+
+    def _request_simple_cached(self, method: RPCEndpoint, params: Any) -> RPCResponse:
+        key = method, repr(params)
+        response = self._simple_cache.get(key)
+        if response is None:
+            response = self._request(method, params)
+            if _result_ok(response):
+                self._simple_cache[key] = response
+        return response
+
+    def _call(self, method: RPCEndpoint, params: Any) -> RPCResponse:
+        return _call_with_cache(method, params, self._request, self._call_cache)
+
+    def _get_block_by_number(self, method: RPCEndpoint, params: Any) -> RPCResponse:
+        return _get_block_with_cache(method, params, self._request, self._block_cache)
+
+    def _send_transaction_rate_limited(self, method: RPCEndpoint, params: Any) -> RPCResponse:
+        return _rate_limiter(method, params, self._fill_and_send, self._w3, self._state)
+
+    def _fill_and_send(self, method: RPCEndpoint, params: Any) -> RPCResponse:
+        if self._set_max_fee:
+            error_response = _set_max_fee(params, self._make_request, self._block_cache)
+            if error_response is not None:
+                return error_response
+        return self._send_transaction(method, params)
+
+
+def generate_fused_middleware(
+    chain_id: ChainId,
+    account: LocalAccount | None,
+    set_max_fee: bool,
+    max_concurrent_requests: int = DEFAULT_MAX_CONCURRENT_REQUESTS,
+    max_requests_per_second: float | None = None,
+    compute_units_per_second: float | None = None,
+    compute_units: Mapping[str, float] | None = None,
+) -> Middleware:
+    """Return a fused middleware, see above. Transactions are signed by
+    ``account``, if given, and their fees are set by the max fee setter if
+    ``set_max_fee`` is true. The rate limits are the same as those of
+    :func:`generate_rate_limiter`."""
+
+    def fused_middleware(make_request: _MakeRequest, w3: Web3) -> _MakeRequest:
+        state = _make_rate_limiter_state(
+            w3,
+            chain_id,
+            max_concurrent_requests,
+            max_requests_per_second,
+            compute_units_per_second,
+            compute_units,
+        )
+        return _FusedMiddleware(make_request, w3, chain_id, account, set_max_fee, state)
+
+    return cast(Middleware, fused_middleware)
+
+
+# Async variants of the middlewares above, for use with AsyncWeb3.
+#
+# They follow the same logic as their synchronous counterparts, except that
+# waiting is done by suspending the calling coroutine instead of blocking a
+# thread. The block cache is shared with the synchronous middlewares.
+
+_AsyncMakeRequest = Callable[[RPCEndpoint, Any], Awaitable[RPCResponse]]
+_AsyncMiddleware = Callable[[RPCEndpoint, Any], Awaitable[RPCResponse]]
+
+AsyncCacheMiddleware = Callable[
+    [_AsyncMakeRequest, AsyncWeb3, _BlockCache], Awaitable[_AsyncMiddleware]
+]
+
+
+def generate_async_middleware_with_cache(
+    middleware: AsyncCacheMiddleware, chain_id: ChainId
+) -> AsyncMiddleware:
+    if chain_id not in _BLOCK_STORAGE:
+        _BLOCK_STORAGE[chain_id] = _BlockCache()
+
+    cache = _BLOCK_STORAGE[chain_id]
+    return cast(AsyncMiddleware, functools.partial(middleware, cache=cache))
+
+
+async def async_cache_get_block_by_number(
+    make_request: _AsyncMakeRequest, _w3: AsyncWeb3, cache: _BlockCache
+) -> _AsyncMiddleware:
+    async def middleware(method: RPCEndpoint, params: Any) -> RPCResponse:
+        if method != "eth_getBlockByNumber":
+            return await make_request(method, params)
+
+        if params[0] == "latest":
+            response = await make_request(method, params)
+            if _result_ok(response):
+                key = response["result"].number, params[1]
+                cache.add_block(key, response)
+        elif params[0].startswith("0x"):
+            response = cache.get_block(params)
+            if response is None:
+                response = await make_request(method, params)
+                if _result_ok(response):
+                    cache.add_block(params, response)
         else:
-            return priority_fee_response
+            response = await make_request(method, params)
+        return response
 
-        latest_block = cache.get_latest_block()
-        if latest_block is None:
-            latest_block_response = make_request(
-                RPCEndpoint("eth_getBlockByNumber"), ["latest", False]
-            )
-            if _result_ok(latest_block_response):
-                latest_block = latest_block_response
-            else:
-                return latest_block_response
-        base_fee = int(latest_block["result"].baseFeePerGas, 16)
-        max_fee = 2 * base_fee + priority_fee
-        params[0]["maxPriorityFeePerGas"] = priority_fee
-        params[0]["maxFeePerGas"] = max_fee
-        return make_request(method, params)
+    return middleware
+
+
+# The async rate limiter state.
+#
+# Same as _RateLimiterState. Only waiting for a request slot differs, which
+# is done by suspending the calling coroutine instead of blocking a thread.
+@dataclass(slots=True)
+class _AsyncRateLimiterState:
+    bucket: _TokenBucket
+    lanes: _PriorityLanes
+    wait_time_metrics: None | dict[RequestPriority, Histogram] = None
+
+
+# A context variable used to handle reentrancy in web3py middleware. Unlike
+# a thread local object, it is local to the current task.
+_ASYNC_RATE_LIMITER_ENTERED: contextvars.ContextVar[bool] = contextvars.ContextVar(
+    "async_rate_limiter_entered", default=False
+)
+
+
+async def _async_acquire_slot(
+    lanes: _PriorityLanes, method: RPCEndpoint, params: Any
+) -> RequestPriority:
+    # The lanes may be shared with threaded rate limiters, whose threads wake
+    # up the ticket when releasing a slot, see _make_lanes.
+    loop = asyncio.get_running_loop()
+    event = asyncio.Event()
+
+    def wake() -> None:
+        loop.call_soon_threadsafe(event.set)
+
+    ticket = lanes.enqueue(method, params, wake)
+    try:
+        while True:
+            event.clear()
+            wait = lanes.try_acquire(ticket)
+            if wait == 0:
+                return ticket.priority
+            try:
+                await asyncio.wait_for(event.wait(), None if wait == math.inf else wait)
+            except asyncio.TimeoutError:
+                pass
+    except BaseException:
+        lanes.cancel(ticket)
+        raise
+
+
+async def _async_try_make_request(
+    make_request: _AsyncMakeRequest, method: RPCEndpoint, params: Any
+) -> tuple[bool, float | None, None | RPCResponse]:
+    try:
+        response = await make_request(method, params)
+    except aiohttp.ClientResponseError as exc:
+        if exc.status == 429:
+            retry_after = exc.headers.get("Retry-After") if exc.headers is not None else None
+            return True, _parse_retry_after(retry_after), None
+        raise exc
+    return False, None, response
+
+
+async def _async_rate_limiter_inner(
+    method: RPCEndpoint,
+    params: Any,
+    make_request: _AsyncMakeRequest,
+    w3: AsyncWeb3,
+    state: _AsyncRateLimiterState,
+) -> RPCResponse:
+    give_up_time = None
+    while True:
+        rate_limited, retry_after, response = await _async_try_make_request(
+            make_request, method, params
+        )
+        if not rate_limited:
+            assert response is not None
+            return response
+
+        now = time.monotonic()
+        if give_up_time is None:
+            give_up_time = now + _RATE_LIMIT_MAX_RETRY_TIME
+        elif now > give_up_time:
+            rpc = cast(AsyncHTTPProvider, w3.provider).endpoint_uri
+            raise RuntimeError("rate limit period exceeded: %s" % rpc)
+        state.bucket.reject(retry_after)
+
+        wait = state.bucket.acquire()
+        while wait > 0:
+            await asyncio.sleep(wait)
+            wait = state.bucket.acquire()
+
+
+async def _async_rate_limiter(
+    method: RPCEndpoint,
+    params: Any,
+    make_request: _AsyncMakeRequest,
+    w3: AsyncWeb3,
+    state: _AsyncRateLimiterState,
+) -> RPCResponse:
+    if _ASYNC_RATE_LIMITER_ENTERED.get():
+        # See _rate_limiter for why reentrant calls bypass the limits.
+        return await make_request(method, params)
+
+    token = _ASYNC_RATE_LIMITER_ENTERED.set(True)
+    try:
+        t = time.time()
+        priority = await _async_acquire_slot(state.lanes, method, params)
+        try:
+            wait_time = time.time() - t
+            if state.wait_time_metrics is not None:
+                state.wait_time_metrics[priority].observe(wait_time)
+            if wait_time > _RATE_LIMIT_WAIT_TOO_LONG:
+                log.debug(
+                    "Long rate limiter wait time",
+                    wait_time=wait_time,
+                    priority=priority.name,
+                    num_waiting=state.lanes.num_waiting,
+                    rpc=cast(AsyncHTTPProvider, w3.provider).endpoint_uri,
+                )
+            return await _async_rate_limiter_inner(method, params, make_request, w3, state)
+        finally:
+            state.lanes.release()
+    finally:
+        _ASYNC_RATE_LIMITER_ENTERED.reset(token)
+
+
+async def async_rate_limiter(
+    make_request: _AsyncMakeRequest,
+    w3: AsyncWeb3,
+    chain_id: ChainId | None = None,
+    max_concurrent_requests: int = DEFAULT_MAX_CONCURRENT_REQUESTS,
+    max_requests_per_second: float | None = None,
+    compute_units_per_second: float | None = None,
+    compute_units: Mapping[str, float] | None = None,
+) -> _AsyncMiddleware:
+    rpc = str(cast(AsyncHTTPProvider, w3.provider).endpoint_uri)
+    bucket, lanes = _make_lanes(
+        rpc,
+        max_concurrent_requests,
+        max_requests_per_second,
+        compute_units_per_second,
+        compute_units,
+    )
+    state = _AsyncRateLimiterState(
+        bucket=bucket, lanes=lanes, wait_time_metrics=_get_wait_time_metrics(chain_id)
+    )
+    return functools.partial(_async_rate_limiter, make_request=make_request, w3=w3, state=state)
+
+
+def generate_async_rate_limiter(
+    chain_id: ChainId,
+    max_concurrent_requests: int = DEFAULT_MAX_CONCURRENT_REQUESTS,
+    max_requests_per_second: float | None = None,
+    compute_units_per_second: float | None = None,
+    compute_units: Mapping[str, float] | None = None,
+) -> AsyncMiddleware:
+    return cast(
+        AsyncMiddleware,
+        functools.partial(
+            async_rate_limiter,
+            chain_id=chain_id,
+            max_concurrent_requests=max_concurrent_requests,
+            max_requests_per_second=max_requests_per_second,
+            compute_units_per_second=compute_units_per_second,
+            compute_units=compute_units,
+        ),
+    )
+
+
+async def _async_set_max_fee(
+    params: Any, make_request: _AsyncMakeRequest, cache: _BlockCache
+) -> RPCResponse | None:
+    """Same as :func:`_set_max_fee`, for async middlewares."""
+    if _has_max_fee(params):
+        return None
+    priority_fee_response = await make_request(_MAX_PRIORITY_FEE, [])
+    if not _result_ok(priority_fee_response):
+        return priority_fee_response
+
+    latest_block = cache.get_latest_block()
+    if latest_block is None:
+        latest_block = await make_request(_GET_BLOCK_BY_NUMBER, ["latest", False])
+        if not _result_ok(latest_block):
+            return latest_block
+    _store_max_fee(params, priority_fee_response, latest_block)
+    return None
+
+
+async def async_max_fee_setter(
+    make_request: _AsyncMakeRequest, _w3: AsyncWeb3, cache: _BlockCache
+) -> _AsyncMiddleware:
+    async def middleware(method: RPCEndpoint, params: Any) -> RPCResponse:
+        if method != "eth_sendTransaction":
+            return await make_request(method, params)
+        error_response = await _async_set_max_fee(params, make_request, cache)
+        if error_response is not None:
+            return error_response
+        return await make_request(method, params)
+
+    return middleware
+
+
+# A context variable holding the size of the response currently being
+# received, see async_instrumentation.
+_ASYNC_RESPONSE_SIZE: contextvars.ContextVar[list[int] | None] = contextvars.ContextVar(
+    "async_response_size", default=None
+)
+
+
+async def _on_response_chunk_received(
+    _session: aiohttp.ClientSession,
+    _trace_config_ctx: Any,
+    params: aiohttp.TraceResponseChunkReceivedParams,
+) -> None:
+    size = _ASYNC_RESPONSE_SIZE.get()
+    if size is not None:
+        size[0] += len(params.chunk)
+
+
+def make_response_size_trace_config() -> aiohttp.TraceConfig:
+    """Return an aiohttp trace config that passes the response size on to
+    the async instrumentation middleware. Trace callbacks run in the task
+    making the request, so the size can be passed on via a context variable."""
+    trace_config = aiohttp.TraceConfig()
+    trace_config.on_response_chunk_received.append(_on_response_chunk_received)  # type: ignore
+    return trace_config
+
+
+def generate_async_instrumentation(chain_id: ChainId) -> AsyncMiddleware:
+    return cast(
+        AsyncMiddleware, functools.partial(async_instrumentation, metrics=_RPCMetrics(chain_id))
+    )
+
+
+async def async_instrumentation(
+    make_request: _AsyncMakeRequest, _w3: AsyncWeb3, metrics: _RPCMetrics
+) -> _AsyncMiddleware:
+    async def middleware(method: RPCEndpoint, params: Any) -> RPCResponse:
+        size = [0]
+        token = _ASYNC_RESPONSE_SIZE.set(size)
+        calls_method, num_calls = _get_calls(method, params)
+        start = time.monotonic()
+        try:
+            response = await make_request(method, params)
+        except Exception as exc:
+            error = _get_error_label(exc)
+            if error is not None:
+                metrics.record_error(calls_method, error, num_calls)
+            raise
+        finally:
+            _ASYNC_RESPONSE_SIZE.reset(token)
+        metrics.record(calls_method, time.monotonic() - start, size[0], num_calls)
+        num_errors = _count_rpc_errors(method, response)
+        if num_errors:
+            metrics.record_error(calls_method, "rpc", num_errors)
+        return response
 
     return middleware
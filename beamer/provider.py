@@ -0,0 +1,634 @@
+import asyncio
+import collections
+import concurrent.futures
+import json
+import threading
+import time
+from typing import Any, Awaitable, Callable, Optional, Sequence, TypeVar
+
+import aiohttp
+import requests
+import requests.adapters
+import requests.exceptions
+import structlog
+from prometheus_client import Counter, Gauge
+from web3 import AsyncHTTPProvider, AsyncWeb3, HTTPProvider, Web3
+from web3._utils.request import async_make_post_request
+from web3.types import RPCEndpoint, RPCResponse
+
+from beamer.middleware import (
+    BATCH_REQUEST,
+    BatchParams,
+    RequestPriority,
+    get_request_priority,
+    set_response_size,
+)
+from beamer.typing import URL, ChainId
+
+try:
+    import orjson
+except ImportError:
+    orjson = None  # type: ignore
+
+log = structlog.get_logger(__name__)
+
+_T = TypeVar("_T")
+
+# The failover provider.
+#
+# A chain may be served by several RPC endpoints. Requests are sent to the
+# first endpoint, in configured order, that is not known to be down. If an
+# endpoint fails, the request is sent to the next one. Only if all endpoints
+# fail, the error of the last one is raised to the caller.
+#
+# An endpoint fails if a request could not be delivered or answered:
+# connection errors, timeouts, HTTP 429 (Too Many Requests) and HTTP 5xx
+# errors. All other errors, e.g. HTTP 413 for eth_getLogs ranges that are too
+# large, as well as JSON-RPC error responses, are passed on to the caller, as
+# any other endpoint would most likely respond the same way. Transactions are
+# not sent to another endpoint after a read timeout, since the endpoint may
+# have received them.
+#
+# Each endpoint has a circuit breaker. After _CIRCUIT_FAILURE_THRESHOLD
+# consecutive failures, the circuit opens and the endpoint is skipped for
+# _CIRCUIT_OPEN_TIME seconds. After that, the next request is a trial: if it
+# succeeds, the circuit is closed, otherwise it opens again for twice as long,
+# up to _CIRCUIT_MAX_OPEN_TIME seconds. Preferring the endpoints in configured
+# order, instead of e.g. the fastest one, keeps the agent's view of the chain
+# consistent, since different endpoints are usually not exactly in sync.
+#
+# Optionally, reads made with RequestPriority.FILL are hedged: if the first
+# endpoint did not answer within the 95th percentile of its recent latencies
+# for that method, the request is also sent to the next endpoint, and the
+# first answer wins.
+#
+# The health of an endpoint is the moving average of its success rate,
+# which, along with the circuit state, is exported as metrics.
+
+# The number of consecutive failures after which the circuit of an endpoint opens.
+_CIRCUIT_FAILURE_THRESHOLD = 3
+
+# The time in seconds an endpoint is skipped after its circuit opened.
+_CIRCUIT_OPEN_TIME = 10.0
+
+# The maximum time in seconds an endpoint is skipped after failed trials.
+_CIRCUIT_MAX_OPEN_TIME = 300.0
+
+# The weight of the latest request in the health of an endpoint.
+_HEALTH_SMOOTHING = 0.1
+
+# The number of latencies per endpoint and method the hedging delay is based on.
+_LATENCY_SAMPLES = 100
+
+# The hedging delay in seconds, as long as there are not enough latencies.
+_HEDGE_DEFAULT_DELAY = 1.0
+_HEDGE_MIN_SAMPLES = 20
+
+# The default maximum number of pooled connections per RPC endpoint.
+DEFAULT_POOL_SIZE = 20
+
+# HTTP sessions by RPC endpoint, pool size and whether connections are kept
+# alive, shared by all threads and all Web3 instances of the process.
+_SESSIONS: dict[tuple[URL, int, bool], requests.Session] = {}
+_SESSIONS_LOCK = threading.Lock()
+
+_ENDPOINT_HEALTH = Gauge(
+    "rpc_endpoint_health",
+    "Moving average of the success rate of requests to an RPC endpoint",
+    ["chain_id", "endpoint"],
+    multiprocess_mode="livemin",
+)
+_ENDPOINT_CIRCUIT_OPEN = Gauge(
+    "rpc_endpoint_circuit_open",
+    "Whether requests to an RPC endpoint are suspended after repeated failures",
+    ["chain_id", "endpoint"],
+    multiprocess_mode="livemax",
+)
+_FAILOVERS = Counter(
+    "rpc_failovers",
+    "Number of requests that failed on an RPC endpoint and were sent to the next one",
+    ["chain_id", "endpoint"],
+)
+_HEDGED_REQUESTS = Counter(
+    "rpc_hedged_requests",
+    "Number of hedged requests, by whether the first or the hedged request answered first",
+    ["chain_id", "winner"],
+)
+
+
+def get_http_session(
+    url: URL, pool_size: int = DEFAULT_POOL_SIZE, keep_alive: bool = True
+) -> requests.Session:
+    """Return the HTTP session for requests to ``url``, keeping a pool of up
+    to ``pool_size`` connections. Unless ``keep_alive`` is set, connections
+    are closed after each request."""
+    key = (url, pool_size, keep_alive)
+    with _SESSIONS_LOCK:
+        session = _SESSIONS.get(key)
+        if session is None:
+            session = requests.Session()
+            adapter = requests.adapters.HTTPAdapter(pool_maxsize=pool_size)
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            if not keep_alive:
+                session.headers["Connection"] = "close"
+            _SESSIONS[key] = session
+        return session
+
+
+def _decode_json(raw: bytes) -> Any:
+    # Responses of eth_getLogs and full blocks can be large, so they are
+    # decoded with orjson where available, which is several times faster
+    # than the json module.
+    if orjson is not None:
+        return orjson.loads(raw)
+    return json.loads(raw)
+
+
+class PooledHTTPProvider(HTTPProvider):
+    """An HTTP provider sending requests via the shared session of its
+    endpoint, see :func:`get_http_session`.
+
+    Web3's HTTPProvider keeps a session per thread and endpoint, so an agent
+    with many threads would open many connections to the same endpoint.
+    Responses are also read and decoded faster than by web3, see
+    :meth:`post` and :func:`_decode_json`. Unlike web3's provider, it can
+    send JSON-RPC batches, see :func:`make_batch_request`.
+    """
+
+    def __init__(
+        self,
+        endpoint_uri: URL,
+        request_kwargs: Optional[Any] = None,
+        pool_size: int = DEFAULT_POOL_SIZE,
+        keep_alive: bool = True,
+    ):
+        super().__init__(endpoint_uri, request_kwargs=request_kwargs)
+        self._session = get_http_session(endpoint_uri, pool_size, keep_alive)
+
+    def post(self, data: bytes) -> bytes:
+        assert self.endpoint_uri is not None
+        request_kwargs = dict(self.get_request_kwargs())
+        # Read the body straight from the connection in a single call,
+        # instead of letting requests assemble it from small chunks. Once the
+        # body is read, the connection goes back to the pool.
+        with self._session.post(
+            self.endpoint_uri, data=data, stream=True, **request_kwargs
+        ) as response:
+            response.raise_for_status()
+            body = response.raw.read(decode_content=True)
+        set_response_size(len(body))
+        return body
+
+    def decode_rpc_response(self, raw_response: bytes) -> RPCResponse:
+        return _decode_json(raw_response)
+
+    def make_request(self, method: RPCEndpoint, params: Any) -> RPCResponse:
+        if method == BATCH_REQUEST:
+            return RPCResponse(result=_post_batch_request(self, params))
+        return self.decode_rpc_response(self.post(self.encode_rpc_request(method, params)))
+
+
+class BatchAsyncHTTPProvider(AsyncHTTPProvider):
+    """An AsyncHTTPProvider that can also send JSON-RPC batches, see
+    :func:`async_make_batch_request`."""
+
+    async def make_request(self, method: RPCEndpoint, params: Any) -> RPCResponse:
+        if method == BATCH_REQUEST:
+            return RPCResponse(result=await _async_post_batch_request(self, params))
+        return await super().make_request(method, params)
+
+
+def _is_endpoint_failure(exc: Exception, method: RPCEndpoint) -> bool:
+    if isinstance(exc, requests.exceptions.HTTPError):
+        return exc.response is not None and (
+            exc.response.status_code == 429 or exc.response.status_code >= 500
+        )
+    if isinstance(exc, requests.exceptions.ReadTimeout):
+        return get_request_priority(method) != RequestPriority.SUBMIT
+    return isinstance(exc, (requests.exceptions.ConnectionError, requests.exceptions.Timeout))
+
+
+def _is_async_endpoint_failure(exc: Exception, method: RPCEndpoint) -> bool:
+    # Same as _is_endpoint_failure, for the exceptions raised by aiohttp.
+    if isinstance(exc, aiohttp.ClientResponseError):
+        return exc.status == 429 or exc.status >= 500
+    if isinstance(exc, asyncio.TimeoutError):
+        return get_request_priority(method) != RequestPriority.SUBMIT
+    return isinstance(exc, aiohttp.ClientConnectionError)
+
+
+class _EndpointHealth:
+    """The circuit breaker and health of an RPC endpoint, see above."""
+
+    def __init__(self, index: int, url: URL):
+        self.index = index
+        self.url = url
+        self._lock = threading.Lock()
+        self._consecutive_failures = 0
+        self._open_time = _CIRCUIT_OPEN_TIME
+        # The circuit is open until this time, or closed if None.
+        self._open_until: Optional[float] = None
+        self._health = 1.0
+        self._latencies: dict[str, collections.deque[float]] = {}
+        self._health_metric: Optional[Gauge] = None
+        self._circuit_metric: Optional[Gauge] = None
+
+    def init_metrics(self, chain_id: ChainId) -> None:
+        self._health_metric = _ENDPOINT_HEALTH.labels(chain_id, self.index)
+        self._circuit_metric = _ENDPOINT_CIRCUIT_OPEN.labels(chain_id, self.index)
+        self._health_metric.set(self._health)
+        self._circuit_metric.set(self._open_until is not None)
+
+    def is_available(self, now: float) -> bool:
+        open_until = self._open_until
+        return open_until is None or now >= open_until
+
+    @property
+    def open_until(self) -> float:
+        return self._open_until or 0.0
+
+    def hedge_delay(self, method: RPCEndpoint) -> float:
+        with self._lock:
+            latencies = sorted(self._latencies.get(method, ()))
+        if len(latencies) < _HEDGE_MIN_SAMPLES:
+            return _HEDGE_DEFAULT_DELAY
+        return latencies[int(len(latencies) * 0.95)]
+
+    def _record_success(self, method: RPCEndpoint, latency: Optional[float]) -> None:
+        closed = False
+        with self._lock:
+            if latency is not None:
+                latencies = self._latencies.get(method)
+                if latencies is None:
+                    latencies = self._latencies[method] = collections.deque(
+                        maxlen=_LATENCY_SAMPLES
+                    )
+                latencies.append(latency)
+            self._health += _HEALTH_SMOOTHING * (1 - self._health)
+            self._consecutive_failures = 0
+            if self._open_until is not None:
+                closed = True
+                self._open_until = None
+                self._open_time = _CIRCUIT_OPEN_TIME
+            health = self._health
+
+        if self._health_metric is not None:
+            self._health_metric.set(health)
+        if closed:
+            log.info("RPC endpoint recovered", rpc=self.url)
+            if self._circuit_metric is not None:
+                self._circuit_metric.set(0)
+
+    def _record_failure(self) -> None:
+        opened = False
+        with self._lock:
+            now = time.monotonic()
+            self._health -= _HEALTH_SMOOTHING * self._health
+            self._consecutive_failures += 1
+            if self._open_until is not None:
+                # A failed trial.
+                if now >= self._open_until:
+                    self._open_time = min(_CIRCUIT_MAX_OPEN_TIME, self._open_time * 2)
+                    self._open_until = now + self._open_time
+            elif self._consecutive_failures >= _CIRCUIT_FAILURE_THRESHOLD:
+                opened = True
+                self._open_until = now + self._open_time
+            health = self._health
+            open_time = self._open_time
+
+        if self._health_metric is not None:
+            self._health_metric.set(health)
+        if opened:
+            log.warning("RPC endpoint failing, suspending requests", rpc=self.url, time=open_time)
+            if self._circuit_metric is not None:
+                self._circuit_metric.set(1)
+
+
+class _Endpoint(_EndpointHealth):
+    def __init__(
+        self, index: int, url: URL, request_kwargs: Any, pool_size: int, keep_alive: bool
+    ):
+        super().__init__(index, url)
+        self._provider = PooledHTTPProvider(url, request_kwargs, pool_size, keep_alive)
+
+    def make_request(self, method: RPCEndpoint, params: Any) -> RPCResponse:
+        return self._call(method, lambda: self._provider.make_request(method, params), True)
+
+    def make_batch_request(self, params: BatchParams) -> list[RPCResponse]:
+        # Batches take longer than single requests, so their latencies
+        # must not affect the hedging delay.
+        return self._call(
+            params.method, lambda: _post_batch_request(self._provider, params), False
+        )
+
+    def _call(self, method: RPCEndpoint, func: Callable[[], _T], record_latency: bool) -> _T:
+        start = time.monotonic()
+        try:
+            result = func()
+        except Exception as exc:
+            if _is_endpoint_failure(exc, method):
+                self._record_failure()
+            raise
+        self._record_success(method, time.monotonic() - start if record_latency else None)
+        return result
+
+
+class _AsyncEndpoint(_EndpointHealth):
+    def __init__(self, index: int, url: URL, request_kwargs: Any):
+        super().__init__(index, url)
+        self.provider = AsyncHTTPProvider(url, request_kwargs=request_kwargs)
+
+    async def make_request(self, method: RPCEndpoint, params: Any) -> RPCResponse:
+        return await self._call(method, self.provider.make_request(method, params))
+
+    async def make_batch_request(self, params: BatchParams) -> list[RPCResponse]:
+        return await self._call(params.method, _async_post_batch_request(self.provider, params))
+
+    async def _call(self, method: RPCEndpoint, coro: Awaitable[_T]) -> _T:
+        # Hedging is not supported, so latencies are not recorded.
+        try:
+            result = await coro
+        except Exception as exc:
+            if _is_async_endpoint_failure(exc, method):
+                self._record_failure()
+            raise
+        self._record_success(method, None)
+        return result
+
+
+_EndpointT = TypeVar("_EndpointT", bound=_EndpointHealth)
+
+
+def _get_available_endpoints(endpoints: list[_EndpointT]) -> list[_EndpointT]:
+    now = time.monotonic()
+    available = [endpoint for endpoint in endpoints if endpoint.is_available(now)]
+    if not available:
+        # Rather than failing without trying, try the endpoint that
+        # is expected to recover first.
+        available = [min(endpoints, key=lambda endpoint: endpoint.open_until)]
+    return available
+
+
+class FailoverHTTPProvider(PooledHTTPProvider):
+    """An HTTP provider sending requests to the first working one of several
+    RPC endpoints of the same chain, see above.
+
+    ``endpoint_uri`` is the first endpoint, so that the provider can be used
+    wherever an HTTPProvider is expected.
+    """
+
+    def __init__(
+        self,
+        endpoint_uris: Sequence[URL],
+        request_kwargs: Optional[Any] = None,
+        hedged_requests: bool = False,
+        pool_size: int = DEFAULT_POOL_SIZE,
+        keep_alive: bool = True,
+    ):
+        assert endpoint_uris, "at least one endpoint is required"
+        super().__init__(endpoint_uris[0], request_kwargs, pool_size, keep_alive)
+        self._endpoints = [
+            _Endpoint(index, url, request_kwargs, pool_size, keep_alive)
+            for index, url in enumerate(endpoint_uris)
+        ]
+        self._hedged_requests = hedged_requests and len(self._endpoints) > 1
+        self._executor: Optional[concurrent.futures.ThreadPoolExecutor] = None
+        self._executor_lock = threading.Lock()
+        self._failover_metrics: Optional[list[Counter]] = None
+        self._hedge_metrics: Optional[dict[str, Counter]] = None
+
+    def __str__(self) -> str:
+        return "RPC connection %s" % ", ".join(endpoint.url for endpoint in self._endpoints)
+
+    def init_metrics(self, chain_id: ChainId) -> None:
+        """Export the state of the endpoints as metrics of the given chain."""
+        for endpoint in self._endpoints:
+            endpoint.init_metrics(chain_id)
+        self._failover_metrics = [
+            _FAILOVERS.labels(chain_id, endpoint.index) for endpoint in self._endpoints
+        ]
+        self._hedge_metrics = {
+            winner: _HEDGED_REQUESTS.labels(chain_id, winner) for winner in ("first", "hedge")
+        }
+
+    def _get_endpoints(self) -> list[_Endpoint]:
+        return _get_available_endpoints(self._endpoints)
+
+    def make_request(self, method: RPCEndpoint, params: Any) -> RPCResponse:
+        if method == BATCH_REQUEST:
+            return RPCResponse(result=self._make_batch_request(params))
+        endpoints = self._get_endpoints()
+        hedge = (
+            self._hedged_requests
+            and len(endpoints) > 1
+            and get_request_priority(method) == RequestPriority.FILL
+        )
+        last_exc = None
+        if hedge:
+            try:
+                return self._make_hedged_request(endpoints[0], endpoints[1], method, params)
+            except Exception as exc:
+                if not _is_endpoint_failure(exc, method):
+                    raise
+                last_exc = exc
+                self._record_failover(endpoints[1])
+            endpoints = endpoints[2:]
+
+        for endpoint in endpoints:
+            if last_exc is not None:
+                log.debug("Failing over to next RPC endpoint", rpc=endpoint.url, exc=last_exc)
+            try:
+                return endpoint.make_request(method, params)
+            except Exception as exc:
+                if not _is_endpoint_failure(exc, method):
+                    raise
+                last_exc = exc
+                self._record_failover(endpoint)
+
+        assert last_exc is not None
+        raise last_exc
+
+    def _make_batch_request(self, params: BatchParams) -> list[RPCResponse]:
+        # Batches fail over between the endpoints like single requests,
+        # but they are not hedged.
+        last_exc = None
+        for endpoint in self._get_endpoints():
+            try:
+                return endpoint.make_batch_request(params)
+            except Exception as exc:
+                if not _is_endpoint_failure(exc, params.method):
+                    raise
+                last_exc = exc
+                self._record_failover(endpoint)
+
+        assert last_exc is not None
+        raise last_exc
+
+    def _get_executor(self) -> concurrent.futures.ThreadPoolExecutor:
+        with self._executor_lock:
+            if self._executor is None:
+                self._executor = concurrent.futures.ThreadPoolExecutor(
+                    thread_name_prefix="hedged-requests"
+                )
+            return self._executor
+
+    def _make_hedged_request(
+        self, first: _Endpoint, second: _Endpoint, method: RPCEndpoint, params: Any
+    ) -> RPCResponse:
+        executor = self._get_executor()
+        first_future = executor.submit(first.make_request, method, params)
+        try:
+            return first_future.result(timeout=first.hedge_delay(method))
+        except concurrent.futures.TimeoutError:
+            pass
+        except Exception as exc:
+            if not _is_endpoint_failure(exc, method):
+                raise
+            # Failed before hedging, simply fail over.
+            self._record_failover(first)
+            return second.make_request(method, params)
+
+        second_future = executor.submit(second.make_request, method, params)
+        futures = {first_future: "first", second_future: "hedge"}
+        last_exc = None
+        for future in concurrent.futures.as_completed(futures):
+            error = future.exception()
+            if error is None:
+                if self._hedge_metrics is not None:
+                    self._hedge_metrics[futures[future]].inc()
+                return future.result()
+            assert isinstance(error, Exception)
+            if not _is_endpoint_failure(error, method):
+                raise error
+            last_exc = error
+        self._record_failover(first)
+        assert last_exc is not None
+        raise last_exc
+
+    def _record_failover(self, endpoint: _Endpoint) -> None:
+        if self._failover_metrics is not None:
+            self._failover_metrics[endpoint.index].inc()
+
+
+class AsyncFailoverHTTPProvider(BatchAsyncHTTPProvider):
+    """Same as :class:`FailoverHTTPProvider`, but for AsyncWeb3 and without
+    hedged requests."""
+
+    def __init__(self, endpoint_uris: Sequence[URL], request_kwargs: Optional[Any] = None):
+        assert endpoint_uris, "at least one endpoint is required"
+        super().__init__(endpoint_uris[0], request_kwargs=request_kwargs)
+        self._endpoints = [
+            _AsyncEndpoint(index, url, request_kwargs) for index, url in enumerate(endpoint_uris)
+        ]
+        self._failover_metrics: Optional[list[Counter]] = None
+
+    def __str__(self) -> str:
+        return "Async RPC connection %s" % ", ".join(endpoint.url for endpoint in self._endpoints)
+
+    @property
+    def endpoint_providers(self) -> list[AsyncHTTPProvider]:
+        """The providers of the individual endpoints, e.g. to cache their
+        HTTP sessions."""
+        return [endpoint.provider for endpoint in self._endpoints]
+
+    def init_metrics(self, chain_id: ChainId) -> None:
+        """Export the state of the endpoints as metrics of the given chain."""
+        for endpoint in self._endpoints:
+            endpoint.init_metrics(chain_id)
+        self._failover_metrics = [
+            _FAILOVERS.labels(chain_id, endpoint.index) for endpoint in self._endpoints
+        ]
+
+    async def make_request(self, method: RPCEndpoint, params: Any) -> RPCResponse:
+        if method == BATCH_REQUEST:
+            # Batches fail over between the endpoints like single requests.
+            return RPCResponse(
+                result=await self._make_request(
+                    params.method, lambda endpoint: endpoint.make_batch_request(params)
+                )
+            )
+        return await self._make_request(
+            method, lambda endpoint: endpoint.make_request(method, params)
+        )
+
+    async def _make_request(
+        self, method: RPCEndpoint, call: Callable[[_AsyncEndpoint], Awaitable[_T]]
+    ) -> _T:
+        last_exc = None
+        for endpoint in _get_available_endpoints(self._endpoints):
+            if last_exc is not None:
+                log.debug("Failing over to next RPC endpoint", rpc=endpoint.url, exc=last_exc)
+            try:
+                return await call(endpoint)
+            except Exception as exc:
+                if not _is_async_endpoint_failure(exc, method):
+                    raise
+                last_exc = exc
+                if self._failover_metrics is not None:
+                    self._failover_metrics[endpoint.index].inc()
+
+        assert last_exc is not None
+        raise last_exc
+
+
+def _encode_batch_request(params: BatchParams) -> bytes:
+    batch = [
+        dict(jsonrpc="2.0", method=params.method, params=call_params, id=request_id)
+        for request_id, call_params in enumerate(params.params_list)
+    ]
+    return json.dumps(batch).encode()
+
+
+def _decode_batch_response(raw_response: bytes, num_requests: int) -> list[RPCResponse]:
+    responses = _decode_json(raw_response)
+    if not isinstance(responses, list):
+        # Endpoints that do not support batches answer with a single error.
+        raise ValueError(responses.get("error", responses))
+    # The responses of a batch may arrive in any order.
+    by_id = {response.get("id"): response for response in responses}
+    missing = dict(error="missing response in batch")
+    return [by_id.get(request_id, missing) for request_id in range(num_requests)]
+
+
+def _post_batch_request(provider: PooledHTTPProvider, params: BatchParams) -> list[RPCResponse]:
+    raw_response = provider.post(_encode_batch_request(params))
+    return _decode_batch_response(raw_response, len(params.params_list))
+
+
+def make_batch_request(
+    w3: Web3, method: RPCEndpoint, params_list: Sequence[Any]
+) -> list[RPCResponse]:
+    """Send a single JSON-RPC batch, calling ``method`` once with each of
+    ``params_list``, and return the responses in the same order.
+
+    Web3 does not support batches, so the batch is sent through the
+    middlewares of ``w3`` as a single request, which the provider posts as a
+    batch, see beamer.middleware.BATCH_REQUEST. The provider must be a
+    :class:`PooledHTTPProvider`. The params must already be in their JSON-RPC
+    form, and the results are not formatted. Responses that are errors are
+    returned as such, only a failure of the whole batch is raised.
+    """
+    assert isinstance(w3.provider, PooledHTTPProvider)
+    params = BatchParams(method, params_list)
+    return w3.manager.request_blocking(BATCH_REQUEST, params)
+
+
+async def _async_post_batch_request(
+    provider: AsyncHTTPProvider, params: BatchParams
+) -> list[RPCResponse]:
+    assert provider.endpoint_uri is not None
+    raw_response = await async_make_post_request(
+        provider.endpoint_uri, _encode_batch_request(params), **provider.get_request_kwargs()
+    )
+    return _decode_batch_response(raw_response, len(params.params_list))
+
+
+async def async_make_batch_request(
+    w3: AsyncWeb3, method: RPCEndpoint, params_list: Sequence[Any]
+) -> list[RPCResponse]:
+    """Same as :func:`make_batch_request`, but for AsyncWeb3. The provider
+    must be a :class:`BatchAsyncHTTPProvider`."""
+    assert isinstance(w3.provider, BatchAsyncHTTPProvider)
+    params = BatchParams(method, params_list)
+    return await w3.manager.coro_request(BATCH_REQUEST, params)
@@ -45,7 +45,7 @@ def config(tmp_path, contracts, token, token_list, local_account):
         log_level="debug",
         chains=chains,
     )
-    beamer.agent.metrics.init(config=config, source_rpc_url=url, target_rpc_url=url)
+    beamer.agent.metrics.init(config=config, source_rpc_url=url, target_rpc_url=url, rpc_urls={})
     return config
 
 
@@ -1,13 +1,21 @@
 import functools
+import json
 import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
 from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 
 import ape
+import pytest
 import structlog.testing
+from web3 import HTTPProvider, Web3
 
+import beamer.middleware
 from beamer.agent.agent import Agent
+from beamer.middleware import RequestPriority, request_priority
 from beamer.tests.util import HTTPProxy
+from beamer.typing import ChainId
 
 
 class _RateLimiter:
@@ -67,3 +75,158 @@ def test_rate_limiting_rpc(config):
         thread="MainThread",
     )
     assert expected_log in captured_logs
+
+
+class _RPCHandler(BaseHTTPRequestHandler):
+    server: "_RPCServer"
+
+    def do_POST(self):  # pylint: disable=invalid-name
+        request = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        self.server.begin_request()
+        time.sleep(self.server.latency)
+        rate_limited = self.server.rate_limiter is not None and self.server.rate_limiter(
+            None, None
+        )
+        # The client cannot make another request before receiving the
+        # response, so this request is done as far as counting is concerned.
+        self.server.end_request()
+
+        if rate_limited:
+            self.send_response(HTTPStatus.TOO_MANY_REQUESTS)
+            self.send_header("Retry-After", "1")
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        body = json.dumps(dict(jsonrpc="2.0", id=request["id"], result="0x1")).encode()
+        self.send_response(HTTPStatus.OK)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):  # pylint: disable=arguments-differ
+        pass
+
+
+class _RPCServer(ThreadingHTTPServer):
+    """A JSON-RPC server answering every request after ``latency`` seconds,
+    unless rejected by ``rate_limiter``. Keeps track of the maximum number
+    of requests in flight."""
+
+    def __init__(self, latency, rate_limiter=None):
+        super().__init__(("127.0.0.1", 0), _RPCHandler)
+        self.latency = latency
+        self.rate_limiter = rate_limiter
+        self.max_in_flight = 0
+        self._in_flight = 0
+        self._lock = threading.Lock()
+
+    def begin_request(self):
+        with self._lock:
+            self._in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self._in_flight)
+
+    def end_request(self):
+        with self._lock:
+            self._in_flight -= 1
+
+    def url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+
+@pytest.fixture
+def rpc_server(request):
+    server = _RPCServer(**request.param)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def _make_web3(url, **limits):
+    w3 = Web3(HTTPProvider(url))
+    w3.middleware_onion.clear()
+    w3.middleware_onion.add(beamer.middleware.generate_rate_limiter(ChainId(1), **limits))
+    # Web3 sets up the middlewares on the first request. Make sure this does
+    # not happen concurrently, which would create several rate limiters.
+    assert w3.eth.block_number == 1
+    return w3
+
+
+def _measure_throughput(url, num_requests, **limits):
+    w3 = _make_web3(url, **limits)
+    start = time.monotonic()
+    with ThreadPoolExecutor(max_workers=20) as executor:
+        results = list(executor.map(lambda _: w3.eth.block_number, range(num_requests)))
+    throughput = num_requests / (time.monotonic() - start)
+    assert results == [1] * num_requests
+    return throughput
+
+
+@pytest.mark.parametrize("rpc_server", [dict(latency=0.05)], indirect=True)
+def test_rate_limiter_concurrent_requests(rpc_server):
+    throughput = _measure_throughput(rpc_server.url(), 100, max_concurrent_requests=10)
+    # Requests made one at a time would achieve at most 20 requests per second.
+    assert throughput > 80
+    assert rpc_server.max_in_flight == 10
+
+
+@pytest.mark.parametrize("rpc_server", [dict(latency=0)], indirect=True)
+def test_rate_limiter_max_requests_per_second(rpc_server):
+    # The first 50 requests are a burst, the remaining ones take at least 1 second.
+    throughput = _measure_throughput(rpc_server.url(), 100, max_requests_per_second=50)
+    assert throughput < 110
+
+
+@pytest.mark.parametrize(
+    "rpc_server", [dict(latency=0.01, rate_limiter=_RateLimiter(20))], indirect=True
+)
+def test_rate_limiter_adapts_to_rpc_limit(rpc_server):
+    with structlog.testing.capture_logs() as captured_logs:
+        throughput = _measure_throughput(rpc_server.url(), 60)
+
+    assert any(entry["event"] == "Entering rate limiting mode" for entry in captured_logs)
+    # The RPC accepts 20 requests per second. Backing off must not reduce
+    # the throughput to the minimum rate of one request per second.
+    assert 5 < throughput <= 25
+
+
+@pytest.mark.parametrize("rpc_server", [dict(latency=0.05)], indirect=True)
+def test_rate_limiter_priorities(rpc_server):
+    w3 = _make_web3(rpc_server.url(), max_concurrent_requests=1)
+    completed = []
+
+    def get_block_number(priority):
+        with request_priority(priority):
+            assert w3.eth.block_number == 1
+        completed.append(priority)
+
+    with ThreadPoolExecutor(max_workers=11) as executor:
+        for _ in range(10):
+            executor.submit(get_block_number, RequestPriority.BACKFILL)
+        time.sleep(0.02)
+        executor.submit(get_block_number, RequestPriority.FILL)
+
+    # The fill request only needs to wait for the backfill request in
+    # flight, not for the queued ones.
+    assert len(completed) == 11
+    assert completed.index(RequestPriority.FILL) < 3
+
+
+@pytest.mark.parametrize("rpc_server", [dict(latency=0)], indirect=True)
+def test_rate_limiter_compute_units(rpc_server):
+    # With a budget of 5 calls of eth_blockNumber per second, the first 5
+    # requests are a burst, the remaining ones take at least 3 seconds.
+    compute_units = {"eth_blockNumber": 100}
+    throughput = _measure_throughput(
+        rpc_server.url(), 20, compute_units_per_second=500, compute_units=compute_units
+    )
+    assert throughput < 8
+
+    # Calls without cost are not limited by the budget.
+    compute_units = {"eth_blockNumber": 0}
+    throughput = _measure_throughput(
+        rpc_server.url(), 20, compute_units_per_second=500, compute_units=compute_units
+    )
+    assert throughput > 12
@@ -13,7 +13,7 @@ from beamer.agent.agent import Agent
 from beamer.agent.chain import maybe_challenge
 from beamer.agent.models.claim import Claim
 from beamer.agent.models.request import Request
-from beamer.events import ClaimMade, RequestFilled
+from beamer.events import ClaimMade, LatestBlock, RequestFilled
 from beamer.tests.agent.unit.util import BLOCK_NUMBER
 from beamer.tests.util import Sleeper, Timeout, alloc_accounts, make_request
 from beamer.typing import (
@@ -64,7 +64,9 @@ def test_challenge_own_claim(config, request_manager, token, direction):
     # Add context so that maybe_challenge verifies that the claim is not expired
     context = agent.get_context(direction)
     context.requests.add(request.id, request)
-    context.latest_blocks[ChainId(ape.chain.chain_id)] = {"timestamp": Timestamp(0)}
+    context.latest_blocks[ChainId(ape.chain.chain_id)] = LatestBlock(
+        number=BlockNumber(0), hash=HexBytes(b"\x00" * 32), timestamp=Timestamp(0)
+    )
 
     assert not maybe_challenge(claim, context), "Tried to challenge own claim"
 
@@ -0,0 +1,152 @@
+import asyncio
+import threading
+import time
+import types
+
+import aiohttp
+import pytest
+import structlog.testing
+from web3.datastructures import AttributeDict
+from web3.types import RPCEndpoint
+
+import beamer.middleware
+from beamer.middleware import _BlockCache
+
+
+def _make_w3():
+    return types.SimpleNamespace(provider=types.SimpleNamespace(endpoint_uri="http://rpc"))
+
+
+@pytest.fixture(autouse=True)
+def _reset_lanes(monkeypatch):
+    # The rate limiters of the same RPC share their state.
+    monkeypatch.setattr(beamer.middleware, "_LANES", {})
+
+
+def _make_429_error():
+    return aiohttp.ClientResponseError(request_info=None, history=(), status=429)  # type: ignore
+
+
+def test_async_rate_limiter(monkeypatch):
+    monkeypatch.setattr(beamer.middleware, "_RATE_LIMIT_REQUEST_DELAY", 0.01)
+    monkeypatch.setattr(beamer.middleware, "_RATE_LIMIT_MIN_RATE", 100)
+
+    num_calls = 0
+
+    async def make_request(_method, _params):
+        nonlocal num_calls
+        num_calls += 1
+        # Reject the first two requests.
+        if num_calls <= 2:
+            raise _make_429_error()
+        return {"result": num_calls}
+
+    async def run():
+        middleware = await beamer.middleware.async_rate_limiter(make_request, _make_w3())
+        return await asyncio.gather(
+            *(middleware(RPCEndpoint("eth_chainId"), []) for _ in range(5))
+        )
+
+    with structlog.testing.capture_logs() as captured_logs:
+        responses = asyncio.run(run())
+
+    assert sorted(response["result"] for response in responses) == [3, 4, 5, 6, 7]
+    expected_log = dict(
+        event="Entering rate limiting mode",
+        log_level="debug",
+        rpc="http://rpc",
+        thread="MainThread",
+    )
+    assert expected_log in captured_logs
+
+
+def test_async_rate_limiter_gives_up(monkeypatch):
+    monkeypatch.setattr(beamer.middleware, "_RATE_LIMIT_REQUEST_DELAY", 0.01)
+    monkeypatch.setattr(beamer.middleware, "_RATE_LIMIT_MIN_RATE", 100)
+    monkeypatch.setattr(beamer.middleware, "_RATE_LIMIT_MAX_RETRY_TIME", 0.05)
+
+    async def make_request(_method, _params):
+        raise _make_429_error()
+
+    async def run():
+        middleware = await beamer.middleware.async_rate_limiter(make_request, _make_w3())
+        await middleware(RPCEndpoint("eth_chainId"), [])
+
+    with pytest.raises(RuntimeError, match="rate limit period exceeded"):
+        asyncio.run(run())
+
+
+def test_async_cache_get_block_by_number():
+    requests = []
+
+    async def make_request(_method, params):
+        requests.append(params)
+        return {"result": AttributeDict(dict(number="0x10", baseFeePerGas="0x1"))}
+
+    async def run():
+        middleware = await beamer.middleware.async_cache_get_block_by_number(
+            make_request, _make_w3(), cache=_BlockCache()
+        )
+        method = RPCEndpoint("eth_getBlockByNumber")
+        await middleware(method, ("latest", False))
+        await middleware(method, ("0x10", False))
+        await middleware(method, ("0x10", False))
+
+    asyncio.run(run())
+    # The second request for block 0x10 is served from the cache.
+    assert requests == [("latest", False)]
+
+
+def test_async_rate_limiter_shares_limits():
+    async def async_make_request(_method, _params):
+        return {"result": 1}
+
+    middleware = beamer.middleware.rate_limiter(
+        lambda _method, _params: {"result": 1}, _make_w3(), max_concurrent_requests=1
+    )
+    state = middleware.keywords["state"]  # pylint: disable=no-member
+    method = RPCEndpoint("eth_chainId")
+
+    async def run():
+        middleware = await beamer.middleware.async_rate_limiter(
+            async_make_request, _make_w3(), max_concurrent_requests=1
+        )
+        assert middleware.keywords["state"].lanes is state.lanes
+        # Another thread holds the only request slot for a while.
+        # pylint: disable=protected-access
+        beamer.middleware._acquire_slot(state.lanes, method, [])
+        threading.Timer(0.1, state.lanes.release).start()
+        start = time.monotonic()
+        await middleware(method, [])
+        return time.monotonic() - start
+
+    assert asyncio.run(run()) >= 0.1
+
+
+def test_async_max_fee_setter():
+    methods = []
+
+    async def make_request(method, _params):
+        methods.append(method)
+        if method == "eth_maxPriorityFeePerGas":
+            return {"result": "0x2"}
+        if method == "eth_getBlockByNumber":
+            return {"result": AttributeDict(dict(number="0x10", baseFeePerGas="0x5"))}
+        return {"result": "0x1234"}
+
+    async def run(transaction):
+        middleware = await beamer.middleware.async_max_fee_setter(
+            make_request, _make_w3(), cache=_BlockCache()
+        )
+        await middleware(RPCEndpoint("eth_sendTransaction"), [transaction])
+
+    transaction: dict = {}
+    asyncio.run(run(transaction))
+    assert transaction == dict(maxPriorityFeePerGas=2, maxFeePerGas=12)
+
+    # Fees set by the caller, e.g. for a replacement transaction, are kept.
+    methods.clear()
+    transaction = dict(maxPriorityFeePerGas=3, maxFeePerGas=20)
+    asyncio.run(run(transaction))
+    assert transaction == dict(maxPriorityFeePerGas=3, maxFeePerGas=20)
+    assert methods == ["eth_sendTransaction"]
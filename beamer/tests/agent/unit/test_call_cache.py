@@ -0,0 +1,103 @@
+import http.server
+import json
+import threading
+
+import pytest
+from hexbytes import HexBytes
+from web3 import HTTPProvider, Web3
+
+import beamer.middleware
+from beamer.agent.chain import EventProcessor
+from beamer.events import LpAdded, LpRemoved
+from beamer.tests.agent.unit.util import SOURCE_CHAIN_ID, make_context
+from beamer.tests.util import make_address
+from beamer.typing import BlockNumber, ChainId
+
+_CHAIN_ID = ChainId(5432)
+_SELECTOR = "0xaabbccdd"
+
+
+class _RequestHandler(http.server.BaseHTTPRequestHandler):
+    num_calls = 0
+
+    def do_POST(self):  # pylint: disable=invalid-name
+        request = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        if request["method"] == "eth_call":
+            _RequestHandler.num_calls += 1
+        result = "0x%064x" % _RequestHandler.num_calls
+        body = json.dumps(dict(jsonrpc="2.0", id=request["id"], result=result)).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):  # pylint: disable=arguments-differ
+        pass
+
+
+@pytest.fixture
+def w3():
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), _RequestHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    w3 = Web3(HTTPProvider(f"http://127.0.0.1:{server.server_address[1]}"))
+    w3.middleware_onion.clear()
+    w3.middleware_onion.add(beamer.middleware.generate_call_cache(_CHAIN_ID))
+    yield w3
+    server.shutdown()
+    _RequestHandler.num_calls = 0
+
+
+def _call(w3, address, args="", block="latest"):
+    return w3.eth.call(dict(to=address, data=_SELECTOR + args), block)
+
+
+def test_call_cache(w3):
+    address = make_address()
+    beamer.middleware.register_cached_call(_CHAIN_ID, address, _SELECTOR, ("LpAdded",))
+
+    assert _call(w3, address) == _call(w3, address)
+    assert _RequestHandler.num_calls == 1
+
+    # Calls with different arguments, to a different block, or of a
+    # different contract are separate.
+    _call(w3, address, args="01")
+    _call(w3, address, block=1)
+    _call(w3, make_address())
+    assert _RequestHandler.num_calls == 4
+
+    # Only the registered events invalidate the results.
+    beamer.middleware.invalidate_cached_calls(_CHAIN_ID, address, "LpRemoved")
+    _call(w3, address)
+    assert _RequestHandler.num_calls == 4
+    beamer.middleware.invalidate_cached_calls(_CHAIN_ID, address, "LpAdded")
+    _call(w3, address)
+    _call(w3, address, args="01")
+    assert _RequestHandler.num_calls == 6
+
+
+def test_event_processor_invalidates_cached_calls():
+    context, _ = make_context()
+    processor = EventProcessor(context)
+    address = make_address()
+    beamer.middleware.register_cached_call(SOURCE_CHAIN_ID, address, _SELECTOR, ("LpRemoved",))
+    # pylint: disable=protected-access
+    cache = beamer.middleware._CALL_CACHES[SOURCE_CHAIN_ID]
+    key = cache.get_key([dict(to=address, data=_SELECTOR), "latest"])
+    assert key is not None
+    cache.add(key, dict(jsonrpc="2.0", id=1, result="0x01"), cache.get(key)[1])
+
+    def make_event(event_class):
+        return event_class(
+            event_chain_id=SOURCE_CHAIN_ID,
+            event_address=address,
+            block_number=BlockNumber(40),
+            tx_hash=HexBytes(b"\x01"),
+            lp=make_address(),
+        )
+
+    processor.add_events([make_event(LpAdded)])
+    assert cache.get(key)[0] is not None
+    processor.add_events([make_event(LpRemoved)])
+    assert cache.get(key)[0] is None
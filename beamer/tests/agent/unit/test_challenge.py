@@ -5,11 +5,12 @@ from unittest.mock import MagicMock, patch
 import pytest
 from eth_typing import BlockNumber
 from hexbytes import HexBytes
-from web3.types import BlockData, Wei
+from web3.types import Wei
 
 from beamer.agent.agent import Chain
 from beamer.agent.chain import process_claims
 from beamer.chains import search
+from beamer.events import LatestBlock
 from beamer.tests.agent.unit.util import (
     ADDRESS1,
     CLAIMER_STAKE,
@@ -102,8 +103,8 @@ def test_optimism_prove(mocked_relayer_call):
     mocked_relayer_call.return_value = str(timestamp)
     op_chain_id = next(iter(search(bedrock=True, local=True))).id
     context, _ = make_context()
-    context.latest_blocks[op_chain_id] = BlockData(
-        {"number": BlockNumber(30), "timestamp": TIMESTAMP}
+    context.latest_blocks[op_chain_id] = LatestBlock(
+        number=BlockNumber(30), hash=HexBytes(b"\x01" * 32), timestamp=TIMESTAMP
     )
     context.finality_periods[op_chain_id] = 1
     context.target_chain = Chain(
@@ -0,0 +1,207 @@
+import http.server
+import json
+import threading
+
+import pytest
+from eth_abi import encode
+from eth_utils import event_abi_to_log_topic
+from hexbytes import HexBytes
+from prometheus_client import REGISTRY
+from web3.datastructures import AttributeDict
+
+import beamer.events
+from beamer.events import (
+    EventFetcher,
+    LatestBlock,
+    LatestBlockUpdatedEvent,
+    LpAdded,
+    coalesce_latest_blocks,
+)
+from beamer.tests.util import make_address
+from beamer.typing import URL, BlockNumber, ChainId
+from beamer.util import make_web3
+
+_CHAIN_ID = ChainId(1337)
+_LP_ADDED_ABI = dict(
+    type="event",
+    name="LpAdded",
+    anonymous=False,
+    inputs=[dict(name="lp", type="address", indexed=False)],
+)
+_CONTRACT_ADDRESS = make_address()
+_LP = make_address()
+
+
+def _make_log(block_number):
+    return {
+        "address": str(_CONTRACT_ADDRESS).lower(),
+        "topics": ["0x" + event_abi_to_log_topic(_LP_ADDED_ABI).hex()],
+        "data": "0x" + encode(["address"], [_LP]).hex(),
+        "blockNumber": hex(block_number),
+        "blockHash": "0x" + "11" * 32,
+        "transactionHash": "0x" + "22" * 32,
+        "transactionIndex": "0x0",
+        "logIndex": "0x1",
+        "removed": False,
+    }
+
+
+def _make_block(number, bloom):
+    return {
+        "number": hex(number),
+        "hash": "0x" + "%064x" % number,
+        "parentHash": "0x" + "%064x" % (number - 1),
+        "timestamp": hex(1000 + number),
+        "logsBloom": "0x" + bloom.to_bytes(256, "big").hex(),
+        "transactions": [],
+    }
+
+
+class _RequestHandler(http.server.BaseHTTPRequestHandler):
+    head_block = 0
+    blooms: dict[int, int] = {}
+    num_get_logs = 0
+
+    def do_POST(self):  # pylint: disable=invalid-name
+        request = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        result: object
+        if request["method"] == "eth_getLogs":
+            _RequestHandler.num_get_logs += 1
+            (params,) = request["params"]
+            result = [_make_log(int(params["fromBlock"], 16))]
+        elif request["method"] == "eth_getBlockByNumber":
+            number = request["params"][0]
+            number = _RequestHandler.head_block if number == "latest" else int(number, 16)
+            result = _make_block(number, _RequestHandler.blooms.get(number, 0))
+        else:
+            result = hex(_CHAIN_ID)
+        body = json.dumps(dict(jsonrpc="2.0", id=request["id"], result=result)).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        # Send the body in chunks, which the provider reads as a whole.
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        for start in range(0, len(body), 100):
+            end = start + 100
+            chunk = body[start:end]
+            self.wfile.write(b"%x\r\n%s\r\n" % (len(chunk), chunk))
+        self.wfile.write(b"0\r\n\r\n")
+
+    def log_message(self, *args):  # pylint: disable=arguments-differ
+        pass
+
+
+@pytest.fixture
+def w3():
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), _RequestHandler)
+    _RequestHandler.protocol_version = "HTTP/1.1"
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield make_web3(URL(f"http://127.0.0.1:{server.server_address[1]}"))
+    server.shutdown()
+    server.server_close()
+    _RequestHandler.head_block = 0
+    _RequestHandler.blooms = {}
+    _RequestHandler.num_get_logs = 0
+
+
+def test_fetch_raw_logs(w3):
+    # Logs are not converted into AttributeDicts.
+    logs = w3.manager.request_blocking("eth_getLogs", [dict(fromBlock="0x5", toBlock="0x5")])
+    assert not isinstance(logs[0], AttributeDict)
+
+    contract = w3.eth.contract(_CONTRACT_ADDRESS, abi=[_LP_ADDED_ABI])
+    fetcher = EventFetcher(w3, (contract,), BlockNumber(0), 0)
+    # pylint: disable=protected-access
+    events = fetcher._fetch_range(BlockNumber(7), BlockNumber(9))
+    assert events == [
+        LpAdded(
+            event_chain_id=_CHAIN_ID,
+            event_address=_CONTRACT_ADDRESS,
+            block_number=BlockNumber(7),
+            tx_hash=HexBytes(b"\x22" * 32),
+            lp=_LP,
+        )
+    ]
+
+
+@pytest.mark.parametrize("confirmation_blocks", [0, 2])
+def test_logs_bloom_prefilter(w3, confirmation_blocks):
+    contract = w3.eth.contract(_CONTRACT_ADDRESS, abi=[_LP_ADDED_ABI])
+    fetcher = EventFetcher(w3, (contract,), BlockNumber(10), confirmation_blocks)
+    # pylint: disable=protected-access
+    address_bits = beamer.events._bloom_bits(HexBytes(_CONTRACT_ADDRESS))
+    topic_bits = beamer.events._bloom_bits(event_abi_to_log_topic(_LP_ADDED_ABI))
+    skipped = REGISTRY.get_sample_value(
+        "event_fetcher_get_logs_skipped_total", dict(chain_id=str(_CHAIN_ID))
+    )
+
+    # A block whose bloom contains our address, but none of our topics, or
+    # vice versa, is skipped.
+    _RequestHandler.blooms = {10: address_bits, 11: topic_bits | 1, 12: address_bits | topic_bits}
+
+    def fetch(block_number):
+        _RequestHandler.head_block = block_number + confirmation_blocks
+        return fetcher.fetch()
+
+    events = fetch(10)
+    assert [type(event) for event in events] == [LatestBlockUpdatedEvent]
+    fetch(11)
+    assert _RequestHandler.num_get_logs == 0
+    assert fetcher.synced_block == 11
+
+    events = fetch(12)
+    assert _RequestHandler.num_get_logs == 1
+    assert [type(event) for event in events] == [LpAdded, LatestBlockUpdatedEvent]
+
+    # Ranges with blocks whose headers were not fetched are not skipped.
+    fetch(14)
+    assert _RequestHandler.num_get_logs == 2
+    assert fetcher.synced_block == 14
+    assert (
+        REGISTRY.get_sample_value(
+            "event_fetcher_get_logs_skipped_total", dict(chain_id=str(_CHAIN_ID))
+        )
+        == (skipped or 0) + 2
+    )
+
+
+@pytest.mark.parametrize("bloom_prefilter", [True, False])
+def test_logs_bloom_prefilter_untrusted(w3, bloom_prefilter):
+    contract = w3.eth.contract(_CONTRACT_ADDRESS, abi=[_LP_ADDED_ABI])
+    fetcher = EventFetcher(w3, (contract,), BlockNumber(10), 0, bloom_prefilter=bloom_prefilter)
+    # Block 10 has an all-zero bloom, as returned by some nodes, which is
+    # never trusted. Block 11 has a bloom without our address and topics,
+    # which is only trusted if the prefilter is enabled.
+    _RequestHandler.blooms = {10: 0, 11: 1}
+    for block_number in (10, 11):
+        _RequestHandler.head_block = block_number
+        fetcher.fetch()
+    assert fetcher.synced_block == 11
+    assert _RequestHandler.num_get_logs == (1 if bloom_prefilter else 2)
+
+
+def _make_latest_block_updated(chain_id, number):
+    block = LatestBlock(
+        number=BlockNumber(number), hash=HexBytes(number.to_bytes(32, "big")), timestamp=number
+    )
+    return LatestBlockUpdatedEvent(event_chain_id=ChainId(chain_id), block=block)
+
+
+def test_coalesce_latest_blocks():
+    lp_added = LpAdded(
+        event_chain_id=_CHAIN_ID,
+        event_address=_CONTRACT_ADDRESS,
+        block_number=BlockNumber(2),
+        tx_hash=HexBytes(b"\x22" * 32),
+        lp=_LP,
+    )
+    events = [
+        _make_latest_block_updated(1, 1),
+        _make_latest_block_updated(2, 1),
+        lp_added,
+        _make_latest_block_updated(1, 2),
+        _make_latest_block_updated(1, 3),
+    ]
+    assert coalesce_latest_blocks(events) == [events[1], lp_added, events[4]]
+    assert coalesce_latest_blocks(events[1:4]) == events[1:4]
@@ -0,0 +1,99 @@
+import http.server
+import json
+import threading
+from collections import Counter
+
+import pytest
+from eth_account import Account
+
+import beamer.middleware
+from beamer.typing import URL, ChainId
+from beamer.util import make_web3
+
+_CHAIN_ID = ChainId(1)
+_SELECTOR = "0xaabbccdd"
+
+
+class _RequestHandler(http.server.BaseHTTPRequestHandler):
+    requests: Counter = Counter()
+    raw_transactions: list[str] = []
+
+    def do_POST(self):  # pylint: disable=invalid-name
+        request = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        method = request["method"]
+        _RequestHandler.requests[method] += 1
+        result = {
+            "eth_chainId": hex(_CHAIN_ID),
+            "eth_blockNumber": "0x10",
+            "eth_call": "0x%064x" % _RequestHandler.requests["eth_call"],
+            "eth_getBlockByNumber": {
+                "number": "0x10",
+                "hash": "0x" + "11" * 32,
+                "parentHash": "0x" + "22" * 32,
+                "timestamp": "0x10",
+                "baseFeePerGas": "0x7",
+                "transactions": [],
+            },
+            "eth_maxPriorityFeePerGas": "0x1",
+            "eth_sendRawTransaction": "0x" + "33" * 32,
+        }[method]
+        if method == "eth_sendRawTransaction":
+            _RequestHandler.raw_transactions.append(request["params"][0])
+        body = json.dumps(dict(jsonrpc="2.0", id=request["id"], result=result)).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):  # pylint: disable=arguments-differ
+        pass
+
+
+@pytest.fixture
+def rpc_url():
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), _RequestHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield URL(f"http://127.0.0.1:{server.server_address[1]}")
+    server.shutdown()
+    server.server_close()
+
+
+def _run_requests(w3, address):
+    _RequestHandler.requests = Counter()
+    _RequestHandler.raw_transactions = []
+    results = [
+        w3.eth.chain_id,
+        w3.eth.chain_id,
+        w3.eth.block_number,
+        w3.eth.call(dict(to=address, data=_SELECTOR)),
+        w3.eth.call(dict(to=address, data=_SELECTOR)),
+        w3.eth.get_block(16),
+        w3.eth.get_block(16),
+        w3.eth.send_transaction(dict(to=address, value=1, gas=21_000, nonce=0)),
+    ]
+    return results, dict(_RequestHandler.requests), _RequestHandler.raw_transactions
+
+
+@pytest.mark.parametrize("cached_call", [False, True])
+def test_fused_middleware(rpc_url, cached_call):
+    account = Account.create()
+    address = Account.create().address
+    if cached_call:
+        beamer.middleware.register_cached_call(_CHAIN_ID, address, _SELECTOR, ("Reset",))
+
+    # pylint: disable=protected-access
+    beamer.middleware._BLOCK_STORAGE.pop(_CHAIN_ID, None)
+    separate = _run_requests(make_web3(rpc_url, account), address)
+    beamer.middleware._BLOCK_STORAGE.pop(_CHAIN_ID, None)
+    beamer.middleware.invalidate_cached_calls(_CHAIN_ID, address, "Reset")
+    fused = _run_requests(make_web3(rpc_url, account, fused_middleware=True), address)
+
+    # The fused middleware sends the same requests and returns the same
+    # results, including the signed transaction with its fees.
+    assert fused == separate
+    _, requests, raw_transactions = fused
+    assert requests["eth_call"] == (1 if cached_call else 2)
+    assert requests["eth_getBlockByNumber"] == 1
+    assert len(raw_transactions) == 1
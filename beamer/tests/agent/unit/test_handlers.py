@@ -1,4 +1,4 @@
-from typing import cast
+from typing import Any, cast
 from unittest.mock import MagicMock, patch
 
 import pytest
@@ -10,13 +10,22 @@ from web3.datastructures import AttributeDict
 from web3.types import ChecksumAddress, TxReceipt, Wei
 
 from beamer.agent.chain import claim_request, process_claims, process_requests
-from beamer.agent.state_machine import process_event
-from beamer.events import RequestResolved
+from beamer.agent.state_machine import process_event, prune_settled_requests
+from beamer.events import (
+    ClaimMade,
+    ClaimStakeWithdrawn,
+    DepositWithdrawn,
+    RequestCreated,
+    RequestFilled,
+    RequestResolved,
+)
 from beamer.tests.agent.unit.util import (
     ACCOUNT,
     ADDRESS1,
     BLOCK_NUMBER,
+    NULL_ADDRESS,
     SOURCE_CHAIN_ID,
+    TARGET_CHAIN_ID,
     TIMESTAMP,
     make_claim_challenged,
     make_claim_unchallenged,
@@ -25,7 +34,7 @@ from beamer.tests.agent.unit.util import (
 )
 from beamer.tests.constants import FILL_ID
 from beamer.tests.util import make_address
-from beamer.typing import FillId, Termination
+from beamer.typing import ClaimId, FillId, Nonce, RequestId, Termination, TokenAmount
 
 
 def get_tx_receipt(status, tx_hash) -> TxReceipt:
@@ -200,7 +209,7 @@ def test_maybe_claim_no_l1():
 
     # Make sure we're outside the challenge period
     block = context.latest_blocks[request.source_chain_id]
-    assert block["timestamp"] >= claim.termination
+    assert block.timestamp >= claim.termination
     assert not claim.transaction_pending
     process_claims(context)
     assert not claim.transaction_pending
@@ -216,7 +225,7 @@ def test_maybe_claim_no_l1():
 
     # Make sure we're outside the challenge period
     block = context.latest_blocks[request.source_chain_id]
-    assert block["timestamp"] >= claim.termination
+    assert block.timestamp >= claim.termination
 
     assert not claim.transaction_pending
     process_claims(context)
@@ -234,7 +243,7 @@ def test_maybe_claim_no_l1():
     context.claims.add(claim.id, claim)
 
     # Make sure we're inside the challenge period
-    assert block["timestamp"] < claim.termination
+    assert block.timestamp < claim.termination
 
     assert not claim.transaction_pending
     process_claims(context)
@@ -308,3 +317,126 @@ def test_maybe_claim_l1_as_challenger(
         assert mocked_withdraw.called
     else:
         assert not mocked_withdraw.called
+
+
+def test_prune_settled_requests():
+    context, _ = make_context()
+    address = make_address()
+    tx_fields: dict[str, Any] = dict(
+        event_address=address, block_number=BLOCK_NUMBER, tx_hash=HexBytes(b"")
+    )
+
+    def created(request_id, valid_until):
+        return RequestCreated(
+            event_chain_id=SOURCE_CHAIN_ID,
+            request_id=request_id,
+            target_chain_id=TARGET_CHAIN_ID,
+            source_token_address=address,
+            target_token_address=address,
+            source_address=address,
+            target_address=address,
+            amount=TokenAmount(1),
+            nonce=Nonce(1),
+            valid_until=Termination(valid_until),
+            lp_fee=TokenAmount(0),
+            protocol_fee=TokenAmount(0),
+            **tx_fields,
+        )
+
+    def claim_made(request_id, claim_id, claimer=ADDRESS1, last_challenger=NULL_ADDRESS):
+        return ClaimMade(
+            event_chain_id=SOURCE_CHAIN_ID,
+            claim_id=ClaimId(claim_id),
+            request_id=request_id,
+            fill_id=FILL_ID,
+            claimer=claimer,
+            claimer_stake=Wei(1),
+            last_challenger=last_challenger,
+            challenger_stake_total=Wei(0 if last_challenger == NULL_ADDRESS else 2),
+            termination=Termination(1),
+            **tx_fields,
+        )
+
+    def filled(request_id, filler=ADDRESS1):
+        return RequestFilled(
+            event_chain_id=TARGET_CHAIN_ID,
+            request_id=request_id,
+            fill_id=FILL_ID,
+            source_chain_id=SOURCE_CHAIN_ID,
+            target_token_address=address,
+            filler=filler,
+            amount=TokenAmount(1),
+            **tx_fields,
+        )
+
+    def withdrawn(request_id):
+        return DepositWithdrawn(
+            event_chain_id=SOURCE_CHAIN_ID, request_id=request_id, receiver=ADDRESS1, **tx_fields
+        )
+
+    def stake_withdrawn(request_id, claim_id):
+        return ClaimStakeWithdrawn(
+            event_chain_id=SOURCE_CHAIN_ID,
+            claim_id=ClaimId(claim_id),
+            request_id=request_id,
+            stake_recipient=ADDRESS1,
+            **tx_fields,
+        )
+
+    settled, unwithdrawn_claim, expired, live, restored = (
+        RequestId(bytes([i]) * 32) for i in range(1, 6)
+    )
+    other_lp, other_lp_live, challenged, dishonest, own_fill = (
+        RequestId(bytes([i]) * 32) for i in range(6, 11)
+    )
+    # The context's source chain block is at TIMESTAMP and requests can be
+    # claimed up to 100 seconds after they expire.
+    events = [
+        created(settled, TIMESTAMP),
+        created(unwithdrawn_claim, TIMESTAMP),
+        created(expired, TIMESTAMP - 100),
+        created(live, TIMESTAMP - 99),
+        created(restored, TIMESTAMP - 100),
+        created(other_lp, TIMESTAMP - 100),
+        created(other_lp_live, TIMESTAMP - 99),
+        created(challenged, TIMESTAMP - 100),
+        created(dishonest, TIMESTAMP - 100),
+        created(own_fill, TIMESTAMP - 100),
+        claim_made(settled, 1),
+        claim_made(unwithdrawn_claim, 2),
+        claim_made(unwithdrawn_claim, 3),
+        filled(expired),
+        # Requests filled and honestly claimed by another LP are irrelevant
+        # once they can no longer be claimed, unless the agent challenged.
+        filled(other_lp),
+        claim_made(other_lp, 4),
+        filled(other_lp_live),
+        claim_made(other_lp_live, 5),
+        filled(challenged),
+        claim_made(challenged, 6),
+        claim_made(challenged, 6, last_challenger=ACCOUNT.address),
+        filled(dishonest),
+        claim_made(dishonest, 7, claimer=make_address()),
+        filled(own_fill, filler=ACCOUNT.address),
+        claim_made(own_fill, 8, claimer=ACCOUNT.address),
+        withdrawn(settled),
+        withdrawn(unwithdrawn_claim),
+        stake_withdrawn(settled, 1),
+        stake_withdrawn(unwithdrawn_claim, 2),
+    ]
+    request = make_request()
+    context.requests.add(restored, request)
+
+    pruned = prune_settled_requests(events, context)
+    assert {event.request_id for event in pruned} == {
+        unwithdrawn_claim,
+        live,
+        restored,
+        other_lp_live,
+        challenged,
+        dishonest,
+        own_fill,
+    }
+    assert pruned == [
+        event for event in events if event.request_id not in (settled, expired, other_lp)
+    ]
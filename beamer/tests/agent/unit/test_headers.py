@@ -0,0 +1,200 @@
+import http.server
+import json
+import threading
+
+import pytest
+from hexbytes import HexBytes
+from web3 import Web3
+
+import beamer.agent.headers
+from beamer.agent.headers import BlockHeader, HeaderStore
+from beamer.agent.state_machine import process_event
+from beamer.events import EventFetcher, FillInvalidated, LpAdded
+from beamer.provider import PooledHTTPProvider
+from beamer.tests.agent.unit.util import TARGET_CHAIN_ID, make_context
+from beamer.tests.util import make_address
+from beamer.typing import URL, BlockNumber, ChainId, FillId, RequestId
+
+_CHAIN_ID = ChainId(1234)
+
+
+def _make_header(number, base_fee=None):
+    return BlockHeader(
+        number=BlockNumber(number),
+        hash=HexBytes(number.to_bytes(32, "big")),
+        parent_hash=HexBytes((number - 1).to_bytes(32, "big")),
+        timestamp=1000 + number,
+        base_fee=base_fee,
+    )
+
+
+def test_header_store(tmp_path, monkeypatch):
+    monkeypatch.setattr(beamer.agent.headers, "_FLUSH_SIZE", 3)
+    path = tmp_path / "headers.bin"
+    store = HeaderStore(path, _CHAIN_ID)
+    assert store.get(BlockNumber(1)) is None
+
+    store.add(_make_header(1, base_fee=7))
+    store.add(_make_header(2))
+    assert store.get(BlockNumber(1)) == _make_header(1, base_fee=7)
+    size = path.stat().st_size
+    # The third header triggers a write of all buffered headers.
+    store.add(_make_header(3))
+    assert path.stat().st_size > size
+
+    # Another store of the same file sees the appended headers.
+    other = HeaderStore(path, _CHAIN_ID)
+    assert other.get_timestamp(BlockNumber(2)) == 1002
+    store.add_many([_make_header(4), _make_header(5), _make_header(6)])
+    assert other.get(BlockNumber(6)) == _make_header(6)
+    assert len(other) == 6
+    other.close()
+
+    store.add(_make_header(7))
+    store.close()
+    store = HeaderStore(path, _CHAIN_ID)
+    assert len(store) == 7
+    assert store.get(BlockNumber(1)) == _make_header(1, base_fee=7)
+    store.close()
+
+
+def test_header_store_recovery(tmp_path):
+    path = tmp_path / "headers.bin"
+    store = HeaderStore(path, _CHAIN_ID)
+    store.add_many([_make_header(1), _make_header(2)])
+    store.close()
+
+    # A partial record is dropped.
+    with path.open("ab") as f:
+        f.write(b"\x01\x02\x03")
+    store = HeaderStore(path, _CHAIN_ID)
+    assert len(store) == 2
+    store.add(_make_header(3))
+    store.close()
+    store = HeaderStore(path, _CHAIN_ID)
+    assert store.get(BlockNumber(3)) == _make_header(3)
+    store.close()
+
+    # A store of another chain is discarded.
+    store = HeaderStore(path, ChainId(_CHAIN_ID + 1))
+    assert len(store) == 0
+    store.close()
+
+
+class _RequestHandler(http.server.BaseHTTPRequestHandler):
+    batches: list[list[int]] = []
+
+    def do_POST(self):  # pylint: disable=invalid-name
+        request = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        response: object
+        if isinstance(request, list):
+            _RequestHandler.batches.append([int(entry["params"][0], 16) for entry in request])
+            response = [
+                dict(jsonrpc="2.0", id=entry["id"], result=_make_block(entry["params"][0]))
+                for entry in request
+            ]
+        else:
+            response = dict(jsonrpc="2.0", id=request["id"], result=hex(_CHAIN_ID))
+        body = json.dumps(response).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):  # pylint: disable=arguments-differ
+        pass
+
+
+def _make_block(number):
+    return {
+        "number": number,
+        "hash": "0x" + "11" * 32,
+        "parentHash": "0x" + "22" * 32,
+        "timestamp": hex(1000 + int(number, 16)),
+        "baseFeePerGas": "0x7",
+    }
+
+
+@pytest.fixture
+def w3():
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), _RequestHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield Web3(PooledHTTPProvider(URL(f"http://127.0.0.1:{server.server_address[1]}")))
+    server.shutdown()
+    server.server_close()
+    _RequestHandler.batches = []
+
+
+def _make_fill_invalidated(block_number):
+    return FillInvalidated(
+        event_chain_id=_CHAIN_ID,
+        event_address=make_address(),
+        block_number=BlockNumber(block_number),
+        tx_hash=HexBytes(b"\x03"),
+        request_id=RequestId(b"\x04" * 32),
+        fill_id=FillId(b"\x05"),
+    )
+
+
+def test_event_fetcher_block_timestamps(w3, tmp_path):
+    store = HeaderStore(tmp_path / "headers.bin", _CHAIN_ID)
+    store.add(_make_header(30))
+    fetcher = EventFetcher(w3, (), BlockNumber(0), 0, header_store=store)
+    lp_added = LpAdded(
+        event_chain_id=_CHAIN_ID,
+        event_address=make_address(),
+        block_number=BlockNumber(10),
+        tx_hash=HexBytes(b"\x01"),
+        lp=make_address(),
+    )
+    events = [lp_added] + [_make_fill_invalidated(number) for number in (20, 30, 40, 20)]
+
+    # pylint: disable=protected-access
+    events = fetcher._add_block_timestamps(events)
+    assert events[0] == lp_added
+    assert [event.block_timestamp for event in events[1:]] == [1020, 1030, 1040, 1020]
+    # Only the blocks missing in the header store are fetched, in a single batch.
+    assert _RequestHandler.batches == [[20, 40]]
+    assert store.get(BlockNumber(40)) == BlockHeader(
+        number=BlockNumber(40),
+        hash=HexBytes(b"\x11" * 32),
+        parent_hash=HexBytes(b"\x22" * 32),
+        timestamp=1040,
+        base_fee=7,
+    )
+    store.close()
+
+
+def test_fill_invalidated_uses_header_store(tmp_path):
+    context, _ = make_context()
+    store = HeaderStore(tmp_path / "headers.bin", TARGET_CHAIN_ID)
+    context.target_chain.header_store = store
+    context.fill_manager.w3.eth.get_block.return_value = dict(
+        number=BlockNumber(40),
+        hash=HexBytes(b"\x01" * 32),
+        parentHash=HexBytes(b"\x02" * 32),
+        timestamp=2000,
+    )
+
+    def make_event(fill_id, block_timestamp=None):
+        return FillInvalidated(
+            event_chain_id=TARGET_CHAIN_ID,
+            event_address=context.fill_manager.address,
+            block_number=BlockNumber(40),
+            tx_hash=HexBytes(b"\x03"),
+            request_id=RequestId(b"\x04" * 32),
+            fill_id=FillId(fill_id),
+            block_timestamp=block_timestamp,
+        )
+
+    # Events normally carry the timestamp of their block.
+    process_event(make_event(b"\x05", block_timestamp=2000), context)
+    context.fill_manager.w3.eth.get_block.assert_not_called()
+
+    process_event(make_event(b"\x06"), context)
+    process_event(make_event(b"\x07"), context)
+    context.fill_manager.w3.eth.get_block.assert_called_once_with(40)
+    assert store.get_timestamp(BlockNumber(40)) == 2000
+    store.close()
@@ -0,0 +1,137 @@
+import asyncio
+import http.server
+import json
+import threading
+import time
+
+import aiohttp
+import pytest
+import requests
+from prometheus_client import REGISTRY
+from web3 import AsyncHTTPProvider, AsyncWeb3, Web3
+from web3.types import RPCEndpoint
+
+import beamer.middleware
+from beamer.provider import PooledHTTPProvider, make_batch_request
+from beamer.typing import ChainId
+
+_CHAIN_ID = ChainId(1234)
+
+
+class _RequestHandler(http.server.BaseHTTPRequestHandler):
+    # The HTTP status code of the next response.
+    status = 200
+
+    def do_POST(self):  # pylint: disable=invalid-name
+        request = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        response: object
+        if isinstance(request, list):
+            response = [dict(jsonrpc="2.0", id=entry["id"], result="0x10") for entry in request]
+        else:
+            response = dict(jsonrpc="2.0", id=request["id"], result="0x10")
+        body = json.dumps(response).encode()
+        self.send_response(self.status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):  # pylint: disable=arguments-differ
+        pass
+
+
+@pytest.fixture
+def rpc_url():
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), _RequestHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+    _RequestHandler.status = 200
+
+
+def _get_sample_value(name, **labels):
+    return REGISTRY.get_sample_value(name, labels) or 0
+
+
+def _get_samples(method):
+    labels = dict(chain_id=str(_CHAIN_ID), method=method)
+    return (
+        _get_sample_value("rpc_requests_total", **labels),
+        _get_sample_value("rpc_response_size_bytes_sum", **labels),
+        _get_sample_value("rpc_errors_total", error="429", **labels),
+    )
+
+
+def _make_web3(url):
+    # The provider records the size of each response.
+    w3 = Web3(PooledHTTPProvider(url))
+    w3.middleware_onion.clear()
+    w3.middleware_onion.add(beamer.middleware.generate_instrumentation(_CHAIN_ID))
+    return w3
+
+
+def test_instrumentation(rpc_url):
+    w3 = _make_web3(rpc_url)
+    num_requests, response_size, num_errors = _get_samples("eth_blockNumber")
+
+    assert w3.eth.block_number == 16
+    _RequestHandler.status = 429
+    with pytest.raises(requests.exceptions.HTTPError):
+        w3.eth.block_number  # pylint: disable=pointless-statement
+
+    expected_size = len(b'{"jsonrpc": "2.0", "id": 0, "result": "0x10"}')
+    assert _get_samples("eth_blockNumber") == (
+        num_requests + 1,
+        pytest.approx(response_size + expected_size, abs=2),
+        num_errors + 1,
+    )
+
+
+def test_batch_instrumentation(rpc_url):
+    w3 = _make_web3(rpc_url)
+    w3.middleware_onion.add(
+        beamer.middleware.generate_rate_limiter(_CHAIN_ID, compute_units_per_second=100)
+    )
+    method = RPCEndpoint("eth_getBlockByNumber")
+    num_requests, _, _ = _get_samples(method)
+
+    # Each batch costs 5 * 16 compute units. The budget only allows for one
+    # of them at once, so the second batch waits until the budget recovers.
+    start = time.monotonic()
+    for _ in range(2):
+        responses = make_batch_request(w3, method, [[hex(number), False] for number in range(5)])
+        assert [response["result"] for response in responses] == ["0x10"] * 5
+    assert time.monotonic() - start >= 0.5
+
+    # Every call of the batches is recorded.
+    assert _get_samples(method)[0] == num_requests + 10
+
+
+def test_async_instrumentation(rpc_url):
+    async def run():
+        session = aiohttp.ClientSession(
+            raise_for_status=True,
+            trace_configs=[beamer.middleware.make_response_size_trace_config()],
+        )
+        provider = AsyncHTTPProvider(rpc_url)
+        await provider.cache_async_session(session)
+        w3 = AsyncWeb3(provider)
+        w3.middleware_onion.clear()
+        w3.middleware_onion.add(beamer.middleware.generate_async_instrumentation(_CHAIN_ID))
+        try:
+            assert await w3.eth.gas_price == 16
+            _RequestHandler.status = 429
+            with pytest.raises(aiohttp.ClientResponseError):
+                await w3.eth.gas_price
+        finally:
+            await session.close()
+
+    num_requests, response_size, num_errors = _get_samples("eth_gasPrice")
+    asyncio.run(run())
+    expected_size = len(b'{"jsonrpc": "2.0", "id": 0, "result": "0x10"}')
+    assert _get_samples("eth_gasPrice") == (
+        num_requests + 1,
+        pytest.approx(response_size + expected_size, abs=2),
+        num_errors + 1,
+    )
@@ -0,0 +1,73 @@
+import json
+import logging
+
+import pytest
+import structlog
+
+import beamer.util
+from beamer.util import is_debug_logging_enabled, setup_logging
+
+
+class _Model:
+    def __init__(self):
+        self.state = "pending"
+        self.num_reprs = 0
+
+    def __repr__(self):
+        self.num_reprs += 1
+        return f"Model<state={self.state}>"
+
+
+@pytest.fixture(autouse=True)
+def _restore_logging():
+    root = logging.getLogger()
+    handlers, level, log_threads = root.handlers, root.level, logging.logThreads
+    yield
+    beamer.util._stop_log_listener()  # pylint: disable=protected-access
+    root.handlers, logging.logThreads = handlers, log_threads
+    root.setLevel(level)
+    structlog.reset_defaults()
+
+
+def _flush_entries(capsys):
+    # Stopping the listener renders and writes out all queued entries.
+    assert beamer.util._stop_log_listener()  # pylint: disable=protected-access
+    return [json.loads(line) for line in capsys.readouterr().out.splitlines()]
+
+
+def test_threaded_logging_level(capsys):
+    setup_logging("INFO", log_json=True, threaded=True)
+    assert not is_debug_logging_enabled()
+    log = structlog.get_logger("test")
+    model = _Model()
+    log.debug("Hidden", model=model)
+    log.info("%s entry", "Formatted", value=1)
+
+    entries = _flush_entries(capsys)
+    assert len(entries) == 1
+    assert entries[0]["event"] == "Formatted entry"
+    assert entries[0]["value"] == 1
+    assert entries[0]["level"] == "info"
+    assert "timestamp" in entries[0]
+    # Entries below the log level are dropped before their values are used.
+    assert model.num_reprs == 0
+
+    setup_logging("DEBUG", log_json=True, threaded=True)
+    assert is_debug_logging_enabled()
+    structlog.get_logger("test").debug("Shown")
+    assert [entry["event"] for entry in _flush_entries(capsys)] == ["Shown"]
+
+
+def test_threaded_logging_snapshot(capsys):
+    setup_logging("INFO", log_json=True, threaded=True)
+    log = structlog.get_logger("test")
+    model = _Model()
+    log.info("Changed state", model=model, models=[model], info=dict(id=1))
+    model.state = "filled"
+
+    # The entry shows the state at the time of the call, not the state at
+    # the time it is rendered.
+    (entry,) = _flush_entries(capsys)
+    assert entry["model"] == "Model<state=pending>"
+    assert entry["models"] == ["Model<state=pending>"]
+    assert entry["info"] == dict(id=1)
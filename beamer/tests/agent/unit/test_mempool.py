@@ -0,0 +1,177 @@
+import http.server
+import json
+import threading
+from unittest.mock import MagicMock
+
+import pytest
+
+import beamer.agent.chain
+import beamer.agent.mempool
+from beamer.agent.mempool import MempoolWatcher
+from beamer.tests.agent.unit.util import (
+    ACCOUNT,
+    FILL_REQUEST_ABI,
+    SOURCE_CHAIN_ID,
+    TARGET_CHAIN_ID,
+    make_context,
+    make_request,
+)
+from beamer.tests.util import make_address
+from beamer.typing import URL, RequestId, TokenAmount
+from beamer.util import create_request_id, make_web3
+
+_FILL_MANAGER = make_address()
+_OTHER_LP = make_address()
+_TOKEN = make_address()
+_RECEIVER = make_address()
+
+
+def _make_transaction(sender, to, data, nonce=0):
+    return {
+        "blockHash": None,
+        "blockNumber": None,
+        "from": sender,
+        "gas": "0x20000",
+        "gasPrice": "0x8",
+        "hash": "0x%064x" % nonce,
+        "input": data,
+        "nonce": hex(nonce),
+        "to": to,
+        "transactionIndex": None,
+        "value": "0x0",
+        "type": "0x0",
+        "v": "0x0",
+        "r": "0x0",
+        "s": "0x0",
+    }
+
+
+class _RequestHandler(http.server.BaseHTTPRequestHandler):
+    pending: dict[str, dict] = {}
+    txpool_supported = True
+
+    def do_POST(self):  # pylint: disable=invalid-name
+        request = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        response = dict(jsonrpc="2.0", id=request["id"])
+        if request["method"] == "eth_chainId":
+            response["result"] = hex(TARGET_CHAIN_ID)
+        elif _RequestHandler.txpool_supported:
+            response["result"] = dict(pending=_RequestHandler.pending, queued={})
+        else:
+            response["error"] = dict(code=-32601, message="the method does not exist")
+        body = json.dumps(response).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):  # pylint: disable=arguments-differ
+        pass
+
+
+@pytest.fixture
+def watcher():
+    make_context()
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), _RequestHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    w3 = make_web3(URL(f"http://127.0.0.1:{server.server_address[1]}"))
+    fill_manager = w3.eth.contract(_FILL_MANAGER, abi=[FILL_REQUEST_ABI])
+    yield MempoolWatcher(w3, fill_manager, ACCOUNT.address, poll_period=0.1)
+    server.shutdown()
+    server.server_close()
+    _RequestHandler.pending = {}
+    _RequestHandler.txpool_supported = True
+
+
+def _encode_fill(watcher, nonce):
+    # pylint: disable=protected-access
+    return watcher._fill_manager.encodeABI(
+        fn_name="fillRequest", args=(SOURCE_CHAIN_ID, _TOKEN, _RECEIVER, 1, nonce)
+    )
+
+
+def _request_id(nonce):
+    return create_request_id(
+        SOURCE_CHAIN_ID, TARGET_CHAIN_ID, _TOKEN, _RECEIVER, TokenAmount(1), nonce
+    )
+
+
+def test_detect_competing_fills(watcher, monkeypatch):
+    _RequestHandler.pending = {
+        _OTHER_LP: {
+            "0": _make_transaction(_OTHER_LP, _FILL_MANAGER, _encode_fill(watcher, 1)),
+            # Calls to other contracts and other calls are ignored.
+            "1": _make_transaction(_OTHER_LP, make_address(), _encode_fill(watcher, 2), 1),
+            "2": _make_transaction(_OTHER_LP, _FILL_MANAGER, "0x12345678", 2),
+        },
+        # Our own fills are not competing.
+        ACCOUNT.address: {
+            "0": _make_transaction(ACCOUNT.address, _FILL_MANAGER, _encode_fill(watcher, 3)),
+        },
+    }
+    watcher.poll()
+    assert watcher.is_contested(_request_id(1))
+    for nonce in (2, 3):
+        assert not watcher.is_contested(_request_id(nonce))
+
+    # Once the fill is no longer pending, the request stays contested for a
+    # while, until the fill's RequestFilled event is processed.
+    _RequestHandler.pending = {}
+    watcher.poll()
+    assert watcher.is_contested(_request_id(1))
+    monkeypatch.setattr(beamer.agent.mempool, "_CONTESTED_TIME", 0)
+    watcher.poll()
+    assert not watcher.is_contested(_request_id(1))
+    assert not watcher.is_contested(RequestId(b"\x00" * 32))
+
+
+def test_txpool_unsupported(watcher):
+    # If the node does not support txpool_content, the watcher stops, but
+    # the agent keeps running.
+    _RequestHandler.txpool_supported = False
+    watcher.start()
+    # pylint: disable=protected-access
+    watcher._thread.join(1)
+    assert not watcher._thread.is_alive()
+    watcher.stop()
+
+
+def test_skip_contested_request(monkeypatch):
+    context, _ = make_context()
+    request = make_request()
+    context.mempool_watcher = MagicMock()
+    context.fill_mutexes[(TARGET_CHAIN_ID, request.target_token_address)] = threading.Lock()
+    fill_request_exclusive = MagicMock()
+    monkeypatch.setattr(beamer.agent.chain, "_fill_request_exclusive", fill_request_exclusive)
+
+    context.mempool_watcher.is_contested.return_value = True
+    beamer.agent.chain.fill_request(request, context)
+    fill_request_exclusive.assert_not_called()
+
+    context.mempool_watcher.is_contested.return_value = False
+    beamer.agent.chain.fill_request(request, context)
+    fill_request_exclusive.assert_called_once_with(request, context)
+
+
+def test_unexpected_error(watcher, monkeypatch):
+    # Unexpected errors, e.g. from a malformed txpool entry, are logged and
+    # the watcher keeps polling.
+    num_calls = 0
+    polled_again = threading.Event()
+
+    def content():
+        nonlocal num_calls
+        num_calls += 1
+        if num_calls == 2:
+            polled_again.set()
+        raise KeyError("pending")
+
+    # pylint: disable=protected-access
+    monkeypatch.setattr(watcher._web3.geth.txpool, "content", content)
+    monkeypatch.setattr(watcher, "_poll_period", 0.01)
+    watcher.start()
+    assert polled_again.wait(10)
+    assert watcher._thread.is_alive()
+    watcher.stop()
@@ -0,0 +1,97 @@
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import MagicMock
+
+import pytest
+from hexbytes import HexBytes
+from prometheus_client import REGISTRY
+
+from beamer.agent.chain import EventProcessor, _record_fill_latency
+from beamer.events import DepositWithdrawn
+from beamer.tests.agent.unit.util import (
+    REQUEST_ID,
+    SOURCE_CHAIN_ID,
+    TARGET_CHAIN_ID,
+    make_context,
+    make_request,
+)
+from beamer.tests.util import make_address
+from beamer.typing import BlockNumber
+
+_DIRECTION_LABELS = {
+    "source_chain_id": str(SOURCE_CHAIN_ID),
+    "target_chain_id": str(TARGET_CHAIN_ID),
+}
+
+
+def _get_sample_value(name, **labels):
+    return REGISTRY.get_sample_value(name, labels) or 0
+
+
+def test_event_processor_metrics():
+    context, _ = make_context()
+    processor = EventProcessor(context)
+    event = DepositWithdrawn(
+        event_chain_id=SOURCE_CHAIN_ID,
+        event_address=make_address(),
+        block_number=BlockNumber(40),
+        tx_hash=HexBytes(b"\x01"),
+        request_id=REQUEST_ID,
+        receiver=make_address(),
+    )
+
+    processor.add_events([event, event])
+    assert _get_sample_value("event_queue_depth", **_DIRECTION_LABELS) == 2
+
+    count = _get_sample_value("event_processing_duration_seconds_count", **_DIRECTION_LABELS)
+    processor._process_events()  # pylint: disable=protected-access
+    assert (
+        _get_sample_value("event_processing_duration_seconds_count", **_DIRECTION_LABELS) > count
+    )
+    num_events = len(processor._events)  # pylint: disable=protected-access
+    assert _get_sample_value("event_queue_depth", **_DIRECTION_LABELS) == num_events
+
+
+@pytest.mark.parametrize("header_known", (True, False))
+def test_fill_latency(header_known):
+    context, _ = make_context()
+    request = make_request()
+    request.created_block = BlockNumber(40)
+    block = {"number": 40, "hash": b"\x01" * 32, "parentHash": b"\x00" * 32, "timestamp": 1000}
+    context.request_manager.w3.eth.get_block.return_value = block
+    context.source_chain.header_store = MagicMock()
+    context.source_chain.header_store.get_timestamp.return_value = 1000 if header_known else None
+    context.task_pool = ThreadPoolExecutor(max_workers=1)
+
+    sent_sum = _get_sample_value("fill_latency_seconds_sum", stage="sent", **_DIRECTION_LABELS)
+    confirmed_sum = _get_sample_value(
+        "fill_latency_seconds_sum", stage="confirmed", **_DIRECTION_LABELS
+    )
+    _record_fill_latency(request, context, sent_time=1010, confirmed_time=1015)
+    context.task_pool.shutdown(wait=True)
+
+    # The block is only fetched, in the background, if the header store
+    # does not know it.
+    if header_known:
+        context.request_manager.w3.eth.get_block.assert_not_called()
+    else:
+        context.request_manager.w3.eth.get_block.assert_called_once_with(40)
+        context.source_chain.header_store.add.assert_called_once()
+    assert (
+        _get_sample_value("fill_latency_seconds_sum", stage="sent", **_DIRECTION_LABELS)
+        == sent_sum + 10
+    )
+    assert (
+        _get_sample_value("fill_latency_seconds_sum", stage="confirmed", **_DIRECTION_LABELS)
+        == confirmed_sum + 15
+    )
+
+
+def test_agent_info():
+    make_context()
+    (sample,) = (
+        sample
+        for metric in REGISTRY.collect()
+        if metric.name == "agent_info"
+        for sample in metric.samples
+    )
+    assert {"account", "source_rpc_url", "target_rpc_url"} <= sample.labels.keys()
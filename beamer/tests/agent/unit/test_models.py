@@ -0,0 +1,56 @@
+import pytest
+from hexbytes import HexBytes
+
+from beamer.agent.models.fsm import TransitionNotAllowed
+from beamer.tests.agent.unit.util import TIMESTAMP, make_claim_unchallenged, make_request
+from beamer.tests.constants import FILL_ID
+from beamer.tests.util import make_address
+
+
+def test_request_transitions():
+    request = make_request()
+    assert request.pending.is_active
+    assert request.current_state.id == "pending"
+
+    filler = make_address()
+    fill_tx = HexBytes(b"\x01" * 32)
+    request.fill(filler, fill_tx, FILL_ID, TIMESTAMP)
+    assert request.filled.is_active
+    assert not request.pending.is_active
+    assert (request.filler, request.fill_tx, request.fill_id) == (filler, fill_tx, FILL_ID)
+
+    # Not allowed transitions raise and leave the request untouched.
+    with pytest.raises(TransitionNotAllowed):
+        request.try_to_fill()
+    assert request.filled.is_active
+
+    request.try_to_claim()
+    request.l1_resolve(filler, FILL_ID)
+    assert request.l1_resolved.is_active
+    assert request.l1_resolution_fill_id == FILL_ID
+
+
+def test_claim_transitions():
+    request = make_request()
+    claim = make_claim_unchallenged(request, stay_in_started_state=True)
+    assert claim.started.is_active
+
+    tx_hash = HexBytes(b"\x02" * 32)
+    claim.start_challenge(tx_hash, TIMESTAMP)
+    assert claim.claimer_winning.is_active
+    assert claim.invalidation_tx == tx_hash
+
+    claim.withdraw()
+    assert claim.withdrawn.is_active
+    with pytest.raises(TransitionNotAllowed):
+        claim.challenge(claim.latest_claim_made)
+    assert claim.withdrawn.is_active
+
+
+def test_models_are_slotted():
+    request = make_request()
+    claim = make_claim_unchallenged(request)
+    for model in (request, claim):
+        assert not hasattr(model, "__dict__")
+        with pytest.raises(AttributeError):
+            model.unknown = 1  # type: ignore
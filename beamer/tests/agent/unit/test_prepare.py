@@ -0,0 +1,148 @@
+import http.server
+import json
+import threading
+import time
+from collections import Counter
+from unittest.mock import MagicMock
+
+import pytest
+
+from beamer.agent.prepare import FillPreparer
+from beamer.agent.util import Chain
+from beamer.tests.agent.unit.util import (
+    ACCOUNT,
+    FILL_REQUEST_ABI,
+    TARGET_CHAIN_ID,
+    make_context,
+    make_request,
+)
+from beamer.tests.util import make_address
+from beamer.typing import URL
+from beamer.util import make_web3
+
+
+class _RequestHandler(http.server.BaseHTTPRequestHandler):
+    requests: Counter = Counter()
+    raw_transactions: list[str] = []
+    nonce = 0
+
+    def do_POST(self):  # pylint: disable=invalid-name
+        request = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        method = request["method"]
+        _RequestHandler.requests[method] += 1
+        result = {
+            "eth_chainId": hex(TARGET_CHAIN_ID),
+            # Token balance and allowance.
+            "eth_call": "0x%064x" % 10**18,
+            "eth_estimateGas": "0x10000",
+            "eth_getTransactionCount": hex(_RequestHandler.nonce),
+            "eth_getBlockByNumber": {
+                "number": "0x10",
+                "hash": "0x" + "11" * 32,
+                "parentHash": "0x" + "22" * 32,
+                "timestamp": "0x10",
+                "baseFeePerGas": "0x7",
+                "transactions": [],
+            },
+            "eth_gasPrice": "0x8",
+            "eth_maxPriorityFeePerGas": "0x1",
+            "eth_sendRawTransaction": "0x" + "33" * 32,
+            "eth_getTransactionReceipt": {
+                "blockHash": "0x" + "11" * 32,
+                "blockNumber": "0x10",
+                "contractAddress": None,
+                "cumulativeGasUsed": "0x10000",
+                "effectiveGasPrice": "0x8",
+                "from": ACCOUNT.address,
+                "gasUsed": "0x10000",
+                "logs": [],
+                "logsBloom": "0x" + "00" * 256,
+                "status": "0x1",
+                "to": ACCOUNT.address,
+                "transactionHash": "0x" + "33" * 32,
+                "transactionIndex": "0x0",
+                "type": "0x2",
+            },
+        }[method]
+        if method == "eth_sendRawTransaction":
+            _RequestHandler.raw_transactions.append(request["params"][0])
+        body = json.dumps(dict(jsonrpc="2.0", id=request["id"], result=result)).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):  # pylint: disable=arguments-differ
+        pass
+
+
+@pytest.fixture
+def context():
+    context, _ = make_context()
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), _RequestHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    w3 = make_web3(URL(f"http://127.0.0.1:{server.server_address[1]}"), ACCOUNT)
+    context.target_chain = Chain(
+        w3,
+        TARGET_CHAIN_ID,
+        "target",
+        [],
+        fill_manager=w3.eth.contract(make_address(), abi=[FILL_REQUEST_ABI]),
+        request_manager=MagicMock(),
+    )
+    context.source_chain.request_manager.w3.eth.get_balance.return_value = 10**18
+    yield context
+    server.shutdown()
+    server.server_close()
+    _RequestHandler.requests = Counter()
+    _RequestHandler.raw_transactions = []
+    _RequestHandler.nonce = 0
+
+
+@pytest.mark.parametrize("nonce_used", [False, True])
+def test_send_prepared_fill(context, nonce_used):
+    preparer = FillPreparer(ACCOUNT)
+    request = make_request(valid_until=int(time.time()) + 3600)
+    preparer.prepare(request, context)
+    # pylint: disable=protected-access
+    prepared = preparer._prepared[request.id].result()
+    assert prepared is not None
+    assert _RequestHandler.requests["eth_estimateGas"] == 1
+
+    # Another transaction was sent after the preparation, so the prepared
+    # fill needs to be signed again with the next nonce.
+    if nonce_used:
+        _RequestHandler.nonce += 1
+
+    sent = []
+    receipt = preparer.send(request, context, lambda: sent.append(True))
+    assert receipt is not None and receipt["status"] == 1
+    assert sent == [True]
+    assert len(_RequestHandler.raw_transactions) == 1
+    raw_transaction = _RequestHandler.raw_transactions[0]
+    assert (raw_transaction == prepared.raw_transaction.hex()) != nonce_used
+    # Only the balance and allowance were checked again.
+    assert _RequestHandler.requests["eth_estimateGas"] == 1
+    assert _RequestHandler.requests["eth_call"] == 4
+
+    # A prepared fill is only sent once.
+    assert preparer.send(request, context, lambda: None) is None
+    preparer.shutdown()
+
+
+def test_discard_prepared_fill(context):
+    preparer = FillPreparer(ACCOUNT)
+    request = make_request(valid_until=int(time.time()) + 3600)
+    preparer.prepare(request, context)
+    preparer.discard(request.id)
+    assert preparer.send(request, context, lambda: None) is None
+
+    # Requests that are unsafe to fill are not prepared.
+    request = make_request(valid_until=int(time.time()))
+    preparer.prepare(request, context)
+    # pylint: disable=protected-access
+    assert request.id not in preparer._prepared
+    preparer.shutdown()
+    assert not _RequestHandler.raw_transactions
@@ -0,0 +1,82 @@
+import pytest
+
+import beamer.agent.config
+from beamer.agent.agent import get_transfer_directions
+from beamer.agent.config import ConfigError, ShardConfig
+from beamer.provider import DEFAULT_POOL_SIZE
+from beamer.tests.agent.unit.test_shard import _write_config
+from beamer.typing import ChainId, TransferDirection
+
+
+def test_execution_mode_config(tmp_path):
+    path, _ = _write_config(tmp_path, "")
+    config = beamer.agent.config.load(path, {})
+    assert config.execution_mode == "threads"
+
+    config = beamer.agent.config.load(path, {"execution-mode": "processes"})
+    assert config.execution_mode == "processes"
+
+    with pytest.raises(ConfigError):
+        beamer.agent.config.load(path, {"execution-mode": "fibers"})
+
+
+def test_compute_units_config(tmp_path):
+    path, _ = _write_config(tmp_path, "")
+    options = {
+        "compute-units-per-second": 500,
+        "compute-units.eth_getLogs": 100,
+        "chains.foo.compute-units-per-second": 300,
+        "chains.foo.compute-units.eth_call": 50,
+    }
+    config = beamer.agent.config.load(path, options)
+    assert config.chains["foo"].compute_units_per_second == 300
+    assert config.chains["foo"].compute_units == {"eth_getLogs": 100, "eth_call": 50}
+    assert config.chains["bar"].compute_units_per_second == 500
+    assert config.chains["bar"].compute_units == {"eth_getLogs": 100}
+
+    with pytest.raises(ConfigError):
+        beamer.agent.config.load(path, {"compute-units-per-second": 0})
+    with pytest.raises(ConfigError):
+        beamer.agent.config.load(path, {"compute-units.eth_call": -1})
+
+
+def test_get_transfer_directions():
+    chain_ids_by_name = {"foo": ChainId(1), "bar": ChainId(2), "baz": ChainId(3)}
+    directions = get_transfer_directions(chain_ids_by_name, None)
+    assert len(directions) == 6
+
+    shard = ShardConfig(directions=[("foo", "bar"), ("baz", "foo")], tokens=None, lock_dir=None)
+    directions = get_transfer_directions(chain_ids_by_name, shard)
+    assert directions == {
+        TransferDirection(ChainId(1), ChainId(2)),
+        TransferDirection(ChainId(3), ChainId(1)),
+    }
+
+    # A single chain transfers to itself.
+    directions = get_transfer_directions({"foo": ChainId(1)}, None)
+    assert directions == {TransferDirection(ChainId(1), ChainId(1))}
+
+
+def test_fallback_rpc_urls_config(tmp_path):
+    path, _ = _write_config(tmp_path, "")
+    options = {"chains.foo.fallback-rpc-urls": ["http://foo2"], "hedged-requests": True}
+    config = beamer.agent.config.load(path, options)
+    assert config.chains["foo"].fallback_rpc_urls == ["http://foo2"]
+    assert config.chains["foo"].hedged_requests
+    assert config.chains["bar"].fallback_rpc_urls == []
+
+    with pytest.raises(ConfigError):
+        beamer.agent.config.load(path, {"chains.foo.fallback-rpc-urls": "http://foo2"})
+
+
+def test_pool_config(tmp_path):
+    path, _ = _write_config(tmp_path, "")
+    options = {"chains.foo.pool-size": 50, "keep-alive": False}
+    config = beamer.agent.config.load(path, options)
+    assert config.chains["foo"].pool_size == 50
+    assert config.chains["bar"].pool_size == DEFAULT_POOL_SIZE
+    assert not config.chains["foo"].keep_alive
+    assert not config.chains["bar"].keep_alive
+
+    with pytest.raises(ConfigError):
+        beamer.agent.config.load(path, {"pool-size": 0})
@@ -0,0 +1,198 @@
+import asyncio
+import http.server
+import json
+import socket
+import threading
+import time
+
+import aiohttp
+import pytest
+import requests
+from prometheus_client import REGISTRY
+from web3 import AsyncWeb3, Web3
+from web3.types import RPCEndpoint
+
+import beamer.provider
+from beamer.middleware import RequestPriority, request_priority
+from beamer.provider import (
+    AsyncFailoverHTTPProvider,
+    FailoverHTTPProvider,
+    async_make_batch_request,
+    make_batch_request,
+)
+from beamer.typing import URL, ChainId
+
+_CHAIN_ID = ChainId(4321)
+
+
+class _RequestHandler(http.server.BaseHTTPRequestHandler):
+    server: "_Server"
+
+    def do_POST(self):  # pylint: disable=invalid-name
+        request = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        self.server.num_requests += 1
+        time.sleep(self.server.latency)
+        if isinstance(request, list):
+            # Answer batches in reverse order.
+            body = json.dumps(
+                [
+                    dict(jsonrpc="2.0", id=entry["id"], result=entry["params"][0])
+                    for entry in reversed(request)
+                ]
+            )
+        else:
+            body = json.dumps(dict(jsonrpc="2.0", id=request["id"], result=self.server.result))
+        self.send_response(self.server.status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body.encode())
+
+    def log_message(self, *args):  # pylint: disable=arguments-differ
+        pass
+
+
+class _Server(http.server.ThreadingHTTPServer):
+    def __init__(self, result):
+        super().__init__(("127.0.0.1", 0), _RequestHandler)
+        self.result = result
+        self.status = 200
+        self.latency = 0.0
+        self.num_requests = 0
+
+    def url(self):
+        return URL(f"http://127.0.0.1:{self.server_address[1]}")
+
+
+@pytest.fixture
+def servers():
+    servers = [_Server("0x1"), _Server("0x2")]
+    for server in servers:
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield servers
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+def _get_unused_url():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return URL(f"http://127.0.0.1:{sock.getsockname()[1]}")
+
+
+def _make_provider(urls, **kwargs):
+    provider = FailoverHTTPProvider(urls, request_kwargs=dict(timeout=1), **kwargs)
+    provider.init_metrics(_CHAIN_ID)
+    return provider
+
+
+def _get_sample_value(name, **labels):
+    return REGISTRY.get_sample_value(name, dict(chain_id=str(_CHAIN_ID), **labels)) or 0
+
+
+def _get_result(provider, method="eth_blockNumber"):
+    return provider.make_request(method, [])["result"]
+
+
+def test_failover(servers, monkeypatch):
+    monkeypatch.setattr(beamer.provider, "_CIRCUIT_OPEN_TIME", 0.5)
+    primary, fallback = servers
+    provider = _make_provider([primary.url(), fallback.url()])
+    num_failovers = _get_sample_value("rpc_failovers_total", endpoint="0")
+
+    assert _get_result(provider) == "0x1"
+    primary.status = 503
+    for _ in range(beamer.provider._CIRCUIT_FAILURE_THRESHOLD):
+        assert _get_result(provider) == "0x2"
+    assert primary.num_requests == 1 + beamer.provider._CIRCUIT_FAILURE_THRESHOLD
+    assert _get_sample_value("rpc_endpoint_circuit_open", endpoint="0") == 1
+    assert _get_sample_value("rpc_endpoint_health", endpoint="0") < 1
+    assert (
+        _get_sample_value("rpc_failovers_total", endpoint="0")
+        == num_failovers + beamer.provider._CIRCUIT_FAILURE_THRESHOLD
+    )
+
+    # The circuit is open, so the primary endpoint is skipped.
+    assert _get_result(provider) == "0x2"
+    assert primary.num_requests == 1 + beamer.provider._CIRCUIT_FAILURE_THRESHOLD
+
+    # Once the primary endpoint works again, a trial request closes the circuit.
+    primary.status = 200
+    time.sleep(0.5)
+    assert _get_result(provider) == "0x1"
+    assert _get_sample_value("rpc_endpoint_circuit_open", endpoint="0") == 0
+
+
+def test_failover_connection_error(servers):
+    provider = _make_provider([_get_unused_url(), servers[1].url()])
+    assert _get_result(provider) == "0x2"
+
+    # If all endpoints fail, the error is passed on to the caller.
+    servers[1].status = 503
+    with pytest.raises(requests.exceptions.HTTPError):
+        _get_result(provider)
+
+
+def test_no_failover_on_request_errors(servers):
+    # Other endpoints would most likely reject the request as well.
+    servers[0].status = 413
+    provider = _make_provider([servers[0].url(), servers[1].url()])
+    with pytest.raises(requests.exceptions.HTTPError):
+        _get_result(provider)
+    assert servers[1].num_requests == 0
+
+
+def test_hedged_requests(servers, monkeypatch):
+    monkeypatch.setattr(beamer.provider, "_HEDGE_DEFAULT_DELAY", 0.05)
+    primary, fallback = servers
+    primary.latency = 0.5
+    provider = _make_provider([primary.url(), fallback.url()], hedged_requests=True)
+    num_hedged = _get_sample_value("rpc_hedged_requests_total", winner="hedge")
+
+    # Only reads on the fill path are hedged.
+    assert _get_result(provider, "eth_call") == "0x1"
+    with request_priority(RequestPriority.FILL):
+        start = time.monotonic()
+        assert _get_result(provider, "eth_call") == "0x2"
+        assert time.monotonic() - start < 0.4
+        assert _get_result(provider, "eth_sendRawTransaction") == "0x1"
+
+    assert fallback.num_requests == 1
+    assert _get_sample_value("rpc_hedged_requests_total", winner="hedge") == num_hedged + 1
+
+
+def test_batch_request(servers):
+    provider = _make_provider([_get_unused_url(), servers[0].url()])
+    method = RPCEndpoint("eth_getBlockByNumber")
+    responses = make_batch_request(Web3(provider), method, [["0x1"], ["0x2"], ["0x3"]])
+    assert [response["result"] for response in responses] == ["0x1", "0x2", "0x3"]
+    assert servers[0].num_requests == 1
+
+
+def test_async_failover(servers):
+    urls = [_get_unused_url(), servers[0].url()]
+    provider = AsyncFailoverHTTPProvider(urls, request_kwargs=dict(timeout=1))
+    provider.init_metrics(_CHAIN_ID)
+    failovers = _get_sample_value("rpc_failovers_total", endpoint="0")
+    method = RPCEndpoint("eth_getBlockByNumber")
+
+    async def run():
+        sessions = []
+        for endpoint_provider in provider.endpoint_providers:
+            sessions.append(aiohttp.ClientSession(raise_for_status=True))
+            await endpoint_provider.cache_async_session(sessions[-1])
+        try:
+            response = await provider.make_request(RPCEndpoint("eth_blockNumber"), [])
+            w3 = AsyncWeb3(provider)
+            responses = await async_make_batch_request(w3, method, [["0x1"], ["0x2"]])
+        finally:
+            for session in sessions:
+                await session.close()
+        return response, responses
+
+    response, responses = asyncio.run(run())
+    assert response["result"] == "0x1"
+    assert [response["result"] for response in responses] == ["0x1", "0x2"]
+    assert servers[0].num_requests == 2
+    assert _get_sample_value("rpc_failovers_total", endpoint="0") == failovers + 2
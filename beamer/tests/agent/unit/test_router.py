@@ -0,0 +1,149 @@
+from hexbytes import HexBytes
+
+from beamer.agent.router import EventRouter
+from beamer.events import (
+    ClaimMade,
+    FillInvalidated,
+    LatestBlock,
+    LatestBlockUpdatedEvent,
+    LpAdded,
+    RequestCreated,
+    RequestFilled,
+)
+from beamer.tests.agent.unit.util import (
+    ACCOUNT,
+    BLOCK_NUMBER,
+    CLAIM_ID,
+    CLAIMER_STAKE,
+    TERMINATION,
+    TIMESTAMP,
+    ZERO_STAKE,
+)
+from beamer.tests.util import make_address
+from beamer.typing import ChainId, FillId, Nonce, RequestId, TokenAmount, TransferDirection
+
+_A, _B, _C = ChainId(1), ChainId(2), ChainId(3)
+_DIRECTIONS = {
+    TransferDirection(_A, _B),
+    TransferDirection(_A, _C),
+    TransferDirection(_B, _A),
+    TransferDirection(_C, _A),
+}
+_ADDRESS = make_address()
+_TX_HASH = HexBytes(b"\x01" * 32)
+_FILL_ID = FillId(b"\x02" * 32)
+
+
+def _make_request_created(request_id, source_chain_id, target_chain_id):
+    return RequestCreated(
+        event_chain_id=source_chain_id,
+        event_address=_ADDRESS,
+        block_number=BLOCK_NUMBER,
+        tx_hash=_TX_HASH,
+        request_id=request_id,
+        target_chain_id=target_chain_id,
+        source_token_address=_ADDRESS,
+        target_token_address=_ADDRESS,
+        source_address=_ADDRESS,
+        target_address=_ADDRESS,
+        amount=TokenAmount(1),
+        nonce=Nonce(1),
+        valid_until=TERMINATION,
+        lp_fee=TokenAmount(0),
+        protocol_fee=TokenAmount(0),
+    )
+
+
+def _make_claim_made(request_id, chain_id):
+    return ClaimMade(
+        event_chain_id=chain_id,
+        event_address=_ADDRESS,
+        block_number=BLOCK_NUMBER,
+        tx_hash=_TX_HASH,
+        claim_id=CLAIM_ID,
+        request_id=request_id,
+        fill_id=_FILL_ID,
+        claimer=ACCOUNT.address,
+        claimer_stake=CLAIMER_STAKE,
+        last_challenger=_ADDRESS,
+        challenger_stake_total=ZERO_STAKE,
+        termination=TERMINATION,
+    )
+
+
+def _make_fill_invalidated(request_id, chain_id):
+    return FillInvalidated(
+        event_chain_id=chain_id,
+        event_address=_ADDRESS,
+        block_number=BLOCK_NUMBER,
+        tx_hash=_TX_HASH,
+        request_id=request_id,
+        fill_id=_FILL_ID,
+    )
+
+
+def _receivers(routed, event):
+    return {direction for direction, events in routed.items() if event in events}
+
+
+def test_route_events():
+    router = EventRouter()
+    request_id = RequestId(b"\x03" * 32)
+    unknown_request_id = RequestId(b"\x04" * 32)
+    created = _make_request_created(request_id, _A, _C)
+    filled = RequestFilled(
+        event_chain_id=_A,
+        event_address=_ADDRESS,
+        block_number=BLOCK_NUMBER,
+        tx_hash=_TX_HASH,
+        request_id=request_id,
+        fill_id=_FILL_ID,
+        source_chain_id=_B,
+        target_token_address=_ADDRESS,
+        filler=ACCOUNT.address,
+        amount=TokenAmount(1),
+    )
+    claim_made = _make_claim_made(request_id, _A)
+    unknown_claim_made = _make_claim_made(unknown_request_id, _A)
+    lp_added = LpAdded(
+        event_chain_id=_A,
+        event_address=_ADDRESS,
+        block_number=BLOCK_NUMBER,
+        tx_hash=_TX_HASH,
+        lp=ACCOUNT.address,
+    )
+    block = LatestBlock(number=BLOCK_NUMBER, hash=_TX_HASH, timestamp=TIMESTAMP)
+    latest_block_updated = LatestBlockUpdatedEvent(_A, block)
+    events = [created, filled, claim_made, unknown_claim_made, lp_added, latest_block_updated]
+    routed = router.route(events, _DIRECTIONS)
+
+    assert _receivers(routed, created) == {TransferDirection(_A, _C)}
+    assert _receivers(routed, filled) == {TransferDirection(_B, _A)}
+    assert _receivers(routed, claim_made) == {TransferDirection(_A, _C)}
+    # Events of unknown requests go to all directions from the event's chain.
+    assert _receivers(routed, unknown_claim_made) == {
+        TransferDirection(_A, _B),
+        TransferDirection(_A, _C),
+    }
+    assert _receivers(routed, lp_added) == _DIRECTIONS
+    assert _receivers(routed, latest_block_updated) == _DIRECTIONS
+    # The order of events is kept.
+    assert routed[TransferDirection(_A, _C)] == [
+        created,
+        claim_made,
+        unknown_claim_made,
+        lp_added,
+        latest_block_updated,
+    ]
+
+    # The request index is shared by all chains, so a fill invalidation on
+    # the target chain only goes to the request's direction.
+    fill_invalidated = _make_fill_invalidated(request_id, _C)
+    routed = router.route([fill_invalidated], _DIRECTIONS)
+    assert _receivers(routed, fill_invalidated) == {TransferDirection(_A, _C)}
+    fill_invalidated = _make_fill_invalidated(unknown_request_id, _A)
+    routed = router.route([fill_invalidated], _DIRECTIONS)
+    assert _receivers(routed, fill_invalidated) == {
+        TransferDirection(_B, _A),
+        TransferDirection(_C, _A),
+    }
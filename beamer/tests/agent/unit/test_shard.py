@@ -0,0 +1,113 @@
+import json
+import multiprocessing
+import time
+
+import pytest
+from eth_account import Account
+
+import beamer.agent.config
+from beamer.agent.config import ConfigError
+from beamer.agent.util import FileLock
+from beamer.tests.util import make_address
+from beamer.typing import ChainId
+
+_CONFIG_FILE = """
+artifacts-dir = "artifacts"
+abi-dir = "abis"
+
+[account]
+path = "{keyfile}"
+password = "test"
+
+[base-chain]
+rpc-url = "http://base"
+
+[chains.foo]
+rpc-url = "http://foo"
+
+[chains.bar]
+rpc-url = "http://bar"
+
+[tokens]
+TST = [["1", "{tst1}"], ["2", "{tst2}"]]
+USDC = [["1", "{usdc1}"], ["2", "{usdc2}"]]
+
+[shard]
+{shard}
+"""
+
+
+def _write_config(tmp_path, shard):
+    keyfile = tmp_path / "key.json"
+    keyfile.write_text(json.dumps(Account.encrypt(Account.create().key, "test")))
+    tst1, tst2, usdc1, usdc2 = (make_address() for _ in range(4))
+    path = tmp_path / "agent.conf"
+    path.write_text(
+        _CONFIG_FILE.format(
+            keyfile=keyfile, tst1=tst1, tst2=tst2, usdc1=usdc1, usdc2=usdc2, shard=shard
+        )
+    )
+    return path, (tst1, tst2, usdc1, usdc2)
+
+
+def test_shard_config(tmp_path):
+    shard = """
+directions = ["foo -> bar"]
+tokens = ["USDC"]
+lock-dir = "locks"
+"""
+    path, (tst1, tst2, usdc1, usdc2) = _write_config(tmp_path, shard)
+    config = beamer.agent.config.load(path, {})
+
+    assert config.shard is not None
+    assert config.shard.directions == [("foo", "bar")]
+    assert config.shard.tokens == ["USDC"]
+    assert str(config.shard.lock_dir) == "locks"
+
+    # Only tokens owned by the shard are considered valid.
+    checker = config.token_checker
+    assert checker.is_valid_pair(ChainId(1), usdc1, ChainId(2), usdc2)
+    assert not checker.is_valid_pair(ChainId(1), tst1, ChainId(2), tst2)
+
+
+@pytest.mark.parametrize(
+    "shard",
+    ['directions = ["foo -> baz"]', 'directions = ["foo, bar"]', 'tokens = ["DAI"]'],
+)
+def test_shard_config_invalid(tmp_path, shard):
+    path, _ = _write_config(tmp_path, shard)
+    with pytest.raises(ConfigError):
+        beamer.agent.config.load(path, {})
+
+
+def _hold_lock(path, locked, release):
+    with FileLock(path):
+        locked.set()
+        release.wait(10)
+
+
+def test_file_lock_across_processes(tmp_path):
+    path = tmp_path / "fill.lock"
+    ctx = multiprocessing.get_context("fork")
+    locked = ctx.Event()
+    release = ctx.Event()
+    process = ctx.Process(target=_hold_lock, args=(path, locked, release))
+    process.start()
+    try:
+        assert locked.wait(10)
+        lock = FileLock(path)
+
+        def release_later():
+            time.sleep(0.5)
+            release.set()
+
+        releaser = ctx.Process(target=release_later)
+        releaser.start()
+        start = time.monotonic()
+        with lock:
+            waited = time.monotonic() - start
+        releaser.join(10)
+        assert waited >= 0.4
+    finally:
+        release.set()
+        process.join(10)
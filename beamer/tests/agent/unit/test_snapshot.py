@@ -0,0 +1,139 @@
+import json
+
+from hexbytes import HexBytes
+from web3.types import Timestamp
+
+import beamer.agent.snapshot
+from beamer.agent.chain import EventProcessor
+from beamer.events import DepositWithdrawn
+from beamer.tests.agent.unit.util import (
+    SOURCE_CHAIN_ID,
+    TARGET_CHAIN_ID,
+    TIMESTAMP,
+    make_claim_challenged,
+    make_context,
+    make_request,
+)
+from beamer.tests.constants import FILL_ID
+from beamer.tests.util import make_address
+from beamer.typing import BlockNumber, TransferDirection
+
+
+def test_snapshot_roundtrip(tmp_path):
+    context, config = make_context()
+    context.finality_periods[SOURCE_CHAIN_ID] = 42
+
+    request = make_request()
+    request.fill(config.account.address, HexBytes(b"\x02"), FILL_ID, TIMESTAMP)
+    request.invalid_fill_ids[FILL_ID] = HexBytes(b"\x03"), 123
+    context.requests.add(request.id, request)
+
+    claim = make_claim_challenged(request, claimer=config.account.address)
+    claim.proved_tx = HexBytes(b"\x04")
+    context.claims.add(claim.id, claim)
+
+    pending = DepositWithdrawn(
+        event_chain_id=SOURCE_CHAIN_ID,
+        event_address=make_address(),
+        block_number=BlockNumber(40),
+        tx_hash=HexBytes(b"\x05"),
+        request_id=request.id,
+        receiver=make_address(),
+    )
+    # This event is newer than the latest known block of the source chain
+    # and will be fetched again, so it must not be part of the snapshot.
+    too_new = DepositWithdrawn(
+        event_chain_id=SOURCE_CHAIN_ID,
+        event_address=make_address(),
+        block_number=BlockNumber(100),
+        tx_hash=HexBytes(b"\x06"),
+        request_id=request.id,
+        receiver=make_address(),
+    )
+
+    snapshot = beamer.agent.snapshot.take(context, [pending, too_new])
+    assert snapshot is not None
+    path = beamer.agent.snapshot.snapshot_path(
+        tmp_path, TransferDirection(SOURCE_CHAIN_ID, TARGET_CHAIN_ID)
+    )
+    beamer.agent.snapshot.write(path, snapshot)
+
+    loaded = beamer.agent.snapshot.load(path)
+    assert loaded is not None
+    assert loaded.synced_blocks == {SOURCE_CHAIN_ID: 42, TARGET_CHAIN_ID: 43}
+
+    new_context, _ = make_context()
+    new_context.latest_blocks.clear()
+    events = beamer.agent.snapshot.restore(new_context, loaded)
+    assert events == [pending]
+    assert new_context.finality_periods[SOURCE_CHAIN_ID] == 42
+    assert new_context.latest_blocks[SOURCE_CHAIN_ID].timestamp == TIMESTAMP
+
+    restored_request = new_context.requests.get(request.id)
+    assert restored_request is not None
+    assert restored_request.filled.is_active
+    assert restored_request.filler == request.filler
+    assert restored_request.fill_id == request.fill_id
+    assert restored_request.fill_timestamp == Timestamp(TIMESTAMP)
+    assert restored_request.invalid_fill_ids == request.invalid_fill_ids
+
+    restored_claim = new_context.claims.get(claim.id)
+    assert restored_claim is not None
+    assert restored_claim.current_state.id == claim.current_state.id
+    assert restored_claim.latest_claim_made == claim.latest_claim_made
+    assert restored_claim.challenger_stakes == claim.challenger_stakes
+    assert restored_claim.proved_tx == claim.proved_tx
+
+    # Transitions keep working on restored state machines.
+    restored_request.try_to_claim()
+    assert restored_request.claimed.is_active
+
+
+def test_snapshot_version_mismatch(tmp_path):
+    context, _ = make_context()
+    snapshot = beamer.agent.snapshot.take(context, [])
+    assert snapshot is not None
+
+    path = tmp_path / "snapshot.json"
+    beamer.agent.snapshot.write(path, snapshot)
+    data = json.loads(path.read_text())
+    data["version"] = beamer.agent.snapshot.SNAPSHOT_VERSION + 1
+    path.write_text(json.dumps(data))
+
+    assert beamer.agent.snapshot.load(path) is None
+
+
+def test_event_processor_skips_restored_events(tmp_path):
+    context, _ = make_context()
+    request = make_request()
+    context.requests.add(request.id, request)
+
+    path = tmp_path / "snapshot.json"
+    snapshot = beamer.agent.snapshot.take(context, [])
+    assert snapshot is not None
+    beamer.agent.snapshot.write(path, snapshot)
+
+    new_context, _ = make_context()
+    processor = EventProcessor(new_context, path)
+    assert new_context.requests.get(request.id) is not None
+    assert processor.get_resume_block(SOURCE_CHAIN_ID) == 43
+    assert processor.get_resume_block(TARGET_CHAIN_ID) == 44
+
+    old = DepositWithdrawn(
+        event_chain_id=SOURCE_CHAIN_ID,
+        event_address=make_address(),
+        block_number=BlockNumber(42),
+        tx_hash=HexBytes(b"\x05"),
+        request_id=request.id,
+        receiver=make_address(),
+    )
+    new = DepositWithdrawn(
+        event_chain_id=SOURCE_CHAIN_ID,
+        event_address=make_address(),
+        block_number=BlockNumber(43),
+        tx_hash=HexBytes(b"\x06"),
+        request_id=request.id,
+        receiver=make_address(),
+    )
+    processor.add_events([old, new])
+    assert processor._events == [new]  # pylint:disable=protected-access
@@ -0,0 +1,171 @@
+import http.server
+import json
+import threading
+from collections import Counter
+
+import pytest
+
+import beamer.util
+from beamer.tests.agent.unit.util import ACCOUNT, TARGET_CHAIN_ID, make_context
+from beamer.tests.util import make_address
+from beamer.typing import URL
+from beamer.util import make_web3, transact
+
+_WITHDRAW_ABI = dict(
+    type="function",
+    name="withdraw",
+    stateMutability="nonpayable",
+    inputs=[dict(name="claimId", type="uint96")],
+    outputs=[],
+)
+
+
+def _tx_hash(index):
+    return "0x%064x" % index
+
+
+class _RequestHandler(http.server.BaseHTTPRequestHandler):
+    requests: Counter = Counter()
+    # The number of receipt requests per transaction hash.
+    receipt_requests: Counter = Counter()
+    # The gas used by the sent transactions, and whether they succeeded.
+    receipts = [(0x10000, True)]
+    # The number of transactions sent before the last one sent is mined.
+    num_pending = 0
+
+    def do_POST(self):  # pylint: disable=invalid-name
+        request = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        method = request["method"]
+        _RequestHandler.requests[method] += 1
+        num_sent = _RequestHandler.requests["eth_sendRawTransaction"]
+        gas_used, success = _RequestHandler.receipts[min(num_sent, len(self.receipts)) - 1]
+        result = {
+            "eth_chainId": hex(TARGET_CHAIN_ID),
+            "eth_estimateGas": "0x20000",
+            "eth_gasPrice": "0x8",
+            "eth_getTransactionCount": "0x0",
+            "eth_sendRawTransaction": _tx_hash(num_sent),
+            "eth_getTransactionByHash": {
+                "blockHash": None,
+                "blockNumber": None,
+                "from": ACCOUNT.address,
+                "gas": "0x20000",
+                "gasPrice": "0x8",
+                "hash": _tx_hash(1),
+                "input": "0x",
+                "nonce": "0x0",
+                "to": ACCOUNT.address,
+                "transactionIndex": None,
+                "value": "0x0",
+                "type": "0x0",
+                "v": "0x0",
+                "r": "0x0",
+                "s": "0x0",
+            },
+            "eth_getTransactionReceipt": {
+                "blockHash": "0x" + "11" * 32,
+                "blockNumber": "0x10",
+                "contractAddress": None,
+                "cumulativeGasUsed": hex(gas_used),
+                "effectiveGasPrice": "0x8",
+                "from": ACCOUNT.address,
+                "gasUsed": hex(gas_used),
+                "logs": [],
+                "logsBloom": "0x" + "00" * 256,
+                "status": "0x1" if success else "0x0",
+                "to": ACCOUNT.address,
+                "transactionHash": _tx_hash(num_sent),
+                "transactionIndex": "0x0",
+                "type": "0x0",
+            },
+        }[method]
+        # Only the last transaction sent gets mined, after the pending ones.
+        mined = num_sent > _RequestHandler.num_pending
+        if method == "eth_getTransactionCount" and mined:
+            result = "0x1"
+        if method == "eth_getTransactionReceipt":
+            _RequestHandler.receipt_requests[request["params"][0]] += 1
+            if not mined or request["params"][0] != _tx_hash(num_sent):
+                result = None
+        body = json.dumps(dict(jsonrpc="2.0", id=request["id"], result=result)).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):  # pylint: disable=arguments-differ
+        pass
+
+
+@pytest.fixture
+def contract():
+    make_context()
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), _RequestHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    w3 = make_web3(URL(f"http://127.0.0.1:{server.server_address[1]}"), ACCOUNT)
+    yield w3.eth.contract(make_address(), abi=[_WITHDRAW_ABI])
+    server.shutdown()
+    server.server_close()
+    _RequestHandler.requests = Counter()
+    _RequestHandler.receipt_requests = Counter()
+    _RequestHandler.receipts = [(0x10000, True)]
+    _RequestHandler.num_pending = 0
+
+
+def test_gas_limits(contract):
+    token = make_address()
+    # Without a gas key, the gas limit is always estimated.
+    transact(contract.functions.withdraw(1))
+    assert _RequestHandler.requests["eth_estimateGas"] == 1
+
+    transact(contract.functions.withdraw(1), gas_key=token)
+    assert _RequestHandler.requests["eth_estimateGas"] == 2
+    # pylint: disable=protected-access
+    key = TARGET_CHAIN_ID, contract.address, "withdraw", token
+    assert beamer.util._GAS_LIMITS.get(key) == int(0x10000 * 1.25)
+
+    # Once the gas used is known, the gas limit is not estimated.
+    transact(contract.functions.withdraw(1), gas_key=token)
+    assert _RequestHandler.requests["eth_estimateGas"] == 2
+    assert _RequestHandler.requests["eth_sendRawTransaction"] == 3
+
+    # If the transaction runs out of gas, it is sent again with an estimated
+    # gas limit.
+    _RequestHandler.receipts = [(0x10000, True)] * 3 + [(0x14000, False), (0x18000, True)]
+    transact(contract.functions.withdraw(1), gas_key=token)
+    assert _RequestHandler.requests["eth_estimateGas"] == 3
+    assert _RequestHandler.requests["eth_sendRawTransaction"] == 5
+    assert beamer.util._GAS_LIMITS.get(key) == int(0x18000 * 1.25)
+
+    # Other failures are not retried.
+    _RequestHandler.receipts.append((0x100, False))
+    with pytest.raises(beamer.util.TransactionFailed):
+        transact(contract.functions.withdraw(1), gas_key=token)
+    assert _RequestHandler.requests["eth_sendRawTransaction"] == 6
+    beamer.util._GAS_LIMITS.remove(key)
+
+
+def test_replace_pending_transaction(contract, monkeypatch):
+    monkeypatch.setattr(beamer.util, "_MIN_REPLACEMENT_INTERVAL", 0)
+    # The transaction and its first replacement stay pending, the second
+    # replacement gets mined.
+    _RequestHandler.num_pending = 2
+    receipt = transact(contract.functions.withdraw(1), poll_latency=0.01, replace_after=0.05)
+    assert receipt["transactionHash"].hex() == _tx_hash(3)
+    assert _RequestHandler.requests["eth_sendRawTransaction"] == 3
+    assert _RequestHandler.requests["eth_getTransactionByHash"] == 1
+    assert _RequestHandler.requests["eth_estimateGas"] == 1
+    # While the replacements are pending, only the nonce is polled. Once it
+    # moved on, the receipts are requested newest first.
+    assert _RequestHandler.receipt_requests[_tx_hash(2)] == 0
+
+
+def test_make_replacement():
+    # pylint: disable=protected-access
+    transaction = dict(nonce=1, gas=21_000, maxFeePerGas=100, maxPriorityFeePerGas=10)
+    replacement = beamer.util._make_replacement(transaction)  # type: ignore
+    assert replacement == dict(nonce=1, gas=21_000, maxFeePerGas=126, maxPriorityFeePerGas=13)
+    replacement = beamer.util._make_replacement(dict(nonce=1, gasPrice=8))  # type: ignore
+    assert replacement == dict(nonce=1, gasPrice=11)
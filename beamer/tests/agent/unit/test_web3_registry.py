@@ -0,0 +1,104 @@
+import http.server
+import json
+import threading
+
+import pytest
+from web3 import HTTPProvider, Web3
+
+import beamer.util
+from beamer.artifacts import ChainDeployment, DeployedContractInfo, Deployment
+from beamer.contracts import ABIManager, obtain_contract
+from beamer.provider import PooledHTTPProvider
+from beamer.tests.util import make_address
+from beamer.typing import URL, BlockNumber, ChainId
+
+_CHAIN_ID = ChainId(1337)
+
+
+class _RequestHandler(http.server.BaseHTTPRequestHandler):
+    # Keep connections alive.
+    protocol_version = "HTTP/1.1"
+    num_connections = 0
+    num_chain_id_requests = 0
+
+    def setup(self):
+        super().setup()
+        _RequestHandler.num_connections += 1
+
+    def do_POST(self):  # pylint: disable=invalid-name
+        request = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        result = "0x10"
+        if request["method"] == "eth_chainId":
+            _RequestHandler.num_chain_id_requests += 1
+            result = hex(_CHAIN_ID)
+        body = json.dumps(dict(jsonrpc="2.0", id=request["id"], result=result)).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):  # pylint: disable=arguments-differ
+        pass
+
+
+@pytest.fixture
+def rpc_url():
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), _RequestHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield URL(f"http://127.0.0.1:{server.server_address[1]}")
+    server.shutdown()
+    server.server_close()
+    _RequestHandler.num_connections = 0
+    _RequestHandler.num_chain_id_requests = 0
+
+
+def _get_block_number_in_threads(w3, num_threads):
+    # The threads run one after the other, so that a single connection suffices.
+    for _ in range(num_threads):
+        thread = threading.Thread(target=lambda: w3.eth.block_number)
+        thread.start()
+        thread.join()
+
+
+def test_pooled_http_provider(rpc_url):
+    # All threads and providers share the connection pool of the endpoint.
+    _get_block_number_in_threads(Web3(PooledHTTPProvider(rpc_url)), 3)
+    _get_block_number_in_threads(Web3(PooledHTTPProvider(rpc_url)), 3)
+    assert _RequestHandler.num_connections == 1
+
+
+def test_get_web3(rpc_url):
+    w3 = beamer.util.get_web3(rpc_url)
+    assert beamer.util.get_web3(rpc_url) is w3
+    assert _RequestHandler.num_chain_id_requests == 1
+
+    assert beamer.util.get_web3(rpc_url, timeout=60) is not w3
+    assert beamer.util.get_web3(rpc_url, compute_units={"eth_call": 1}) is beamer.util.get_web3(
+        rpc_url, compute_units={"eth_call": 1}
+    )
+
+
+def test_obtain_contract(rpc_url, tmp_path):
+    abi = [dict(type="function", name="foo", inputs=[], outputs=[], stateMutability="view")]
+    data = dict(abi=abi, deploymentBytecode=dict(bytecode="0x"))
+    tmp_path.joinpath("Foo.json").write_text(json.dumps(data))
+    info = DeployedContractInfo(
+        beamer_commit="0",
+        tx_hash="0x",
+        address=make_address(),
+        deployment_block=BlockNumber(1),
+        deployment_args=[],
+    )
+    deployment = Deployment(
+        deployer=make_address(), base=ChainDeployment(chain_id=_CHAIN_ID, contracts=dict(Foo=info))
+    )
+
+    w3 = beamer.util.get_web3(rpc_url)
+    abi_manager = ABIManager(tmp_path)
+    contract = obtain_contract(w3, abi_manager, deployment, "Foo")
+    assert contract.address == info.address
+    assert obtain_contract(w3, abi_manager, deployment, "Foo") is contract
+    other_w3 = Web3(HTTPProvider(rpc_url))
+    assert obtain_contract(other_w3, abi_manager, deployment, "Foo") is not contract
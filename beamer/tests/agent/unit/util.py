@@ -7,8 +7,9 @@ from eth_typing import BlockNumber, ChecksumAddress
 from eth_utils import to_checksum_address
 from hexbytes import HexBytes
 from web3.constants import ADDRESS_ZERO
-from web3.types import BlockData, Timestamp, Wei
+from web3.types import Timestamp, Wei
 
+import beamer.agent.metrics
 from beamer.agent.agent import Chain
 from beamer.agent.config import ChainConfig, Config
 from beamer.agent.models.claim import Claim
@@ -17,7 +18,7 @@ from beamer.agent.state_machine import Context
 from beamer.agent.tracker import Tracker
 from beamer.agent.util import TokenChecker
 from beamer.chains import ChainDescriptor, register, search
-from beamer.events import ClaimMade
+from beamer.events import ClaimMade, LatestBlock
 from beamer.tests.constants import FILL_ID
 from beamer.tests.util import make_address
 from beamer.typing import URL, ChainId, ClaimId, FillId, Nonce, RequestId, Termination, TokenAmount
@@ -41,6 +42,20 @@ ADDRESS1 = make_address()
 NULL_ADDRESS = to_checksum_address("0x0000000000000000000000000000000000000000")
 GAS_PRICE = Wei(2000000000)
 
+FILL_REQUEST_ABI = dict(
+    type="function",
+    name="fillRequest",
+    stateMutability="nonpayable",
+    inputs=[
+        dict(name="sourceChainId", type="uint256"),
+        dict(name="targetTokenAddress", type="address"),
+        dict(name="targetReceiverAddress", type="address"),
+        dict(name="amount", type="uint256"),
+        dict(name="nonce", type="uint96"),
+    ],
+    outputs=[dict(name="", type="bytes32")],
+)
+
 
 class MockEth:
     def __init__(self, chain_id):
@@ -145,7 +160,7 @@ def make_context() -> Tuple[Context, Config]:
         register(SOURCE_CHAIN_ID, ChainDescriptor(SOURCE_CHAIN_ID, "ethereum", "testnet"))
 
     chains = {}
-    for chain_name in ("l2a", "l2b"):
+    for chain_name in ("source", "target"):
         chains[chain_name] = ChainConfig(
             rpc_url=URL(""),
             min_source_balance=0,
@@ -188,17 +203,11 @@ def make_context() -> Tuple[Context, Config]:
         token_checker=checker,
         address=config.account.address,
         latest_blocks={
-            SOURCE_CHAIN_ID: BlockData(
-                {
-                    "number": BlockNumber(42),
-                    "timestamp": TIMESTAMP,
-                }
+            SOURCE_CHAIN_ID: LatestBlock(
+                number=BlockNumber(42), hash=HexBytes(b"\x01" * 32), timestamp=TIMESTAMP
             ),
-            TARGET_CHAIN_ID: BlockData(
-                {
-                    "number": BlockNumber(43),
-                    "timestamp": Timestamp(458),
-                }
+            TARGET_CHAIN_ID: LatestBlock(
+                number=BlockNumber(43), hash=HexBytes(b"\x02" * 32), timestamp=Timestamp(458)
             ),
         },
         config=config,
@@ -212,4 +221,5 @@ def make_context() -> Tuple[Context, Config]:
     )
     context.request_manager.functions.claimStake().call.return_value = 1  # type: ignore
     context.web3_l1.eth.gas_price = GAS_PRICE  # type: ignore
+    beamer.agent.metrics.init(config=config, source_rpc_url="", target_rpc_url="", rpc_urls={})
     return context, config
@@ -1,14 +1,20 @@
+import atexit
 import json
 import logging
+import logging.handlers
 import pathlib
 import random
 import subprocess
 import sys
+import threading
 import time
 from collections import defaultdict
+from datetime import datetime, timezone
 from pathlib import Path
-from typing import Any, Optional, TypedDict, Union, cast
+from queue import Queue
+from typing import Any, Callable, Hashable, Mapping, Optional, Sequence, TypedDict, Union, cast
 
+import aiohttp
 import click
 import lru
 import requests
@@ -17,23 +23,40 @@ from eth_abi.packed import encode_packed
 from eth_account import Account
 from eth_account.signers.local import LocalAccount
 from eth_utils import keccak, to_canonical_address, to_checksum_address
-from web3 import HTTPProvider, Web3
+from hexbytes import HexBytes
+from web3 import AsyncWeb3, Web3
 from web3.contract import ContractConstructor
 from web3.contract.contract import ContractFunction
-from web3.exceptions import ContractLogicError, TimeExhausted
+from web3.exceptions import ContractLogicError, TimeExhausted, TransactionNotFound
 from web3.gas_strategies.rpc import rpc_gas_price_strategy
 from web3.middleware import (
+    async_construct_simple_cache_middleware,
+    async_geth_poa_middleware,
     construct_sign_and_send_raw_middleware,
     construct_simple_cache_middleware,
     geth_poa_middleware,
+    latest_block_based_cache_middleware,
 )
-from web3.types import GasPriceStrategy, TxParams, TxReceipt
+from web3.middleware.signing import async_construct_sign_and_send_raw_middleware
+from web3.types import GasPriceStrategy, TxParams, TxReceipt, Wei
 from web3.utils.caching import SimpleCache
 
 import beamer.middleware
 from beamer.chains import get_chain_descriptor
+from beamer.provider import (
+    DEFAULT_POOL_SIZE,
+    AsyncFailoverHTTPProvider,
+    BatchAsyncHTTPProvider,
+    FailoverHTTPProvider,
+    PooledHTTPProvider,
+)
 from beamer.typing import URL, ChainId, ChecksumAddress, RequestId, TokenAmount
 
+try:
+    import orjson
+except ImportError:
+    orjson = None  # type: ignore
+
 log = structlog.get_logger(__name__)
 
 
@@ -45,11 +68,102 @@ class TransactionFailed(Exception):
         return "transaction failed: %s" % (self.args if self.args else self.__cause__)
 
 
+# The gas limit of a transaction whose kind is known, see transact, is the
+# maximum gas used by earlier transactions of the same kind, plus this margin.
+_GAS_LIMIT_MARGIN = 1.25
+
+
+class _OutOfGas(TransactionFailed):
+    pass
+
+
+class _GasLimits:
+    """Gas limits learned from the receipts of earlier transactions, by
+    chain, contract, function and a caller supplied key, e.g. the token."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._gas_used: dict[Hashable, int] = {}
+
+    def get(self, key: Hashable) -> Optional[int]:
+        with self._lock:
+            gas_used = self._gas_used.get(key)
+        return None if gas_used is None else int(gas_used * _GAS_LIMIT_MARGIN)
+
+    def update(self, key: Hashable, gas_used: int) -> None:
+        with self._lock:
+            self._gas_used[key] = max(gas_used, self._gas_used.get(key, 0))
+
+    def remove(self, key: Hashable) -> None:
+        with self._lock:
+            self._gas_used.pop(key, None)
+
+
+_GAS_LIMITS = _GasLimits()
+
+
 def transact(
     func: Union[ContractConstructor, ContractFunction],
     timeout: float = 120,
     poll_latency: float = 0.1,
     attempts: int = 5,
+    on_sent: Optional[Callable[[], None]] = None,
+    gas_key: Optional[Hashable] = None,
+    replace_after: Optional[float] = None,
+    deadline: Optional[float] = None,
+    **kwargs: Any,
+) -> TxReceipt:
+    """Send a transaction calling ``func`` and wait for its receipt.
+
+    If ``gas_key`` is given, the gas limit is not estimated, but taken from
+    the gas used by earlier transactions calling the same function of the
+    same contract with the same ``gas_key``. This saves a round trip, but
+    transactions that would revert are sent nevertheless. If the transaction
+    runs out of gas, it is sent again with an estimated gas limit.
+
+    If ``replace_after`` is given, a transaction that is still pending after
+    that many seconds is replaced by one with higher fees, see
+    :func:`_replace_until_mined`. The time between replacements shrinks as
+    ``deadline``, the timestamp by which the transaction needs to be mined,
+    comes closer.
+    """
+    replacement = replace_after, deadline
+    if gas_key is None or "gas" in kwargs or not isinstance(func, ContractFunction):
+        return _transact(func, timeout, poll_latency, attempts, on_sent, replacement, **kwargs)
+
+    key = func.w3.eth.chain_id, func.address, func.fn_name, gas_key
+    gas_limit = _GAS_LIMITS.get(key)
+    if gas_limit is not None:
+        try:
+            receipt = _transact(
+                func,
+                timeout,
+                poll_latency,
+                attempts,
+                on_sent,
+                replacement,
+                gas=gas_limit,
+                **kwargs,
+            )
+        except _OutOfGas as exc:
+            log.warning("Transaction ran out of gas, estimating gas", exc=exc, gas=gas_limit)
+            _GAS_LIMITS.remove(key)
+        else:
+            _GAS_LIMITS.update(key, receipt["gasUsed"])
+            return receipt
+
+    receipt = _transact(func, timeout, poll_latency, attempts, on_sent, replacement, **kwargs)
+    _GAS_LIMITS.update(key, receipt["gasUsed"])
+    return receipt
+
+
+def _transact(
+    func: Union[ContractConstructor, ContractFunction],
+    timeout: float,
+    poll_latency: float,
+    attempts: int,
+    on_sent: Optional[Callable[[], None]],
+    replacement: tuple[Optional[float], Optional[float]],
     **kwargs: Any,
 ) -> TxReceipt:
     try:
@@ -70,50 +184,346 @@ def transact(
     except (ContractLogicError, requests.exceptions.RequestException) as exc:
         raise TransactionFailed() from exc
 
+    if on_sent is not None:
+        on_sent()
+
+    replace_after, deadline = replacement
+    if replace_after is not None:
+        txn_hash = _replace_until_mined(
+            func.w3, txn_hash, replace_after, deadline, timeout, poll_latency
+        )
+    return _wait_for_receipt(func.w3, txn_hash, timeout, poll_latency, kwargs.get("gas"))
+
+
+def transact_raw(
+    w3: Web3,
+    raw_transaction: HexBytes,
+    timeout: float = 120,
+    poll_latency: float = 0.1,
+    on_sent: Optional[Callable[[], None]] = None,
+    replace_after: Optional[float] = None,
+    deadline: Optional[float] = None,
+) -> TxReceipt:
+    """Send a signed transaction and wait for its receipt. Unlike
+    :func:`transact`, sending is not retried, since a failure usually means
+    that the transaction needs to be signed again, e.g. with another nonce."""
+    try:
+        txn_hash = w3.eth.send_raw_transaction(raw_transaction)
+    except (ValueError, requests.exceptions.RequestException) as exc:
+        raise TransactionFailed() from exc
+
+    if on_sent is not None:
+        on_sent()
+
+    if replace_after is not None:
+        txn_hash = _replace_until_mined(
+            w3, txn_hash, replace_after, deadline, timeout, poll_latency
+        )
+    return _wait_for_receipt(w3, txn_hash, timeout, poll_latency)
+
+
+# Replacements of pending transactions.
+#
+# A transaction that is not mined within the replacement interval is replaced
+# by a transaction with the same nonce and higher fees. Nodes only accept a
+# replacement if it raises the fees by some minimum, 10% with geth's default
+# settings, so the fees are raised by _FEE_BUMP_PERCENT each time. Whichever
+# of the transactions gets mined, the others are dropped.
+
+_FEE_BUMP_PERCENT = 25
+
+# The maximum number of replacements of a transaction, which limits its fees
+# to about three times the original ones.
+_MAX_REPLACEMENTS = 5
+
+# The minimum time between replacements, in seconds, however close the
+# deadline is.
+_MIN_REPLACEMENT_INTERVAL = 5.0
+
+
+def _bump_fee(fee: Union[str, Wei]) -> Wei:
+    fee = cast(Wei, fee)
+    return Wei(fee + fee * _FEE_BUMP_PERCENT // 100 + 1)
+
+
+def _get_transaction_params(w3: Web3, txn_hash: HexBytes) -> TxParams:
+    transaction = w3.eth.get_transaction(txn_hash)
+    params: TxParams = {
+        "from": transaction["from"],
+        "nonce": transaction["nonce"],
+        "gas": transaction["gas"],
+        "value": transaction["value"],
+        "data": transaction["input"],
+    }
+    if transaction.get("to") is not None:
+        params["to"] = transaction["to"]
+    if "maxFeePerGas" in transaction:
+        params["maxFeePerGas"] = transaction["maxFeePerGas"]
+        params["maxPriorityFeePerGas"] = transaction["maxPriorityFeePerGas"]
+    else:
+        params["gasPrice"] = transaction["gasPrice"]
+    return params
+
+
+def _make_replacement(transaction: TxParams) -> TxParams:
+    replacement: TxParams = {**transaction}
+    if "maxFeePerGas" in transaction:
+        replacement["maxFeePerGas"] = _bump_fee(transaction["maxFeePerGas"])
+        replacement["maxPriorityFeePerGas"] = _bump_fee(transaction["maxPriorityFeePerGas"])
+    else:
+        replacement["gasPrice"] = _bump_fee(transaction["gasPrice"])
+    return replacement
+
+
+def _replacement_interval(replace_after: float, deadline: Optional[float]) -> float:
+    if deadline is None:
+        return replace_after
+    # Leave a few replacements before the deadline.
+    return max(_MIN_REPLACEMENT_INTERVAL, min(replace_after, (deadline - time.time()) / 4))
+
+
+def _find_mined(w3: Web3, txn_hashes: list[HexBytes]) -> Optional[HexBytes]:
+    for txn_hash in reversed(txn_hashes):
+        try:
+            w3.eth.get_transaction_receipt(txn_hash)
+        except TransactionNotFound:
+            continue
+        return txn_hash
+    return None
+
+
+def _is_nonce_used(w3: Web3, transaction: TxParams) -> bool:
+    sender = to_checksum_address(transaction["from"])
+    return w3.eth.get_transaction_count(sender) > transaction["nonce"]
+
+
+def _replace_until_mined(
+    w3: Web3,
+    txn_hash: HexBytes,
+    replace_after: float,
+    deadline: Optional[float],
+    timeout: float,
+    poll_latency: float,
+) -> HexBytes:
+    """Wait until the transaction ``txn_hash``, or one of its replacements,
+    is mined and return the hash of the mined transaction. Like
+    :func:`_wait_for_receipt`, keep waiting after a timeout.
+
+    Once there are several transactions, only the nonce of the account is
+    polled, and their receipts are only requested after one of them was
+    mined, in order not to multiply the requests during a fee spike."""
+    txn_hashes = [txn_hash]
+    transaction: Optional[TxParams] = None
+    replace_time = time.monotonic() + _replacement_interval(replace_after, deadline)
+    while True:
+        if transaction is None or _is_nonce_used(w3, transaction):
+            mined = _find_mined(w3, txn_hashes)
+            if mined is not None:
+                return mined
+        if len(txn_hashes) > _MAX_REPLACEMENTS and time.monotonic() >= replace_time + timeout:
+            log.error(
+                "Timed out waiting for replaced transaction, retrying",
+                txn_hash=txn_hash.hex(),
+                chain_id=w3.eth.chain_id,
+            )
+            replace_time = time.monotonic()
+        if len(txn_hashes) <= _MAX_REPLACEMENTS and time.monotonic() >= replace_time:
+            if transaction is None:
+                transaction = _get_transaction_params(w3, txn_hash)
+            replacement = _make_replacement(transaction)
+            try:
+                txn_hashes.append(w3.eth.send_transaction(replacement))
+            except ValueError as exc:
+                # E.g. the transaction was mined in the meantime, so that its
+                # nonce is too low now.
+                log.warning("Replacing transaction failed", exc=exc, txn_hash=txn_hash.hex())
+            else:
+                transaction = replacement
+                log.info(
+                    "Replaced pending transaction",
+                    txn_hash=txn_hash.hex(),
+                    replacement=txn_hashes[-1].hex(),
+                    nonce=replacement["nonce"],
+                )
+            replace_time = time.monotonic() + _replacement_interval(replace_after, deadline)
+        time.sleep(poll_latency)
+
+
+def _wait_for_receipt(
+    w3: Web3,
+    txn_hash: HexBytes,
+    timeout: float,
+    poll_latency: float,
+    gas_limit: Optional[int] = None,
+) -> TxReceipt:
     while True:
         try:
-            receipt = func.w3.eth.wait_for_transaction_receipt(
+            receipt = w3.eth.wait_for_transaction_receipt(
                 txn_hash, timeout=timeout, poll_latency=poll_latency
             )
         except TimeExhausted as exc:
             log.error(
                 "Timed out waiting for tx receipt, retrying",
                 exc=exc,
-                chain_id=func.w3.eth.chain_id,
+                chain_id=w3.eth.chain_id,
             )
         else:
             break
 
     if receipt.status == 0:  # type: ignore
+        if gas_limit is not None and receipt["gasUsed"] >= gas_limit:
+            raise _OutOfGas(f"{txn_hash!r} ran out of gas")
         raise TransactionFailed(f"{txn_hash!r} failed with unknown error")
     return receipt
 
 
-def setup_logging(log_level: str, log_json: bool) -> None:
-    """Basic structlog setup"""
+def _json_dumps(obj: Any, **kwargs: Any) -> str:
+    if orjson is not None:
+        return orjson.dumps(obj, default=repr, option=orjson.OPT_NON_STR_KEYS).decode()
+    return json.dumps(obj, default=repr, **kwargs)
+
+
+class _DeferredQueueHandler(logging.handlers.QueueHandler):
+    """A queue handler that passes records on as they are.
+
+    The default implementation formats each record before putting it into
+    the queue, which would render the log entry on the logging thread.
+    Since the queue never leaves the process, the record can be passed
+    on unmodified and formatted by the listener thread instead.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+
+_TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S.%f"
+
+_PLAIN_TYPES = (str, bytes, int, float, bool, type(None))
+
 
-    logging.basicConfig(level=log_level, stream=sys.stdout, format="%(message)s")
+def _snapshot(value: Any) -> Any:
+    if isinstance(value, _PLAIN_TYPES):
+        return value
+    if isinstance(value, dict):
+        return {key: _snapshot(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_snapshot(item) for item in value]
+    if isinstance(value, tuple):
+        return tuple(_snapshot(item) for item in value)
+    return repr(value)
+
+
+def _snapshot_values(
+    _logger: Any, _method_name: str, event_dict: structlog.types.EventDict
+) -> structlog.types.EventDict:
+    # Entries are rendered later on the listener thread, by which time logged
+    # objects, e.g. requests and claims, may have changed. Take their repr
+    # on the logging thread so that entries show the state at logging time.
+    return {key: _snapshot(value) for key, value in event_dict.items()}
+
+
+def _add_record_timestamp(
+    _logger: Any, _method_name: str, event_dict: structlog.types.EventDict
+) -> structlog.types.EventDict:
+    # Use the creation time of the log record, which is taken on the logging
+    # thread, rather than the time the entry is rendered.
+    created = event_dict["_record"].created
+    event_dict["timestamp"] = datetime.fromtimestamp(created, tz=timezone.utc).strftime(
+        _TIMESTAMP_FORMAT
+    )
+    return event_dict
+
+
+# The listener of the queue used by the threaded logging setup, if any.
+_LOG_LISTENER: Optional[logging.handlers.QueueListener] = None
+
+
+def _stop_log_listener() -> bool:
+    global _LOG_LISTENER
+    if _LOG_LISTENER is None:
+        return False
+    _LOG_LISTENER.stop()
+    _LOG_LISTENER = None
+    return True
+
+
+def setup_logging(log_level: str, log_json: bool, threaded: bool = False) -> None:
+    """Basic structlog setup
+
+    If ``threaded`` is set, log entries are only captured on the logging
+    thread and put into a queue. Rendering and writing them out happens on
+    a dedicated thread, so that logging does not slow down the agent's hot
+    paths. Values other than plain data are replaced by their ``repr`` when
+    the entry is captured, so that they show their state at that time.
+    """
+
+    was_threaded = _stop_log_listener()
     logging.logThreads = False
 
     logging.getLogger("web3").setLevel("INFO")
     logging.getLogger("urllib3").setLevel("INFO")
 
-    shared_processors = [
+    # These processors need to run on the logging thread, since they capture
+    # the stack and the exception being logged.
+    capture_processors: list[Any] = [
         structlog.stdlib.add_log_level,
         structlog.stdlib.add_logger_name,
-        structlog.stdlib.PositionalArgumentsFormatter(),
-        structlog.processors.TimeStamper(fmt="%Y-%m-%d %H:%M:%S.%f"),
         structlog.processors.StackInfoRenderer(),
         structlog.processors.format_exc_info,
     ]
 
+    renderer: Any
     if log_json:
-        processors = shared_processors + [structlog.processors.JSONRenderer()]
+        renderer = structlog.processors.JSONRenderer(serializer=_json_dumps)
     else:
-        processors = shared_processors + [structlog.dev.ConsoleRenderer()]
+        renderer = structlog.dev.ConsoleRenderer()
+
+    processors: list[Any]
+    if threaded:
+        handler = logging.StreamHandler(sys.stdout)
+        handler.setFormatter(
+            structlog.stdlib.ProcessorFormatter(
+                processors=[
+                    _add_record_timestamp,
+                    structlog.stdlib.ProcessorFormatter.remove_processors_meta,
+                    structlog.stdlib.PositionalArgumentsFormatter(),
+                    renderer,
+                ],
+                foreign_pre_chain=capture_processors,
+            )
+        )
+        queue: Queue[logging.LogRecord] = Queue()
+        listener = logging.handlers.QueueListener(queue, handler)
+        listener.start()
+        global _LOG_LISTENER
+        _LOG_LISTENER = listener
+        atexit.register(_stop_log_listener)
+
+        root = logging.getLogger()
+        root.handlers = [_DeferredQueueHandler(queue)]
+        root.setLevel(log_level)
+        processors = [
+            # Drop entries below the log level before doing any work on them.
+            structlog.stdlib.filter_by_level,
+            *capture_processors,
+            _snapshot_values,
+            structlog.stdlib.ProcessorFormatter.wrap_for_formatter,
+        ]
+    else:
+        # Replace the queue handler of a previous threaded setup, if any.
+        logging.basicConfig(
+            level=log_level, stream=sys.stdout, format="%(message)s", force=was_threaded
+        )
+        processors = [
+            structlog.stdlib.filter_by_level,
+            *capture_processors,
+            structlog.processors.TimeStamper(fmt=_TIMESTAMP_FORMAT),
+            structlog.stdlib.PositionalArgumentsFormatter(),
+            renderer,
+        ]
 
     structlog.configure(
-        processors=processors,  # type: ignore
+        processors=processors,
         context_class=dict,
         logger_factory=structlog.stdlib.LoggerFactory(),
         wrapper_class=structlog.stdlib.BoundLogger,
@@ -121,6 +531,12 @@ def setup_logging(log_level: str, log_json: bool) -> None:
     )
 
 
+def is_debug_logging_enabled() -> bool:
+    """Return whether debug log entries are emitted at all. Use this to avoid
+    computing expensive log arguments on hot paths."""
+    return logging.getLogger().isEnabledFor(logging.DEBUG)
+
+
 def account_from_keyfile(keyfile: Path, password: str) -> LocalAccount:
     with open(keyfile, "rt") as fp:
         privkey = Account.decrypt(json.load(fp), password)
@@ -144,48 +560,280 @@ class _LRUCache(SimpleCache):
         return value, evicted_items
 
 
+def _add_middlewares(
+    w3: Web3,
+    chain_id: ChainId,
+    set_max_fee: bool,
+    max_concurrent_requests: int,
+    max_requests_per_second: Optional[float],
+    compute_units_per_second: Optional[float],
+    compute_units: Optional[Mapping[str, float]],
+) -> None:
+    if set_max_fee:
+        w3.middleware_onion.add(
+            beamer.middleware.generate_middleware_with_cache(
+                middleware=beamer.middleware.max_fee_setter,
+                chain_id=chain_id,
+            )
+        )
+    # Cache data of 1000 least recently used blocks, fetched via eth_getBlockByNumber.
+    w3.middleware_onion.add(
+        beamer.middleware.generate_middleware_with_cache(
+            middleware=beamer.middleware.cache_get_block_by_number,
+            chain_id=chain_id,
+        )
+    )
+
+    # Handle RPCs that rate limit us.
+    w3.middleware_onion.add(
+        beamer.middleware.generate_rate_limiter(
+            chain_id,
+            max_concurrent_requests,
+            max_requests_per_second,
+            compute_units_per_second,
+            compute_units,
+        )
+    )
+
+    # Answer calls of contract constants from the cache, without waiting for
+    # the rate limiter.
+    w3.middleware_onion.add(beamer.middleware.generate_call_cache(chain_id))
+
+
 def make_web3(
     url: URL,
     account: Optional[LocalAccount] = None,
     gas_price_strategy: GasPriceStrategy = rpc_gas_price_strategy,
     timeout: int = 5,
+    max_concurrent_requests: int = beamer.middleware.DEFAULT_MAX_CONCURRENT_REQUESTS,
+    max_requests_per_second: Optional[float] = None,
+    compute_units_per_second: Optional[float] = None,
+    compute_units: Optional[Mapping[str, float]] = None,
+    fallback_urls: Sequence[URL] = (),
+    hedged_requests: bool = False,
+    pool_size: int = DEFAULT_POOL_SIZE,
+    keep_alive: bool = True,
+    latest_block_cache: bool = False,
+    fused_middleware: bool = False,
 ) -> Web3:
-    w3 = Web3(HTTPProvider(url, request_kwargs=dict(timeout=timeout)))
+    """Return a new Web3 instance for the chain at ``url``. Most code should
+    use the shared instances returned by :func:`get_web3` instead.
+
+    If ``fused_middleware`` is true, the caching, fee setting, signing and
+    rate limiting middlewares are replaced by a single, fused middleware."""
+    # The providers record the response sizes for the instrumentation themselves.
+    request_kwargs = dict(timeout=timeout)
+    provider: PooledHTTPProvider
+    if fallback_urls:
+        # Fail over to the fallback endpoints if the RPC at url stops working.
+        provider = FailoverHTTPProvider(
+            [url, *fallback_urls],
+            request_kwargs=request_kwargs,
+            hedged_requests=hedged_requests,
+            pool_size=pool_size,
+            keep_alive=keep_alive,
+        )
+    else:
+        provider = PooledHTTPProvider(url, request_kwargs, pool_size, keep_alive)
+    w3 = Web3(provider)
 
     # Add POA middleware for geth POA chains, no/op for other chains
     w3.middleware_onion.inject(geth_poa_middleware, layer=0)
+    # Leave the results of some methods as plain dicts, see RAW_RESULT_METHODS.
+    w3.middleware_onion.replace(
+        "attrdict", beamer.middleware.attrdict_middleware  # type: ignore[arg-type]
+    )
     if account is not None:
-        w3.middleware_onion.add(construct_sign_and_send_raw_middleware(account))
+        if not fused_middleware:
+            w3.middleware_onion.add(construct_sign_and_send_raw_middleware(account))
         w3.eth.default_account = account.address
 
-    # Cache data of 1000 least recently used blocks.
-    middleware = construct_simple_cache_middleware(_LRUCache(1000))
-    w3.middleware_onion.add(middleware)
+    if not fused_middleware:
+        # Cache data of 1000 least recently used blocks.
+        middleware = construct_simple_cache_middleware(_LRUCache(1000))
+        w3.middleware_onion.add(middleware)
 
     chain_id = ChainId(w3.eth.chain_id)
+    if isinstance(provider, FailoverHTTPProvider):
+        provider.init_metrics(chain_id)
 
     # Apply type 2 transaction middleware for ETH2 PoS chains
     chain_descriptor = get_chain_descriptor(chain_id)
     assert chain_descriptor is not None, "Chain not supported"
+    set_max_fee = chain_descriptor.type2 and not chain_descriptor.local
+    if not set_max_fee:
+        w3.eth.set_gas_price_strategy(gas_price_strategy)
+
+    if fused_middleware:
+        w3.middleware_onion.add(
+            beamer.middleware.generate_fused_middleware(
+                chain_id,
+                account,
+                set_max_fee,
+                max_concurrent_requests,
+                max_requests_per_second,
+                compute_units_per_second,
+                compute_units,
+            )
+        )
+    else:
+        _add_middlewares(
+            w3,
+            chain_id,
+            set_max_fee,
+            max_concurrent_requests,
+            max_requests_per_second,
+            compute_units_per_second,
+            compute_units,
+        )
+
+    if latest_block_cache:
+        # Cache results of requests for the latest block until a new block arrives.
+        w3.middleware_onion.add(latest_block_based_cache_middleware)
+
+    # Record metrics of the calls that reach the RPC, as the innermost middleware.
+    w3.middleware_onion.inject(beamer.middleware.generate_instrumentation(chain_id), layer=0)
+
+    return w3
+
+
+# Web3 instances returned by get_web3, by URL, account and the other
+# arguments of make_web3.
+_WEB3_INSTANCES: dict[tuple[Any, ...], Web3] = {}
+_WEB3_INSTANCES_LOCK = threading.Lock()
+
+
+def _make_hashable(value: Any) -> Any:
+    if isinstance(value, Mapping):
+        return tuple(sorted((key, _make_hashable(item)) for key, item in value.items()))
+    if isinstance(value, (list, tuple)):
+        return tuple(_make_hashable(item) for item in value)
+    return value
+
+
+def get_web3(url: URL, account: Optional[LocalAccount] = None, **kwargs: Any) -> Web3:
+    """Return the Web3 instance for the chain at ``url``, created by
+    :func:`make_web3` with the same arguments on first use.
+
+    The instances are shared by the whole process, so that the middlewares,
+    the connection pool and the chain ID of each RPC endpoint are set up only
+    once. Callers must not modify the returned instance.
+    """
+    address = None if account is None else account.address
+    key = (url, address, _make_hashable(kwargs))
+    with _WEB3_INSTANCES_LOCK:
+        w3 = _WEB3_INSTANCES.get(key)
+        if w3 is None:
+            w3 = _WEB3_INSTANCES[key] = make_web3(url, account, **kwargs)
+        return w3
+
+
+# HTTP sessions used by AsyncWeb3 instances, one per RPC endpoint. Each session
+# keeps a pool of connections which is shared by all concurrent requests to
+# that endpoint.
+_ASYNC_SESSIONS: dict[URL, aiohttp.ClientSession] = {}
+
+# The maximum number of concurrent connections per RPC endpoint.
+_ASYNC_MAX_CONNECTIONS = 100
+
+
+async def _get_async_session(url: URL) -> aiohttp.ClientSession:
+    session = _ASYNC_SESSIONS.get(url)
+    if session is None or session.closed:
+        connector = aiohttp.TCPConnector(limit=_ASYNC_MAX_CONNECTIONS)
+        session = aiohttp.ClientSession(
+            connector=connector,
+            raise_for_status=True,
+            trace_configs=[beamer.middleware.make_response_size_trace_config()],
+        )
+        _ASYNC_SESSIONS[url] = session
+    return session
+
+
+async def close_async_sessions() -> None:
+    """Close the HTTP sessions created by :func:`make_async_web3`. Must be
+    called from the event loop the sessions were used in."""
+    sessions = list(_ASYNC_SESSIONS.values())
+    _ASYNC_SESSIONS.clear()
+    for session in sessions:
+        await session.close()
+
+
+async def make_async_web3(
+    url: URL,
+    account: Optional[LocalAccount] = None,
+    timeout: int = 5,
+    max_concurrent_requests: int = beamer.middleware.DEFAULT_MAX_CONCURRENT_REQUESTS,
+    max_requests_per_second: Optional[float] = None,
+    compute_units_per_second: Optional[float] = None,
+    compute_units: Optional[Mapping[str, float]] = None,
+    fallback_urls: Sequence[URL] = (),
+) -> AsyncWeb3:
+    """Return an AsyncWeb3 instance with the same middlewares as the ones
+    used by :func:`make_web3`.
+
+    The rate limiter shares its limits with the rate limiters of Web3
+    instances for the same RPC and limits, see beamer.middleware."""
+    request_kwargs = dict(timeout=aiohttp.ClientTimeout(total=timeout))
+    provider: BatchAsyncHTTPProvider
+    if fallback_urls:
+        # Fail over to the fallback endpoints if the RPC at url stops working.
+        provider = AsyncFailoverHTTPProvider([url, *fallback_urls], request_kwargs)
+        for endpoint_provider in provider.endpoint_providers:
+            assert endpoint_provider.endpoint_uri is not None
+            endpoint_url = URL(str(endpoint_provider.endpoint_uri))
+            await endpoint_provider.cache_async_session(await _get_async_session(endpoint_url))
+    else:
+        provider = BatchAsyncHTTPProvider(url, request_kwargs=request_kwargs)
+        await provider.cache_async_session(await _get_async_session(url))
+    w3 = AsyncWeb3(provider)
+
+    # Add POA middleware for geth POA chains, no/op for other chains
+    w3.middleware_onion.inject(async_geth_poa_middleware, layer=0)
+    if account is not None:
+        w3.middleware_onion.add(await async_construct_sign_and_send_raw_middleware(account))
+        w3.eth.default_account = account.address
+
+    # Cache data of 1000 least recently used blocks.
+    w3.middleware_onion.add(await async_construct_simple_cache_middleware(_LRUCache(1000)))
+
+    chain_id = ChainId(await w3.eth.chain_id)
+    if isinstance(provider, AsyncFailoverHTTPProvider):
+        provider.init_metrics(chain_id)
+
+    # Apply type 2 transaction middleware for ETH2 PoS chains. Other chains
+    # fall back to web3's defaults, since gas price strategies are not
+    # supported by AsyncWeb3.
+    chain_descriptor = get_chain_descriptor(chain_id)
+    assert chain_descriptor is not None, "Chain not supported"
     if chain_descriptor.type2 and not chain_descriptor.local:
         w3.middleware_onion.add(
-            beamer.middleware.generate_middleware_with_cache(
-                middleware=beamer.middleware.max_fee_setter,
+            beamer.middleware.generate_async_middleware_with_cache(
+                middleware=beamer.middleware.async_max_fee_setter,
                 chain_id=chain_id,
             )
         )
-    else:
-        w3.eth.set_gas_price_strategy(gas_price_strategy)
     # Cache data of 1000 least recently used blocks, fetched via eth_getBlockByNumber.
     w3.middleware_onion.add(
-        beamer.middleware.generate_middleware_with_cache(
-            middleware=beamer.middleware.cache_get_block_by_number,
+        beamer.middleware.generate_async_middleware_with_cache(
+            middleware=beamer.middleware.async_cache_get_block_by_number,
             chain_id=chain_id,
         )
     )
 
     # Handle RPCs that rate limit us.
-    w3.middleware_onion.add(beamer.middleware.rate_limiter)
+    w3.middleware_onion.add(
+        beamer.middleware.generate_async_rate_limiter(
+            chain_id,
+            max_concurrent_requests,
+            max_requests_per_second,
+            compute_units_per_second,
+            compute_units,
+        )
+    )
+
+    # Record metrics of the calls that reach the RPC, as the innermost middleware.
+    w3.middleware_onion.inject(beamer.middleware.generate_async_instrumentation(chain_id), layer=0)
 
     return w3
 
@@ -213,7 +861,7 @@ def get_token_details(token_address: str, rpc: str) -> TokenDetails:
     token_details = defaultdict(dict)  # type: ignore[var-annotated]
     contract_abi = get_ERC20_abi()
     contract_address = to_checksum_address(token_address)
-    web3 = make_web3(URL(rpc))
+    web3 = get_web3(URL(rpc))
     contract = web3.eth.contract(address=contract_address, abi=contract_abi)
     token_details["decimals"] = contract.functions.decimals().call()
     token_details["symbol"] = contract.functions.symbol().call()
@@ -223,7 +871,7 @@ def get_token_details(token_address: str, rpc: str) -> TokenDetails:
 def get_token_balance(token_address: str, wallet_address: str, rpc: str) -> int:
     contract_abi = get_ERC20_abi()
     contract_address = to_checksum_address(token_address)
-    web3 = make_web3(URL(rpc))
+    web3 = get_web3(URL(rpc))
     contract = web3.eth.contract(address=contract_address, abi=contract_abi)
     balance = contract.functions.balanceOf(wallet_address).call()
     return balance
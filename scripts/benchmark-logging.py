@@ -0,0 +1,103 @@
+"""Measure the agent's event processing throughput with different logging setups.
+
+Runs RequestCreated events through an EventProcessor, with logging at info
+and at debug level, rendered either synchronously or on the logging thread.
+Log output is discarded. The throughput is the one seen by the event
+processor, i.e. it does not include rendering entries still in the queue.
+"""
+import os
+import subprocess
+import sys
+import time
+
+import structlog
+from hexbytes import HexBytes
+
+import beamer.util
+from beamer.agent.chain import EventProcessor
+from beamer.events import Event, RequestCreated
+from beamer.tests.agent.unit.util import SOURCE_CHAIN_ID, TARGET_CHAIN_ID, make_context
+from beamer.tests.util import make_address
+from beamer.typing import BlockNumber, Nonce, RequestId, Termination, TokenAmount
+
+
+def _make_events(num_events: int) -> list[Event]:
+    address = make_address()
+    return [
+        RequestCreated(
+            event_chain_id=SOURCE_CHAIN_ID,
+            event_address=address,
+            block_number=BlockNumber(index),
+            tx_hash=HexBytes(index.to_bytes(32, "big")),
+            request_id=RequestId(index.to_bytes(32, "big")),
+            target_chain_id=TARGET_CHAIN_ID,
+            source_token_address=address,
+            target_token_address=address,
+            source_address=address,
+            target_address=address,
+            amount=TokenAmount(1),
+            nonce=Nonce(index),
+            valid_until=Termination(0),
+            lp_fee=TokenAmount(0),
+            protocol_fee=TokenAmount(0),
+        )
+        for index in range(num_events)
+    ]
+
+
+def _benchmark(log_level: str, threaded: bool, num_events: int) -> float:
+    beamer.util.setup_logging(log_level=log_level, log_json=False, threaded=threaded)
+    context, _ = make_context()
+    context.logger = structlog.get_logger("Context").bind(
+        source_chain_id=SOURCE_CHAIN_ID, target_chain_id=TARGET_CHAIN_ID
+    )
+    processor = EventProcessor(context)
+    events = _make_events(num_events)
+
+    start = time.perf_counter()
+    # Deliver the events in small batches, as the event monitors do.
+    for start_index in range(0, num_events, 10):
+        end_index = start_index + 10
+        processor.add_events(events[start_index:end_index])
+        processor._process_events()  # pylint: disable=protected-access
+    return num_events / (time.perf_counter() - start)
+
+
+def _run_configuration(log_level: str, threaded: bool, num_events: int) -> None:
+    # The log handlers write to sys.stdout, which needs to be replaced
+    # before logging is set up.
+    # Output may still be written after the measurement, so devnull is left open.
+    stdout = sys.stdout
+    sys.stdout = open(os.devnull, "wt")  # pylint: disable=consider-using-with
+
+    # Warm up, so that the measurement is not skewed.
+    _benchmark(log_level, threaded, min(num_events, 1_000))
+    throughput = _benchmark(log_level, threaded, num_events)
+
+    sys.stdout = stdout
+    print(throughput)
+
+
+def main() -> None:
+    if len(sys.argv) == 4:
+        _run_configuration(sys.argv[1], sys.argv[2] == "threaded", int(sys.argv[3]))
+        return
+
+    num_events = int(sys.argv[1]) if len(sys.argv) > 1 else 10_000
+    print(f"Processed {num_events} events")
+    # Each configuration runs in a fresh interpreter, since structlog caches
+    # loggers with the configuration in effect when they are first used.
+    for log_level in ("INFO", "DEBUG"):
+        for mode in ("synchronous", "threaded"):
+            output = subprocess.run(
+                [sys.executable, __file__, log_level, mode, str(num_events)],
+                check=True,
+                capture_output=True,
+                text=True,
+            ).stdout
+            throughput = float(output.split()[-1])
+            print(f"{log_level:>5} {mode:>11}: {throughput:10.0f} events/s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+"""Compare the throughput of make_web3's middleware stack with the fused middleware.
+
+Sends typical agent requests through Web3 instances created by make_web3,
+once with the separate middlewares and once with the fused middleware. The
+HTTP transport is replaced by canned responses, so the measured calls per
+second only reflect the overhead of web3 and the middlewares.
+"""
+import sys
+import time
+from typing import Any, Callable
+
+from eth_account import Account
+from eth_typing import HexStr
+from web3 import Web3
+from web3.types import Nonce, RPCEndpoint, RPCResponse, Wei
+
+import beamer.middleware
+from beamer.provider import PooledHTTPProvider
+from beamer.typing import URL, ChainId
+from beamer.util import make_web3
+
+# A type 2 chain, so that transactions go through the max fee setter.
+_CHAIN_ID = ChainId(1)
+_ADDRESS = Web3.to_checksum_address("0x" + "11" * 20)
+_CACHED_SELECTOR = HexStr("0xaabbccdd")
+_UNCACHED_SELECTOR = HexStr("0x11223344")
+
+_BLOCK = {
+    "number": "0x10",
+    "hash": "0x" + "11" * 32,
+    "parentHash": "0x" + "22" * 32,
+    "timestamp": "0x10",
+    "baseFeePerGas": "0x7",
+    "transactions": [],
+}
+
+_RESULTS = {
+    "eth_chainId": hex(_CHAIN_ID),
+    "eth_blockNumber": "0x10",
+    "eth_call": "0x" + "00" * 32,
+    "eth_getBlockByNumber": _BLOCK,
+    "eth_getBalance": "0x10",
+    "eth_maxPriorityFeePerGas": "0x1",
+    "eth_sendRawTransaction": "0x" + "33" * 32,
+}
+
+
+def _make_request(_provider: Any, method: RPCEndpoint, _params: Any) -> RPCResponse:
+    return {"jsonrpc": "2.0", "id": 0, "result": _RESULTS[method]}
+
+
+def _call(w3: Web3, selector: HexStr) -> None:
+    w3.eth.call({"to": _ADDRESS, "data": selector})
+
+
+def _send_transaction(w3: Web3) -> None:
+    w3.eth.send_transaction(
+        {"to": _ADDRESS, "value": Wei(1), "gas": 21_000, "nonce": Nonce(0), "chainId": _CHAIN_ID}
+    )
+
+
+_WORKLOADS: dict[str, Callable[[Web3], Any]] = {
+    "eth_chainId": lambda w3: w3.eth.chain_id,
+    "eth_blockNumber": lambda w3: w3.eth.block_number,
+    "eth_getBalance": lambda w3: w3.eth.get_balance(_ADDRESS),
+    "eth_call (cached)": lambda w3: _call(w3, _CACHED_SELECTOR),
+    "eth_call": lambda w3: _call(w3, _UNCACHED_SELECTOR),
+    "eth_getBlockByNumber": lambda w3: w3.eth.get_block(16),
+    "eth_sendTransaction": _send_transaction,
+}
+
+
+def _benchmark(w3: Web3, num_calls: int) -> dict[str, float]:
+    rates = {}
+    for name, workload in _WORKLOADS.items():
+        # Warm up the caches.
+        workload(w3)
+        start = time.perf_counter()
+        for _ in range(num_calls):
+            workload(w3)
+        rates[name] = num_calls / (time.perf_counter() - start)
+    return rates
+
+
+def main() -> None:
+    num_calls = int(sys.argv[1]) if len(sys.argv) > 1 else 5_000
+    PooledHTTPProvider.make_request = _make_request  # type: ignore
+    beamer.middleware.register_cached_call(_CHAIN_ID, _ADDRESS, _CACHED_SELECTOR)
+    account = Account.create()
+    url = URL("http://127.0.0.1:8545")
+    separate = _benchmark(make_web3(url, account), num_calls)
+    fused = _benchmark(make_web3(url, account, fused_middleware=True), num_calls)
+
+    print(f"Benchmarking {num_calls} calls per method")
+    print(f"{'method':>22}  {'separate':>10}  {'fused':>10}  speedup")
+    for name, rate in separate.items():
+        print(f"{name:>22}  {rate:8.0f}/s  {fused[name]:8.0f}/s  {fused[name] / rate:6.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+"""Compare the agent's request model with an equivalent python-statemachine model.
+
+Measures the time needed to create requests and drive them through a typical
+sequence of transitions, and the memory held by the created requests.
+"""
+import gc
+import sys
+import time
+import tracemalloc
+from typing import Any, Callable
+
+from eth_utils import to_checksum_address
+from statemachine import State, StateMachine
+
+from beamer.agent.models.request import Request
+from beamer.typing import ChainId, FillId, Nonce, RequestId, TokenAmount
+
+_ADDRESS = to_checksum_address("0x" + "11" * 20)
+
+
+class _StateMachineRequest(StateMachine):
+    """The request model as it was implemented with python-statemachine."""
+
+    def __init__(self, **kwargs: Any) -> None:
+        for name, value in kwargs.items():
+            setattr(self, name, value)
+        self.filler = None
+        self.fill_tx = None
+        self.fill_timestamp = None
+        self.fill_id = None
+        self.invalid_fill_ids: dict = {}
+        self.l1_resolution_filler = None
+        self.l1_resolution_fill_id = None
+        self.l1_resolution_invalid_fill_ids: set = set()
+        super().__init__()
+
+    pending = State(initial=True)
+    filled = State()
+    claimed = State()
+    l1_resolved = State()
+    withdrawn = State()
+    ignored = State()
+
+    fill = pending.to(filled) | filled.to(filled) | ignored.to(filled) | claimed.to(claimed)
+    try_to_fill = pending.to(filled)
+    try_to_claim = filled.to(claimed)
+    l1_resolve = (
+        filled.to(l1_resolved)
+        | claimed.to(l1_resolved)
+        | l1_resolved.to(l1_resolved)
+        | withdrawn.to(withdrawn)
+        | ignored.to(ignored)
+    )
+    withdraw = (
+        claimed.to(withdrawn)
+        | filled.to(withdrawn)
+        | l1_resolved.to(withdrawn)
+        | ignored.to(withdrawn)
+    )
+    ignore = pending.to(ignored) | filled.to(ignored)
+
+    def on_fill(self, filler: Any, fill_tx: Any, fill_id: Any, fill_timestamp: Any) -> None:
+        self.filler = filler
+        self.fill_tx = fill_tx
+        self.fill_id = fill_id
+        self.fill_timestamp = fill_timestamp
+
+
+def _make_request(cls: Callable[..., Any], index: int) -> Any:
+    return cls(
+        request_id=RequestId(index.to_bytes(32, "big")),
+        source_chain_id=ChainId(1),
+        target_chain_id=ChainId(2),
+        source_token_address=_ADDRESS,
+        target_token_address=_ADDRESS,
+        target_address=_ADDRESS,
+        amount=TokenAmount(1),
+        nonce=Nonce(index),
+        valid_until=0,
+    )
+
+
+def _run_transitions(request: Any) -> None:
+    request.fill(_ADDRESS, b"", FillId(b"\x01"), 0)
+    request.try_to_claim()
+    request.withdraw()
+
+
+def _measure_memory(cls: Callable[..., Any], num_requests: int) -> float:
+    gc.collect()
+    tracemalloc.start()
+    requests = [_make_request(cls, index) for index in range(num_requests)]
+    memory, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del requests
+    return memory / num_requests
+
+
+def _benchmark(name: str, cls: Callable[..., Any], num_requests: int) -> None:
+    gc.collect()
+    start = time.perf_counter()
+    requests = [_make_request(cls, index) for index in range(num_requests)]
+    created = time.perf_counter()
+    for request in requests:
+        _run_transitions(request)
+    done = time.perf_counter()
+    # Tracing allocations slows down creation considerably, so memory is
+    # measured separately, on fewer requests.
+    memory = _measure_memory(cls, min(num_requests, 100))
+
+    print(
+        f"{name:>19}: create {(created - start) / num_requests * 1e6:8.2f} us/request, "
+        f"transitions {(done - created) / num_requests * 1e6:7.2f} us/request, "
+        f"memory {memory:8.1f} bytes/request"
+    )
+
+
+def main() -> None:
+    num_requests = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000
+    print(f"Benchmarking {num_requests} requests")
+    _benchmark("python-statemachine", _StateMachineRequest, num_requests)
+    _benchmark("slotted", Request, num_requests)
+
+
+if __name__ == "__main__":
+    main()
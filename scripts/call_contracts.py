@@ -11,7 +11,7 @@ from web3.contract import Contract
 import beamer.artifacts
 from beamer.contracts import ABIManager, obtain_contract
 from beamer.typing import URL, Address, ChainId, TokenAmount
-from beamer.util import account_from_keyfile, make_web3, setup_logging, transact
+from beamer.util import account_from_keyfile, get_web3, setup_logging, transact
 from scripts._util import pass_args, validate_address, validate_bytes
 
 log = structlog.get_logger(__name__)
@@ -51,7 +51,7 @@ def cli(
     setup_logging(log_level="DEBUG", log_json=False)
 
     account = account_from_keyfile(keystore_file, password)
-    web3 = make_web3(eth_rpc, account)
+    web3 = get_web3(eth_rpc, account)
 
     abi_manager = ABIManager(abi_dir)
     deployment = beamer.artifacts.load(artifacts_dir, ChainId(web3.eth.chain_id))
@@ -6,7 +6,7 @@ from pathlib import Path
 import beamer.artifacts
 from beamer.contracts import ABIManager, obtain_contract
 from beamer.typing import URL, ChainId, TokenAmount
-from beamer.util import account_from_keyfile, create_request_id, make_web3
+from beamer.util import account_from_keyfile, create_request_id, get_web3
 
 
 def main() -> None:
@@ -18,7 +18,7 @@ def main() -> None:
     password = sys.argv[5]
 
     deployer = account_from_keyfile(keystore_file, password)
-    web3 = make_web3(l2_rpc, deployer)
+    web3 = get_web3(l2_rpc, deployer)
 
     abi_manager = ABIManager(abi_dir)
     deployment = beamer.artifacts.load(artifacts_dir, ChainId(web3.eth.chain_id))
@@ -11,7 +11,7 @@ from web3 import Web3
 import beamer.artifacts
 from beamer.contracts import ABIManager, obtain_contract
 from beamer.typing import URL, ChainId
-from beamer.util import account_from_keyfile, make_web3, transact
+from beamer.util import account_from_keyfile, get_web3, transact
 from scripts._util import pass_args
 
 # Topic signatures are taken from:
@@ -44,7 +44,7 @@ MESSENGER_ADDRESS = to_checksum_address("0x6900000000000000000000000000000000000
 @click.pass_context
 def cli(ctx: Any, keystore_file: Path, password: str, l1_rpc: str) -> None:
     account = account_from_keyfile(keystore_file, password)
-    web3_l1 = make_web3(URL(l1_rpc), account)
+    web3_l1 = get_web3(URL(l1_rpc), account)
     ctx.ensure_object(dict)
     ctx.obj["account"] = account
     ctx.obj["web3_l1"] = web3_l1
@@ -90,7 +90,7 @@ def set_chain_on_resolver(
     artifact_name: str,
     l2_rpc: URL,
 ) -> None:
-    web3 = make_web3(l2_rpc, account)
+    web3 = get_web3(l2_rpc, account)
     source_chain_id = ChainId(int(os.environ["SOURCE_CHAIN_ID"]))
 
     op_deployment_path = artifacts_dir / artifact_name